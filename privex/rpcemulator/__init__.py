@@ -6,6 +6,21 @@ X11 / MIT License
 **Submodules**:
 
   * :py:mod:`.bitcoin` - Bitcoin RPC emulator
+  * :py:mod:`.altcoins` - Litecoin, Dogecoin and Bitcoin Cash RPC emulators
+  * :py:mod:`.coins` - Coin profiles (ports, address versions, fees) for bitcoind and its forks
+  * :py:mod:`.base` - Base :class:`.Emulator` class and HTTP server helpers
+  * :py:mod:`.asyncserver` - AsyncIO JsonRPC server backend
+  * :py:mod:`.dispatcher` - JsonRPC dispatching with batch request support
+  * :py:mod:`.stats` - Per-method call stats, served by the ``emulator_stats`` RPC method and ``/metrics``
+  * :py:mod:`.faults` - Fault injection (latency, errors, rate limits, drops), configured by ``emulator_faults``
+  * :py:mod:`.profiler` - Opt-in cProfile / stack sampling profilers for the emulator server process
+  * :py:mod:`.addresses` - Address registry deriving checksum-valid addresses, with labels
+  * :py:mod:`.mempool` - Emulated mempool with a fee market, used for block assembly and fee estimates
+  * :py:mod:`.utxo` - UTXO set with per-address and amount indexes, used for coin selection and ``listunspent``
+  * :py:mod:`.rawtx` - Raw transaction serialization, with cached memoryview based decoding
+  * :py:mod:`.store` - Indexed transaction storage
+  * :py:mod:`.seed` - Command line tool for seeding large wallets
+  * :py:mod:`.benchmark` - Benchmark harness reporting throughput and latency per RPC method
 
 
 **Copyright**::
@@ -0,0 +1,321 @@
+"""
+Address registry for emulated wallets - tracks which addresses the wallet owns (with their labels), which foreign
+addresses are known, and derives new checksum-valid addresses on demand for ``getnewaddress``::
+
+    >>> from privex.rpcemulator.addresses import AddressRegistry
+    >>> reg = AddressRegistry(['1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8'], seed='example')
+    >>> addr = reg.new_address('deposits')
+    >>> addr in reg, reg.label(addr), reg.addresses_by_label('deposits') == [addr]
+    (True, 'deposits', True)
+    >>> reg.is_valid('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2'), reg.is_valid('notanaddress')
+    (True, False)
+
+New addresses are derived deterministically from the registry's ``seed`` and an ever increasing index (see
+:func:`.derive_address`), so the same seed always produces the same addresses, and an address is never handed out
+twice. They're Base58Check encoded like real P2PKH addresses, so they pass validation in client libraries - but
+they're derived from a hash, rather than a key pair, so nothing can be signed with them.
+
+Membership, validation and label lookups are all dictionary / set lookups, and addresses are derived in batches
+(see :py:meth:`.AddressRegistry.keypool_refill`), so wallets with millions of addresses stay fast.
+
+In multi-worker mode (see :py:meth:`.AddressRegistry.share`), the derivation index is shared between processes, so
+workers never hand out the same address - but labels set by one worker aren't seen by the others.
+
+"""
+import hashlib
+import multiprocessing
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
+
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+"""The Base58 alphabet used by Bitcoin addresses"""
+
+P2PKH_VERSION = 0
+"""Version byte of Bitcoin mainnet pay-to-pubkey-hash addresses (the ``1...`` addresses)"""
+
+KEYPOOL_SIZE = 1000
+"""Default number of addresses derived ahead of time by :py:meth:`.AddressRegistry.keypool_refill`"""
+
+# Encoding two Base58 digits per divmod halves the work of the encoding loop
+_B58_PAIRS = [a + b for a in B58_ALPHABET for b in B58_ALPHABET]
+_B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+
+def _sha256d(data: bytes) -> bytes:
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def b58check_encode(payload: bytes) -> str:
+    """Encode ``payload`` (version byte + data) as Base58Check, i.e. with a 4 byte double SHA256 checksum appended"""
+    raw = payload + _sha256d(payload)[:4]
+    n, digits = int.from_bytes(raw, 'big'), []
+    while n:
+        n, r = divmod(n, 3364)
+        digits.append(_B58_PAIRS[r])
+    encoded = ''.join(reversed(digits)).lstrip('1')
+    # Each leading zero byte is encoded as a '1'
+    return '1' * (len(raw) - len(raw.lstrip(b'\0'))) + encoded
+
+
+def b58check_decode(address: str) -> Optional[bytes]:
+    """
+    Decode the Base58Check string ``address``, returning the payload (version byte + data) - or ``None`` if it
+    contains invalid characters, or the checksum doesn't match.
+    """
+    n = 0
+    try:
+        for c in address:
+            n = n * 58 + _B58_INDEX[c]
+    except KeyError:
+        return None
+    raw = n.to_bytes((n.bit_length() + 7) // 8, 'big')
+    raw = b'\0' * (len(address) - len(address.lstrip('1'))) + raw
+    if len(raw) < 5 or _sha256d(raw[:-4])[:4] != raw[-4:]:
+        return None
+    return raw[:-4]
+
+
+def address_hash(address: str, version: int = P2PKH_VERSION) -> Optional[bytes]:
+    """Returns the 20 byte hash160 of a P2PKH ``address`` with the version byte ``version``, or ``None`` if invalid"""
+    payload = b58check_decode(address)
+    if payload is None or len(payload) != 21 or payload[0] != version:
+        return None
+    return payload[1:]
+
+
+def is_valid_address(address: str, version: int = P2PKH_VERSION) -> bool:
+    """Returns ``True`` if ``address`` is a checksum-valid P2PKH address with the version byte ``version``"""
+    return isinstance(address, str) and 25 <= len(address) <= 35 and address_hash(address, version) is not None
+
+
+def derive_address(seed: Union[str, bytes], index: int, version: int = P2PKH_VERSION) -> str:
+    """
+    Derive the address number ``index`` for ``seed`` - the hash160 is the first 20 bytes of
+    ``sha256(seed + index)``, which is Base58Check encoded with the version byte ``version``.
+    """
+    seed = seed.encode() if isinstance(seed, str) else seed
+    digest = hashlib.sha256(seed + index.to_bytes(8, 'big')).digest()
+    return b58check_encode(bytes([version]) + digest[:20])
+
+
+def derive_addresses(seed: Union[str, bytes], start: int, count: int, version: int = P2PKH_VERSION) -> List[str]:
+    """Derive ``count`` addresses for ``seed``, starting from the index ``start`` (see :func:`.derive_address`)"""
+    seed = seed.encode() if isinstance(seed, str) else seed
+    prefix, sha256 = bytes([version]), hashlib.sha256
+    return [
+        b58check_encode(prefix + sha256(seed + i.to_bytes(8, 'big')).digest()[:20])
+        for i in range(start, start + count)
+    ]
+
+
+class _Counter:
+    """A process-local stand in for :func:`multiprocessing.Value`, used until :py:meth:`.AddressRegistry.share`"""
+    def __init__(self, value: int = 0):
+        self.value = value
+
+    def claim(self, n: int = 1) -> int:
+        start, self.value = self.value, self.value + n
+        return start
+
+
+class _SharedCounter:
+    """A derivation index shared between processes, backed by a :func:`multiprocessing.Value`"""
+    def __init__(self, value: int = 0):
+        self._value = multiprocessing.Value('Q', value)
+
+    @property
+    def value(self) -> int:
+        return self._value.value
+
+    def claim(self, n: int = 1) -> int:
+        with self._value.get_lock():
+            start = self._value.value
+            self._value.value = start + n
+        return start
+
+
+class AddressRegistry:
+    """
+    The addresses of an emulated wallet - our own addresses (in the order they were added, each with a label), plus
+    a set of known foreign addresses.
+
+    Acts as a read-only sequence of our own addresses, so ``address in registry``, ``len(registry)``,
+    ``registry[i]`` and :func:`random.choice` all work as they did with the plain address list it replaces.
+
+    Labels replace accounts the same way they do in Bitcoin Core 0.17+, so an address' account is its label.
+    """
+    def __init__(self, addresses: Iterable[str] = (), external: Iterable[str] = (), seed: Union[str, bytes] = None,
+                 version: int = P2PKH_VERSION, keypool_size: int = KEYPOOL_SIZE):
+        """
+        :param addresses: Addresses owned by the wallet to start with (label ``""``)
+        :param external: Known foreign addresses
+        :param seed: Seed used to derive new addresses (default: random)
+        :param int version: Version byte of the addresses derived / accepted by this registry
+        :param int keypool_size: Number of addresses derived at a time when the keypool runs out
+        """
+        self.seed = os.urandom(16) if seed is None else (seed.encode() if isinstance(seed, str) else seed)
+        self.version = version
+        self.keypool_size = keypool_size
+        self.external: Set[str] = set(external)
+        """Known foreign addresses - i.e. addresses which are valid, but aren't owned by this wallet"""
+        self._info: Dict[str, dict] = {}
+        self._list: List[str] = []
+        self._labels: Dict[str, Dict[str, None]] = {}
+        self._keypool: Dict[int, str] = {}
+        self._counter = _Counter()
+        self._synced = 0
+        self.extend(addresses)
+
+    def __len__(self):
+        return len(self._list)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._list)
+
+    def __getitem__(self, index):
+        return self._list[index]
+
+    def __contains__(self, address) -> bool:
+        return self.is_mine(address)
+
+    def _register(self, address: str, label: str = "", index: int = None) -> bool:
+        if address in self._info:
+            return False
+        self._info[address] = dict(label=label, index=index)
+        self._list.append(address)
+        self._labels.setdefault(label, {})[address] = None
+        return True
+
+    def add(self, address: str, label: str = "") -> bool:
+        """
+        Add an existing address to the wallet (e.g. an imported address) with the label ``label``.
+
+        :return bool added: ``False`` if the address was already in the wallet
+        """
+        return self._register(address, label)
+
+    def extend(self, addresses: Iterable[str], label: str = "") -> int:
+        """Add each address in ``addresses`` to the wallet, returning how many weren't already in it"""
+        return sum(self._register(a, label) for a in addresses)
+
+    def add_external(self, addresses: Iterable[str]):
+        """Add ``addresses`` to the set of known foreign addresses"""
+        self.external.update(addresses)
+
+    def is_mine(self, address: str) -> bool:
+        """Returns ``True`` if ``address`` is owned by this wallet"""
+        if address in self._info:
+            return True
+        # Another worker may have derived it (see share)
+        return self.shared and self._synced < self._counter.value and self._sync(address)
+
+    def is_valid(self, address: str) -> bool:
+        """Returns ``True`` if ``address`` is known (ours or foreign), or is a checksum-valid address for this coin"""
+        return (
+            address in self._info or address in self.external or is_valid_address(address, self.version)
+        )
+
+    def derive(self, index: int) -> str:
+        """Returns the address derived from this registry's seed at ``index`` (see :func:`.derive_address`)"""
+        address = self._keypool.get(index)
+        return derive_address(self.seed, index, self.version) if address is None else address
+
+    @property
+    def shared(self) -> bool:
+        """Whether the derivation index is shared with other processes (see :py:meth:`.share`)"""
+        return isinstance(self._counter, _SharedCounter)
+
+    def _fill(self, start: int, size: int) -> int:
+        # Drop entries which were claimed before start (e.g. by other workers)
+        self._keypool = {i: a for i, a in self._keypool.items() if i >= start}
+        missing = [i for i in range(start, start + size) if i not in self._keypool]
+        if missing:
+            first, count = missing[0], missing[-1] - missing[0] + 1
+            self._keypool.update(zip(range(first, first + count), derive_addresses(self.seed, first, count,
+                                                                                   self.version)))
+        return len(missing)
+
+    def keypool_refill(self, size: int = None) -> int:
+        """
+        Derive the next ``size`` (default: :py:attr:`.keypool_size`) addresses ahead of time, so that
+        :py:meth:`.new_address` doesn't have to derive them one at a time.
+
+        :return int derived: The number of addresses which were derived
+        """
+        return self._fill(self._counter.value, self.keypool_size if size is None else size)
+
+    def keypool_remaining(self) -> int:
+        """The number of derived addresses waiting in the keypool"""
+        start = self._counter.value
+        return sum(1 for i in self._keypool if i >= start)
+
+    def new_address(self, label: str = "") -> str:
+        """Derive a new address which has never been handed out before, and add it to the wallet as ``label``"""
+        index = self._counter.claim()
+        if index not in self._keypool:
+            self._fill(index, self.keypool_size)
+        address = self._keypool.pop(index)
+        self._register(address, label, index)
+        return address
+
+    def generate(self, count: int, label: str = "") -> List[str]:
+        """Derive ``count`` new addresses in one batch, and add them all to the wallet as ``label``"""
+        start = self._counter.claim(count)
+        addresses = derive_addresses(self.seed, start, count, self.version)
+        for i, address in enumerate(addresses, start):
+            self._keypool.pop(i, None)
+            self._register(address, label, i)
+        return addresses
+
+    def _sync(self, address: str) -> bool:
+        """Register the addresses derived by other workers, returning whether ``address`` was one of them"""
+        end = self._counter.value
+        for i in range(self._synced, end):
+            self._register(self.derive(i), "", i)
+        self._synced = end
+        return address in self._info
+
+    def info(self, address: str) -> Optional[dict]:
+        """Returns ``{label, index}`` for one of our addresses (``index`` is ``None`` unless derived), else ``None``"""
+        if not self.is_mine(address):
+            return None
+        return dict(self._info[address])
+
+    def label(self, address: str) -> Optional[str]:
+        """Returns the label of one of our addresses, or ``None`` if it isn't ours"""
+        return self._info[address]['label'] if self.is_mine(address) else None
+
+    def set_label(self, address: str, label: str):
+        """Change the label of one of our addresses"""
+        if not self.is_mine(address):
+            raise KeyError(f"Address {address} is not in the wallet")
+        info = self._info[address]
+        old = self._labels[info['label']]
+        del old[address]
+        if not old:
+            del self._labels[info['label']]
+        info['label'] = label
+        self._labels.setdefault(label, {})[address] = None
+
+    def addresses_by_label(self, label: str) -> List[str]:
+        """Returns our addresses which have the label ``label``, in the order they were added"""
+        return list(self._labels.get(label, ()))
+
+    def labels(self) -> List[str]:
+        """Returns every label used by at least one of our addresses, sorted"""
+        return sorted(self._labels)
+
+    def share(self):
+        """
+        Share the derivation index with forked child processes (see
+        :py:meth:`privex.rpcemulator.bitcoin.BitcoinEmulator.share_state`), so no two workers derive the same address.
+        """
+        if not self.shared:
+            self._counter = _SharedCounter(self._counter.value)
+            self._synced = self._counter.value
+
+    def unshare(self):
+        """Switch back to a process-local derivation index, after the workers sharing it have stopped"""
+        if self.shared:
+            self._sync('')
+            self._counter = _Counter(self._counter.value)
@@ -0,0 +1,37 @@
+"""
+Emulators for forks of bitcoind - subclasses of :class:`privex.rpcemulator.bitcoin.BitcoinEmulator` set to the
+:class:`privex.rpcemulator.coins.CoinProfile` of their coin.
+
+Each emulator listens on its coin's default RPC port, generates addresses with its coin's version byte, and serves
+its coin's RPC methods (e.g. ``signrawtransaction`` for Dogecoin). Each emulator has its own wallet, so they can
+run side by side - or be served by one event loop, with ``use_async=True, background=False``::
+
+    >>> from privex.rpcemulator.altcoins import LitecoinEmulator, DogecoinEmulator
+    >>> with LitecoinEmulator(), DogecoinEmulator():
+    ...     # Litecoin at http://127.0.0.1:9332 and Dogecoin at http://127.0.0.1:22555
+    ...
+
+"""
+from privex.rpcemulator.bitcoin import BitcoinEmulator
+from privex.rpcemulator.coins import BITCOIN_CASH, DOGECOIN, LITECOIN, CoinProfile
+
+
+class LitecoinEmulator(BitcoinEmulator):
+    """Emulates ``litecoind`` - listens at http://127.0.0.1:9332 by default"""
+    coin: CoinProfile = LITECOIN
+
+
+class DogecoinEmulator(BitcoinEmulator):
+    """
+    Emulates ``dogecoind`` - listens at http://127.0.0.1:22555 by default. Dogecoin has no segwit, so fees are paid
+    for legacy transaction sizes, at a minimum of 0.01 DOGE per 1000 bytes.
+    """
+    coin: CoinProfile = DOGECOIN
+
+
+class BitcoinCashEmulator(BitcoinEmulator):
+    """
+    Emulates Bitcoin Cash Node's ``bitcoind`` - listens at http://127.0.0.1:8332 by default. Bitcoin Cash has
+    ``estimatefee`` instead of ``estimatesmartfee``.
+    """
+    coin: CoinProfile = BITCOIN_CASH
@@ -0,0 +1,358 @@
+"""
+AsyncIO JsonRPC server backend - an alternative to the :class:`http.server.HTTPServer` /
+:class:`jsonrpcserver.server.RequestHandler` pair used by :mod:`privex.rpcemulator.base`
+
+Requests are dispatched using :func:`privex.rpcemulator.dispatcher.async_dispatch`, and connections are handled by
+a minimal HTTP/1.1 implementation built on :func:`asyncio.start_server`, supporting persistent (keep-alive)
+connections.
+
+Since all connections are served by a single event loop, thousands of concurrent keep-alive connections can be
+held open without needing a thread per connection.
+
+The emulators' methods are synchronous, and some of them block - e.g. on a SQLite store, or waiting for the state
+lock held by another worker. So that they don't stall every other connection, the calls of each request are ran in
+a thread pool belonging to the server (see ``offload`` in :func:`.async_serve`) - only the calls themselves use a
+thread, while idle and waiting connections are still handled by the event loop alone.
+
+Faults configured with :mod:`privex.rpcemulator.faults` (rate limits, dropped connections and slow-drip responses)
+are applied to each JsonRPC request, in the same way as :class:`privex.rpcemulator.base.RequestHandler`.
+
+Running inside your own event loop::
+
+    >>> from privex.rpcemulator.asyncserver import async_serve, close_server, wait_server_closed
+    >>> server = await async_serve('127.0.0.1', 8332, quiet=True)
+    >>> # make some queries to the RPC at http://127.0.0.1:8332
+    >>> close_server(server)
+    >>> await wait_server_closed(server)
+
+"""
+import asyncio
+import functools
+import logging
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from typing import Callable, ContextManager, Optional, Tuple, Dict
+
+from jsonrpcserver.methods import Methods, global_methods
+
+from privex.rpcemulator import stats
+from privex.rpcemulator.dispatcher import async_dispatch
+from privex.rpcemulator.faults import REJECT_BODIES, REJECT_HEADERS, injector
+
+log = logging.getLogger(__name__)
+
+KEEPALIVE_TIMEOUT = 60
+"""Close idle keep-alive connections after this many seconds without a new request"""
+
+MAX_KEEPALIVE_REQUESTS = 1000
+"""Close keep-alive connections after serving this many requests"""
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+"""Content type of the Prometheus text format served at ``/metrics``"""
+
+MAX_BODY_SIZE = 16 * 1024 * 1024
+"""Reject requests with a ``Content-Length`` larger than this many bytes"""
+
+
+def async_methods(methods: Methods = None) -> Methods:
+    """
+    Wrap each synchronous method in ``methods`` (default: jsonrpcserver's global methods) with a coroutine function,
+    so that they can be called by :func:`jsonrpcserver.async_dispatch`.
+
+    Methods which are already coroutine functions are left as-is. The wrapped methods are called inline by the event
+    loop, so a method which blocks stalls every connection - :func:`.async_serve` only uses this when some of the
+    methods are coroutine functions, otherwise it runs the synchronous methods in an executor.
+
+    :param Methods methods: A :class:`jsonrpcserver.methods.Methods` instance (default: global methods)
+    :return Methods async_methods: A new :class:`jsonrpcserver.methods.Methods` instance containing coroutine functions
+    """
+    methods = global_methods if methods is None else methods
+    wrapped = {}
+    for name, fn in methods.items.items():
+        if asyncio.iscoroutinefunction(fn):
+            wrapped[name] = fn
+            continue
+        wrapped[name] = _wrap_sync(fn)
+    return Methods(**wrapped)
+
+
+def _wrap_sync(fn):
+    # functools.wraps sets __wrapped__ so that jsonrpcserver's argument validation sees the original signature
+    @functools.wraps(fn)
+    async def _wrapper(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return _wrapper
+
+
+async def _read_request(reader: asyncio.StreamReader,
+                        timeout: float) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+    """
+    Read the request line and headers of an HTTP request.
+
+    :return tuple request: ``(method, path, version, headers)`` - or ``None`` if the client closed the connection
+    """
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    if not line:
+        return None
+    parts = line.decode('latin-1').strip().split()
+    if len(parts) != 3:
+        raise ValueError(f'Malformed request line: {line!r}')
+    method, path, version = parts
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        k, _, v = line.decode('latin-1').partition(':')
+        headers[k.strip().lower()] = v.strip()
+    return method.upper(), path, version.upper(), headers
+
+
+def _response_head(status: int, length: int, keep_alive: bool, content_type: str, headers: dict = None) -> bytes:
+    head = [
+        f'HTTP/1.1 {status} {HTTPStatus(status).phrase}',
+        f'Content-Type: {content_type}',
+        f'Content-Length: {length}',
+        f'Connection: {"keep-alive" if keep_alive else "close"}',
+        *(f'{k}: {v}' for k, v in (headers or {}).items()),
+        '', ''
+    ]
+    return '\r\n'.join(head).encode('latin-1')
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, body: bytes = b'', keep_alive: bool = True,
+                    content_type: str = 'application/json', headers: dict = None):
+    writer.write(_response_head(status, len(body), keep_alive, content_type, headers) + body)
+
+
+async def _drip_response(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool, content_type: str,
+                         chunk: int, interval: float):
+    """Write a response with its body split into ``chunk`` byte pieces, ``interval`` seconds apart"""
+    writer.write(_response_head(status, len(body), keep_alive, content_type))
+    for i in range(0, len(body), chunk):
+        if i:
+            await asyncio.sleep(interval)
+        writer.write(body[i:i + chunk])
+        await writer.drain()
+
+
+def _log_request(peer, method: str, status: int):
+    sys.stderr.write(
+        '%s - - [%s] "%s" %s -\n' % (peer[0] if peer else '-', datetime.now().strftime('%d/%b/%Y %H:%M:%S'),
+                                     method, status)
+    )
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, methods: Methods,
+                            quiet: bool = False, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                            max_batch_size: int = None, max_requests: int = MAX_KEEPALIVE_REQUESTS,
+                            metrics: bool = False, context: Callable[[], ContextManager] = None,
+                            router: Callable[[str], Optional[Callable[[], ContextManager]]] = None,
+                            batch_context: Callable[[], ContextManager] = None, executor: Executor = None):
+    """
+    Serve JsonRPC requests from a single client connection until the client disconnects, the connection is idle for
+    longer than ``keepalive_timeout``, ``max_requests`` requests have been served (``0`` for no limit),
+    or the client asks to close the connection.
+    
+    If ``metrics`` is ``True``, ``GET /metrics`` returns the stats from :mod:`privex.rpcemulator.stats` in the
+    Prometheus text format. ``context`` is entered around each JsonRPC request
+    (see :func:`privex.rpcemulator.dispatcher.async_dispatch`) - or if ``router`` is set, the context it returns
+    for the request path, with a ``404`` for paths it returns ``None`` for. ``batch_context`` is entered around the
+    calls of each batch request.
+    
+    If ``executor`` is passed, ``methods`` are synchronous, and each request's calls are ran in ``executor``
+    (see :func:`privex.rpcemulator.dispatcher.async_dispatch`).
+    
+    When faults are configured (see :mod:`privex.rpcemulator.faults`), JsonRPC requests may be rejected by the rate
+    limit, have their connection closed after the request has been dispatched instead of receiving the response,
+    or receive the response slowly (slow drip).
+    """
+    peer, served = writer.get_extra_info('peername'), 0
+    try:
+        while True:
+            try:
+                req = await _read_request(reader, keepalive_timeout)
+            except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+                break
+            except ValueError:
+                _write_response(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+                break
+            if req is None or writer.is_closing():
+                break
+            method, path, version, headers = req
+            conn = headers.get('connection', '').lower()
+            keep_alive = conn != 'close' if version == 'HTTP/1.1' else conn == 'keep-alive'
+            served += 1
+            if max_requests and served >= max_requests:
+                keep_alive = False
+
+            # Same as RequestHandler.do_POST - a POST must have a Content-Length, which must be a valid size
+            raw_length = headers.get('content-length')
+            if raw_length is None and method == 'POST':
+                _write_response(writer, HTTPStatus.LENGTH_REQUIRED, keep_alive=False)
+                break
+            try:
+                length = int(raw_length or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                _write_response(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+                break
+            if length > MAX_BODY_SIZE:
+                _write_response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, keep_alive=False)
+                break
+            body = await reader.readexactly(length) if length else b''
+            try:
+                request = body.decode()
+            except UnicodeDecodeError:
+                request = None
+
+            content_type, headers, drip = 'application/json', None, None
+            request_context = context if router is None else router(path)
+            if method == 'GET' and metrics:
+                if path == '/metrics':
+                    status, data, content_type = HTTPStatus.OK, stats.prometheus_text().encode(), METRICS_CONTENT_TYPE
+                else:
+                    status, data = HTTPStatus.NOT_FOUND, b''
+            elif method != 'POST':
+                status, data = HTTPStatus.NOT_IMPLEMENTED, b''
+            elif router is not None and request_context is None:
+                status, data = HTTPStatus.NOT_FOUND, b''
+            elif request is None:
+                status, data = HTTPStatus.BAD_REQUEST, b''
+            else:
+                faulty = injector.active and not injector.exempt(body)
+                reject = injector.reject() if faulty else None
+                if reject is not None:
+                    status, data, content_type, headers = reject, REJECT_BODIES[reject], 'text/plain', REJECT_HEADERS
+                else:
+                    response = await async_dispatch(
+                        request, methods, max_batch_size=max_batch_size, context=request_context,
+                        batch_context=batch_context, executor=executor
+                    )
+                    if faulty and injector.drop():
+                        break
+                    if response.wanted:
+                        status, data = response.http_status, str(response).encode()
+                    else:
+                        status, data = HTTPStatus.NO_CONTENT, b''
+                    drip = injector.drip if faulty else None
+
+            if drip and data:
+                await _drip_response(writer, status, data, keep_alive, content_type, *drip)
+            else:
+                _write_response(writer, status, data, keep_alive=keep_alive, content_type=content_type, headers=headers)
+                await writer.drain()
+            if not quiet:
+                _log_request(peer, method, status)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def async_serve(name: str = "", port: int = 5000, quiet: bool = False, methods: Methods = None,
+                      keepalive_timeout: float = KEEPALIVE_TIMEOUT, max_batch_size: int = None,
+                      max_requests: int = MAX_KEEPALIVE_REQUESTS, metrics: bool = False,
+                      context: Callable[[], ContextManager] = None,
+                      router: Callable[[str], Optional[Callable[[], ContextManager]]] = None,
+                      batch_context: Callable[[], ContextManager] = None, offload: bool = True,
+                      max_workers: int = None, **kwargs) -> asyncio.AbstractServer:
+    """
+    Start an AsyncIO JsonRPC server inside of the current event loop, and return the :class:`asyncio.Server`
+    once it's listening. Close the server using :func:`.close_server` followed by :func:`.wait_server_closed`.
+
+    :param str name: Server address.
+    :param int port: Server port.
+    :param bool quiet: If ``True``, disable HTTP request logging
+    :param Methods methods: Methods to serve (default: jsonrpcserver's global methods)
+    :param float keepalive_timeout: Close idle keep-alive connections after this many seconds
+    :param int max_batch_size: Maximum number of calls allowed in a batch request
+    :param int max_requests: Close keep-alive connections after serving this many requests (``0`` for no limit)
+    :param bool metrics: Serve Prometheus metrics at ``GET /metrics`` (see :mod:`privex.rpcemulator.stats`)
+    :param context: A function returning a context manager, entered around each JsonRPC request
+    :param router: A function returning the ``context`` for a request path, or ``None`` if the path isn't found
+    :param batch_context: A function returning a context manager, entered around the calls of each batch request
+                          (only when ``offload`` is used, see :func:`privex.rpcemulator.dispatcher.async_dispatch`)
+    :param bool offload: If ``True`` (default) and every method is synchronous, run the calls in a thread pool of
+                         this server, so that methods which block don't stall other connections. Otherwise
+                         synchronous methods are called inline by the event loop (see :func:`.async_methods`)
+    :param int max_workers: Maximum number of threads used when ``offload`` is enabled
+                            (default: :class:`concurrent.futures.ThreadPoolExecutor`'s default)
+    :param kwargs: Any additional kwargs are passed through to :func:`asyncio.start_server` - e.g. ``sock`` to
+                   serve on an already bound socket
+    :return asyncio.AbstractServer server: The listening server
+    """
+    methods = global_methods if methods is None else methods
+    executor = None
+    if offload and not any(asyncio.iscoroutinefunction(fn) for fn in methods.items.values()):
+        # The server's own pool, so that calls can't be starved by other users of the loop's default executor
+        executor = ThreadPoolExecutor(max_workers, thread_name_prefix='rpcemulator-async')
+    else:
+        methods = async_methods(methods)
+
+    # The handler task and writer of each open connection, so that close_server can close them
+    connections = {}
+
+    async def _handler(reader, writer):
+        task = asyncio.current_task()
+        connections[task] = writer
+        try:
+            await handle_connection(
+                reader, writer, methods, quiet=quiet, keepalive_timeout=keepalive_timeout,
+                max_batch_size=max_batch_size, max_requests=max_requests, metrics=metrics, context=context,
+                router=router, batch_context=batch_context, executor=executor
+            )
+        finally:
+            connections.pop(task, None)
+
+    kwargs = {'backlog': 1024, **kwargs}
+    if kwargs.get('sock') is not None:
+        name, port = None, None
+    server = await asyncio.start_server(_handler, name or None, port, **kwargs)
+    server.connections, server.executor = connections, executor
+    log.info(" * Listening on port %s (asyncio)", server.sockets[0].getsockname()[1])
+    return server
+
+
+def close_server(server: asyncio.AbstractServer):
+    """
+    Stop a server started by :func:`.async_serve` from listening, close its open (keep-alive) connections, and shut
+    down its thread pool. Use :func:`.wait_server_closed` to wait for the connections to finish closing.
+    """
+    server.close()
+    for writer in list(getattr(server, 'connections', {}).values()):
+        writer.close()
+    executor = getattr(server, 'executor', None)
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+async def wait_server_closed(server: asyncio.AbstractServer):
+    """Wait for a server closed by :func:`.close_server`, and the handlers of its connections, to finish"""
+    await server.wait_closed()
+    tasks = list(getattr(server, 'connections', {}))
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def async_serve_forever(name: str = "", port: int = 5000, quiet: bool = False, methods: Methods = None,
+                        sock=None, ready=None, **kwargs):
+    """
+    Blocking wrapper around :func:`.async_serve` - creates a new event loop and serves requests forever.
+    
+    If ``ready`` is passed (e.g. a :class:`multiprocessing.Event`), then ``ready.set()`` is called once the server
+    is listening. Any additional kwargs are passed through to :func:`.async_serve`
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(
+        async_serve(name, port, quiet=quiet, methods=methods, sock=sock, **kwargs)
+    )
+    if ready is not None:
+        ready.set()
+    loop.run_forever()
@@ -1,45 +1,394 @@
+import asyncio
 import multiprocessing
+import select
+import socket
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
 from http.server import HTTPServer
 from os.path import dirname, abspath
-from typing import Optional
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, ContextManager, List, Optional, Tuple, Type
 
-from jsonrpcserver import serve
-from jsonrpcserver.server import RequestHandler
+from jsonrpcserver import server as jsonrpc_server
+from jsonrpcserver.methods import Methods
 import logging
 
+from privex.rpcemulator import stats
+from privex.rpcemulator.asyncserver import (
+    async_serve, async_serve_forever, close_server, wait_server_closed, KEEPALIVE_TIMEOUT, MAX_BODY_SIZE,
+    MAX_KEEPALIVE_REQUESTS, METRICS_CONTENT_TYPE
+)
+from privex.rpcemulator.dispatcher import dispatch
+from privex.rpcemulator.faults import REJECT_BODIES, REJECT_HEADERS, injector
+from privex.rpcemulator.profiler import DEFAULT_INTERVAL, profile_path as _profile_path, start_profiler
+
 log = logging.getLogger(__name__)
 
 BASE_DIR = dirname(dirname(dirname(abspath(__file__))))
 
 
+class RequestHandler(jsonrpc_server.RequestHandler):
+    """
+    Same as :class:`jsonrpcserver.server.RequestHandler`, but requests are dispatched using
+    :func:`privex.rpcemulator.dispatcher.dispatch`, which handles batch requests as a single unit of work.
+    
+    Supports HTTP/1.1 persistent (keep-alive) connections, so clients can make many calls over one TCP connection.
+    Every response (including notifications, which get an empty ``204``) carries a ``Content-Length``, and the
+    connection is closed once it has been idle for ``keepalive_timeout`` seconds, or after ``max_requests``
+    requests have been served on it.
+    
+    The following settings are read from the server instance (see :func:`.make_server`):
+    
+     * ``keep_alive`` - whether connections may be kept open (only enabled on threaded servers, as a plain
+       :class:`http.server.HTTPServer` would be blocked by a single idle client)
+     * ``keepalive_timeout`` - close idle connections after this many seconds
+     * ``max_requests`` - close connections after serving this many requests
+     * ``max_batch_size`` - maximum number of calls allowed in a batch request
+     * ``metrics`` - serve Prometheus metrics from :mod:`privex.rpcemulator.stats` at ``GET /metrics``
+     * ``methods`` / ``context`` - the methods to serve, and the context entered around each request
+       (see :func:`privex.rpcemulator.dispatcher.dispatch`)
+     * ``router`` - if set, called with the request path to look up the context for each request, instead of
+       ``context`` - paths which it returns ``None`` for get a ``404`` (see :py:attr:`.Emulator.router`)
+     * ``batch_context`` - the context entered around the calls of each batch request
+       (see :py:attr:`.Emulator.batch_context`)
+    
+    When faults are configured (see :mod:`privex.rpcemulator.faults`), JsonRPC requests may be rejected by the rate
+    limit, have their connection closed after the request has been dispatched instead of receiving the response,
+    or receive the response slowly (slow drip).
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, so Nagle's algorithm would delay the body of each keep-alive response
+    disable_nagle_algorithm = True
+    timeout = KEEPALIVE_TIMEOUT
+    requests_served = 0
+    
+    def setup(self) -> None:
+        # StreamRequestHandler.setup applies self.timeout to the connection, making it our idle timeout
+        self.timeout = getattr(self.server, 'keepalive_timeout', self.timeout)
+        super().setup()
+    
+    def handle(self) -> None:
+        """Handle requests on this connection until it's closed - yielding to waiting connections on a pooled server"""
+        has_waiting = getattr(self.server, 'has_waiting', None)
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if has_waiting is not None and not self._await_request(has_waiting):
+                break
+            self.handle_one_request()
+    
+    def _pending(self) -> bool:
+        """Returns ``True`` if the next request (or EOF) can be read without blocking"""
+        self.connection.settimeout(0)
+        try:
+            # With a non-blocking socket, peek returns any buffered (pipelined) data, or b'' if nothing has arrived
+            if self.rfile.peek(1):
+                return True
+        except OSError:
+            # Let handle_one_request deal with the broken connection
+            return True
+        finally:
+            self.connection.settimeout(self.timeout)
+        return bool(select.select([self.connection], [], [], 0)[0])
+    
+    def _await_request(self, has_waiting, interval: float = 0.05) -> bool:
+        """
+        Wait up to ``self.timeout`` seconds for the next request on a keep-alive connection, giving up early if
+        ``has_waiting()`` reports other connections are waiting for this worker thread.
+        
+        :return bool ready: ``True`` if a request is ready to be read, ``False`` if the connection should be closed
+        """
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            if self._pending():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or has_waiting():
+                return False
+            if select.select([self.connection], [], [], min(remaining, interval))[0]:
+                return True
+    
+    def do_GET(self) -> None:
+        if not getattr(self.server, 'metrics', False):
+            return self.send_error(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported method ({self.command!r})")
+        if self.path != '/metrics':
+            return self.send_error(HTTPStatus.NOT_FOUND)
+        self._send_body(HTTPStatus.OK, stats.prometheus_text().encode(), METRICS_CONTENT_TYPE)
+    
+    def do_POST(self) -> None:
+        raw_length = self.headers["Content-Length"]
+        if raw_length is None:
+            return self.send_error(HTTPStatus.LENGTH_REQUIRED)
+        try:
+            length = int(raw_length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            return self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        try:
+            request = self.rfile.read(length).decode()
+        except UnicodeDecodeError:
+            return self.send_error(HTTPStatus.BAD_REQUEST, "Request body isn't valid UTF-8")
+        faulty = injector.active and not injector.exempt(request)
+        reject = injector.reject() if faulty else None
+        if reject is not None:
+            return self._send_body(reject, REJECT_BODIES[reject], "text/plain", REJECT_HEADERS)
+        server = self.server
+        context, router = getattr(server, 'context', None), getattr(server, 'router', None)
+        if router is not None:
+            context = router(self.path)
+            if context is None:
+                return self._send_body(HTTPStatus.NOT_FOUND)
+        response = dispatch(
+            request, getattr(server, 'methods', None), max_batch_size=getattr(server, 'max_batch_size', None),
+            context=context, batch_context=getattr(server, 'batch_context', None)
+        )
+        if faulty and injector.drop():
+            self.close_connection = True
+            return
+        drip = injector.drip if faulty else None
+        if response.wanted:
+            self._send_body(response.http_status, str(response).encode(), "application/json", drip=drip)
+        else:
+            self._send_body(HTTPStatus.NO_CONTENT)
+    
+    def _send_body(self, status: int, body: bytes = b'', content_type: str = None, headers: dict = None,
+                   drip: Tuple[int, float] = None):
+        """
+        Send a complete response, closing the connection afterwards unless it can be kept alive.
+        If ``drip`` is set to ``(chunk, interval)``, the body is sent ``chunk`` bytes at a time, ``interval`` seconds
+        apart.
+        """
+        self.requests_served += 1
+        max_requests = getattr(self.server, 'max_requests', MAX_KEEPALIVE_REQUESTS)
+        if not getattr(self.server, 'keep_alive', False) or (max_requests and self.requests_served >= max_requests):
+            self.close_connection = True
+        
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close" if self.close_connection else "keep-alive")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if not drip:
+            return self.wfile.write(body)
+        chunk, interval = drip
+        for i in range(0, len(body), chunk):
+            if i:
+                time.sleep(interval)
+            self.wfile.write(body[i:i + chunk])
+
+
 class QuietRequestHandler(RequestHandler):
     """
-    Same as :class:`jsonrpcserver.server.RequestHandler` but with logging disabled.
+    Same as :class:`.RequestHandler` but with logging disabled.
     """
     def log_message(self, format, *args):
         return
 
 
-def quiet_serve(name: str = "", port: int = 5000) -> None:
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Same as :class:`http.server.HTTPServer`, but handles each request in a new thread, so that slow or
+    concurrent clients don't queue behind each other.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    Same as :class:`.ThreadedHTTPServer`, but instead of spawning a thread per request, requests are handed off
+    to a fixed size :class:`concurrent.futures.ThreadPoolExecutor` with ``max_workers`` threads.
+    
+    As each keep-alive connection holds on to a worker, idle keep-alive connections are closed early whenever
+    other connections are waiting for a worker (see :py:meth:`.has_waiting`).
+    """
+    request_queue_size = 128
+
+    def __init__(self, server_address, RequestHandlerClass, max_workers: int = None, bind_and_activate=True):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate=bind_and_activate)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._waiting, self._waiting_lock = 0, threading.Lock()
+
+    def has_waiting(self) -> bool:
+        """Returns ``True`` if there are connections queued, waiting for a free worker thread"""
+        return self._waiting > 0
+
+    def process_request(self, request, client_address):
+        """Submit the request to the thread pool instead of handling it in the serving thread"""
+        with self._waiting_lock:
+            self._waiting += 1
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Same as :meth:`socketserver.ThreadingMixIn.process_request_thread` - runs inside a pool worker"""
+        with self._waiting_lock:
+            self._waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def bind_socket(name: str = "", port: int = 5000, backlog: int = 128) -> socket.socket:
+    """
+    Create a TCP socket which is bound to ``name`` : ``port`` and listening, so that it can be handed to a server
+    (e.g. via ``make_server(sock=sock)``) in another process.
+    
+    Pass ``port=0`` to let the OS pick a free port - the chosen port is available via ``sock.getsockname()[1]``
+    
+    :param str name: The address to listen on
+    :param int port: The port to listen on (``0`` to pick a free port)
+    :param int backlog: The maximum number of connections waiting to be accepted
+    :return socket.socket sock: The listening socket
+    """
+    sock = socket.socket(socket.AF_INET6 if ':' in name else socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((name, port))
+        sock.listen(backlog)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def make_server(name: str = "", port: int = 5000, handler: Type[RequestHandler] = RequestHandler,
+                threaded: bool = False, max_workers: int = None, sock: socket.socket = None,
+                max_batch_size: int = None, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                max_requests: int = MAX_KEEPALIVE_REQUESTS, metrics: bool = False, methods: Methods = None,
+                context: Callable[[], ContextManager] = None,
+                router: Callable[[str], Optional[Callable[[], ContextManager]]] = None,
+                batch_context: Callable[[], ContextManager] = None) -> HTTPServer:
+    """
+    Create (and bind) the HTTP server used to serve the JsonRPC methods, without starting it.
+    
+     * If ``threaded`` is ``False``, returns a plain :class:`http.server.HTTPServer` (one request at a time)
+     * If ``threaded`` is ``True`` and ``max_workers`` is set, returns a :class:`.PooledHTTPServer`
+     * If ``threaded`` is ``True`` and ``max_workers`` is ``None``, returns a :class:`.ThreadedHTTPServer`
+
+    :param str name: Server address.
+    :param int port: Server port.
+    :param handler: The request handler class, e.g. :class:`.QuietRequestHandler`
+    :param bool threaded: Handle requests concurrently using threads
+    :param int max_workers: Maximum amount of worker threads (only used when ``threaded`` is ``True``)
+    :param socket.socket sock: Use this already bound and listening socket (see :func:`.bind_socket`), instead of
+                               binding to ``name`` : ``port``
+    :param int max_batch_size: Maximum number of calls allowed in a batch request
+                               (default: :py:attr:`privex.rpcemulator.dispatcher.MAX_BATCH_SIZE`)
+    :param float keepalive_timeout: Close idle keep-alive connections after this many seconds
+    :param int max_requests: Close keep-alive connections after serving this many requests (``0`` for no limit)
+    :param bool metrics: Serve Prometheus metrics at ``GET /metrics`` (see :mod:`privex.rpcemulator.stats`)
+    :param Methods methods: Methods to serve (default: jsonrpcserver's global methods)
+    :param context: A function returning a context manager, entered around each request (e.g. to activate the
+                    state of an emulator, see :py:attr:`.Emulator.context`)
+    :param router: A function returning the ``context`` for a request path, or ``None`` if the path isn't found
+                   (see :py:attr:`.Emulator.router`)
+    :param batch_context: A function returning a context manager, entered around the calls of each batch request
+                          (see :py:attr:`.Emulator.batch_context`)
+    :return HTTPServer httpd: The bound HTTP server instance
+    
+    Keep-alive connections are only enabled when ``threaded`` is ``True`` - a non-threaded server handles one
+    connection at a time, so it closes each connection after responding.
+    """
+    kwargs = dict(bind_and_activate=sock is None)
+    if not threaded:
+        httpd = HTTPServer((name, port), handler, **kwargs)
+    elif max_workers:
+        httpd = PooledHTTPServer((name, port), handler, max_workers=max_workers, **kwargs)
+    else:
+        httpd = ThreadedHTTPServer((name, port), handler, **kwargs)
+    if sock is not None:
+        httpd.socket.close()
+        httpd.socket = sock
+        httpd.server_address = sock.getsockname()
+        httpd.server_name, httpd.server_port = name, httpd.server_address[1]
+    httpd.max_batch_size, httpd.keep_alive = max_batch_size, threaded
+    httpd.keepalive_timeout, httpd.max_requests, httpd.metrics = keepalive_timeout, max_requests, metrics
+    httpd.methods, httpd.context, httpd.router = methods, context, router
+    httpd.batch_context = batch_context
+    return httpd
+
+
+def quiet_serve(name: str = "", port: int = 5000, threaded: bool = False, max_workers: int = None,
+                sock: socket.socket = None, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                max_requests: int = MAX_KEEPALIVE_REQUESTS) -> None:
     """
     Quiet version of :py:func:`jsonrpcserver.serve` with logging disabled.
 
     Args:
         name: Server address.
         port: Server port.
+        threaded: Handle requests concurrently using threads (see :func:`.make_server`)
+        max_workers: Maximum amount of worker threads when ``threaded`` is ``True``
+        sock: Use this already bound and listening socket (see :func:`.bind_socket`)
+        keepalive_timeout: Close idle keep-alive connections after this many seconds (only when ``threaded``)
+        max_requests: Close keep-alive connections after serving this many requests (only when ``threaded``)
     """
-    log.info(" * Listening on port %s", port)
-    httpd = HTTPServer((name, port), QuietRequestHandler)
+    httpd = make_server(
+        name, port, QuietRequestHandler, threaded=threaded, max_workers=max_workers, sock=sock,
+        keepalive_timeout=keepalive_timeout, max_requests=max_requests
+    )
+    log.info(" * Listening on port %s", httpd.server_port)
     httpd.serve_forever()
 
 
-def _serve(host="", port=5000, quiet=False, use_coverage=False):
+def serve(name: str = "", port: int = 5000, threaded: bool = False, max_workers: int = None,
+          sock: socket.socket = None, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+          max_requests: int = MAX_KEEPALIVE_REQUESTS) -> None:
+    """
+    Same as :py:func:`jsonrpcserver.serve` (HTTP request logging enabled), but supports ``threaded``,
+    ``max_workers``, ``sock``, ``keepalive_timeout`` and ``max_requests`` like :func:`.quiet_serve`
     """
-    Wrapper function for :func:`jsonrpcserver.serve` and :func:`.quiet_serve`. Can be forked into background.
+    httpd = make_server(
+        name, port, RequestHandler, threaded=threaded, max_workers=max_workers, sock=sock,
+        keepalive_timeout=keepalive_timeout, max_requests=max_requests
+    )
+    log.info(" * Listening on port %s", httpd.server_port)
+    httpd.serve_forever()
+
+
+def _serve(host="", port=5000, quiet=False, use_coverage=False, threaded=False, max_workers=None, use_async=False,
+           sock: socket.socket = None, ready=None, profile: str = None, profile_path: str = None,
+           profile_interval: float = DEFAULT_INTERVAL, on_start: Callable[[], Any] = None, faults: dict = None,
+           **kwargs):
+    """
+    Wrapper function for :func:`.make_server` and :func:`privex.rpcemulator.asyncserver.async_serve_forever`.
+    Can be forked into background.
     
     Sets up SIGTERM hook using :py:func:`pytest_cov.embed.cleanup_on_sigterm` so coverage data is correctly
     saved when the subprocess is terminated.
+    
+    If ``profile`` is set (``cprofile`` or ``sample``), the server is profiled using
+    :func:`privex.rpcemulator.profiler.start_profiler`, which hooks the same SIGTERM path to write the profile to
+    ``profile_path`` when the subprocess is terminated.
+    
+    If ``ready`` is passed (e.g. a :class:`multiprocessing.Event`), then ``ready.set()`` is called once the server
+    is listening and about to start handling requests.
+    
+    If ``on_start`` is passed, it's called in the server process before the server is started (see
+    :py:meth:`.Emulator.start_worker`).
+    
+    If ``faults`` is passed, it's applied to the server process with
+    :py:meth:`privex.rpcemulator.faults.FaultInjector.configure` before the server is started.
+    
+    Any additional kwargs (e.g. ``max_batch_size``, ``keepalive_timeout``, ``max_requests``, ``methods``) are passed
+    through to :func:`.make_server` or :func:`privex.rpcemulator.asyncserver.async_serve`
     """
     # If this is being called from a unit test, then attempt to setup the pytest-cov SIGTERM hook to ensure
     # coverage data is generated correctly for this subprocess.
@@ -50,8 +399,34 @@ def _serve(host="", port=5000, quiet=False, use_coverage=False):
         except ImportError:
             warnings.warn("Could not import coverage module in child process...")
             pass
-    srv = quiet_serve if quiet else serve
-    srv(host, port)
+    # Installed after the coverage hook, so that on SIGTERM the profile is written first, then coverage is saved
+    finish = start_profiler(profile, profile_path, profile_interval) if profile else None
+    try:
+        if faults:
+            injector.configure(**faults)
+        if on_start is not None:
+            on_start()
+        if use_async:
+            return async_serve_forever(
+                host, port, quiet=quiet, sock=sock, ready=ready, max_workers=max_workers, **kwargs
+            )
+        handler = QuietRequestHandler if quiet else RequestHandler
+        httpd = make_server(host, port, handler, threaded=threaded, max_workers=max_workers, sock=sock, **kwargs)
+        log.info(" * Listening on port %s", httpd.server_port)
+        if ready is not None:
+            ready.set()
+        httpd.serve_forever()
+    finally:
+        if finish is not None:
+            finish()
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Returns the currently running event loop, or ``None`` if we're not inside of a coroutine"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
 
 class Emulator:
@@ -62,17 +437,138 @@ class Emulator:
     shutting down the process either via context management (``with`` statements), direct calls to
     :py:meth:`.terminate`, or when the object is garbage collected via :py:meth:`.__del__`
     
+    HTTP keep-alive (persistent) connections, and with them :py:attr:`.keepalive_timeout` and
+    :py:attr:`.max_requests`, only apply to the :mod:`http.server` backend when :py:attr:`.threaded` is enabled -
+    a non-threaded server handles one connection at a time, so it closes each connection after responding, rather
+    than letting one idle client block every other client. The AsyncIO backend (:py:attr:`.use_async`) always
+    supports keep-alive.
+    
     """
     proc: Optional[multiprocessing.Process]
     """Holds the :class:`multiprocessing.Process` background process instance for serve()"""
     
+    procs: List[multiprocessing.Process]
+    """Holds every background server process - one per worker (see :py:attr:`.workers`)"""
+    
+    server: Optional[asyncio.AbstractServer]
+    """When running inside of the caller's event loop (see :py:attr:`.use_async`), holds the :class:`asyncio.Server`"""
+    
+    server_task: Optional[asyncio.Task]
+    """When running inside of the caller's event loop, holds the :class:`asyncio.Task` which starts the server"""
+    
+    httpd: Optional[HTTPServer]
+    """When running in a thread of the current process (see :py:attr:`.in_process`), holds the HTTP server"""
+    
     quiet = False
     """Set ``Emulator.quiet = True`` to use :py:func:`.quiet_serve` (disable HTTP request logging)"""
     
     use_coverage = False
     """When running unit tests, this should be set to True to load coverage in the subprocess"""
     
-    def __init__(self, host="", port: int = 5000, background=True):
+    threaded = False
+    """Set ``Emulator.threaded = True`` to handle requests concurrently using threads by default"""
+    
+    max_workers: Optional[int] = None
+    """When :py:attr:`.threaded` is enabled, limit request handling to a pool of this many threads"""
+    
+    use_async = False
+    """
+    Set ``Emulator.use_async = True`` to use the AsyncIO server backend (:mod:`privex.rpcemulator.asyncserver`)
+    by default, instead of :class:`http.server.HTTPServer`
+    """
+    
+    ready_timeout = 10
+    """Maximum number of seconds to wait for the background server to start, when waiting for it to be ready"""
+    
+    max_batch_size: Optional[int] = None
+    """
+    Maximum number of calls allowed in a JsonRPC batch request
+    (``None`` = :py:attr:`privex.rpcemulator.dispatcher.MAX_BATCH_SIZE`)
+    """
+    
+    keepalive_timeout: float = KEEPALIVE_TIMEOUT
+    """Close idle HTTP keep-alive connections after this many seconds (see the class docstring for when they're used)"""
+    
+    max_requests: int = MAX_KEEPALIVE_REQUESTS
+    """
+    Close HTTP keep-alive connections after serving this many requests (``0`` for no limit). Keep-alive is only
+    used by threaded or async servers (see the class docstring).
+    """
+    
+    metrics = False
+    """
+    Set ``Emulator.metrics = True`` to serve per-method stats in the Prometheus text format at ``GET /metrics``
+    (the stats are always available via the ``emulator_stats`` RPC method, see :mod:`privex.rpcemulator.stats`)
+    """
+    
+    profile: Optional[str] = None
+    """
+    Set to ``cprofile`` or ``sample`` to profile the server process(es) - the profile is written to
+    :py:attr:`.profile_path` when the emulator is terminated. See :mod:`privex.rpcemulator.profiler`
+    """
+    
+    profile_path: Optional[str] = None
+    """
+    Where to write the profile - ``{pid}`` is replaced with the server's process ID
+    (default: ``rpcemulator-{pid}.prof`` or ``rpcemulator-{pid}.folded`` in the current directory)
+    """
+    
+    profile_interval: float = DEFAULT_INTERVAL
+    """Number of seconds between each stack sample when :py:attr:`.profile` is ``sample``"""
+    
+    profile_files: List[str]
+    """The profiles written by the server processes, available after the emulator has been terminated"""
+    
+    workers: int = 1
+    """
+    Number of server processes to fork, all accepting connections from the same listening socket. When more than one
+    worker is used, :py:meth:`.share_state` is called before forking, so that the workers share the emulator state.
+    """
+    
+    methods: Optional[Methods] = None
+    """
+    The JsonRPC methods served by this emulator (``None`` = jsonrpcserver's global methods). Emulators set this to
+    their own registry, so that several emulators with different methods can be served from one process.
+    """
+    
+    context: Optional[Callable[[], ContextManager]] = None
+    """
+    A function returning a context manager which is entered around each request - emulators with per-instance state
+    use this to make their state the one their methods act on (e.g. :py:meth:`.CoinState.activate`)
+    """
+    
+    router: Optional[Callable[[str], Optional[Callable[[], ContextManager]]]] = None
+    """
+    If set, used instead of :py:attr:`.context` to pick the context for each request from its URL path - e.g. to
+    serve several wallets at ``/wallet/<name>``. Requests to paths which it returns ``None`` for get a ``404``.
+    """
+    
+    batch_context: Optional[Callable[[], ContextManager]] = None
+    """
+    A function returning a context manager which is entered (inside of :py:attr:`.context`) around the calls of each
+    batch request - emulators use this to hold their state lock for the whole batch, and to cache data between the
+    calls (e.g. :func:`privex.rpcemulator.bitcoin.batch_snapshot`)
+    """
+    
+    faults: Optional[dict] = None
+    """
+    Faults to inject into the server's responses, as the kwargs of
+    :py:meth:`privex.rpcemulator.faults.FaultInjector.configure` - e.g. ``dict(latency={'*': 0.05})``. The faults can
+    also be changed at runtime via the ``emulator_faults`` RPC method. Fault settings belong to the server process,
+    so emulators served by the same process (``in_process`` or ``use_async`` without ``background``) share them.
+    """
+    
+    in_process = False
+    """
+    Set ``Emulator.in_process = True`` to serve from a daemon thread of the current process when ``background`` is
+    ``True``, instead of forking a server process. This avoids the memory and startup cost of a process per
+    emulator, and the emulator's state can be inspected directly - but requests compete with the caller for the GIL.
+    """
+    
+    def __init__(self, host="", port: int = 5000, background=True, threaded: bool = None, max_workers: int = None,
+                 use_async: bool = None, wait: bool = True, max_batch_size: int = None, workers: int = None,
+                 metrics: bool = None, profile: str = None, profile_path: str = None, in_process: bool = None,
+                 faults: dict = None):
         """
         Launch an RPC emulator web server. Without arguments, will fork into background at http://127.0.0.1:5000
 
@@ -99,15 +595,197 @@ class Emulator:
         :param str host: The IP address to listen on. If left as ``""`` - will listen at 127.0.0.1
         :param int port: The port number to listen on (Defaults to 5000)
         :param bool background: If ``True``, spawns the webserver in a sub-process, instead of blocking the app.
+        :param bool threaded: If ``True``, handle requests concurrently using threads (default: :py:attr:`.threaded`)
+        :param int max_workers: Handle requests using a pool of this many threads, instead of a thread per
+                                request. Only used when ``threaded`` is enabled, or as the size of the thread pool
+                                which runs the calls of the AsyncIO backend. (default: :py:attr:`.max_workers`)
+        :param bool use_async: If ``True``, serve requests using the AsyncIO server backend. When combined with
+                               ``background=False`` inside of a running event loop, the server is started inside of
+                               the caller's event loop instead of blocking (default: :py:attr:`.use_async`)
+        :param bool wait: If ``True`` (default), wait until the background server is ready to handle requests before
+                          returning (see :py:meth:`.wait_ready`). The listening socket is always bound before
+                          returning, so requests made before the server is ready will wait, rather than fail.
+        :param int max_batch_size: Maximum number of calls allowed in a batch request
+                                   (default: :py:attr:`.max_batch_size`)
+        :param int workers: Number of server processes to fork, sharing the same port, so that the emulator can use
+                            more than one CPU core (default: :py:attr:`.workers`). Only used when ``background``.
+        :param bool metrics: If ``True``, serve per-method stats in the Prometheus text format at ``GET /metrics``
+                             (default: :py:attr:`.metrics`)
+        :param str profile: Profile the server process(es) using ``cprofile`` or ``sample``, writing the profile
+                            when the emulator is terminated (default: :py:attr:`.profile`)
+        :param str profile_path: Where to write the profile, ``{pid}`` is replaced with the server's process ID.
+                                 With more than one worker, ``.{pid}`` is appended if it's missing
+                                 (default: :py:attr:`.profile_path`)
+        :param bool in_process: If ``True`` (and ``background``), serve from a daemon thread of this process using
+                                the :mod:`http.server` backend, instead of forking - ``workers``, ``use_async`` and
+                                ``profile`` aren't used (default: :py:attr:`.in_process`)
+        :param dict faults: Faults to inject into the server's responses (default: :py:attr:`.faults`), see
+                            :mod:`privex.rpcemulator.faults`
+        
+        To avoid port collisions when running tests in parallel, pass ``port=0`` to have the OS pick a free port -
+        the chosen port is available via :py:attr:`.port` as soon as the emulator is constructed.
         """
+        self.proc, self.server, self.server_task, self.procs, self._ready = None, None, None, [], []
+        self.host, self.port, self._shared, self.profile_files, self.httpd = host, port, False, [], None
+        workers = self.workers if workers is None else workers
+        threaded = self.threaded if threaded is None else threaded
+        max_workers = self.max_workers if max_workers is None else max_workers
+        use_async = self.use_async if use_async is None else use_async
+        in_process = self.in_process if in_process is None else in_process
+        self.max_batch_size = self.max_batch_size if max_batch_size is None else max_batch_size
+        self.metrics = self.metrics if metrics is None else metrics
+        self.faults = self.faults if faults is None else faults
+        self.profile = self.profile if profile is None else profile
+        self.profile_path = self.profile_path if profile_path is None else profile_path
+        if self.profile:
+            # Check the profiler name now, rather than finding out when the server process fails to start
+            _profile_path(self.profile, self.profile_path)
+            if workers > 1 and self.profile_path and '{pid}' not in self.profile_path:
+                self.profile_path += '.{pid}'
+        profile_options = dict(
+            profile=self.profile, profile_path=self.profile_path, profile_interval=self.profile_interval
+        )
+        self.server_options = dict(
+            max_batch_size=self.max_batch_size, keepalive_timeout=self.keepalive_timeout,
+            max_requests=self.max_requests, metrics=self.metrics, methods=self.methods, context=self.context,
+            router=self.router, batch_context=self.batch_context
+        )
         
+        if background and in_process:
+            self.start_thread(threaded=threaded, max_workers=max_workers)
+            return
+        if use_async and not background and _running_loop() is not None:
+            self.server_task = _running_loop().create_task(self.start_async())
+            return
         if not background:
-            _serve(host, port)
+            _serve(
+                host, port, self.quiet, threaded=threaded, max_workers=max_workers, use_async=use_async,
+                on_start=partial(self.start_worker, 0), faults=self.faults, **profile_options, **self.server_options
+            )
             return
-        t = multiprocessing.Process(target=_serve, args=(host, port, self.quiet, self.use_coverage))
-        t.daemon = True
-        t.start()
-        self.proc = t
+        # Bind the socket in this process, so that the port is known immediately (even if port=0), and any requests
+        # made before the server process has started are queued in the socket backlog instead of being refused.
+        sock = bind_socket(host, port, backlog=128 * max(1, workers))
+        self.port = sock.getsockname()[1]
+        if workers > 1:
+            self.share_state()
+            self._shared = True
+        # Every worker inherits the same listening socket, and the kernel hands each new connection to one of them
+        for i in range(max(1, workers)):
+            ready = multiprocessing.Event()
+            t = multiprocessing.Process(target=_serve, kwargs=dict(
+                host=host, port=self.port, quiet=self.quiet, use_coverage=self.use_coverage, threaded=threaded,
+                max_workers=max_workers, use_async=use_async, sock=sock, ready=ready,
+                on_start=partial(self.start_worker, i), faults=self.faults, **profile_options, **self.server_options
+            ))
+            t.daemon = True
+            t.start()
+            self.procs.append(t)
+            self._ready.append(ready)
+        self.proc = self.procs[0]
+        # The server processes have their own copy of the socket - close ours, so the port is released once they exit.
+        sock.close()
+        if wait:
+            self.wait_ready()
+
+    def start_thread(self, threaded: bool = None, max_workers: int = None) -> HTTPServer:
+        """
+        Start serving from a daemon thread of the current process (see :py:attr:`.in_process`), listening on
+        :py:attr:`.host` and :py:attr:`.port`. Called automatically when constructed with ``in_process=True``.
+        
+        :param bool threaded: Handle requests concurrently using threads (default: :py:attr:`.threaded`)
+        :param int max_workers: Maximum amount of worker threads when ``threaded`` (default: :py:attr:`.max_workers`)
+        :return HTTPServer httpd: The running HTTP server (also available via :py:attr:`.httpd`)
+        """
+        threaded = self.threaded if threaded is None else threaded
+        max_workers = self.max_workers if max_workers is None else max_workers
+        sock = bind_socket(self.host, self.port)
+        self.port = sock.getsockname()[1]
+        handler = QuietRequestHandler if self.quiet else RequestHandler
+        if self.faults:
+            injector.configure(**self.faults)
+        httpd = make_server(
+            self.host, self.port, handler, threaded=threaded, max_workers=max_workers, sock=sock, **self.server_options
+        )
+        self.start_worker(0)
+        # A short poll interval, so that terminate() doesn't wait long for serve_forever to notice the shutdown
+        thread = threading.Thread(
+            target=httpd.serve_forever, args=(0.1,), name=f'Emulator-{self.port}', daemon=True
+        )
+        thread.start()
+        self.httpd = httpd
+        return httpd
+
+    def wait_ready(self, timeout: float = None) -> int:
+        """
+        Wait until the background server process is ready to handle requests.
+        
+        :param float timeout: Maximum number of seconds to wait (default: :py:attr:`.ready_timeout`)
+        :raises TimeoutError: When the server didn't become ready within ``timeout`` seconds
+        :raises ChildProcessError: When a server process exited before it became ready
+        :return int port: The port that the server is listening on
+        """
+        timeout = self.ready_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        for proc, ready in zip(self.procs, self._ready):
+            while not ready.wait(0.05):
+                if not proc.is_alive():
+                    raise ChildProcessError(f"Emulator server process exited before it was ready (port {self.port})")
+                if time.time() > deadline:
+                    raise TimeoutError(f"Emulator server wasn't ready after {timeout} seconds (port {self.port})")
+        return self.port
+
+    def share_state(self):
+        """
+        Called in the parent process before forking more than one worker (see :py:attr:`.workers`).
+        
+        Each worker is a separate process, so any state which is changed by RPC calls (e.g. a wallet's transactions)
+        must be moved into a backend shared by every worker, and guarded by a cross-process lock - otherwise each
+        worker would only see the changes made by requests which it served itself.
+        
+        The base emulator has no state, so this does nothing - emulators with state should override this, along
+        with :py:meth:`.unshare_state`
+        """
+        pass
+
+    def unshare_state(self):
+        """Called after the workers have been terminated, to undo :py:meth:`.share_state` in the parent process"""
+        pass
+
+    def start_worker(self, index: int):
+        """
+        Called in each server process before it starts serving requests, with the worker's ``index`` (``0`` to
+        ``workers - 1``) - or in the current process when the server isn't ran in the background.
+        
+        Emulators can override this to start background tasks which should only run once per server (e.g. when
+        ``index == 0``). The base emulator does nothing.
+        """
+        pass
+
+    async def start_async(self) -> asyncio.AbstractServer:
+        """
+        Start the AsyncIO server backend inside of the current event loop, listening on :py:attr:`.host` and
+        :py:attr:`.port`. Called automatically when constructed with ``use_async=True, background=False`` from
+        inside of a running event loop.
+
+        **Using with an Async Context Manager**::
+            >>> from privex.rpcemulator.base import Emulator
+            >>>
+            >>> async with Emulator(use_async=True, background=False):
+            ...     # make some queries to the RPC at https://127.0.0.1:5000
+            ...
+            >>> # Once the `async with` statement is over, the JsonRPC server is closed
+        
+        """
+        sock = bind_socket(self.host, self.port)
+        self.port = sock.getsockname()[1]
+        if self.faults:
+            injector.configure(**self.faults)
+        self.start_worker(0)
+        self.server = await async_serve(
+            self.host, self.port, quiet=self.quiet, sock=sock, max_workers=self.max_workers, **self.server_options
+        )
+        return self.server
 
     def terminate(self):
         """
@@ -117,6 +795,23 @@ class Emulator:
         """
         self.__del__()
     
+    async def terminate_async(self):
+        """Same as :py:meth:`.terminate`, but also waits for an in-loop AsyncIO server to finish closing"""
+        server = self.server
+        self.terminate()
+        if server is not None:
+            await wait_server_closed(server)
+    
+    async def __aenter__(self):
+        """Called at the start of an ``async with`` statement - waits for an in-loop server to start listening"""
+        if self.server_task is not None:
+            await self.server_task
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """When an ``async with`` statement has ended, calls :py:meth:`.terminate_async` to close the server"""
+        await self.terminate_async()
+    
     def __enter__(self):
         """Called at the start of a ``with`` statement for context management"""
         return self
@@ -133,6 +828,24 @@ class Emulator:
         
         When the instance is garbage collected, or ``del someinstance`` is called, this method should get triggered.
         """
-        if self.proc is not None and self.proc.is_alive():
-            self.proc.terminate()
-        self.proc = None
+        procs = getattr(self, 'procs', None) or []
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        if getattr(self, 'server', None) is not None:
+            close_server(self.server)
+        if getattr(self, 'httpd', None) is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        # Wait for the workers to exit if they're writing a profile, or using the shared state
+        profile = getattr(self, 'profile', None)
+        if procs and (profile or getattr(self, '_shared', False)):
+            for proc in procs:
+                proc.join(5)
+        if profile:
+            self.profile_files += [_profile_path(profile, self.profile_path, pid=proc.pid) for proc in procs]
+        if getattr(self, '_shared', False):
+            self._shared = False
+            self.unshare_state()
+        self.proc, self.procs, self.server = None, [], None
@@ -0,0 +1,282 @@
+"""
+Benchmark harness for the Bitcoin RPC emulator - starts a :class:`privex.rpcemulator.bitcoin.BitcoinEmulator`,
+seeds it with ``N`` transactions, then drives a weighted mix of JsonRPC calls from concurrent clients, and reports
+the throughput plus p50/p99 latency of each method as JSON.
+
+Usage::
+
+    user@host: ~/rpcemulator $ python3 -m privex.rpcemulator.benchmark -n 100000 -c 8 -r 5000 \\
+                                   --mix getbalance=4,listtransactions=3,gettransaction=2,sendtoaddress=1
+    {
+      "config": {"transactions": 100000, "clients": 8, "requests": 5000, ...},
+      "total": {"requests": 5000, "errors": 0, "seconds": 1.92, "rps": 2604.1, "p50_ms": 2.6, "p99_ms": 9.1, ...},
+      "methods": {
+        "getbalance": {"requests": 2013, "errors": 0, "rps": 1048.4, "p50_ms": 1.9, "p99_ms": 7.2, ...},
+        ...
+      }
+    }
+
+Batched payouts can be measured with ``--mix sendmany --payouts 1000`` - each ``sendmany`` call pays to
+``--payouts`` derived addresses, while ``--mix listunspent`` pages through the UTXOs of a random wallet address.
+The raw transaction methods can be measured with
+``--mix createrawtransaction,signrawtransactionwithwallet,decoderawtransaction``, using transactions which spend the
+wallet's largest UTXOs.
+
+Server options such as ``--threaded``, ``--max-workers``, ``--async`` and ``--workers`` are passed through to the
+emulator, so the same mix can be compared across server backends (or against an SQLite wallet using ``--store``).
+Add ``--profile sample`` (or ``--profile cprofile``) to profile the emulator while it's under load - see
+:mod:`privex.rpcemulator.profiler`.
+
+Benchmarks can also be run from Python, which returns the report as a dictionary::
+
+    >>> from privex.rpcemulator.benchmark import run_benchmark
+    >>> report = run_benchmark(transactions=10000, clients=4, requests=1000, threaded=True)
+    >>> report['methods']['getbalance']['p99_ms']
+    3.71
+
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Union
+
+from privex.rpcemulator import bitcoin
+from privex.rpcemulator.addresses import derive_addresses
+from privex.rpcemulator.store import BaseTransactionStore, TransactionStore
+
+DEFAULT_MIX = {'getbalance': 4, 'listtransactions': 3, 'gettransaction': 2, 'sendtoaddress': 1}
+"""Default request mix - relative weights for how often each method is called"""
+
+TXID_SAMPLE = 1000
+"""Maximum number of TXIDs sampled from the wallet to use for ``gettransaction`` calls"""
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    """
+    Parse a request mix string into a dictionary of ``{method: weight}``
+
+        >>> parse_mix('getbalance=4,gettransaction=1')
+        {'getbalance': 4, 'gettransaction': 1}
+        >>> parse_mix('getbalance,listtransactions')
+        {'getbalance': 1, 'listtransactions': 1}
+
+    """
+    res = {}
+    for item in mix.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        res[name.strip()] = int(weight) if weight else 1
+    for name in res:
+        if name not in METHOD_PARAMS:
+            raise ValueError(f"Unsupported method '{name}' in mix. Supported methods: {', '.join(METHOD_PARAMS)}")
+    return res
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Return the ``pct`` percentile (0 - 100) of the **sorted** list ``values`` using the nearest-rank method"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def _summarise(latencies: List[float], errors: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return dict(
+        requests=count, errors=errors, rps=round(count / seconds, 1) if seconds else 0.0,
+        mean_ms=round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        p50_ms=round(percentile(latencies, 50) * 1000, 3), p90_ms=round(percentile(latencies, 90) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        max_ms=round(latencies[-1] * 1000, 3) if count else 0.0,
+    )
+
+
+METHOD_PARAMS = {
+    'getbalance': lambda rng, ctx: [],
+    'listtransactions': lambda rng, ctx: ['*', 10, rng.randint(0, ctx['list_skip'])],
+    'gettransaction': lambda rng, ctx: [rng.choice(ctx['txids'])],
+    'sendtoaddress': lambda rng, ctx: [ctx['send_address'], ctx['send_amount']],
+    'sendmany': lambda rng, ctx: ['', {addr: ctx['send_amount'] for addr in ctx['payout_addresses']}],
+    'getreceivedbyaddress': lambda rng, ctx: [rng.choice(ctx['addresses'])],
+    'validateaddress': lambda rng, ctx: [rng.choice(ctx['addresses'])],
+    'listunspent': lambda rng, ctx: [1, 9999999, [rng.choice(ctx['addresses'])], True, {'maximumCount': 100}],
+    'createrawtransaction': lambda rng, ctx: [
+        [rng.choice(ctx['raw_inputs'])], {ctx['send_address']: ctx['send_amount']}
+    ],
+    'signrawtransactionwithwallet': lambda rng, ctx: [rng.choice(ctx['unsigned_txs'])],
+    'decoderawtransaction': lambda rng, ctx: [rng.choice(ctx['signed_txs'])],
+    'getblockchaininfo': lambda rng, ctx: [],
+    'getnetworkinfo': lambda rng, ctx: [],
+}
+"""Functions which generate the parameters for each supported benchmark method, given ``(random, context)``"""
+
+
+def _client(port: int, plan: List[str], ctx: dict, seed: int, host: str = '127.0.0.1'):
+    """
+    Make each request in ``plan`` over a single (keep-alive where the server allows it) HTTP connection.
+
+    :return tuple results: A list of ``(method, seconds, ok)`` tuples
+    """
+    rng, results = random.Random(seed), []
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    headers = {'Content-Type': 'application/json'}
+    try:
+        for i, name in enumerate(plan):
+            body = json.dumps(dict(jsonrpc='2.0', id=i, method=name, params=METHOD_PARAMS[name](rng, ctx)))
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/', body, headers)
+                res = conn.getresponse()
+                data = res.read()
+                ok = res.status == 200 and 'error' not in json.loads(data)
+            except (OSError, http.client.HTTPException, ValueError):
+                conn.close()
+                ok = False
+            results.append((name, time.perf_counter() - start, ok))
+    finally:
+        conn.close()
+    return results
+
+
+def _sample_txids(store: BaseTransactionStore, rng: random.Random, count: int = TXID_SAMPLE) -> List[str]:
+    total = len(store)
+    positions = range(total) if total <= count else rng.sample(range(total), count)
+    return [store[i]['txid'] for i in positions]
+
+
+def run_benchmark(transactions: int = 10000, clients: int = 4, requests: int = 1000,
+                  mix: Union[str, Dict[str, int]] = None, seed: int = 1, store: str = None,
+                  send_amount: str = '0.00001', warmup: int = 0, payouts: int = 100, **emulator_kwargs) -> dict:
+    """
+    Start a :class:`privex.rpcemulator.bitcoin.BitcoinEmulator` on a free port, seed it with ``transactions``
+    fake transactions, then make ``requests`` JsonRPC calls from ``clients`` concurrent clients, picking each
+    method randomly according to the weights in ``mix``.
+
+    Each ``sendmany`` call pays ``send_amount`` to each of ``payouts`` addresses, derived from ``seed`` with
+    :func:`privex.rpcemulator.addresses.derive_addresses`.
+
+    The emulator's transaction store is restored after the benchmark, so this is safe to call from tests.
+
+    :param int transactions: Number of transactions to seed the wallet with (generated with
+                             :func:`privex.rpcemulator.bitcoin.j_add_txs`)
+    :param int clients: Number of concurrent clients, each with their own HTTP connection
+    :param int requests: Total number of requests to make (split evenly between clients)
+    :param mix: Request mix - either a dict of ``{method: weight}`` or a string parsed by :func:`.parse_mix`
+    :param int seed: Random seed used for seeding the wallet and picking the request mix
+    :param str store: Optional path to an SQLite wallet database, instead of the in-memory store
+    :param str send_amount: The amount sent by each ``sendtoaddress`` call
+    :param int warmup: Number of times each client calls every method in ``mix`` before measuring
+    :param int payouts: Number of outputs in each ``sendmany`` call
+    :param emulator_kwargs: Additional server options passed to :class:`.BitcoinEmulator`, e.g. ``threaded=True``
+    :return dict report: A dictionary containing ``config``, ``total`` and per-method ``methods`` statistics
+    """
+    mix = dict(DEFAULT_MIX) if mix is None else (parse_mix(mix) if isinstance(mix, str) else dict(mix))
+    rng = random.Random(seed)
+    orig_store = bitcoin.internal['transactions']
+    payout_addresses = derive_addresses(f'payouts-{seed}', 0, payouts)
+    try:
+        wallet = bitcoin.j_use_store(store if store else TransactionStore(bitcoin.DEFAULT_TRANSACTIONS))
+        if transactions:
+            bitcoin.j_add_txs(transactions, seed=seed, category='receive')
+        send_address = sorted(bitcoin.internal['addresses'].external)[0]
+        # Raw transactions spending some of the largest UTXOs, for the raw transaction methods
+        raw_inputs = [
+            dict(txid=u['txid'], vout=u['vout']) for u in bitcoin.listunspent(0, query_options={'maximumCount': 100})
+        ]
+        unsigned = [bitcoin.createrawtransaction([i], {send_address: send_amount}) for i in raw_inputs]
+        ctx = dict(
+            txids=_sample_txids(wallet, rng), addresses=list(bitcoin.internal['addresses']),
+            send_address=send_address, send_amount=send_amount,
+            list_skip=max(0, min(len(wallet) - 10, 1000)), payout_addresses=payout_addresses,
+            raw_inputs=raw_inputs, unsigned_txs=unsigned,
+            signed_txs=[bitcoin.signrawtransactionwithwallet(raw)['hex'] for raw in unsigned],
+        )
+        wallet_size = len(wallet)
+        names, weights = list(mix.keys()), list(mix.values())
+        plans = [[] for _ in range(clients)]
+        for i in range(requests):
+            plans[i % clients].append(rng.choices(names, weights)[0])
+
+        # The wallet is inherited by the forked emulator process, so it must be seeded before the emulator starts
+        with bitcoin.BitcoinEmulator(port=0, **emulator_kwargs) as emu:
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                if warmup:
+                    list(pool.map(lambda c: _client(emu.port, names * warmup, ctx, seed + c), range(clients)))
+                start = time.perf_counter()
+                futures = [pool.submit(_client, emu.port, plan, ctx, seed + c) for c, plan in enumerate(plans)]
+                results = [r for f in futures for r in f.result()]
+                seconds = time.perf_counter() - start
+    finally:
+        if bitcoin.internal['transactions'] is not orig_store:
+            if store:
+                bitcoin.internal['transactions'].close()
+            bitcoin.j_use_store(orig_store)
+
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for name, taken, ok in results:
+        latencies[name].append(taken)
+        if not ok:
+            errors[name] += 1
+
+    return dict(
+        config=dict(
+            transactions=transactions, clients=clients, requests=requests, mix=mix, seed=seed, store=store,
+            payouts=payouts, wallet_size=wallet_size, server=dict(emulator_kwargs),
+        ),
+        total=dict(seconds=round(seconds, 3), **_summarise([r[1] for r in results], sum(errors.values()), seconds)),
+        methods={name: _summarise(latencies[name], errors[name], seconds) for name in names if latencies[name]},
+    )
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Bitcoin RPC emulator with concurrent clients, and output the results as JSON'
+    )
+    parser.add_argument('-n', '--transactions', type=int, default=10000, help='Number of transactions to seed')
+    parser.add_argument('-c', '--clients', type=int, default=4, help='Number of concurrent clients')
+    parser.add_argument('-r', '--requests', type=int, default=1000, help='Total number of requests to make')
+    parser.add_argument('-m', '--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help='Request mix as comma separated method=weight pairs (default: %(default)s)')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='Random seed (default: %(default)s)')
+    parser.add_argument('-w', '--warmup', type=int, default=0, help='Warmup rounds per client')
+    parser.add_argument('-p', '--payouts', type=int, default=100, help='Number of outputs per sendmany call')
+    parser.add_argument('--store', default=None, help='Use this SQLite wallet database instead of the memory store')
+    parser.add_argument('--threaded', action='store_true', help='Handle requests concurrently using threads')
+    parser.add_argument('--max-workers', type=int, default=None, help='Size of the thread pool (with --threaded)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Use the AsyncIO server backend')
+    parser.add_argument('--workers', type=int, default=1, help='Number of server processes (default: %(default)s)')
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], default=None,
+                        help='Profile the emulator server process(es) (see privex.rpcemulator.profiler)')
+    parser.add_argument('--profile-path', default=None, help='Where to write the profile ({pid} = server process ID)')
+    parser.add_argument('-o', '--output', default=None, help='Write the JSON report to this file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    server = dict(threaded=args.threaded, use_async=args.use_async, workers=args.workers)
+    if args.max_workers:
+        server['max_workers'] = args.max_workers
+    if args.profile:
+        server.update(profile=args.profile, profile_path=args.profile_path)
+    bitcoin.BitcoinEmulator.quiet = True
+    report = run_benchmark(
+        transactions=args.transactions, clients=args.clients, requests=args.requests, mix=parse_mix(args.mix),
+        seed=args.seed, store=args.store, warmup=args.warmup, payouts=args.payouts, **server
+    )
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(out + '\n')
+    else:
+        print(out)
+    return 1 if report['total']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
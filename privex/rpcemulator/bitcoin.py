@@ -28,99 +28,373 @@ Basic Usage::
 
 
 """
+import hashlib
+import heapq
+import math
+import multiprocessing
+import os
 import random
 import logging
+import tempfile
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import Union, Dict, List, Tuple, Optional
+from decimal import Decimal, ROUND_UP
+from functools import partial
+from urllib.parse import unquote, urlsplit
+from typing import Any, Callable, Union, Dict, List, Tuple, Optional, Iterator, Sequence
 from jsonrpcserver import method
+from jsonrpcserver.methods import Methods, global_methods
 from faker import Faker
 from privex.helpers import is_true, dec_round
 
+from privex.rpcemulator.addresses import AddressRegistry, address_hash, derive_addresses
 from privex.rpcemulator.base import Emulator
+from privex.rpcemulator.coins import BITCOIN, CoinProfile
+from privex.rpcemulator.mempool import MAX_BLOCK_WEIGHT, tx_vsize
+from privex.rpcemulator.rawtx import (
+    SIGHASH_TYPES, Transaction, TxIn, TxOut, decode_hex, nulldata_script, p2pkh_script, p2pkh_script_sig,
+    script_address, script_asm, script_type, serialize_transaction
+)
+from privex.rpcemulator.store import (
+    BaseTransactionStore, SqliteTransactionStore, TransactionStore, block_hash, block_hash_height
+)
 
 log = logging.getLogger(__name__)
 
-internal = {
-    "transactions": [
-        dict(
-            account='', address='1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', amount=Decimal('0.1'), category='receive',
-            txid='db3f9b83bc7c53483e98a8714b61fc667772e1856333f290e2543186947ee939', confirmations=5, time=1572020407,
-            label='', vout=0, generated=False
-        ),
-        dict(
-            account='', address='13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp', amount=Decimal('0.03'), category='receive',
-            txid='fccacaffcb0a0a104274f1caa0b710e5a58b78f774629bfdcae99d544750e655', confirmations=26, time=1572279928,
-            label='', vout=0, generated=False
-        ),
-        dict(
-            account='', address='1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW', amount=Decimal('0.05'), category='receive',
-            txid='e20ec2d1d56c7a2cc286a323ab4af4a990d9d23ca779ef1b0c0ad8e337e76d87', confirmations=28, time=1571928625,
-            label='', vout=0, generated=False
-        ),
-    
-    ],
-    "addresses": [
-        '13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp', '12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV',
-        '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW',
-        '18VstwHr1CWYPremjpJWTDNQvJmrPbdoef', '1GrZfggs26g3MMfATeRZCt2nEMmMSpJtVb',
-        '1Br7KPLQJFuS2naqidyzdciWUYhnMZAzKA',
-        '1ni4jkof1JAiuG7r3cnnDaCh9pk1gXZCG', '1Zr95UjPJBrUM8yXojNCYEjiX7uvbg6vM', '12AAGLe6BCoTfH1sKBXyUkzhSADoNgreAY',
-        '1eS2hvVhiiA56hKd5JVMu9GrYvyLqfZ6q', '1PiXyqVnqv3TjEmBNESU3ZcTktZUZyZqnz', '1ASCd3gLBkMUtXXgLSMESUjAakth5iqvHM',
-        '18iHXvsy57NiNmC7rWRm5X6rW6DSzWPAhP', '1BNqgLyNTFbFjGLR4sQMDX8E1F3rM8KBzT',
-        '1ALEM4xrGPjSfcmLGica1Ygf3gsy9oPJgP',
-        '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', '1JBLYpceHDrPkhzWvP4o5bPo7tFMHPEYJ3',
-        '1GWh8RfFDZrD9ooSAUpNQhUsFyyHaRfUye',
-        '1J2VishkhGviaEZA5dYgrqW1bjV8JGKFj', '1MuncCP7uUicoL7bouyemZ3XqL5fC33J5V',
-    ],
-    "external_addresses": [
-        "13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR", "165GagcJtj4LtvM94BDrM2nfBfnfX1gQxc",
-        "17EZkTedEnhEHe6yyy48YX1goAuP92DMUy", "1L5mrvowocD5rZdHWSBeacBZzMxAeGY6Rj",
-    ],
-    "getblockchaininfo":  dict(
-        chain="main", blocks=601440, headers=601440,
-        bestblockhash="00000000000000000000d6e50e9a20b98936b7833069a30e1e86c3d722d8a176", difficulty=13691480038694.45,
-        mediantime=1572303763, verificationprogress=0.9999950714588575, initialblockdownload=False,
-        chainwork="000000000000000000000000000000000000000009a65702bd04b8615352b4f7", size_on_disk=279953979777,
-        pruned=False, softforks=[], bip9_softforks={}, warnings=""
+DEFAULT_TRANSACTIONS = [
+    dict(
+        account='', address='1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', amount=Decimal('0.1'), category='receive',
+        txid='db3f9b83bc7c53483e98a8714b61fc667772e1856333f290e2543186947ee939', confirmations=5, time=1572020407,
+        label='', vout=0, generated=False
     ),
-    "getnetworkinfo":     dict(
-        version=170100, subversion="/Satoshi:0.17.1/", protocolversion=70015, localservices="000000000000040d",
-        localrelay=True, timeoffset=0, networkactive=True, connections=8,
+    dict(
+        account='', address='13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp', amount=Decimal('0.03'), category='receive',
+        txid='fccacaffcb0a0a104274f1caa0b710e5a58b78f774629bfdcae99d544750e655', confirmations=26, time=1572279928,
+        label='', vout=0, generated=False
+    ),
+    dict(
+        account='', address='1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW', amount=Decimal('0.05'), category='receive',
+        txid='e20ec2d1d56c7a2cc286a323ab4af4a990d9d23ca779ef1b0c0ad8e337e76d87', confirmations=28, time=1571928625,
+        label='', vout=0, generated=False
+    ),
+]
+"""The ``receive`` transactions which are loaded into a new wallet, so that it has a balance to send from"""
+
+
+def _network_info(coin: CoinProfile) -> dict:
+    """The ``getnetworkinfo`` result of a node of ``coin``"""
+    relayfee = float(coin.relay_fee)
+    return dict(
+        version=coin.version, subversion=coin.subversion, protocolversion=coin.protocol_version,
+        localservices="000000000000040d", localrelay=True, timeoffset=0, networkactive=True, connections=8,
         networks=[
             dict(name="ipv4", limited=False, reachable=True, proxy="", proxy_randomize_credentials=False),
             dict(name="ipv6", limited=False, reachable=True, proxy="", proxy_randomize_credentials=False),
             dict(name="onion", limited=True, reachable=False, proxy="", proxy_randomize_credentials=False)
         ],
-        relayfee=0.00001000, incrementalfee=0.00001000,
+        relayfee=relayfee, incrementalfee=relayfee,
         localaddresses=[
-            dict(address="127.0.0.1", port=8333, score=1),
-            dict(address="::1", port=8333, score=1)
+            dict(address="127.0.0.1", port=coin.p2p_port, score=1),
+            dict(address="::1", port=coin.p2p_port, score=1)
         ],
         warnings=""
     )
+
+
+_BLOCKCHAIN_INFO = dict(
+    chain="main", blocks=601440, headers=601440,
+    bestblockhash="00000000000000000000d6e50e9a20b98936b7833069a30e1e86c3d722d8a176", difficulty=13691480038694.45,
+    mediantime=1572303763, verificationprogress=0.9999950714588575, initialblockdownload=False,
+    chainwork="000000000000000000000000000000000000000009a65702bd04b8615352b4f7", size_on_disk=279953979777,
+    pruned=False, softforks=[], bip9_softforks={}, warnings=""
+)
+
+_default_internal = {
+    "transactions": TransactionStore(DEFAULT_TRANSACTIONS),
+    "addresses": AddressRegistry(
+        [
+            '13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp', '12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV',
+            '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW',
+            '18VstwHr1CWYPremjpJWTDNQvJmrPbdoef', '1GrZfggs26g3MMfATeRZCt2nEMmMSpJtVb',
+            '1Br7KPLQJFuS2naqidyzdciWUYhnMZAzKA',
+            '1ni4jkof1JAiuG7r3cnnDaCh9pk1gXZCG', '1Zr95UjPJBrUM8yXojNCYEjiX7uvbg6vM',
+            '12AAGLe6BCoTfH1sKBXyUkzhSADoNgreAY', '1eS2hvVhiiA56hKd5JVMu9GrYvyLqfZ6q',
+            '1PiXyqVnqv3TjEmBNESU3ZcTktZUZyZqnz', '1ASCd3gLBkMUtXXgLSMESUjAakth5iqvHM',
+            '18iHXvsy57NiNmC7rWRm5X6rW6DSzWPAhP', '1BNqgLyNTFbFjGLR4sQMDX8E1F3rM8KBzT',
+            '1ALEM4xrGPjSfcmLGica1Ygf3gsy9oPJgP',
+            '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', '1JBLYpceHDrPkhzWvP4o5bPo7tFMHPEYJ3',
+            '1GWh8RfFDZrD9ooSAUpNQhUsFyyHaRfUye',
+            '1J2VishkhGviaEZA5dYgrqW1bjV8JGKFj', '1MuncCP7uUicoL7bouyemZ3XqL5fC33J5V',
+        ],
+        external=[
+            "13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR", "165GagcJtj4LtvM94BDrM2nfBfnfX1gQxc",
+            "17EZkTedEnhEHe6yyy48YX1goAuP92DMUy", "1L5mrvowocD5rZdHWSBeacBZzMxAeGY6Rj",
+        ],
+    ),
+    "getblockchaininfo": dict(_BLOCKCHAIN_INFO),
+    "getnetworkinfo": _network_info(BITCOIN),
+    "max_block_weight": MAX_BLOCK_WEIGHT,
+    "paytxfee": Decimal(0),
 }
+
+
+def _new_internal(coin: CoinProfile, seed: Union[str, bytes] = None) -> dict:
+    """
+    Create the ``internal`` dict of a new wallet for ``coin`` (see :py:attr:`.internal`) - with 20 addresses derived
+    from ``seed`` (default: random), and the :py:attr:`.DEFAULT_TRANSACTIONS` received into the first three of them.
+    """
+    addresses = AddressRegistry(seed=seed, version=coin.p2pkh_version)
+    own = addresses.generate(20)
+    addresses.add_external(derive_addresses(addresses.seed + b'-external', 0, 4, coin.p2pkh_version))
+    transactions = [
+        dict(tx, address=own[i], txid=hashlib.sha256(addresses.seed + tx['txid'].encode()).hexdigest())
+        for i, tx in enumerate(DEFAULT_TRANSACTIONS)
+    ]
+    return {
+        "transactions": TransactionStore(transactions, decimals=coin.decimals),
+        "addresses": addresses,
+        "getblockchaininfo": dict(_BLOCKCHAIN_INFO),
+        "getnetworkinfo": _network_info(coin),
+        "max_block_weight": MAX_BLOCK_WEIGHT,
+        "paytxfee": Decimal(0),
+    }
+
+
+class CoinState:
+    """
+    The wallet and chain state of one emulated coin daemon - its ``internal`` dict (see :py:attr:`.internal`), the
+    lock which guards it, and the :class:`.CoinProfile` of the coin.
+    
+    The module level :py:attr:`.internal` and :py:attr:`.internal_lock` refer to the state which is active in the
+    current context (see :py:meth:`.activate`) - or the default Bitcoin state, when no other state is active. Each
+    :class:`.BitcoinEmulator` activates its own state around every request it serves, so several emulators (e.g.
+    different coins) can be served by one process without sharing their wallets::
+    
+        >>> from privex.rpcemulator.coins import LITECOIN
+        >>> ltc = CoinState(LITECOIN, seed='ltc')
+        >>> with ltc.activate():
+        ...     getnewaddress()
+        'LaAaiwpsbdy432Y15i7YnG3cLod9ayKDAA'
+    
+    """
+    def __init__(self, coin: CoinProfile = BITCOIN, internal: dict = None, lock=None, seed: Union[str, bytes] = None,
+                 name: str = ""):
+        """
+        :param CoinProfile coin: The coin being emulated
+        :param dict internal: The wallet state (default: a new wallet, see :func:`._new_internal`)
+        :param lock: The lock guarding ``internal`` (default: a new :class:`threading.RLock`)
+        :param seed: Seed used to derive the addresses of a new wallet (default: random)
+        :param str name: The wallet's name, as returned by ``getwalletinfo`` / ``listwallets`` (``""`` = default)
+        """
+        self.coin, self.name = coin, name
+        self.internal = _new_internal(coin, seed) if internal is None else internal
+        self.lock = threading.RLock() if lock is None else lock
+    
+    @contextmanager
+    def activate(self):
+        """Context manager which makes this the state used by the RPC methods (in the current thread / task)"""
+        token = _active_state.set(self)
+        try:
+            yield self
+        finally:
+            _active_state.reset(token)
+
+
+_active_state: ContextVar = ContextVar('rpcemulator_coin_state', default=None)
+
+_active_wallets: ContextVar = ContextVar('rpcemulator_wallets', default=None)
+
+_default_states: Dict[CoinProfile, CoinState] = {BITCOIN: CoinState(BITCOIN, _default_internal)}
+
+
+def default_state(coin: CoinProfile = BITCOIN) -> CoinState:
+    """
+    Returns the default :class:`.CoinState` of ``coin`` (created on first use, with addresses derived from the
+    coin's name), which is used by emulators that aren't given their own state.
+    """
+    state = _default_states.get(coin)
+    if state is None:
+        state = _default_states.setdefault(coin, CoinState(coin, seed=coin.name))
+    return state
+
+
+def current_state() -> CoinState:
+    """Returns the :class:`.CoinState` which is active in the current context (default: Bitcoin's default state)"""
+    state = _active_state.get()
+    return _default_states[BITCOIN] if state is None else state
+
+
+def _coin() -> CoinProfile:
+    return current_state().coin
+
+
+class _InternalProxy(MutableMapping):
+    """Dict-like view of the ``internal`` dict of the active :class:`.CoinState`"""
+    def __getitem__(self, key):
+        return current_state().internal[key]
+    
+    def __setitem__(self, key, value):
+        current_state().internal[key] = value
+    
+    def __delitem__(self, key):
+        del current_state().internal[key]
+    
+    def __iter__(self):
+        return iter(current_state().internal)
+    
+    def __len__(self):
+        return len(current_state().internal)
+    
+    def __repr__(self):
+        return f'<internal of {current_state().coin.symbol}: {current_state().internal!r}>'
+
+
+class _LockProxy:
+    """Forwards to the lock of the active :class:`.CoinState`"""
+    def acquire(self, *args, **kwargs):
+        return current_state().lock.acquire(*args, **kwargs)
+    
+    def release(self):
+        current_state().lock.release()
+    
+    def __enter__(self):
+        return current_state().lock.__enter__()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return current_state().lock.__exit__(exc_type, exc_val, exc_tb)
+
+
+internal = _InternalProxy()
 """
-This module attribute is used as in-memory storage for various data, such as:
- 
- * ``transactions`` - A list of incoming and outgoing wallet transactions. Some are pre-defined to ensure some
-   addresses have a balance for immediate usage of the emulator.
+This module attribute is used as in-memory storage for various data (of the active :class:`.CoinState` - by default
+the Bitcoin wallet), such as:
  
- * ``addresses`` - Addresses in the emulated "wallet" that are owned by the emulated daemon
+ * ``transactions`` - A :class:`privex.rpcemulator.store.TransactionStore` (list-like) of incoming and outgoing
+   wallet transactions, indexed by txid / address / account / category. Some are pre-defined to ensure some
+   addresses have a balance for immediate usage of the emulator (see :py:attr:`.DEFAULT_TRANSACTIONS`).
+   Can be replaced with any other :class:`privex.rpcemulator.store.BaseTransactionStore` using :func:`.j_use_store`.
+   The store also holds the wallet's UTXOs (``internal['transactions'].utxos``), which sends spend as their inputs.
  
- * ``external_addresses`` - External/foreign addresses (i.e. not controlled by this wallet). Used for very basic
-   address validation.
+ * ``addresses`` - An :class:`privex.rpcemulator.addresses.AddressRegistry` of the addresses in the emulated
+   "wallet" that are owned by the emulated daemon (with their labels), plus known external/foreign addresses in
+   ``internal['addresses'].external``. New addresses are derived by the registry for :func:`.getnewaddress`.
  
- * ``getblockchaininfo`` - Stores the dictionary that would be returned by a :func:`.getblockchaininfo` call
+ * ``getblockchaininfo`` - Stores the dictionary that would be returned by a :func:`.getblockchaininfo` call. The
+   ``blocks``, ``headers``, ``bestblockhash`` and ``mediantime`` keys are replaced with the current chain tip of the
+   transaction store (see :func:`.j_generate`)
  
  * ``getnetworkinfo`` - Stores the dictionary that would be returned by a :func:`.getnetworkinfo` call
  
+ * ``max_block_weight`` - The maximum weight of the blocks mined by :func:`.j_generate`, which limits how many
+   transactions from the mempool are confirmed by each block (see :py:meth:`.BaseTransactionStore.mine_block`)
+ 
+ * ``paytxfee`` - The feerate (BTC per 1000 vbytes) paid by :func:`.sendtoaddress`, set using :func:`.settxfee`.
+   When ``0``, the feerate is estimated from the mempool with :func:`.estimatesmartfee` instead.
+ 
+
+"""
 
+internal_lock = _LockProxy()
+"""
+Re-entrant lock which guards :py:attr:`.internal` - must be held while reading or updating the wallet state, so that
+concurrent requests (see :py:attr:`privex.rpcemulator.base.Emulator.threaded`) see consistent balances. Like
+:py:attr:`.internal`, it refers to the lock of the active :class:`.CoinState`.
 """
 
 fake = Faker()
 """An instance of :class:`faker.Faker` for generating fake data in functions such as :func:`.j_gen_tx`"""
 
+TX_CONFIRM_TARGET = 6
+"""Number of blocks :func:`.sendtoaddress` aims to be confirmed within, when the feerate is estimated"""
+
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+COMPAT_METHODS = Methods()
+"""
+Older RPC methods which bitcoind has removed, but some forks still have (see :py:attr:`.CoinProfile.compat_methods`).
+Unlike the other methods, these aren't registered with jsonrpcserver's global methods.
+"""
+
+compat_method = COMPAT_METHODS.add
+
+
+def coin_methods(coin: CoinProfile = BITCOIN, methods: Methods = None) -> Methods:
+    """
+    Build the JsonRPC methods served for ``coin`` - ``methods`` (default: jsonrpcserver's global methods, which
+    includes every ``@method`` in this module) without the coin's :py:attr:`.CoinProfile.exclude_methods`, plus its
+    :py:attr:`.CoinProfile.compat_methods` from :py:attr:`.COMPAT_METHODS`.
+    
+        >>> from privex.rpcemulator.coins import DOGECOIN
+        >>> 'signrawtransaction' in coin_methods(DOGECOIN).items
+        True
+    
+    :param CoinProfile coin: The coin to build the methods for
+    :param Methods methods: The methods to start from (default: jsonrpcserver's global methods)
+    :return Methods methods: A new :class:`jsonrpcserver.methods.Methods` instance
+    """
+    methods = global_methods if methods is None else methods
+    items = {name: fn for name, fn in methods.items.items() if name not in coin.exclude_methods}
+    items.update({name: fn for name, fn in COMPAT_METHODS.items.items() if name in coin.compat_methods})
+    return Methods(**items)
+
+
+def _reseed():
+    # Forked workers inherit the parent's random state, which would make them generate the same TXIDs
+    random.seed()
+    fake.seed_instance()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reseed)
+
+_batch_caches: ContextVar = ContextVar('rpcemulator_batch_caches', default={})
+"""The cache of each :class:`.CoinState` with a batch in progress in this context (see :func:`.batch_snapshot`)"""
+
+
+@contextmanager
+def batch_snapshot():
+    """
+    Context manager which :class:`.BitcoinEmulator` enters around each JsonRPC batch request (see
+    :py:attr:`privex.rpcemulator.base.Emulator.batch_context`).
+    
+    Holds the lock of the active :class:`.CoinState` for the whole batch, so every call in the batch sees the same
+    wallet state, and caches derived data such as balances and serialized transactions, so that it's only calculated
+    once per batch. The cache belongs to the active state, so calls which activate another state (e.g. another coin
+    served by the same process) don't see it. The cache is cleared whenever the wallet is modified (e.g. a
+    ``sendtoaddress`` within the batch).
+    """
+    state = current_state()
+    with state.lock:
+        caches = _batch_caches.get()
+        if state in caches:
+            yield caches[state]
+            return
+        token = _batch_caches.set({**caches, state: {}})
+        try:
+            yield _batch_caches.get()[state]
+        finally:
+            _batch_caches.reset(token)
+
+
+def _batch_cached(key: tuple, fn: Callable[[], Any]) -> Any:
+    """Returns ``fn()``, caching the result under ``key`` when called within a batch (see :func:`.batch_snapshot`)"""
+    cache = _batch_caches.get().get(current_state())
+    if cache is None:
+        return fn()
+    if key not in cache:
+        cache[key] = fn()
+    return cache[key]
+
+
+def _batch_invalidate():
+    """Clear the batch cache after modifying the wallet state"""
+    cache = _batch_caches.get().get(current_state())
+    if cache:
+        cache.clear()
+
 
 def j_gen_tx(account="", address=None, amount=None, category=None, **kwargs):
     """
@@ -129,6 +403,9 @@ def j_gen_tx(account="", address=None, amount=None, category=None, **kwargs):
     If any transaction attributes aren't specified, fake data will be automatically generated using :py:mod:`random` or
     :py:mod:`faker` to fill the attributes.
     
+    If neither ``confirmations`` nor ``blockheight`` are passed, the TX is given a random amount of confirmations
+    (``1`` to ``30``). Pass ``blockheight=None`` for an unconfirmed TX.
+    
     :param account: Wallet account to label the transaction under
     :param address: **Our** address, that we're sending from or receiving into.
     :param amount: The amount of BTC transferred
@@ -138,8 +415,8 @@ def j_gen_tx(account="", address=None, amount=None, category=None, **kwargs):
     """
     address = random.choice(internal["addresses"]) if address is None else address
     category = random.choice(['receive', 'send']) if category is None else category
-    amount = Decimal(random.random(), 7) if amount is None else Decimal(amount)
-    amount = dec_round(amount, dp=8)
+    amount = Decimal(random.random()) if amount is None else Decimal(amount)
+    amount = dec_round(amount, dp=_coin().decimals)
     # If an amount is being sent, then the amount becomes negative.
     # If an amount is being received, the amount must be positive.
     if (category == 'send' and amount > 0) or (category == 'receive' and amount < 0):
@@ -154,7 +431,8 @@ def j_gen_tx(account="", address=None, amount=None, category=None, **kwargs):
     tx = {**tx, **kwargs}
     
     tx['txid'] = tx.get('txid', fake.sha256())
-    tx['confirmations'] = tx.get('confirmations', random.randint(1, 30))
+    if 'blockheight' not in tx:
+        tx['confirmations'] = tx.get('confirmations', random.randint(1, 30))
     
     if 'time' not in tx:
         tx['time'] = int(fake.unix_time(start_datetime=datetime.utcnow() - timedelta(days=5)))
@@ -181,49 +459,235 @@ def j_add_tx(account="", address = None, amount: Union[float, str, Decimal] = No
     tx = j_gen_tx(
         account=account, address=address, amount=amount, category=category, **kwargs
     )
-    internal['transactions'].append(tx)
+    with internal_lock:
+        internal['transactions'].append(tx)
+        _batch_invalidate()
     return tx
 
 
+def j_gen_txs(count: int, seed: int = None, account="", addresses: Sequence[str] = None, category: str = None,
+              start_time: int = None, end_time: int = None, max_amount: Union[str, Decimal] = '1',
+              batch_size: int = 10000) -> Iterator[List[dict]]:
+    """
+    Generate ``count`` fake transactions in bulk, yielding them in lists of up to ``batch_size`` transactions.
+    
+    Unlike :py:func:`.j_gen_tx`, this doesn't use :py:mod:`faker` or :func:`privex.helpers.dec_round` per
+    transaction - the txids for an entire batch are generated from a single call to :meth:`random.Random.getrandbits`,
+    amounts are generated as whole satoshis, and timestamps are spread evenly across ``start_time`` to ``end_time``
+    (oldest first), so a million transactions can be generated in seconds. Each transaction is placed in one of the
+    30 most recent blocks of the chain tip at the time this is called.
+    
+    The same ``seed`` will always produce the same transactions.
+    
+    :param int count: The number of transactions to generate
+    :param int seed: Seed for the random number generator, so the generated transactions are reproducible
+    :param str account: Wallet account to label the transactions under
+    :param addresses: **Our** addresses to pick from (default: ``internal['addresses']``)
+    :param str category: Either ``'receive'`` or ``'send'`` - if not specified, picked at random per transaction
+    :param int start_time: UNIX timestamp of the oldest transaction (default: 5 days ago)
+    :param int end_time: UNIX timestamp of the newest transaction (default: now)
+    :param max_amount: The maximum amount of each transaction
+    :param int batch_size: Yield the transactions in lists of this many transactions
+    :return Iterator[List[dict]] batches: Lists of generated transactions
+    """
+    rng, decimals = random.Random(seed), _coin().decimals
+    addresses = list(internal['addresses'] if addresses is None else addresses)
+    end_time = int(datetime.utcnow().timestamp()) if end_time is None else int(end_time)
+    start_time = end_time - 5 * 86400 if start_time is None else int(start_time)
+    span, max_sats = max(end_time - start_time, 0), int(Decimal(max_amount).scaleb(decimals))
+    tip = internal['transactions'].tip
+    
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        txids = rng.getrandbits(256 * n).to_bytes(32 * n, 'big').hex()
+        batch = []
+        for i in range(n):
+            cat = category or ('receive' if rng.getrandbits(1) else 'send')
+            sats = rng.randint(1, max_sats)
+            batch.append(dict(
+                account=account, address=rng.choice(addresses),
+                amount=Decimal(sats if cat == 'receive' else -sats).scaleb(-decimals), category=cat,
+                txid=txids[i * 64:(i + 1) * 64], blockheight=max(tip - rng.randint(1, 30) + 1, 0),
+                time=start_time + (span * (offset + i)) // max(count - 1, 1), label='', vout=0, generated=False
+            ))
+        yield batch
+
+
+def j_add_txs(count: int, seed: int = None, **kwargs) -> int:
+    """
+    Generate ``count`` transactions using :py:func:`.j_gen_txs`, streaming each batch into the transaction
+    store (``internal['transactions']``) as it's generated.
+    
+        >>> j_add_txs(1000000, seed=123)
+        1000000
+    
+    :param int count: The number of transactions to generate
+    :param int seed: Seed for the random number generator, so the generated transactions are reproducible
+    :param kwargs: Any additional kwargs are passed to :py:func:`.j_gen_txs`
+    :return int count: The number of transactions which were added
+    """
+    added = 0
+    for batch in j_gen_txs(count, seed=seed, **kwargs):
+        with internal_lock:
+            internal['transactions'].extend(batch)
+            _batch_invalidate()
+        added += len(batch)
+    return added
+
+
+def j_use_store(store: Union[str, BaseTransactionStore]) -> BaseTransactionStore:
+    """
+    Replace the transaction storage backend (``internal['transactions']``).
+    
+    If ``store`` is a string, it's treated as the path to an SQLite database, which will be opened using
+    :class:`privex.rpcemulator.store.SqliteTransactionStore` (and loaded with :py:attr:`.DEFAULT_TRANSACTIONS` if
+    the database is empty)::
+    
+        >>> j_use_store('/tmp/wallet.db')
+    
+    :param store: A :class:`privex.rpcemulator.store.BaseTransactionStore` instance, or a path to an SQLite database
+    :return BaseTransactionStore store: The new transaction store
+    """
+    if isinstance(store, str):
+        store = SqliteTransactionStore(store, transactions=DEFAULT_TRANSACTIONS, decimals=_coin().decimals)
+    with internal_lock:
+        internal['transactions'] = store
+        _batch_invalidate()
+    return store
+
+
+def j_generate(nblocks: int = 1, time: int = None) -> List[str]:
+    """
+    Mine ``nblocks`` blocks on top of the emulated chain (see :py:meth:`.BaseTransactionStore.mine_block`).
+    
+    Each block confirms the highest feerate transactions in the mempool, up to ``internal['max_block_weight']``, so
+    a large backlog (see :func:`.j_fill_mempool`) takes several blocks to clear, and low fee transactions wait the
+    longest. The confirmations of other transactions are derived from the new chain tip, so they aren't touched.
+    
+        >>> j_generate(3)
+        ['0000000000000000a5f1...', '0000000000000000e93b...', '00000000000000003c0d...']
+    
+    :param int nblocks: The number of blocks to mine
+    :param int time: UNIX timestamp of the new blocks (default: now)
+    :return List[str] hashes: The hashes of the new blocks
+    """
+    heights = []
+    with internal_lock:
+        store = internal['transactions']
+        for _ in range(int(nblocks)):
+            heights.append(store.mine_block(internal['max_block_weight'], time=time))
+        _batch_invalidate()
+    return [block_hash(h) for h in heights]
+
+
+def j_fill_mempool(count: int, seed: int = None, min_feerate: float = 1, max_feerate: float = 200,
+                   batch_size: int = 10000) -> int:
+    """
+    Add ``count`` foreign (non-wallet) transactions to the mempool, to emulate a backlog of transactions competing
+    for block space. Their feerates are spread log-uniformly between ``min_feerate`` and ``max_feerate``, so most of
+    the backlog pays low fees, same as a real congested mempool.
+    
+        >>> j_fill_mempool(100000, seed=1)
+        100000
+        >>> estimatesmartfee(2)
+        {'feerate': 0.00095191, 'blocks': 2}
+    
+    :param int count: The number of transactions to add
+    :param int seed: Seed for the random number generator, so the backlog is reproducible
+    :param float min_feerate: The lowest feerate, in satoshis per vbyte
+    :param float max_feerate: The highest feerate, in satoshis per vbyte
+    :param int batch_size: Add the transactions to the mempool in batches of this many
+    :return int added: The number of transactions which were added
+    """
+    rng, added, decimals = random.Random(seed), 0, _coin().decimals
+    low, high = math.log(min_feerate), math.log(max_feerate)
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        txids = rng.getrandbits(256 * n).to_bytes(32 * n, 'big').hex()
+        with internal_lock:
+            store = internal['transactions']
+            batch = []
+            for i in range(n):
+                vsize = rng.randint(110, 600)
+                sats = math.ceil(math.exp(rng.uniform(low, high)) * vsize)
+                batch.append(dict(
+                    txid=txids[i * 64:(i + 1) * 64], fee=Decimal(sats).scaleb(-decimals), vsize=vsize, height=store.tip
+                ))
+            added += store.mempool.extend(batch)
+            _batch_invalidate()
+    return added
+
+
+def j_produce_blocks(interval: float, stop: threading.Event = None) -> threading.Thread:
+    """
+    Mine a block every ``interval`` seconds using :func:`.j_generate` in a background daemon thread, until ``stop``
+    is set. The blocks are mined on the chain of the :class:`.CoinState` which is active when this is called.
+    
+    :param float interval: Seconds between each block
+    :param threading.Event stop: Stop mining once this event is set
+    :return threading.Thread thread: The (started) block production thread
+    """
+    stop, state = threading.Event() if stop is None else stop, current_state()
+    
+    def _produce():
+        with state.activate():
+            while not stop.wait(interval):
+                j_generate(1)
+    
+    t = threading.Thread(target=_produce, name='BlockProducer', daemon=True)
+    t.start()
+    return t
+
+
 def j_update_blockchaininfo(**kwargs):
     """Update keys in the blockchaininfo using the kwargs"""
-    internal['getblockchaininfo'] = {**internal['getblockchaininfo'], **kwargs}
-    return internal['getblockchaininfo']
+    with internal_lock:
+        internal['getblockchaininfo'] = {**internal['getblockchaininfo'], **kwargs}
+        _batch_invalidate()
+        return internal['getblockchaininfo']
 
 
 def j_update_networkinfo(**kwargs):
     """Update keys in the networkinfo using the kwargs"""
-    internal['getnetworkinfo'] = {**internal['getnetworkinfo'], **kwargs}
-    return internal['getnetworkinfo']
+    with internal_lock:
+        internal['getnetworkinfo'] = {**internal['getnetworkinfo'], **kwargs}
+        _batch_invalidate()
+        return internal['getnetworkinfo']
 
 
 def j_transactions(cast_decimal=float) -> List[dict]:
     """
     Returns ``internal['transactions']`` with unserializable types such as ``Decimal`` casted appropriately.
     
-    This should be used instead of ``internal['transactions']`` if returning TXs from the RPC.
+    This should be used instead of ``internal['transactions']`` if returning TXs from the RPC. If you're only
+    returning some of the transactions, use :py:meth:`.TransactionStore.views` instead, which only converts
+    the transactions which are being returned.
     
     :param cast_decimal: A casting function to use to convert Decimal's, e.g. ``float`` or ``str``
     :return List[dict] txs: A list of dict transactions, with values converted to allow JSON serialisation.
     """
-    new_txs = []
-    for tx in internal['transactions']:
-        new_tx = {}
-        for k, v in tx.items():
-            if type(v) is Decimal:
-                new_tx[k] = cast_decimal(v)
-                continue
-            new_tx[k] = v
-        new_txs.append(new_tx)
-    return new_txs
+    with internal_lock:
+        store = internal['transactions']
+        if cast_decimal is float:
+            return _batch_cached(('transactions',), lambda: store.views(range(len(store))))
+        tip = store.tip
+        return [store.serialize(tx, cast_decimal, tip=tip) for tx in store]
+
+
+def j_tx(tx: dict, cast_decimal=float) -> dict:
+    """
+    Returns a copy of the transaction ``tx`` with unserializable types such as ``Decimal`` casted appropriately,
+    and its ``confirmations`` based on the current chain tip.
+    
+    :param dict tx: A transaction dict from ``internal['transactions']``
+    :param cast_decimal: A casting function to use to convert Decimal's, e.g. ``float`` or ``str``
+    :return dict tx: The transaction, with values converted to allow JSON serialisation.
+    """
+    return internal['transactions'].serialize(tx, cast_decimal)
 
 
 def _address_valid(address: str):
-    if address in internal['addresses']:
-        return True
-    if address in internal['external_addresses']:
-        return True
-    return False
+    return internal['addresses'].is_valid(address)
 
 
 def _address_balances() -> List[Tuple[str, Decimal]]:
@@ -231,31 +695,49 @@ def _address_balances() -> List[Tuple[str, Decimal]]:
     Calculate the balance for each address in ``internal['addresses']`` based on
     stored transactions.
     """
-    balances = {}
-    for tx in internal['transactions']:
-        addr = tx['address']
-        if addr not in internal['addresses']:
-            continue
-        if addr not in balances:
-            balances[addr] = Decimal(0)
-        balances[addr] += Decimal(tx['amount'])
+    with internal_lock:
+        return internal['transactions'].select_addresses(predicate=internal['addresses'].is_mine)
+
+
+def _select_utxos(amount: Decimal, cost_of_change: Decimal = Decimal(0)) -> List[dict]:
+    """
+    Select which of the wallet's unlocked UTXOs to spend for ``amount`` (see :py:meth:`.BaseUTXOSet.select`) - an
+    input set which doesn't need change if there is one, otherwise the largest UTXOs first.
     
-    return sorted(balances.items(), key=lambda d: d[1], reverse=True)
+    :param Decimal amount: The total amount being spent, including the fee
+    :param Decimal cost_of_change: The fee a change output would add - excess up to this is paid as fee instead
+    :return list utxos: The selected UTXOs (``{txid, vout, address, amount, blockheight}``)
+    """
+    with internal_lock:
+        selected = internal['transactions'].utxos.select(amount, cost_of_change, internal['addresses'].is_mine)
+    assert selected is not None, "Insufficient funds"
+    return selected
+
+
+def _estimate_feerate(blocks: int) -> Decimal:
+    """
+    Estimate the feerate (coins per 1000 vbytes) to confirm within ``blocks`` blocks from the mempool - never lower
+    than the coin's minimum relay fee (see :py:attr:`.CoinProfile.min_feerate`)
+    """
+    feerate = internal['transactions'].mempool.estimate_feerate(blocks, internal['max_block_weight'])
+    return max(feerate, _coin().relay_fee)
+
+
+def _wallet_feerate() -> Decimal:
+    """The feerate paid by sends (BTC per 1000 vbytes) - ``paytxfee`` if set, otherwise estimated from the mempool"""
+    if internal['paytxfee'] > 0:
+        return internal['paytxfee']
+    return _estimate_feerate(TX_CONFIRM_TARGET)
 
 
 def _get_balance(account="*", confirmations: int = 0):
     """Internal function for calculating balances"""
-    total = Decimal(0)
-    # Send transactions have negative amounts, while receive transactions have positive amounts
-    # so we don't need to differentiate them, just add them to the total.
-    for tx in internal['transactions']:  # type: dict
-        if account not in ['', '*', None]:
-            if tx['account'].lower() != account.lower():
-                continue
-        if tx['confirmations'] < confirmations:
-            continue
-        total += Decimal(tx['amount'])
-    return total
+    # Send transactions have negative amounts, while receive transactions have positive amounts, so the
+    # running balances maintained by the TransactionStore already account for both.
+    with internal_lock:
+        return _batch_cached(
+            ('balance', account, confirmations), lambda: internal['transactions'].balance(account, confirmations)
+        )
 
 
 @method
@@ -276,9 +758,13 @@ def listtransactions(account="*", count: int = 10, skip: int = 0, watch_only=Fal
     """
     Simulates a Bitcoin RPC ``listtransactions`` call - returns a list of dictionary transactions
     from :py:attr:`.internal` ``['transactions']``
+    
+    Same as bitcoind, returns the ``count`` most recent transactions after skipping the ``skip`` most recent
+    transactions - ordered oldest to newest. For example, ``listtransactions("*", 10, 10)`` returns the 11th to
+    20th most recent transactions, with the 20th most recent transaction first.
 
 
-    :param account: Account to list TXs for
+    :param account: Account to list TXs for (``"*"`` for all accounts)
     :param count: Load this many recent TXs
     :param skip: Skip this many recent TXs (for pagination)
     :param watch_only: (NOT IMPLEMENTED)
@@ -286,21 +772,246 @@ def listtransactions(account="*", count: int = 10, skip: int = 0, watch_only=Fal
                 txid, time, comment, to}, ... ]
 
     """
-    tx_list = j_transactions()
-    if account in ['', '*', None]:
-        return tx_list[skip:count]
-    _txs = []
-    for tx in tx_list:
-        if tx.get('account', '').lower() == account.lower():
-            _txs.append(tx)
-    
-    return _txs
+    count, skip = int(count), int(skip)
+    assert count >= 0, "Negative count"
+    assert skip >= 0, "Negative from"
+    with internal_lock:
+        store = internal['transactions']
+        return _batch_cached(
+            ('listtransactions', account, count, skip), lambda: store.views(store.page(account, count, skip))
+        )
 
 
 @method
 def getblockchaininfo():
     """Return bitcoind blockchain information, e.g. current block height"""
-    return internal['getblockchaininfo']
+    with internal_lock:
+        store = internal['transactions']
+        
+        def _info():
+            tip = store.tip
+            return {
+                **internal['getblockchaininfo'], 'blocks': tip, 'headers': tip, 'bestblockhash': block_hash(tip),
+                # The median time of the past 11 blocks is roughly the time of the 6th most recent block
+                'mediantime': store.block_time(max(tip - 5, 0)),
+            }
+        return _batch_cached(('getblockchaininfo',), _info)
+
+
+@method
+def getblockcount():
+    """Return the height of the emulated chain tip"""
+    with internal_lock:
+        return internal['transactions'].tip
+
+
+@method
+def getbestblockhash():
+    """Return the hash of the emulated chain tip"""
+    with internal_lock:
+        return block_hash(internal['transactions'].tip)
+
+
+@method
+def getblockhash(height: int):
+    """Return the hash of the emulated block at ``height``"""
+    height = int(height)
+    with internal_lock:
+        assert 0 <= height <= internal['transactions'].tip, "Block height out of range"
+    return block_hash(height)
+
+
+def _block_height(blockhash: str) -> int:
+    """Return the height of the block ``blockhash`` - raising an error unless it's in the emulated chain"""
+    height = block_hash_height(blockhash)
+    assert height is not None and height <= internal['transactions'].tip, "Block not found"
+    return height
+
+
+@method
+def getblock(blockhash: str, verbosity: int = 1):
+    """
+    Return information about the emulated block ``blockhash``. Since the emulated chain only contains wallet
+    transactions, ``tx`` only lists the TXIDs of the wallet transactions which were confirmed in the block.
+    
+    :param str blockhash: The hash of the block, e.g. from :func:`.getblockhash`
+    :param int verbosity: (Only ``1`` is implemented)
+    :return dict block: ``{hash, confirmations, height, time, mediantime, nTx, tx, previousblockhash, nextblockhash}``
+    """
+    assert int(verbosity) == 1, "Only verbosity 1 is supported"
+    with internal_lock:
+        store = internal['transactions']
+        
+        def _block():
+            height, tip = _block_height(blockhash), store.tip
+            # The send and receive sides of a TX share a TXID, so only list each TXID once
+            txids = list(dict.fromkeys(store[p]['txid'] for p in store.height_positions(height, height)))
+            block = dict(
+                hash=block_hash(height), confirmations=tip - height + 1, height=height,
+                time=store.block_time(height), mediantime=store.block_time(max(height - 5, 0)), nTx=len(txids),
+                tx=txids
+            )
+            if height > 0:
+                block['previousblockhash'] = block_hash(height - 1)
+            if height < tip:
+                block['nextblockhash'] = block_hash(height + 1)
+            return block
+        return _batch_cached(('getblock', blockhash), _block)
+
+
+@method
+def listsinceblock(blockhash: str = "", target_confirmations: int = 1, include_watchonly=False,
+                   include_removed: bool = True):
+    """
+    Simulates a Bitcoin RPC ``listsinceblock`` call - returns the wallet transactions which were confirmed in blocks
+    after ``blockhash``, plus any unconfirmed transactions, ordered oldest to newest. If ``blockhash`` is empty,
+    every transaction is returned.
+    
+    Transactions are found using the block height index (see :py:meth:`.BaseTransactionStore.height_positions`),
+    so only the transactions since ``blockhash`` are loaded and serialized, no matter how large the wallet history is.
+    
+    Pass the returned ``lastblock`` as ``blockhash`` in the next call to only receive new transactions. Transactions
+    with less than ``target_confirmations`` confirmations will be returned again by the next call.
+    
+    :param str blockhash: Return transactions confirmed after this block (``""`` for all transactions)
+    :param int target_confirmations: ``lastblock`` is the block which has this many confirmations
+    :param include_watchonly: (NOT IMPLEMENTED)
+    :param bool include_removed: Include the (always empty - the emulated chain can't re-org) ``removed`` list
+    :return dict res: ``{transactions: [...], removed: [], lastblock: str}``
+    """
+    target_confirmations = int(target_confirmations)
+    assert target_confirmations >= 1, "Invalid parameter"
+    with internal_lock:
+        store = internal['transactions']
+        
+        def _since():
+            tip = store.tip
+            if blockhash:
+                height = _block_height(blockhash)
+                positions = heapq.merge(store.height_positions(height + 1), store.mempool_positions())
+            else:
+                positions = range(len(store))
+            return dict(
+                transactions=store.views(positions),
+                lastblock=block_hash(max(tip - target_confirmations + 1, 0))
+            )
+        res = _batch_cached(('listsinceblock', blockhash, target_confirmations), _since)
+        return {**res, 'removed': []} if is_true(include_removed) else res
+
+
+@method
+def estimatesmartfee(conf_target: int, estimate_mode: str = "CONSERVATIVE"):
+    """
+    Estimate the feerate (BTC per 1000 vbytes) needed for a transaction to be confirmed within ``conf_target``
+    blocks, based on the transactions waiting in the mempool (see :py:meth:`.BaseMempool.estimate_feerate`).
+    
+    :param int conf_target: Confirmation target in blocks (``1`` to ``1008``)
+    :param str estimate_mode: (NOT IMPLEMENTED)
+    :return dict estimate: ``{feerate, blocks}``
+    """
+    conf_target = int(conf_target)
+    assert 1 <= conf_target <= 1008, "Invalid conf_target, must be between 1 and 1008"
+    with internal_lock:
+        feerate = _batch_cached(('estimatesmartfee', conf_target), lambda: _estimate_feerate(conf_target))
+    return dict(feerate=float(feerate), blocks=conf_target)
+
+
+@compat_method
+def estimatefee(nblocks: int = TX_CONFIRM_TARGET):
+    """
+    Estimate the feerate (coins per 1000 vbytes) needed for a transaction to be confirmed within ``nblocks`` blocks -
+    the predecessor of :func:`.estimatesmartfee`, which is still used by some forks (e.g. Bitcoin Cash, Dogecoin).
+    
+    :param int nblocks: Confirmation target in blocks
+    :return float feerate: The estimated feerate
+    """
+    return estimatesmartfee(max(1, min(int(nblocks), 1008)))['feerate']
+
+
+@method
+def getmempoolinfo():
+    """Return the number of transactions waiting in the mempool, their total size and fees, and the minimum fees"""
+    with internal_lock:
+        info = _batch_cached(('mempoolinfo',), internal['transactions'].mempool.info)
+    relayfee = internal['getnetworkinfo']['relayfee']
+    return dict(
+        loaded=True, size=info['size'], bytes=info['bytes'], usage=info['bytes'], total_fee=float(info['fees']),
+        maxmempool=300000000, mempoolminfee=relayfee, minrelaytxfee=relayfee, unbroadcastcount=0
+    )
+
+
+def _mempool_entry(e: dict) -> dict:
+    fee = float(e['fee'])
+    return dict(
+        vsize=e['vsize'], weight=e['weight'], fee=fee, modifiedfee=fee, time=e['time'], height=e['height'],
+        descendantcount=1, descendantsize=e['vsize'], ancestorcount=1, ancestorsize=e['vsize'],
+        fees=dict(base=fee, modified=fee, ancestor=fee, descendant=fee), depends=[], spentby=[],
+        **{'bip125-replaceable': False}
+    )
+
+
+@method
+def getrawmempool(verbose: bool = False, mempool_sequence: bool = False):
+    """
+    Return the txids of every transaction in the mempool - including foreign transactions (see
+    :func:`.j_fill_mempool`), not just the wallet's own.
+    
+    :param bool verbose: Return a dict mapping each txid to its mempool entry (see :func:`.getmempoolentry`)
+    :param bool mempool_sequence: (NOT IMPLEMENTED)
+    """
+    with internal_lock:
+        pool = internal['transactions'].mempool
+        if is_true(verbose):
+            return _batch_cached(
+                ('rawmempool', True), lambda: {e['txid']: _mempool_entry(e) for e in pool.entries()}
+            )
+        return _batch_cached(('rawmempool', False), pool.txids)
+
+
+@method
+def getmempoolentry(txid: str):
+    """Return the mempool entry of ``txid`` - ``{vsize, weight, fee, time, height, ...}``"""
+    with internal_lock:
+        e = internal['transactions'].mempool.get(txid)
+    assert e is not None, "Transaction not in mempool"
+    return _mempool_entry(e)
+
+
+@method
+def settxfee(amount: Union[float, str, Decimal]):
+    """
+    Set the feerate (BTC per 1000 vbytes) paid by :func:`.sendtoaddress` - ``0`` to estimate it from the mempool.
+    
+    Like the rest of :py:attr:`.internal` (other than the transaction store), this is only set in the worker
+    process which served the call, when running with multiple workers.
+    """
+    amount = Decimal(amount)
+    assert amount >= 0, "Amount out of range"
+    internal['paytxfee'] = amount
+    return True
+
+
+@method
+def generate(nblocks: int = 1, maxtries: int = 1000000):
+    """
+    Mine ``nblocks`` blocks immediately (see :func:`.j_generate`), each confirming the highest feerate transactions
+    from the mempool which fit into the block.
+    
+    :param int nblocks: How many blocks to mine
+    :param int maxtries: (NOT IMPLEMENTED)
+    :return List[str] hashes: The hashes of the new blocks
+    """
+    assert int(nblocks) >= 0, "Negative nblocks"
+    return j_generate(int(nblocks))
+
+
+@method
+def generatetoaddress(nblocks: int, address: str, maxtries: int = 1000000):
+    """
+    Same as :func:`.generate` - ``address`` must be valid, but isn't credited with the block rewards.
+    """
+    assert _address_valid(address), "Invalid address"
+    return generate(nblocks, maxtries)
 
 
 @method
@@ -310,39 +1021,401 @@ def getnetworkinfo():
 
 
 @method
-def getnewaddress(account="", address_type=None):
+def getnewaddress(label="", address_type=None, account: str = None):
     """
-    Generate a Bitcoin address. Note: this is simulated, it just pulls a random address from ``internal['addresses']``
+    Generate a new Bitcoin address, which is added to the wallet with the label ``label``.
+    
+    Addresses are derived by :py:meth:`.AddressRegistry.new_address`, so they're checksum-valid, and never repeat.
+    
+    :param str label: The label (or account) to file the new address under
+    :param str address_type: (NOT IMPLEMENTED - always returns a legacy P2PKH address)
+    :param str account: Older name of ``label`` (bitcoind before 0.17), still accepted as a keyword argument -
+                        used as the label when ``label`` isn't passed
+    :return str address: The new address
     """
-    return random.choice(internal["addresses"])
+    if account is not None and not label:
+        label = account
+    with internal_lock:
+        return internal['addresses'].new_address(label)
+
+
+def _script_pubkey(address: str) -> str:
+    """The P2PKH output script (hex) which pays to ``address``"""
+    return p2pkh_script(address_hash(address, internal['addresses'].version)).hex()
 
 
 @method
 def getreceivedbyaddress(address, confirmations: int = 0):
     """Returns the total amount of coins received by ``address`` (excludes send transactions!)"""
-    total = Decimal(0)
-    for tx in internal['transactions']:  # type: dict
-        if tx['category'] != 'receive': continue
-        if tx['confirmations'] < confirmations: continue
-        if tx['address'] != address: continue
-        total += Decimal(tx['amount'])
-    
-    return float(total)
+    with internal_lock:
+        return _batch_cached(
+            ('received', address, confirmations),
+            lambda: float(internal['transactions'].received_by_address(address, confirmations))
+        )
 
 
 @method
 def validateaddress(address: str):
-    return dict(isvalid=_address_valid(address))
+    """Check whether ``address`` is a valid address for this coin - see :py:meth:`.AddressRegistry.is_valid`"""
+    if not _address_valid(address):
+        return dict(isvalid=False)
+    return dict(
+        isvalid=True, address=address, scriptPubKey=_script_pubkey(address), isscript=False, iswitness=False
+    )
+
+
+@method
+def getaddressinfo(address: str):
+    """
+    Returns information about ``address``, including whether it's owned by the wallet (``ismine``), and its label.
+    
+    Addresses derived by :func:`.getnewaddress` include their ``hdkeypath``, i.e. their derivation index.
+    """
+    assert _address_valid(address), "Invalid address"
+    with internal_lock:
+        info = internal['addresses'].info(address)
+    res = dict(
+        address=address, scriptPubKey=_script_pubkey(address), ismine=info is not None, iswatchonly=False,
+        isscript=False, iswitness=False,
+    )
+    if info is not None:
+        res['label'] = info['label']
+        res['labels'] = [dict(name=info['label'], purpose='receive')]
+        if info['index'] is not None:
+            res['hdkeypath'] = f"m/0'/0'/{info['index']}'"
+    return res
+
+
+@method
+def getaddressesbylabel(label: str):
+    """Returns the wallet's addresses with the label ``label``, as a dict of ``{address: {"purpose": "receive"}}``"""
+    with internal_lock:
+        addresses = internal['addresses'].addresses_by_label(label)
+    assert addresses, f"No addresses with label {label}"
+    return {a: dict(purpose='receive') for a in addresses}
+
+
+@method
+def setlabel(address: str, label: str):
+    """Change the label of one of the wallet's addresses"""
+    with internal_lock:
+        assert internal['addresses'].is_mine(address), "Address is not in the wallet"
+        internal['addresses'].set_label(address, label)
+
+
+@method
+def listlabels(purpose: str = None):
+    """Returns every label used by the wallet's addresses (``purpose`` other than ``"receive"`` returns nothing)"""
+    if purpose not in (None, 'receive'):
+        return []
+    with internal_lock:
+        return internal['addresses'].labels()
+
+
+@method
+def keypoolrefill(newsize: int = None):
+    """Derive ``newsize`` addresses ahead of time, so that :func:`.getnewaddress` calls don't have to"""
+    assert newsize is None or int(newsize) >= 0, "Invalid parameter, expected valid size"
+    with internal_lock:
+        internal['addresses'].keypool_refill(None if newsize is None else int(newsize))
+
+
+def _wallets() -> Dict[str, CoinState]:
+    """The wallets of the emulator serving the current request (see :py:attr:`.BitcoinEmulator.wallets`)"""
+    wallets = _active_wallets.get()
+    assert wallets is not None, "Method not found (multiple wallets are only available via a BitcoinEmulator)"
+    return wallets
+
+
+@method
+def createwallet(wallet_name: str, disable_private_keys: bool = False, blank: bool = False, passphrase: str = "",
+                 avoid_reuse: bool = False, descriptors: bool = False, load_on_startup: bool = None):
+    """
+    Create a new, independent wallet of the same coin, served at ``/wallet/<wallet_name>`` (see
+    :py:meth:`.BitcoinEmulator.add_wallet`). Only the wallet name is used - the other arguments are accepted for
+    compatibility.
+    
+    :param str wallet_name: The name of the new wallet
+    :return dict res: ``{name, warning}``
+    """
+    assert isinstance(wallet_name, str) and wallet_name, "Invalid parameter, wallet_name must be a non-empty string"
+    wallets = _wallets()
+    assert wallet_name not in wallets, f"Wallet {wallet_name} already exists."
+    state = current_state()
+    wallets[wallet_name] = CoinState(state.coin, name=wallet_name)
+    return dict(name=wallet_name, warning="")
+
+
+@method
+def listwallets():
+    """Returns the names of the wallets served by the emulator, e.g. ``["", "alice"]``"""
+    return list(_wallets())
+
+
+@method
+def unloadwallet(wallet_name: str = None, load_on_startup: bool = None):
+    """
+    Stop serving the wallet ``wallet_name`` (default: the wallet the request was sent to). The default wallet
+    (``""``) can't be unloaded.
+    
+    :param str wallet_name: The name of the wallet to unload
+    :return dict res: ``{warning}``
+    """
+    wallets, name = _wallets(), current_state().name if wallet_name is None else wallet_name
+    assert name in wallets, "Requested wallet does not exist or is not loaded"
+    assert name != "", "The default wallet can't be unloaded"
+    del wallets[name]
+    return dict(warning="")
+
+
+@method
+def getwalletinfo():
+    """Returns the name, balances, transaction count and keypool size of the wallet the request was sent to"""
+    with internal_lock:
+        total, confirmed = _get_balance(), _get_balance(confirmations=1)
+        return dict(
+            walletname=current_state().name, walletversion=169900, balance=float(confirmed),
+            unconfirmed_balance=float(total - confirmed), immature_balance=0.0, txcount=len(internal['transactions']),
+            keypoolsize=internal['addresses'].keypool_remaining(), paytxfee=float(internal['paytxfee']),
+            private_keys_enabled=True, avoid_reuse=False, scanning=False
+        )
 
 
 @method
 def gettransaction(txid: str):
-    txs = j_transactions()
-    for t in txs:
-        if t['txid'] == txid:
-            return t
+    with internal_lock:
+        store = internal['transactions']
+        pos = _batch_cached(('position', txid), lambda: store.position(txid))
+        assert pos is not None, "Transaction not found"
+        return _batch_cached(('view', pos), lambda: store.view(pos))
+
+
+def _unspent(u: dict, tip: int) -> dict:
+    """Convert the UTXO ``u`` into a :func:`.listunspent` entry"""
+    registry = internal['addresses']
+    conf = 0 if u['blockheight'] is None else tip - u['blockheight'] + 1
+    return dict(
+        txid=u['txid'], vout=u['vout'], address=u['address'], label=registry.label(u['address']),
+        scriptPubKey=_script_pubkey(u['address']), amount=float(u['amount']), confirmations=conf, spendable=True,
+        solvable=True, safe=conf > 0
+    )
+
+
+@method
+def listunspent(minconf: int = 1, maxconf: int = 9999999, addresses: List[str] = None, include_unsafe: bool = True,
+                query_options: dict = None):
+    """
+    List the wallet's unspent outputs with ``minconf`` to ``maxconf`` confirmations, largest first. Locked outputs
+    (see :func:`.lockunspent`) aren't included.
+    
+    UTXOs are read from the per-address index when ``addresses`` is given, otherwise from the amount index (starting
+    at ``maximumAmount``), so only the UTXOs which are returned need to be read - even from wallets holding hundreds
+    of thousands of UTXOs.
+    
+    :param int minconf: Only include UTXOs with at least this many confirmations
+    :param int maxconf: Only include UTXOs with at most this many confirmations
+    :param list addresses: Only include UTXOs paying these addresses
+    :param bool include_unsafe: Include unconfirmed UTXOs (when ``minconf`` is ``0``)
+    :param dict query_options: ``minimumAmount``, ``maximumAmount``, ``maximumCount`` and ``minimumSumAmount``
+    :return list utxos: ``{txid, vout, address, label, scriptPubKey, amount, confirmations, spendable, ...}`` dicts
+    """
+    minconf, maxconf, opts = int(minconf), int(maxconf), query_options or {}
+    assert 0 <= minconf <= maxconf, "Invalid parameter, minconf must be between 0 and maxconf"
+    min_amount = Decimal(str(opts.get('minimumAmount', 0)))
+    max_amount = None if opts.get('maximumAmount') is None else Decimal(str(opts['maximumAmount']))
+    max_count = int(opts.get('maximumCount') or 0)
+    min_sum = None if opts.get('minimumSumAmount') is None else Decimal(str(opts['minimumSumAmount']))
+    registry = internal['addresses']
+    with internal_lock:
+        store = internal['transactions']
+        tip = store.tip
+        if addresses:
+            for address in addresses:
+                assert registry.is_valid(address), f"Invalid Bitcoin address: {address}"
+            source = sorted(
+                (u for a in dict.fromkeys(addresses) for u in store.utxos.by_address(a)
+                 if u['amount'] >= min_amount and (max_amount is None or u['amount'] <= max_amount)),
+                key=lambda u: u['amount'], reverse=True
+            )
+        else:
+            source = store.utxos.by_amount(min_amount, max_amount)
+        res, total = [], Decimal(0)
+        for u in source:
+            conf = 0 if u['blockheight'] is None else tip - u['blockheight'] + 1
+            if conf < minconf or conf > maxconf or (conf == 0 and not include_unsafe):
+                continue
+            if not registry.is_mine(u['address']):
+                continue
+            res.append(_unspent(u, tip))
+            total += u['amount']
+            if (max_count and len(res) >= max_count) or (min_sum is not None and total >= min_sum):
+                break
+        return res
+
+
+@method
+def lockunspent(unlock: bool, transactions: List[dict] = None, persistent: bool = False):
+    """
+    Lock (``unlock=False``) or unlock (``unlock=True``) the UTXOs in ``transactions``, so that they aren't spent by
+    :func:`.sendtoaddress` / :func:`.sendmany`. Unlocking without ``transactions`` unlocks every UTXO.
+    
+    :param bool unlock: ``True`` to unlock the UTXOs, ``False`` to lock them
+    :param list transactions: ``{"txid": str, "vout": int}`` dicts of the UTXOs to lock / unlock
+    :param bool persistent: (NOT IMPLEMENTED)
+    :return bool success: ``True`` once the UTXOs are (un)locked
+    """
+    unlock = is_true(unlock)
+    with internal_lock:
+        utxos = internal['transactions'].utxos
+        if transactions is None:
+            assert unlock, "Invalid parameter, transactions must be specified when locking"
+            utxos.unlock()
+            return True
+        outpoints = []
+        for t in transactions:
+            assert isinstance(t, dict) and 'txid' in t and 'vout' in t, "Invalid parameter, expected txid and vout"
+            outpoint = (t['txid'], int(t['vout']))
+            assert outpoint in utxos, "Invalid parameter, unknown transaction output"
+            locked = utxos.is_locked(*outpoint)
+            assert not unlock or locked, "Invalid parameter, expected locked output"
+            assert unlock or not locked, "Invalid parameter, output already locked"
+            outpoints.append(outpoint)
+        if unlock:
+            utxos.unlock(outpoints)
+        else:
+            utxos.lock(outpoints)
+        _batch_invalidate()
+    return True
+
+
+@method
+def listlockunspent():
+    """Returns the ``{txid, vout}`` of each UTXO locked by :func:`.lockunspent`"""
+    with internal_lock:
+        return [dict(txid=txid, vout=vout) for txid, vout in internal['transactions'].utxos.locked()]
+
+
+def _store_tx(txid: str, selected: List[dict], outputs: List[Tuple[Optional[str], Decimal]], fee: Decimal,
+              vsize: int, change_vouts: Sequence[int] = (), shares: Dict[str, Decimal] = None, comment="",
+              comment_to=""):
+    """
+    Store a transaction which spends the UTXOs ``selected`` - its send transactions (one per input address), plus
+    receive transactions for the outputs paying our own addresses - in a single
+    :py:meth:`.BaseTransactionStore.extend` call, and add it to the mempool.
+    
+    :param str txid: The TXID of the transaction
+    :param list selected: The UTXOs (``{txid, vout, address, amount}``) spent by the transaction
+    :param list outputs: ``(address, amount)`` of each output, in vout order (``address`` is ``None`` for outputs
+                         which don't pay an address, e.g. ``OP_RETURN`` data)
+    :param Decimal fee: The fee paid by the transaction
+    :param int vsize: The virtual size of the transaction, used for its mempool feerate
+    :param change_vouts: Outputs returning change to one of the input addresses - they reduce what's spent from that
+                         address, rather than being listed as receives
+    :param dict shares: The part of the fee subtracted from the amount of each of these output addresses
+    """
+    store, shares = internal['transactions'], shares or {}
+    # What's spent from each input address, less any change returned to it
+    spent = {}
+    for u in selected:
+        spent[u['address']] = spent.get(u['address'], Decimal(0)) + u['amount']
+    for vout in change_vouts:
+        addr, amount = outputs[vout]
+        spent[addr] -= amount
+    inputs = list(spent.items())
+    paid = [(vout, addr, amount) for vout, (addr, amount) in enumerate(outputs) if vout not in change_vouts]
+    
+    now = int(datetime.utcnow().timestamp())
+    paid_addrs = [addr for _, addr, _ in paid if addr is not None]
+    dest = paid_addrs[0] if len(paid_addrs) == 1 else f"{len(paid_addrs)} addresses"
+    common = dict(comment=comment, comment_to=comment_to, txid=txid, time=now, blockheight=None)
+    # The fee is paid from the last inputs (which hold the leftover balance), so each send's amount + fee is
+    # what it spends from its address, and the amounts add up to what's sent
+    fees, fee_left = [Decimal(0)] * len(inputs), fee
+    for i in reversed(range(len(inputs))):
+        fees[i] = min(inputs[i][1], fee_left)
+        fee_left -= fees[i]
+    log.debug('Generating SEND transaction(s)')
+    txs = [
+        j_gen_tx(address=from_addr, amount=from_amount - from_fee, fee=Decimal(0) - from_fee, category="send",
+                 label=f"Sent from {from_addr} to {dest}", vout=vout, **common)
+        for vout, ((from_addr, from_amount), from_fee) in enumerate(zip(inputs, fees))
+    ]
+    own = internal['addresses']
+    from_addrs = ', '.join(a for a, _ in inputs)
+    for vout, addr, amount in paid:
+        if addr is not None and addr in own:
+            log.debug('Generating RECEIVE transaction for internal address %s', addr)
+            txs.append(j_gen_tx(
+                address=addr, amount=amount - shares.get(addr, 0), category="receive",
+                label=f"Sent from {from_addrs} to {addr}", vout=vout, **common
+            ))
+    change_outputs = [
+        dict(txid=txid, vout=vout, address=outputs[vout][0], amount=outputs[vout][1]) for vout in change_vouts
+    ]
+    store.mempool.add(txid, fee, vsize, time=now, height=store.tip)
+    store.extend(txs, [(u['txid'], u['vout']) for u in selected], change_outputs)
+    _batch_invalidate()
+
+
+def _send(outputs: Dict[str, Decimal], subtractfeefrom: Sequence[str] = (), comment="", comment_to="") -> str:
+    """
+    Create a transaction paying each ``{address: amount}`` in ``outputs`` from the wallet, and store its send (and
+    receive, for our own addresses) transactions in a single :py:meth:`.BaseTransactionStore.extend` call.
+    
+    The transaction spends UTXOs selected by :func:`._select_utxos`, and pays any change back to the address of the
+    last UTXO selected. The fee is estimated for one output per address plus change (see :func:`.sendtoaddress`), and
+    split evenly between the outputs in ``subtractfeefrom`` - or paid by the wallet if it's empty. Change which is
+    smaller than the coin's dust limit (see :py:attr:`.CoinProfile.dust_limit`), or than the fee it would cost, is
+    added to the fee. Coins without segwit pay for the size of a legacy transaction.
     
-    assert False, "Transaction not found"
+    :param dict outputs: A dict mapping each (already validated) destination address to a positive ``Decimal``
+    :param subtractfeefrom: Addresses in ``outputs`` whose amounts are reduced to pay the fee
+    :return str txid: The TXID of the new transaction
+    """
+    total_out = sum(outputs.values())
+    # Hold the lock from the balance check until the transactions are stored, otherwise two concurrent sends
+    # could both pass the balance check, and spend the same coins.
+    with internal_lock:
+        store, feerate, n_inputs, coin = internal['transactions'], _wallet_feerate(), 1, _coin()
+        sats, segwit = coin.unit, coin.segwit
+        # A change output adds its own size, plus the size of the input which spends it later
+        cost_of_change = (feerate * (tx_vsize(1, 1, segwit) - tx_vsize(0, 0, segwit)) / 1000).quantize(
+            sats, rounding=ROUND_UP
+        )
+        # Spending more inputs makes the TX larger, so re-select until the fee covers the inputs it needs
+        while True:
+            vsize = tx_vsize(n_inputs, len(outputs) + 1, segwit)
+            fee = (feerate * vsize / 1000).quantize(sats, rounding=ROUND_UP)
+            total = total_out if subtractfeefrom else total_out + fee
+            log.debug('Checking if we have enough balance for %s (fee: %s)', total, fee)
+            assert total <= _get_balance(), "Insufficient funds"
+            selected = _select_utxos(total, cost_of_change)
+            if len(selected) <= n_inputs:
+                break
+            n_inputs = len(selected)
+        log.debug('Selected UTXOs: %s', selected)
+        
+        # Split the fee evenly between the subtractfeefrom outputs, with any remainder paid by the first one
+        shares = {}
+        if subtractfeefrom:
+            share, remainder = divmod(int(fee.scaleb(coin.decimals)), len(subtractfeefrom))
+            for i, addr in enumerate(subtractfeefrom):
+                shares[addr] = Decimal(share + (remainder if i == 0 else 0)).scaleb(-coin.decimals)
+                assert outputs[addr] > shares[addr], "The transaction amount is too small to pay the fee"
+        
+        change = sum(u['amount'] for u in selected) - total
+        if change < max(coin.dust_limit * sats, cost_of_change):
+            fee, total, change = fee + change, total + change, Decimal(0)
+            vsize = tx_vsize(len(selected), len(outputs), segwit)
+        outputs = list(outputs.items())
+        change_vouts = []
+        if change:
+            # The change is returned to the address of the last (smallest) UTXO
+            outputs.append((selected[-1]['address'], change))
+            change_vouts.append(len(outputs) - 1)
+        txid = fake.sha256()
+        _store_tx(txid, selected, outputs, fee, vsize, change_vouts, shares, comment, comment_to)
+    return txid
 
 
 @method
@@ -350,6 +1423,11 @@ def sendtoaddress(address, amount: Union[float, str, Decimal], comment="", comme
     """
     Sends ``amount`` BTC to ``address`` - generates a fake TX in :py:attr:`.internal` transaction storage.
     
+    The TX pays a fee at the feerate set with :func:`.settxfee`, or estimated to confirm it within
+    :py:attr:`.TX_CONFIRM_TARGET` blocks, for the estimated vsize of a transaction spending the input addresses.
+    It's added to the mempool, and stays unconfirmed (``0`` confirmations) until it's included in a block, either by
+    :func:`.generate` or the block timer (see :py:attr:`.BitcoinEmulator.block_interval`).
+    
     Example::
 
         $ curl -v -s --data '{"method": "sendtoaddress",
@@ -364,34 +1442,263 @@ def sendtoaddress(address, amount: Union[float, str, Decimal], comment="", comme
     :param str comment:     A comment used to store what the transaction is for.
     :param str comment_to:  A comment, representing the name of the person or organization you're sending to.
     :param bool subtractfee: (Default False) If set to True, reduce the sending amount to cover the TX fee.
-    :return:
+    :return str txid: The TXID of the send transaction
     """
     log.debug('Checking if address %s is valid', address)
     assert _address_valid(address), "Invalid address"
     log.debug('Converting amount %s to decimal', amount)
     amount = Decimal(amount)
-    log.debug('Checking amount %s is > 0.00000001', amount)
-    assert amount > Decimal('0.00000001'), "Invalid amount"
-    log.debug('Checking if we have enough balance')
-    assert amount < Decimal(_get_balance()), "Insufficient funds"
-    log.debug('Getting best address to send from')
-    best_addr, bal = _address_balances()[0]
-    log.debug('Best address: %s    Balance: %s', best_addr, bal)
-    assert bal > amount, "Insufficient funds (Emulation limitation - can only send from one address)"
-    log.debug('Generating SEND transaction')
-    
-    tx = j_add_tx(
-        address=best_addr, amount=amount, category="send", comment=comment, comment_to=comment_to,
-        label=f"Sent from {best_addr} to {address}",
-    )
-    log.debug('Checking if internal address')
-    if address in internal['addresses']:
-        log.debug('Generating RECEIVE transaction')
-        j_add_tx(address=address, amount=amount, category="receive", comment=comment, comment_to=comment_to,
-                 label=f"Sent from {best_addr} to {address}", txid=tx['txid'])
+    log.debug('Checking amount %s is > the smallest unit', amount)
+    assert amount > _coin().unit, "Invalid amount"
+    txid = _send({address: amount}, [address] if is_true(subtractfee) else [], comment, comment_to)
     log.debug('Returning TXID')
     
-    return tx['txid']
+    return txid
+
+
+@method
+def sendmany(dummy: str, amounts: Dict[str, Union[float, str]], minconf: int = 1, comment: str = "",
+             subtractfeefrom: List[str] = None, replaceable: bool = False, conf_target: int = None,
+             estimate_mode: str = "UNSET"):
+    """
+    Send to multiple addresses in a single transaction - e.g. a batch of withdrawals. Same as :func:`.sendtoaddress`,
+    but the destinations are validated in one pass using set lookups, the balance is checked once for the total,
+    and all of the send / receive transactions are stored together.
+    
+    Example::
+
+        $ curl -s --data '{"method": "sendmany", "params": ["", {"17EZkTedEnhEHe6yyy48YX1goAuP92DMUy": 0.01,
+            "13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR": 0.02}], "jsonrpc": "2.0", "id": 1}' http://127.0.0.1:8332
+
+        {"jsonrpc": "2.0", "result": "5d4e9f02bd93e1ff0f1a5b5cd27cd53ab2a0c1a0e6b8a7e5e1c7d5e2cbd81c2a", "id": 1}
+    
+    :param str dummy: Must be ``""`` (the deprecated "fromaccount" argument)
+    :param dict amounts: A dict mapping each destination address to the amount to send to it
+    :param int minconf: (NOT IMPLEMENTED)
+    :param str comment: A comment used to store what the transaction is for
+    :param list subtractfeefrom: Addresses in ``amounts`` which pay the fee, split evenly, out of the amount sent
+    :param bool replaceable: (NOT IMPLEMENTED)
+    :param int conf_target: (NOT IMPLEMENTED)
+    :param str estimate_mode: (NOT IMPLEMENTED)
+    :return str txid: The TXID of the send transaction
+    """
+    assert dummy in ("", "*", None), 'Dummy value must be set to ""'
+    assert isinstance(amounts, dict) and amounts, "Invalid amounts, must be a non-empty object of address: amount"
+    registry, outputs, unit = internal['addresses'], {}, _coin().unit
+    for address, amount in amounts.items():
+        assert registry.is_valid(address), f"Invalid address: {address}"
+        amount = Decimal(str(amount))
+        assert amount > unit, f"Invalid amount for {address}"
+        outputs[address] = amount
+    subtractfeefrom = list(dict.fromkeys(subtractfeefrom or []))
+    missing = [a for a in subtractfeefrom if a not in outputs]
+    assert not missing, f"Invalid parameter, subtractfeefrom address not in amounts: {', '.join(missing)}"
+    return _send(outputs, subtractfeefrom, comment)
+
+
+def _decode_raw(hexstring: str) -> Transaction:
+    """Decode the hex transaction ``hexstring`` (cached, see :func:`privex.rpcemulator.rawtx.decode_hex`)"""
+    tx = decode_hex(hexstring) if isinstance(hexstring, str) else None
+    assert tx is not None, "TX decode failed"
+    return tx
+
+
+def _is_hex(value: str) -> bool:
+    """Whether ``value`` is an even length string of hex digits"""
+    return len(value) % 2 == 0 and all(c in _HEX_DIGITS for c in value)
+
+
+@method
+def createrawtransaction(inputs: List[dict], outputs: Union[Dict[str, Any], List[dict]], locktime: int = 0,
+                         replaceable: bool = False):
+    """
+    Create an unsigned transaction spending ``inputs`` and paying ``outputs``, returned as hex. Nothing is checked
+    against the wallet - sign it with :func:`.signrawtransactionwithwallet`, then broadcast it with
+    :func:`.sendrawtransaction`.
+    
+    :param list inputs: ``{"txid": str, "vout": int, "sequence": int (optional)}`` dicts of the outputs to spend
+    :param outputs: A dict of ``{address: amount}`` (and/or ``{"data": hex}`` for an ``OP_RETURN`` output), or a list
+                    of single key dicts, to set the order of the outputs
+    :param int locktime: The transaction's locktime (non-zero makes the inputs non-final by default)
+    :param bool replaceable: Signal BIP 125 replaceability, i.e. default the input sequences to ``0xfffffffd``
+    :return str hex: The serialized transaction
+    """
+    assert isinstance(inputs, list), "Invalid parameter, inputs must be an array"
+    locktime = int(locktime)
+    assert 0 <= locktime <= 0xffffffff, "Invalid parameter, locktime out of range"
+    default_sequence = 0xfffffffd if is_true(replaceable) else (0xfffffffe if locktime else 0xffffffff)
+    txins = []
+    for i in inputs:
+        assert isinstance(i, dict) and 'txid' in i and 'vout' in i, "Invalid parameter, expected txid and vout"
+        txid = i['txid']
+        assert isinstance(txid, str) and len(txid) == 64 and _is_hex(txid), \
+            f"Invalid parameter, txid must be 64 hex characters: {txid}"
+        vout, sequence = int(i['vout']), int(i.get('sequence', default_sequence))
+        assert vout >= 0, "Invalid parameter, vout cannot be negative"
+        assert 0 <= sequence <= 0xffffffff, "Invalid parameter, sequence number is out of range"
+        txins.append(TxIn(txid, vout, sequence=sequence))
+    
+    registry, txouts, seen, decimals = internal['addresses'], [], set(), _coin().decimals
+    for o in ([outputs] if isinstance(outputs, dict) else outputs):
+        assert isinstance(o, dict), "Invalid parameter, outputs must be objects"
+        for key, value in o.items():
+            assert key not in seen, f"Invalid parameter, duplicated key: {key}"
+            seen.add(key)
+            if key == 'data':
+                assert isinstance(value, str) and _is_hex(value), "Data must be hexadecimal string"
+                txouts.append(TxOut(0, nulldata_script(bytes.fromhex(value))))
+                continue
+            assert registry.is_valid(key), f"Invalid Bitcoin address: {key}"
+            units = Decimal(str(value)).scaleb(decimals)
+            assert units >= 0 and units == units.to_integral_value(), f"Invalid amount for {key}"
+            txouts.append(TxOut(int(units), p2pkh_script(address_hash(key, registry.version))))
+    return serialize_transaction(2, txins, txouts, locktime).hex()
+
+
+@method
+def decoderawtransaction(hexstring: str, iswitness: bool = None):
+    """
+    Decode the hex transaction ``hexstring`` - same format as bitcoind. Decoded transactions are cached (see
+    :func:`privex.rpcemulator.rawtx.decode_hex`), so decoding the same transaction again is a dictionary lookup.
+    
+    :param str hexstring: The serialized transaction, e.g. from :func:`.createrawtransaction`
+    :param bool iswitness: (NOT IMPLEMENTED - both serializations are tried)
+    :return dict tx: ``{txid, hash, version, size, vsize, weight, locktime, vin: [...], vout: [...]}``
+    """
+    tx, version, decimals = _decode_raw(hexstring), internal['addresses'].version, _coin().decimals
+    vin = []
+    for i in tx.inputs:
+        script_sig = dict(asm=script_asm(i.script_sig, True), hex=i.script_sig.hex())
+        entry = dict(txid=i.txid, vout=i.vout, scriptSig=script_sig)
+        if i.witness:
+            entry['txinwitness'] = [w.hex() for w in i.witness]
+        entry['sequence'] = i.sequence
+        vin.append(entry)
+    vout = []
+    for n, o in enumerate(tx.outputs):
+        spk = dict(asm=script_asm(o.script_pubkey), hex=o.script_pubkey.hex(), type=script_type(o.script_pubkey))
+        address = script_address(o.script_pubkey, version)
+        if address is not None:
+            spk['address'] = address
+        vout.append(dict(value=float(Decimal(o.value).scaleb(-decimals)), n=n, scriptPubKey=spk))
+    return dict(
+        txid=tx.txid, hash=tx.hash, version=tx.version, size=tx.size, vsize=tx.vsize, weight=tx.weight,
+        locktime=tx.locktime, vin=vin, vout=vout
+    )
+
+
+def _fake_script_sig(tx: Transaction, txin: TxIn, address: str, sighash: int) -> bytes:
+    """
+    A placeholder P2PKH input script for ``txin`` - a DER shaped signature (derived from the transaction and the
+    outpoint, so signing is deterministic) and a compressed public key (derived from ``address``). The emulated
+    addresses don't have key pairs, so it can't be a real signature.
+    """
+    seed = hashlib.sha256(f'{tx.txid}:{txin.txid}:{txin.vout}'.encode()).digest()
+    r, s = hashlib.sha256(b'r' + seed).digest(), hashlib.sha256(b's' + seed).digest()
+    # Clearing the top bit keeps both integers positive, so they don't need a padding byte
+    signature = b'\x30\x44\x02\x20' + bytes((r[0] & 0x7f | 0x01,)) + r[1:] + b'\x02\x20' + \
+        bytes((s[0] & 0x7f | 0x01,)) + s[1:] + bytes((sighash,))
+    pubkey = b'\x02' + hashlib.sha256(address.encode()).digest()
+    return p2pkh_script_sig(signature, pubkey)
+
+
+@method
+def signrawtransactionwithwallet(hexstring: str, prevtxs: List[dict] = None, sighashtype: str = "ALL"):
+    """
+    Sign the inputs of the hex transaction ``hexstring`` which spend the wallet's UTXOs. Inputs which don't spend one
+    of the wallet's UTXOs are left as-is, and reported in ``errors``.
+    
+    The input scripts are placeholders with the same shape and size as a real P2PKH signature + public key (see
+    :func:`._fake_script_sig`), as the emulated addresses don't have private keys.
+    
+    :param str hexstring: The serialized transaction, e.g. from :func:`.createrawtransaction`
+    :param list prevtxs: (NOT IMPLEMENTED)
+    :param str sighashtype: The signature hash type, e.g. ``ALL`` or ``SINGLE|ANYONECANPAY``
+    :return dict res: ``{hex, complete}`` plus ``errors`` (``{txid, vout, scriptSig, sequence, error}``) if incomplete
+    """
+    tx = _decode_raw(hexstring)
+    assert sighashtype in SIGHASH_TYPES, f"{sighashtype} is not a valid sighash parameter."
+    inputs, errors = [], []
+    with internal_lock:
+        utxos, registry = internal['transactions'].utxos, internal['addresses']
+        for i in tx.inputs:
+            u = utxos.get(i.txid, i.vout)
+            if u is None or not registry.is_mine(u['address']):
+                inputs.append(i)
+                errors.append(dict(
+                    txid=i.txid, vout=i.vout, scriptSig=i.script_sig.hex(), sequence=i.sequence,
+                    error="Input not found or already spent"
+                ))
+                continue
+            inputs.append(i._replace(script_sig=_fake_script_sig(tx, i, u['address'], SIGHASH_TYPES[sighashtype])))
+    res = dict(hex=serialize_transaction(tx.version, inputs, tx.outputs, tx.locktime).hex(), complete=not errors)
+    if errors:
+        res['errors'] = errors
+    return res
+
+
+@compat_method
+def signrawtransaction(hexstring: str, prevtxs: List[dict] = None, privkeys: List[str] = None,
+                       sighashtype: str = "ALL"):
+    """
+    The predecessor of :func:`.signrawtransactionwithwallet`, which is still used by some forks (e.g. Dogecoin).
+    
+    :param str hexstring: The serialized transaction, e.g. from :func:`.createrawtransaction`
+    :param list prevtxs: (NOT IMPLEMENTED)
+    :param list privkeys: (NOT IMPLEMENTED - the inputs are always signed with the wallet)
+    :param str sighashtype: The signature hash type, e.g. ``ALL`` or ``SINGLE|ANYONECANPAY``
+    :return dict res: ``{hex, complete}`` plus ``errors`` if incomplete
+    """
+    return signrawtransactionwithwallet(hexstring, prevtxs, sighashtype)
+
+
+@method
+def sendrawtransaction(hexstring: str, maxfeerate: Union[float, str] = 0.10):
+    """
+    Broadcast the signed hex transaction ``hexstring`` - its inputs must spend the wallet's UTXOs. The transaction
+    is stored under its real TXID, with a send transaction for each input address, and a receive transaction for
+    each output paying one of our own addresses. Outputs which pay back to an input address are treated as change.
+    
+    It's added to the mempool with its real vsize, and the fee left over between the inputs and outputs.
+    
+    :param str hexstring: The signed transaction, e.g. from :func:`.signrawtransactionwithwallet`
+    :param maxfeerate: Reject the transaction if its feerate (BTC per 1000 vbytes) is higher than this (``0`` for
+                       no limit)
+    :return str txid: The TXID of the transaction
+    """
+    tx, maxfeerate = _decode_raw(hexstring), Decimal(str(maxfeerate))
+    assert tx.inputs, "bad-txns-vin-empty"
+    assert tx.outputs, "bad-txns-vout-empty"
+    outpoints = [(i.txid, i.vout) for i in tx.inputs]
+    assert len(set(outpoints)) == len(outpoints), "bad-txns-inputs-duplicate"
+    version, coin = internal['addresses'].version, _coin()
+    outputs = [(script_address(o.script_pubkey, version), Decimal(o.value).scaleb(-coin.decimals)) for o in tx.outputs]
+    with internal_lock:
+        store = internal['transactions']
+        assert tx.txid not in store.mempool, "txn-already-in-mempool"
+        assert store.position(tx.txid) is None, "Transaction already in block chain"
+        selected = []
+        for i in tx.inputs:
+            u = store.utxos.get(i.txid, i.vout)
+            assert u is not None, "bad-txns-inputs-missingorspent"
+            assert i.script_sig or i.witness, \
+                "mandatory-script-verify-flag-failed (Operation not valid with the current stack size)"
+            selected.append(u)
+        fee = sum(u['amount'] for u in selected) - sum(amount for _, amount in outputs)
+        assert fee >= 0, "bad-txns-in-belowout"
+        assert fee.scaleb(coin.decimals) >= Decimal(str(coin.min_feerate)) * tx.vsize, "min relay fee not met"
+        assert maxfeerate <= 0 or fee * 1000 / tx.vsize <= maxfeerate, \
+            "Fee exceeds maximum configured by user (e.g. -maxtxfee, maxfeerate)"
+        # Outputs paying an input address are change, as long as they don't return more than it spent
+        remaining, change_vouts = {}, []
+        for u in selected:
+            remaining[u['address']] = remaining.get(u['address'], Decimal(0)) + u['amount']
+        for vout, (addr, amount) in enumerate(outputs):
+            if addr in remaining and amount <= remaining[addr]:
+                remaining[addr] -= amount
+                change_vouts.append(vout)
+        _store_tx(tx.txid, selected, outputs, fee, tx.vsize, change_vouts)
+    return tx.txid
 
 
 class BitcoinEmulator(Emulator):
@@ -428,9 +1735,65 @@ class BitcoinEmulator(Emulator):
         >>> # once you're done, terminate the process
         >>> btc_rpc.terminate()
     
+    **Block production**
+    
+    Blocks can be mined on demand using the ``generate`` / ``generatetoaddress`` RPC methods, or automatically every
+    :py:attr:`.block_interval` seconds::
+    
+        >>> with BitcoinEmulator(block_interval=1):
+        ...     # transactions sent with sendtoaddress are confirmed within a second
+        ...
+    
+    **Other coins**
+    
+    Forks of bitcoind are emulated by passing their :class:`.CoinProfile` (or using the subclasses in
+    :mod:`privex.rpcemulator.altcoins`). Each emulator serves its coin's methods, and acts on its own
+    :class:`.CoinState`, so several coins can be served by one event loop::
+    
+        >>> from privex.rpcemulator.coins import LITECOIN
+        >>> async with BitcoinEmulator(use_async=True, background=False), \\
+        ...            BitcoinEmulator(coin=LITECOIN, use_async=True, background=False):
+        ...     # Bitcoin at http://127.0.0.1:8332 and Litecoin at http://127.0.0.1:9332
+        ...
+    
+    **Multiple wallets**
+    
+    Like bitcoind's multiwallet support, wallets added with :py:meth:`.add_wallet` (or the ``createwallet`` RPC)
+    are served at ``/wallet/<name>``, while ``/`` serves the default wallet. Each wallet is fully independent (with
+    its own chain and mempool), so one in-process server can replace a process per wallet for parallel tests::
+    
+        >>> with BitcoinEmulator(port=0, in_process=True, threaded=True, isolated=True) as emu:
+        ...     for i in range(100):
+        ...         emu.add_wallet(f'test{i}')
+        ...     # each test uses its own wallet at http://127.0.0.1:{emu.port}/wallet/test{i}
+        ...
+    
     """
     
-    def __init__(self, host="", port: int = 8332, background=True):
+    block_interval: Optional[float] = None
+    """
+    If set, mine a block every this many seconds (see :func:`.j_produce_blocks`) while the emulator is running.
+    Blocks are only produced by the first worker, as the workers share the chain.
+    """
+    
+    coin: CoinProfile = BITCOIN
+    """The coin being emulated - sets the default port, address versions, fee limits and the methods served"""
+    
+    isolated = False
+    """
+    Set to ``True`` to give each emulator a new wallet (:class:`.CoinState`) of its own by default, instead of
+    serving the coin's :func:`.default_state`, which is shared with the module level :py:attr:`.internal`
+    """
+    
+    state: CoinState
+    """The default wallet, served at ``/``"""
+    
+    wallets: Dict[str, CoinState]
+    """The wallets served by this emulator, keyed by name - the default wallet (:py:attr:`.state`) first"""
+    
+    def __init__(self, host="", port: int = None, background=True, store: Union[str, BaseTransactionStore] = None,
+                 block_interval: float = None, block_weight: int = None, coin: CoinProfile = None,
+                 state: CoinState = None, isolated: bool = None, wallets: Sequence[str] = (), **kwargs):
         """
         Without any constructor arguments, will fork into background at http://127.0.0.1:8332
 
@@ -447,10 +1810,134 @@ class BitcoinEmulator(Emulator):
 
 
         :param str host: The IP address to listen on. If left as ``""`` - will listen at 127.0.0.1
-        :param int port: The port number to listen on (Defaults to 8332, same as Bitcoin)
+        :param int port: The port number to listen on (Defaults to the coin's port, e.g. 8332 for Bitcoin)
         :param bool background: If ``True``, spawns the webserver in a sub-process, instead of blocking the app.
+        :param store: Use this transaction storage backend (or path to an SQLite database), see :func:`.j_use_store`
+        :param float block_interval: Mine a block every this many seconds (default: :py:attr:`.block_interval`)
+        :param int block_weight: The maximum weight of each block - lower it to emulate a congested network
+                                 (sets ``internal['max_block_weight']``, default: 4000000)
+        :param CoinProfile coin: The coin to emulate (default: :py:attr:`.coin`)
+        :param CoinState state: The wallet / chain state to serve (default: the coin's :func:`.default_state`, or a
+                                new wallet if ``isolated``)
+        :param bool isolated: Serve a new wallet instead of the coin's default state (default: :py:attr:`.isolated`)
+        :param wallets: Names of additional (new) wallets to serve at ``/wallet/<name>`` (see :py:meth:`.add_wallet`)
+        :param kwargs: Any additional server options (e.g. ``threaded``, ``max_workers``, ``use_async``, ``wait``)
+                       are passed through to :class:`privex.rpcemulator.base.Emulator`
+        """
+        self.coin = self.coin if coin is None else coin
+        isolated = self.isolated if isolated is None else isolated
+        if state is None:
+            state = CoinState(self.coin) if isolated else default_state(self.coin)
+        self.state, self.wallets = state, {state.name: state}
+        for name in wallets:
+            self.add_wallet(name)
+        self.methods, self.context, self.router = coin_methods(self.coin), self.activate, self.route
+        self.batch_context = batch_snapshot
+        with self.state.activate():
+            if store is not None:
+                j_use_store(store)
+            if block_weight is not None:
+                internal['max_block_weight'] = int(block_weight)
+        self.block_interval = self.block_interval if block_interval is None else block_interval
+        self._stop_blocks = threading.Event()
+        port = self.coin.port if port is None else port
+        super().__init__(host=host, port=port, background=background, **kwargs)
+
+    @contextmanager
+    def activate(self, state: CoinState = None):
+        """
+        Context manager which makes ``state`` (default: :py:attr:`.state`) the wallet used by the RPC methods, and
+        this emulator's :py:attr:`.wallets` the ones listed / created by the wallet RPCs
+        """
+        token = _active_wallets.set(self.wallets)
+        try:
+            with (self.state if state is None else state).activate():
+                yield
+        finally:
+            _active_wallets.reset(token)
+    
+    def route(self, path: str) -> Optional[Callable[[], Any]]:
+        """
+        Returns the context for a request to ``path`` (see :py:attr:`privex.rpcemulator.base.Emulator.router`) -
+        :py:meth:`.activate` for ``/``, or for the wallet ``<name>`` for ``/wallet/<name>``. Returns ``None`` for any
+        other path, or a wallet which isn't loaded.
         """
-        super().__init__(host=host, port=port, background=background)
+        path = urlsplit(path).path
+        if path in ('', '/'):
+            return self.activate
+        if not path.startswith('/wallet/'):
+            return None
+        state = self.wallets.get(unquote(path[8:]))
+        return None if state is None else partial(self.activate, state)
+    
+    def add_wallet(self, name: str, state: CoinState = None, seed: Union[str, bytes] = None) -> CoinState:
+        """
+        Serve ``state`` (default: a new wallet of :py:attr:`.coin`) at ``/wallet/<name>``.
+        
+        Wallets added once a server process has been forked (i.e. anything but the ``wallets`` passed to the
+        constructor) are only served by in-process servers (see :py:attr:`.in_process`) and servers running in the
+        caller's event loop. Only the default wallet is shared between :py:attr:`.workers`.
+        
+        :param str name: The wallet's name
+        :param CoinState state: The wallet to serve (default: a new wallet, derived from ``seed``)
+        :param seed: Seed used to derive the addresses of a new wallet (default: random)
+        :return CoinState state: The wallet
+        """
+        state = CoinState(self.coin, seed=seed) if state is None else state
+        state.name, self.wallets[name] = name, state
+        return state
+
+    def start_worker(self, index: int):
+        """Start mining blocks every :py:attr:`.block_interval` seconds in the first worker (if enabled)"""
+        if self.block_interval and index == 0:
+            with self.state.activate():
+                j_produce_blocks(self.block_interval, self._stop_blocks)
+
+    def share_state(self):
+        """
+        Share the wallet between worker processes (see :py:attr:`privex.rpcemulator.base.Emulator.workers`).
+        
+        Unless the wallet is already stored in an SQLite database file, the current transactions are copied into a
+        temporary SQLite database, which each worker connects to. The lock of :py:attr:`.state` is replaced with a
+        :class:`multiprocessing.RLock`, so that balance checks and sends stay atomic across workers, and the address
+        derivation index is shared (see :py:meth:`.AddressRegistry.share`), so workers never hand out the same address.
+        """
+        with self.state.activate():
+            self._share_state()
+    
+    def _share_state(self):
+        state = self.state
+        store = internal['transactions']
+        self._unshared = (store, state.lock, None)
+        internal['addresses'].share()
+        if not isinstance(store, SqliteTransactionStore) or store.path == ':memory:':
+            fd, path = tempfile.mkstemp(prefix='rpcemulator-', suffix='.db')
+            os.close(fd)
+            shared = SqliteTransactionStore(
+                path, tip=store.tip, tip_time=store.block_time(store.tip), decimals=state.coin.decimals
+            )
+            shared.mempool.extend(store.mempool.entries())
+            shared.extend(iter(store))
+            # The UTXOs are copied as-is, as the transactions don't record which outputs the wallet's sends spent
+            shared.utxos.clear()
+            shared.utxos.add(store.utxos.entries())
+            shared.utxos.lock(store.utxos.locked())
+            j_use_store(shared)
+            self._unshared = (store, state.lock, path)
+        state.lock = multiprocessing.RLock()
+
+    def unshare_state(self):
+        """Restore the wallet store and lock which were replaced by :py:meth:`.share_state`, removing the temp DB"""
+        store, lock, path = self._unshared
+        with self.state.activate():
+            if path is not None:
+                internal['transactions'].close()
+                for p in (path, f'{path}-wal', f'{path}-shm'):
+                    if os.path.exists(p):
+                        os.remove(p)
+            self.state.lock = lock
+            internal['addresses'].unshare()
+            j_use_store(store)
 
     def __enter__(self):
         return self
@@ -459,6 +1946,9 @@ class BitcoinEmulator(Emulator):
         self.terminate()
 
     def __del__(self):
+        # Stop mining blocks if the emulator was running in this process (e.g. in the caller's event loop)
+        if getattr(self, '_stop_blocks', None) is not None:
+            self._stop_blocks.set()
         super().__del__()
 
 
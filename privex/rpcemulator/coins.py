@@ -0,0 +1,89 @@
+"""
+Coin profiles - the per-coin parameters used by :class:`privex.rpcemulator.bitcoin.BitcoinEmulator` to emulate
+bitcoind and its forks (Litecoin, Dogecoin, Bitcoin Cash etc.), which share the same JsonRPC API.
+
+A :class:`.CoinProfile` holds a coin's default ports, address version bytes, decimals, fee and dust limits, whether
+it supports segwit, and which RPC methods its daemon lacks or adds. Each emulator serves the methods of its profile
+(see :func:`privex.rpcemulator.bitcoin.coin_methods`), so several coins can be emulated by one process::
+
+    >>> from privex.rpcemulator.coins import LITECOIN, PROFILES
+    >>> LITECOIN.port, LITECOIN.p2pkh_version
+    (9332, 48)
+    >>> sorted(PROFILES)
+    ['BCH', 'BTC', 'DOGE', 'LTC']
+
+"""
+from decimal import Decimal
+from typing import Dict, FrozenSet, NamedTuple
+
+
+class CoinProfile(NamedTuple):
+    """The parameters which differ between bitcoind and its forks"""
+    name: str
+    """Lowercase coin name, e.g. ``bitcoin``"""
+    symbol: str
+    """Ticker symbol, e.g. ``BTC`` - used as the key in :py:attr:`.PROFILES`"""
+    port: int
+    """Default JsonRPC port of the coin's daemon"""
+    p2p_port: int
+    """Default P2P port, returned in ``getnetworkinfo``'s ``localaddresses``"""
+    p2pkh_version: int
+    """Version byte of P2PKH addresses (the addresses generated by the emulated wallet)"""
+    p2sh_version: int
+    """Version byte of P2SH addresses"""
+    decimals: int = 8
+    """Number of decimal places of the coin - amounts are rounded to ``10 ** -decimals``"""
+    min_feerate: float = 1.0
+    """Minimum relay feerate, in units (satoshis) per vbyte - fee estimates are never lower than this"""
+    dust_limit: int = 546
+    """Outputs smaller than this many units are dust - sends add change below this to the fee instead"""
+    segwit: bool = True
+    """Whether the coin supports segwit - if not, transaction sizes are estimated as legacy P2PKH transactions"""
+    block_interval: int = 600
+    """Target number of seconds between blocks"""
+    subversion: str = "/Satoshi:0.17.1/"
+    """User agent returned by ``getnetworkinfo``"""
+    version: int = 170100
+    """Daemon version returned by ``getnetworkinfo``"""
+    protocol_version: int = 70015
+    """P2P protocol version returned by ``getnetworkinfo``"""
+    exclude_methods: FrozenSet[str] = frozenset()
+    """RPC methods which the coin's daemon doesn't have, and aren't served for this coin"""
+    compat_methods: FrozenSet[str] = frozenset()
+    """Older RPC methods which the coin's daemon still has, served in addition to the bitcoind methods"""
+
+    @property
+    def unit(self) -> Decimal:
+        """The smallest amount of the coin, e.g. ``Decimal('0.00000001')``"""
+        return Decimal(1).scaleb(-self.decimals)
+
+    @property
+    def relay_fee(self) -> Decimal:
+        """The minimum relay feerate in coins per 1000 vbytes, as returned by ``getnetworkinfo``"""
+        return (Decimal(str(self.min_feerate)) * 1000).scaleb(-self.decimals)
+
+
+BITCOIN = CoinProfile(
+    name='bitcoin', symbol='BTC', port=8332, p2p_port=8333, p2pkh_version=0x00, p2sh_version=0x05,
+)
+
+LITECOIN = CoinProfile(
+    name='litecoin', symbol='LTC', port=9332, p2p_port=9333, p2pkh_version=0x30, p2sh_version=0x32,
+    block_interval=150, subversion="/LitecoinCore:0.18.1/", version=180100, protocol_version=70015,
+)
+
+DOGECOIN = CoinProfile(
+    name='dogecoin', symbol='DOGE', port=22555, p2p_port=22556, p2pkh_version=0x1e, p2sh_version=0x16,
+    min_feerate=1000.0, dust_limit=1000000, segwit=False, block_interval=60, subversion="/Shibetoshi:1.14.6/",
+    version=1140600, protocol_version=70015,
+    exclude_methods=frozenset({'signrawtransactionwithwallet'}), compat_methods=frozenset({'signrawtransaction'}),
+)
+
+BITCOIN_CASH = CoinProfile(
+    name='bitcoincash', symbol='BCH', port=8332, p2p_port=8333, p2pkh_version=0x00, p2sh_version=0x05,
+    segwit=False, subversion="/Bitcoin Cash Node:24.1.0(EB32.0)/", version=24010000, protocol_version=70016,
+    exclude_methods=frozenset({'estimatesmartfee'}), compat_methods=frozenset({'estimatefee'}),
+)
+
+PROFILES: Dict[str, CoinProfile] = {p.symbol: p for p in (BITCOIN, LITECOIN, DOGECOIN, BITCOIN_CASH)}
+"""The built-in coin profiles, keyed by their symbol"""
@@ -0,0 +1,254 @@
+"""
+JsonRPC request dispatching with first-class batch support, used by both server backends in
+:mod:`privex.rpcemulator.base` and :mod:`privex.rpcemulator.asyncserver` in place of :func:`jsonrpcserver.dispatch`
+
+Compared to :func:`jsonrpcserver.dispatch`, a batch request is:
+
+ * parsed once, and each call is checked structurally instead of validating the whole batch with a JSON schema
+ * answered in the same order as the calls were sent (jsonrpcserver returns batch responses in arbitrary order)
+ * limited to ``max_batch_size`` calls (default: :py:attr:`.MAX_BATCH_SIZE`)
+ * ran inside of the server's ``batch_context`` (if any) - emulators use this to hold their state lock for the
+   whole batch, so every call sees one consistent view of the wallet, and to cache derived data (e.g. balances and
+   serialized transactions) between calls in the same batch (see
+   :py:attr:`privex.rpcemulator.base.Emulator.batch_context`)
+
+Every call (batched or not) is timed and recorded in :mod:`privex.rpcemulator.stats`, along with its request and
+result sizes, and whether it returned an error.
+
+Servers which serve an emulator's own methods (see :py:attr:`privex.rpcemulator.base.Emulator.methods`) also pass
+its ``context`` - entered around the whole request, before the batch context - so that the methods act on that
+emulator's state, rather than the module defaults.
+
+When faults are configured (see :mod:`privex.rpcemulator.faults`), each call is delayed by its sampled latency, and
+may return an injected error instead of calling the method. Batches sleep for the delays of all of their calls
+before entering the batch context, so the state lock isn't held while sleeping.
+
+"""
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Executor
+from contextlib import ExitStack
+from functools import partial
+from json import JSONDecodeError, dumps as default_serialize, loads as default_deserialize
+from typing import Any, Callable, ContextManager, List, Optional
+
+from jsonrpcserver import status
+from jsonrpcserver.dispatcher import call, handle_exceptions
+from jsonrpcserver.exceptions import ApiError
+from jsonrpcserver.methods import Methods, global_methods, lookup, validate_args
+from jsonrpcserver.request import Request
+from jsonrpcserver.response import (
+    BatchResponse, ErrorResponse, InvalidJSONResponse, InvalidJSONRPCResponse, Response, SuccessResponse
+)
+
+from privex.rpcemulator import stats
+from privex.rpcemulator.faults import ErrorRate, injector
+
+MAX_BATCH_SIZE = 1000
+"""Default maximum number of calls allowed in a single batch request"""
+
+
+class OrderedBatchResponse(BatchResponse):
+    """A :class:`jsonrpcserver.response.BatchResponse` which keeps the responses in the same order as the calls"""
+    def __init__(self, responses, http_status: int = status.HTTP_OK, **kwargs: Any) -> None:
+        super().__init__([], http_status=http_status, **kwargs)
+        self.responses = [r for r in responses if r.wanted]
+
+
+def _valid_call(call) -> bool:
+    return (
+        isinstance(call, dict) and call.get('jsonrpc') == '2.0' and isinstance(call.get('method'), str) and
+        isinstance(call.get('params', []), (list, dict)) and set(call) <= {'jsonrpc', 'method', 'params', 'id'}
+    )
+
+
+def parse_request(request: str, max_batch_size: int = None, debug: bool = False,
+                  deserialize: Callable = default_deserialize):
+    """
+    Parse the JSON request body ``request`` into a :class:`jsonrpcserver.request.Request` (or a list of them for
+    batch requests). Batch calls which aren't valid JsonRPC are replaced with an error response in the list.
+
+    :return tuple parsed: ``(requests, error)`` - if the request as a whole is invalid, ``requests`` is ``None``
+                          and ``error`` is the :class:`jsonrpcserver.response.Response` to send
+    """
+    max_batch_size = MAX_BATCH_SIZE if max_batch_size is None else max_batch_size
+    try:
+        data = deserialize(request)
+    except (JSONDecodeError, ValueError) as exc:
+        return None, InvalidJSONResponse(data=str(exc), debug=debug)
+    if isinstance(data, list):
+        if not data:
+            return None, InvalidJSONRPCResponse(data=None, debug=debug)
+        if len(data) > max_batch_size:
+            return None, ErrorResponse(
+                f"Batch too large ({len(data)} calls, maximum is {max_batch_size})",
+                code=status.JSONRPC_INVALID_REQUEST_CODE, id=None, debug=debug,
+                http_status=status.HTTP_BAD_REQUEST
+            )
+        return [
+            Request(**call) if _valid_call(call) else InvalidJSONRPCResponse(data=None, debug=debug)
+            for call in data
+        ], None
+    if not _valid_call(data):
+        return None, InvalidJSONRPCResponse(data=None, debug=debug)
+    return Request(**data), None
+
+
+def _sample_faults(reqs) -> tuple:
+    """
+    Sample the fault of each call in ``reqs`` (a request, or a batch of them) - returns
+    ``(total_delay, [error, ...])``, or ``(0, None)`` when no faults are configured
+    """
+    if not injector.active:
+        return 0, None
+    faults = [
+        injector.call_fault(r.method) if isinstance(r, Request) else (0.0, None)
+        for r in (reqs if isinstance(reqs, list) else [reqs])
+    ]
+    return sum(delay for delay, _ in faults), [error for _, error in faults]
+
+
+def safe_call(request: Request, methods: Methods, *, debug: bool, serialize: Callable,
+              request_bytes: int = 0, fault: Optional[ErrorRate] = None) -> Response:
+    """
+    Same as :func:`jsonrpcserver.dispatcher.safe_call` - call a request, always returning a response (errors
+    included) - but records the call with :func:`privex.rpcemulator.stats.record`.
+    
+    jsonrpcserver already serializes each result to check that it's serializable, so that is reused to record the
+    size of the result for free.
+
+    :param ErrorRate fault: An injected error to return instead of calling the method
+    """
+    start, size = time.perf_counter(), 0
+    with handle_exceptions(request, debug) as handler:
+        if fault is not None:
+            raise ApiError(fault.message, code=fault.code)
+        result = call(lookup(methods, request.method), *request.args, **request.kwargs)
+        size = len(serialize(result))
+        handler.response = SuccessResponse(result=result, id=request.id, serialize_func=serialize)
+    response = handler.response
+    stats.record(
+        request.method, time.perf_counter() - start, isinstance(response, ErrorResponse), request_bytes, size
+    )
+    return response
+
+
+async def async_safe_call(request: Request, methods: Methods, *, debug: bool, serialize: Callable,
+                          request_bytes: int = 0, fault: Optional[ErrorRate] = None) -> Response:
+    """AsyncIO version of :func:`.safe_call` - the method must be a coroutine function"""
+    start, size = time.perf_counter(), 0
+    with handle_exceptions(request, debug) as handler:
+        if fault is not None:
+            raise ApiError(fault.message, code=fault.code)
+        fn = lookup(methods, request.method)
+        result = await validate_args(fn, *request.args, **request.kwargs)(*request.args, **request.kwargs)
+        size = len(serialize(result))
+        handler.response = SuccessResponse(result=result, id=request.id, serialize_func=serialize)
+    response = handler.response
+    stats.record(
+        request.method, time.perf_counter() - start, isinstance(response, ErrorResponse), request_bytes, size
+    )
+    return response
+
+
+def dispatch(request: str, methods: Optional[Methods] = None, max_batch_size: int = None, debug: bool = False,
+             serialize: Callable = default_serialize, context: Callable[[], ContextManager] = None,
+             batch_context: Callable[[], ContextManager] = None) -> Response:
+    """
+    Dispatch a JsonRPC request (or batch of requests) to ``methods`` - see the module docstring for how this
+    differs from :func:`jsonrpcserver.dispatch`
+
+    :param str request: The raw JSON request body
+    :param Methods methods: Methods to call (default: jsonrpcserver's global methods)
+    :param int max_batch_size: Reject batches with more calls than this (default: :py:attr:`.MAX_BATCH_SIZE`)
+    :param bool debug: Include more information in error responses
+    :param context: A function returning a context manager, which is entered around the whole request
+    :param batch_context: A function returning a context manager, which is entered (inside of ``context``) before
+                          the first call of a batch request, and exited after the last call
+    :return Response response: The response to send back to the client
+    """
+    methods = global_methods if methods is None else methods
+    reqs, error = parse_request(request, max_batch_size, debug=debug)
+    if error is not None:
+        return error
+    delay, faults = _sample_faults(reqs)
+    if delay:
+        time.sleep(delay)
+    return _call_parsed(request, reqs, methods, debug, serialize, faults, context, batch_context)
+
+
+def _call_parsed(request: str, reqs, methods: Methods, debug: bool, serialize: Callable,
+                 faults: Optional[List[Optional[ErrorRate]]], context: Callable[[], ContextManager] = None,
+                 batch_context: Callable[[], ContextManager] = None) -> Response:
+    with ExitStack() as stack:
+        if context is not None:
+            stack.enter_context(context())
+        if not isinstance(reqs, list):
+            return safe_call(
+                reqs, methods, debug=debug, serialize=serialize, request_bytes=len(request),
+                fault=faults and faults[0]
+            )
+        # Each call in a batch is recorded with an equal share of the batch's size
+        size = len(request) // len(reqs)
+        faults = faults or [None] * len(reqs)
+        if batch_context is not None:
+            stack.enter_context(batch_context())
+        responses = [
+            r if isinstance(r, Response) else
+            safe_call(r, methods, debug=debug, serialize=serialize, request_bytes=size, fault=fault)
+            for r, fault in zip(reqs, faults)
+        ]
+    return OrderedBatchResponse(responses, serialize_func=serialize)
+
+
+async def async_dispatch(request: str, methods: Optional[Methods] = None, max_batch_size: int = None,
+                         debug: bool = False, serialize: Callable = default_serialize,
+                         context: Callable[[], ContextManager] = None,
+                         batch_context: Callable[[], ContextManager] = None, executor: Executor = None) -> Response:
+    """
+    AsyncIO version of :func:`.dispatch` - ``methods`` must be coroutine functions
+    (see :func:`privex.rpcemulator.asyncserver.async_methods`), unless an ``executor`` is passed.
+
+    Batch calls are awaited one after another, rather than concurrently. Without an ``executor``, ``batch_context``
+    isn't entered - it may hold a lock, which mustn't be held across awaits, as other requests served by the same
+    event loop (and thread) could then interleave with the batch, or block the loop waiting for the lock.
+
+    :param Executor executor: If passed, ``methods`` are synchronous functions - the request is parsed (and any
+                              injected latency is awaited) in the event loop, then the calls are ran in ``executor``,
+                              inside of a copy of the current :mod:`contextvars` context, so that methods which
+                              block (e.g. on a SQLite store, or waiting for the state lock) don't stall the loop.
+    """
+    methods = global_methods if methods is None else methods
+    reqs, error = parse_request(request, max_batch_size, debug=debug)
+    if error is not None:
+        return error
+    delay, faults = _sample_faults(reqs)
+    if delay:
+        await asyncio.sleep(delay)
+    if executor is not None:
+        call_parsed = partial(
+            contextvars.copy_context().run, _call_parsed, request, reqs, methods, debug, serialize, faults, context,
+            batch_context
+        )
+        return await asyncio.get_running_loop().run_in_executor(executor, call_parsed)
+    with ExitStack() as stack:
+        if context is not None:
+            stack.enter_context(context())
+        return await _async_call_parsed(request, reqs, methods, debug, serialize, faults)
+
+
+async def _async_call_parsed(request: str, reqs, methods: Methods, debug: bool, serialize: Callable,
+                             faults: Optional[List[Optional[ErrorRate]]]) -> Response:
+    if not isinstance(reqs, list):
+        return await async_safe_call(
+            reqs, methods, debug=debug, serialize=serialize, request_bytes=len(request), fault=faults and faults[0]
+        )
+    size = len(request) // len(reqs)
+    faults = faults or [None] * len(reqs)
+    responses = []
+    for r, fault in zip(reqs, faults):
+        responses.append(r if isinstance(r, Response) else await async_safe_call(
+            r, methods, debug=debug, serialize=serialize, request_bytes=size, fault=fault
+        ))
+    return OrderedBatchResponse(responses, serialize_func=serialize)
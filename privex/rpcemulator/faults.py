@@ -0,0 +1,277 @@
+"""
+Fault injection for the emulator servers - so that clients can be load tested against a degraded node, instead of
+an emulator which always answers instantly. Applied in front of the method dispatch by both server backends
+(:mod:`privex.rpcemulator.base` and :mod:`privex.rpcemulator.asyncserver`):
+
+ * **latency** - a per-method delay sampled from a distribution (see :class:`.Latency`) before each call
+ * **errors** - a per-method chance of returning a JsonRPC error instead of calling the method, e.g.
+   bitcoind's ``-28 Loading block index...`` while it's starting up (see :class:`.ErrorRate`)
+ * **rate_limit** - a token bucket of ``rate`` requests per second (with bursts of up to ``burst``) - requests
+   which don't get a token are rejected with HTTP ``429`` (or ``503``, like bitcoind's "Work queue depth exceeded")
+ * **drop_rate** - the chance of closing the connection without responding
+ * **drip** - send response bodies ``chunk`` bytes at a time, ``interval`` seconds apart
+
+Method names can be ``*`` to apply to every method without its own setting. Faults are configured per server
+process, either with :py:attr:`privex.rpcemulator.base.Emulator.faults` when the emulator is started, or at runtime
+using the ``emulator_faults`` RPC method (which is never faulted itself)::
+
+    $ curl -s --data '{"method": "emulator_faults", "params": {"latency": {"*": {"distribution": "lognormal",
+        "a": 0.02, "b": 0.8}}, "errors": {"getblockchaininfo": 0.1}, "rate_limit": {"rate": 50, "burst": 10}},
+        "jsonrpc": "2.0", "id": 1}' http://127.0.0.1:8332
+
+When no faults are configured, the servers only check :py:attr:`.FaultInjector.active`.
+
+"""
+import json
+import math
+import random
+import threading
+import time
+from http import HTTPStatus
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+from jsonrpcserver import method
+
+ADMIN_METHOD = 'emulator_faults'
+"""The RPC method used to configure the faults - requests calling it are never faulted"""
+
+_ADMIN_MARKER = f'"{ADMIN_METHOD}"'
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+"""The latency distributions supported by :class:`.Latency`"""
+
+REJECT_BODIES = {
+    HTTPStatus.TOO_MANY_REQUESTS: b'Too Many Requests',
+    HTTPStatus.SERVICE_UNAVAILABLE: b'Work queue depth exceeded',
+}
+"""The (plain text) body sent with requests rejected by the rate limit, for each supported status"""
+
+REJECT_HEADERS = {'Retry-After': '1'}
+"""Extra headers sent with requests rejected by the rate limit"""
+
+
+class Latency(NamedTuple):
+    """
+    A distribution of delays, in seconds:
+
+     * ``fixed`` - always ``a``
+     * ``uniform`` - between ``a`` and ``b``
+     * ``normal`` - mean ``a``, standard deviation ``b`` (negative samples are clipped to ``0``)
+     * ``lognormal`` - median ``a``, with the log of the delay having a standard deviation of ``b`` - a long tail,
+       like a real node under load
+     * ``exponential`` - mean ``a``
+    """
+    distribution: str = 'fixed'
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """Returns a random delay in seconds"""
+        d, a, b = self.distribution, self.a, self.b
+        if d == 'fixed':
+            return a
+        if d == 'uniform':
+            return rng.uniform(a, b)
+        if d == 'normal':
+            return max(0.0, rng.gauss(a, b))
+        if d == 'lognormal':
+            return rng.lognormvariate(math.log(a), b) if a > 0 else 0.0
+        return rng.expovariate(1 / a) if a > 0 else 0.0
+
+
+class ErrorRate(NamedTuple):
+    """The chance (``0`` to ``1``) of a call returning the JsonRPC error ``code`` / ``message``"""
+    rate: float
+    code: int = -28
+    message: str = "Loading block index..."
+
+
+class TokenBucket:
+    """A thread safe token bucket, refilled with ``rate`` tokens per second, holding at most ``burst`` tokens"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate, self.burst = float(rate), max(1, int(burst))
+        self.tokens, self.updated = float(self.burst), time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Take a token - returns ``False`` if the bucket is empty"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _latency(value: Union[float, dict, list]) -> Latency:
+    if isinstance(value, (int, float)):
+        latency = Latency('fixed', float(value))
+    elif isinstance(value, dict):
+        latency = Latency(**value)
+    else:
+        latency = Latency(*value)
+    assert latency.distribution in DISTRIBUTIONS, \
+        f"Invalid latency distribution {latency.distribution!r}, must be one of: {', '.join(DISTRIBUTIONS)}"
+    assert latency.a >= 0 and latency.b >= 0, "Invalid latency, a and b can't be negative"
+    return latency._replace(a=float(latency.a), b=float(latency.b))
+
+
+def _error_rate(value: Union[float, dict, list]) -> ErrorRate:
+    if isinstance(value, (int, float)):
+        error = ErrorRate(float(value))
+    elif isinstance(value, dict):
+        error = ErrorRate(**value)
+    else:
+        error = ErrorRate(*value)
+    assert 0 <= error.rate <= 1, "Invalid error rate, must be between 0 and 1"
+    return error._replace(rate=float(error.rate), code=int(error.code))
+
+
+class FaultInjector:
+    """
+    Holds the fault settings of a server process, and decides which faults each request / call suffers.
+    The servers use the module level :py:attr:`.injector`.
+    """
+
+    def __init__(self, seed: int = None):
+        self.lock = threading.Lock()
+        self.reset(seed)
+
+    def reset(self, seed: int = None):
+        """Remove every fault"""
+        with self.lock:
+            self.rng = random.Random(seed)
+            self.latency: Dict[str, Latency] = {}
+            self.errors: Dict[str, ErrorRate] = {}
+            self.rate_limit: Optional[TokenBucket] = None
+            self.limit_status = HTTPStatus.TOO_MANY_REQUESTS
+            self.drop_rate = 0.0
+            self.drip: Optional[Tuple[int, float]] = None
+            self.active = False
+
+    def configure(self, latency: Dict[str, Union[float, dict, list, None]] = None,
+                  errors: Dict[str, Union[float, dict, list, None]] = None, rate_limit: Optional[dict] = None,
+                  drop_rate: float = None, drip: Optional[dict] = None, seed: int = None) -> dict:
+        """
+        Change the fault settings - arguments left as ``None`` are unchanged. See the module docstring.
+
+            >>> injector.configure(latency={'*': 0.01, 'getblock': ('lognormal', 0.05, 1)}, errors={'*': 0.01})
+
+        :param dict latency: ``{method: latency}`` where each latency is the kwargs / args of a :class:`.Latency`,
+                             or a number of seconds. A latency of ``None`` removes the method's latency.
+        :param dict errors: ``{method: error}`` where each error is the kwargs / args of an :class:`.ErrorRate`, or
+                            just the rate (for ``-28 Loading block index...``). ``None`` removes the method's errors.
+        :param dict rate_limit: ``{rate, burst, status}`` - ``status`` is ``429`` (default) or ``503``. An empty
+                                dict (or ``0``) removes the rate limit.
+        :param float drop_rate: The chance (``0`` to ``1``) of closing a connection instead of responding
+        :param dict drip: ``{chunk, interval}`` - send responses ``chunk`` bytes (default ``1``) at a time,
+                          ``interval`` seconds apart. An empty dict (or ``0``) sends responses normally.
+        :param int seed: Re-seed the random number generator, so the faults are reproducible
+        :return dict config: The new settings (see :py:meth:`.config`)
+        """
+        # Validate everything before changing anything, so a bad setting doesn't leave half of the change applied
+        latency = {k: None if v is None else _latency(v) for k, v in (latency or {}).items()}
+        errors = {k: None if v is None else _error_rate(v) for k, v in (errors or {}).items()}
+        bucket, status = None, self.limit_status
+        if rate_limit:
+            status = HTTPStatus(int(rate_limit.get('status', HTTPStatus.TOO_MANY_REQUESTS)))
+            assert status in REJECT_BODIES, "Invalid rate_limit status, must be 429 or 503"
+            assert float(rate_limit['rate']) > 0, "Invalid rate_limit rate, must be greater than 0"
+            bucket = TokenBucket(rate_limit['rate'], rate_limit.get('burst', 1))
+        assert drop_rate is None or 0 <= float(drop_rate) <= 1, "Invalid drop_rate, must be between 0 and 1"
+        if drip:
+            chunk, interval = int(drip.get('chunk', 1)), float(drip.get('interval', 0))
+            assert chunk > 0 and interval >= 0, "Invalid drip, chunk must be positive and interval non-negative"
+        with self.lock:
+            for settings, changes in ((self.latency, latency), (self.errors, errors)):
+                for name, value in changes.items():
+                    if value is None:
+                        settings.pop(name, None)
+                    else:
+                        settings[name] = value
+            if rate_limit is not None:
+                self.rate_limit, self.limit_status = bucket, status
+            if drop_rate is not None:
+                self.drop_rate = float(drop_rate)
+            if drip is not None:
+                self.drip = (chunk, interval) if drip else None
+            if seed is not None:
+                self.rng = random.Random(seed)
+            self.active = bool(
+                self.latency or self.errors or self.rate_limit or self.drop_rate or self.drip
+            )
+        return self.config()
+
+    def config(self) -> dict:
+        """The current settings, in the same format as :py:meth:`.configure`'s arguments"""
+        bucket = self.rate_limit
+        return dict(
+            latency={k: v._asdict() for k, v in self.latency.items()},
+            errors={k: v._asdict() for k, v in self.errors.items()},
+            rate_limit={} if bucket is None else dict(rate=bucket.rate, burst=bucket.burst, status=self.limit_status),
+            drop_rate=self.drop_rate,
+            drip={} if self.drip is None else dict(chunk=self.drip[0], interval=self.drip[1]),
+        )
+
+    @staticmethod
+    def exempt(body: Union[str, bytes]) -> bool:
+        """
+        Whether the request ``body`` only calls the admin method (:py:attr:`.ADMIN_METHOD`), so it isn't faulted -
+        either a single call, or a batch made up entirely of admin calls.
+        """
+        # Most requests don't mention the admin method at all, so they're ruled out without parsing the JSON
+        if (_ADMIN_MARKER if isinstance(body, str) else _ADMIN_MARKER.encode()) not in body:
+            return False
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return False
+        calls = data if isinstance(data, list) else [data]
+        return bool(calls) and all(isinstance(c, dict) and c.get('method') == ADMIN_METHOD for c in calls)
+
+    def reject(self) -> Optional[int]:
+        """Take a token from the rate limit - returns the HTTP status to reject the request with, if it's empty"""
+        bucket = self.rate_limit
+        if bucket is None or bucket.take():
+            return None
+        return self.limit_status
+
+    def drop(self) -> bool:
+        """Whether to close the connection instead of responding"""
+        return self.drop_rate > 0 and self.rng.random() < self.drop_rate
+
+    def call_fault(self, name: str) -> Tuple[float, Optional[ErrorRate]]:
+        """
+        Returns the delay (in seconds) before calling the method ``name``, and the error to return instead of
+        calling it, if it fails
+        """
+        if name == ADMIN_METHOD:
+            return 0.0, None
+        latency = self.latency.get(name, self.latency.get('*'))
+        error = self.errors.get(name, self.errors.get('*'))
+        delay = 0.0 if latency is None else latency.sample(self.rng)
+        if error is None or self.rng.random() >= error.rate:
+            error = None
+        return delay, error
+
+
+injector = FaultInjector()
+"""The fault settings of this process, used by both server backends"""
+
+
+@method
+def emulator_faults(reset: bool = False, latency: dict = None, errors: dict = None, rate_limit: dict = None,
+                    drop_rate: float = None, drip: dict = None, seed: int = None):
+    """
+    RPC method to view or change the faults injected by the server (see :py:meth:`.FaultInjector.configure`).
+    Called without arguments, returns the current settings.
+
+    :param bool reset: If ``True``, remove every fault before applying the other arguments
+    :return dict config: The new settings
+    """
+    if reset:
+        injector.reset()
+    return injector.configure(latency, errors, rate_limit, drop_rate, drip, seed)
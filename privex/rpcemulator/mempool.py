@@ -0,0 +1,420 @@
+"""
+Emulated mempool with a fee market - holds the unconfirmed transactions of a transaction store (see
+:py:attr:`privex.rpcemulator.store.BaseTransactionStore.mempool`), decides which of them are confirmed in each new
+block (:py:meth:`.BaseTransactionStore.mine_block`), and estimates fees from the backlog.
+
+Entries are keyed by txid, and hold the fee and virtual size of the transaction. Besides the wallet's own
+unconfirmed transactions, a backlog of foreign transactions can be added using :py:meth:`.BaseMempool.extend`
+(e.g. :func:`privex.rpcemulator.bitcoin.j_fill_mempool`), to emulate a congested network.
+
+ * Block assembly (:py:meth:`.BaseMempool.select`) takes the transactions with the highest feerate first until the
+   block weight limit is reached, using a priority heap (or a feerate index for SQLite), so mining a block costs
+   ``O(k log n)`` for a block of ``k`` transactions, rather than sorting the entire mempool.
+ * Transactions are also counted in exponentially spaced feerate buckets (same as bitcoind's fee estimator), so
+   fee estimates (:py:meth:`.BaseMempool.estimate_feerate`) and totals (:py:meth:`.BaseMempool.info`) only need to
+   walk the buckets, no matter how many transactions are waiting.
+
+Feerates are in the smallest units of the coin (e.g. satoshis) per virtual byte, unless stated otherwise.
+
+Basic Usage::
+
+    >>> from privex.rpcemulator.mempool import Mempool
+    >>> pool = Mempool()
+    >>> pool.add('aa' * 32, fee=Decimal('0.00002820'), vsize=141)
+    >>> pool.add('bb' * 32, fee=Decimal('0.00000141'), vsize=141)
+    >>> pool.select()
+    ['aaaa...', 'bbbb...']
+    >>> pool.estimate_feerate(2)
+    Decimal('0.00001000')
+
+"""
+import heapq
+import math
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from decimal import Decimal
+from itertools import count
+from time import time as _now
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAX_BLOCK_WEIGHT = 4000000
+"""The maximum weight of a block (``4 * vsize``)"""
+
+COINBASE_WEIGHT = 4000
+"""Block weight reserved for the coinbase transaction, which isn't available to mempool transactions"""
+
+MIN_RELAY_FEERATE = 1.0
+"""The lowest feerate which is returned by fee estimates (units per vbyte)"""
+
+DEFAULT_VSIZE = 141
+"""Virtual size used for transactions added without one - a 1 input, 2 output P2WPKH transaction"""
+
+FEE_SPACING = 1.05
+"""Each feerate bucket starts at a feerate this many times higher than the previous bucket"""
+
+MAX_CONSECUTIVE_FAILURES = 1000
+"""Stop assembling a block once this many transactions in a row were too large to fit into it"""
+
+
+def tx_vsize(inputs: int = 1, outputs: int = 2, segwit: bool = True) -> int:
+    """
+    Estimate the virtual size of a P2WPKH transaction with ``inputs`` inputs and ``outputs`` outputs - or of a legacy
+    P2PKH transaction if ``segwit`` is ``False`` (for coins without segwit, e.g. Dogecoin)
+    """
+    if not segwit:
+        return 10 + 148 * inputs + 34 * outputs
+    return math.ceil(10.5 + 68 * inputs + 31 * outputs)
+
+
+def fee_bucket(feerate: float) -> int:
+    """Return the bucket which ``feerate`` is counted in - feerates up to :py:attr:`.MIN_RELAY_FEERATE` are in ``0``"""
+    if feerate <= MIN_RELAY_FEERATE:
+        return 0
+    return int(math.log(feerate / MIN_RELAY_FEERATE) / math.log(FEE_SPACING))
+
+
+def bucket_feerate(bucket: int) -> float:
+    """Return the lowest feerate counted in the bucket ``bucket``"""
+    return MIN_RELAY_FEERATE * FEE_SPACING ** bucket
+
+
+class BaseMempool(ABC):
+    """
+    Base class for mempool backends, such as the in-memory :class:`.Mempool` and the SQLite backed
+    :class:`.SqliteMempool`.
+
+    Fees are passed in and returned as ``Decimal`` amounts of the coin (e.g. ``Decimal('0.00000141')``), and are
+    stored as integer units, which sub-classes convert using :py:meth:`._units` / :py:meth:`._decimal`.
+    """
+    unit: Decimal
+
+    def _units(self, amount) -> int:
+        return int((abs(Decimal(amount)) * self.unit).to_integral_value())
+
+    def _decimal(self, units: Optional[int]) -> Decimal:
+        return Decimal(units or 0) / self.unit
+
+    def _entry(self, txid: str, fee: int, vsize: int, time: int, height: Optional[int]) -> dict:
+        return dict(txid=txid, fee=self._decimal(fee), vsize=vsize, weight=vsize * 4, time=time, height=height)
+
+    @abstractmethod
+    def add(self, txid: str, fee: Decimal = Decimal(0), vsize: int = DEFAULT_VSIZE, time: int = None,
+            height: int = None) -> bool:
+        """
+        Add the transaction ``txid`` to the mempool. Does nothing if it's already in the mempool (e.g. the receive
+        side of a send to ourselves).
+
+        :param str txid: The transaction ID
+        :param Decimal fee: The fee paid by the transaction (the sign is ignored, as wallet sends have negative fees)
+        :param int vsize: The virtual size of the transaction in vbytes
+        :param int time: UNIX timestamp of when the transaction entered the mempool (default: now)
+        :param int height: The chain height when the transaction entered the mempool
+        :return bool added: ``True`` if the transaction was added, ``False`` if it was already in the mempool
+        """
+        raise NotImplementedError
+
+    def extend(self, entries: Iterable[dict]) -> int:
+        """
+        Add each entry in ``entries`` - dicts with the same keys as the arguments of :py:meth:`.add`
+
+        :return int added: The number of entries which weren't already in the mempool
+        """
+        return sum(self.add(**e) for e in entries)
+
+    @abstractmethod
+    def remove(self, txids: Iterable[str]) -> int:
+        """Remove each txid in ``txids`` from the mempool (e.g. once mined), returning how many were removed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, txid: str) -> Optional[dict]:
+        """Return the entry ``{txid, fee, vsize, weight, time, height}`` for ``txid``, or ``None`` if not found"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def txids(self) -> List[str]:
+        """Return the txids of every transaction in the mempool"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def entries(self) -> Iterable[dict]:
+        """Iterate over the entries (see :py:meth:`.get`) of every transaction in the mempool"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def histogram(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Return ``(bucket, count, vsize, fee_units)`` for each non-empty feerate bucket (see :func:`.fee_bucket`),
+        highest feerate first
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def select(self, max_weight: int = MAX_BLOCK_WEIGHT) -> List[str]:
+        """
+        Assemble a block template - return the txids of the highest feerate transactions, in order, which fit into a
+        block of ``max_weight`` (less :py:attr:`.COINBASE_WEIGHT`). Transactions which are too large for the space
+        left are skipped, so smaller transactions with a lower feerate can still fill the block.
+
+        Doesn't remove the transactions from the mempool - call :py:meth:`.remove` once they've been mined.
+        """
+        raise NotImplementedError
+
+    def info(self) -> dict:
+        """Return the number of transactions (``size``), their total vsize (``bytes``) and total fees (``fees``)"""
+        size, vbytes, fees = 0, 0, 0
+        for _, n, vsize, fee in self.histogram():
+            size, vbytes, fees = size + n, vbytes + vsize, fees + fee
+        return dict(size=size, bytes=vbytes, fees=self._decimal(fees))
+
+    def estimate_feerate(self, blocks: int = 6, max_weight: int = MAX_BLOCK_WEIGHT) -> Decimal:
+        """
+        Estimate the feerate needed for a transaction to be confirmed within ``blocks`` blocks, in coins per 1000
+        vbytes (same as bitcoind's ``estimatesmartfee``).
+
+        Walks the feerate buckets from the highest feerate down, until the transactions seen would fill ``blocks``
+        blocks - a new transaction has to pay more than the bucket where that happens. If the whole mempool fits
+        into ``blocks`` blocks, the minimum feerate is enough.
+        """
+        capacity, queued = blocks * (max_weight - COINBASE_WEIGHT) // 4, 0
+        feerate = MIN_RELAY_FEERATE
+        for bucket, _, vsize, _ in self.histogram():
+            queued += vsize
+            if queued >= capacity:
+                feerate = bucket_feerate(bucket + 1)
+                break
+        return (Decimal(feerate) * 1000 / self.unit).quantize(1 / self.unit)
+
+    def __contains__(self, txid: str) -> bool:
+        return self.get(txid) is not None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} transactions={len(self)}>'
+
+
+class Mempool(BaseMempool):
+    """
+    In-memory mempool - entries are kept in a dict by txid, plus a max-heap of ``(-feerate, seq, txid)`` for block
+    assembly, and running totals per feerate bucket.
+
+    Like the richest address heap in :class:`privex.rpcemulator.store.TransactionStore`, removed transactions are
+    left in the heap and skipped once they're popped (``seq`` tells a re-added transaction from its stale entry),
+    and the heap is rebuilt once it's mostly made up of stale entries.
+    """
+    def __init__(self, decimals: int = 8):
+        """:param int decimals: The number of decimal places of the coin, used to convert fees to integer units"""
+        self.unit = Decimal(10) ** decimals
+        # txid -> (fee_units, vsize, time, height, seq)
+        self._entries: Dict[str, Tuple[int, int, int, Optional[int], int]] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._buckets: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])
+        self._seq = count()
+
+    def add(self, txid: str, fee: Decimal = Decimal(0), vsize: int = DEFAULT_VSIZE, time: int = None,
+            height: int = None) -> bool:
+        if txid in self._entries:
+            return False
+        fee, vsize, seq = self._units(fee), max(int(vsize), 1), next(self._seq)
+        self._entries[txid] = (fee, vsize, int(_now() if time is None else time), height, seq)
+        heapq.heappush(self._heap, (-fee / vsize, seq, txid))
+        b = self._buckets[fee_bucket(fee / vsize)]
+        b[0], b[1], b[2] = b[0] + 1, b[1] + vsize, b[2] + fee
+        return True
+
+    def remove(self, txids: Iterable[str]) -> int:
+        removed = 0
+        for txid in txids:
+            e = self._entries.pop(txid, None)
+            if e is None:
+                continue
+            fee, vsize = e[0], e[1]
+            bucket = fee_bucket(fee / vsize)
+            b = self._buckets[bucket]
+            b[0], b[1], b[2] = b[0] - 1, b[1] - vsize, b[2] - fee
+            if not b[0]:
+                del self._buckets[bucket]
+            removed += 1
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(-e[0] / e[1], e[4], t) for t, e in self._entries.items()]
+            heapq.heapify(self._heap)
+        return removed
+
+    def get(self, txid: str) -> Optional[dict]:
+        e = self._entries.get(txid)
+        return None if e is None else self._entry(txid, *e[:4])
+
+    def txids(self) -> List[str]:
+        return list(self._entries)
+
+    def entries(self) -> Iterable[dict]:
+        for txid, e in self._entries.items():
+            yield self._entry(txid, *e[:4])
+
+    def histogram(self) -> List[Tuple[int, int, int, int]]:
+        return sorted(((k, *v) for k, v in self._buckets.items()), reverse=True)
+
+    def select(self, max_weight: int = MAX_BLOCK_WEIGHT) -> List[str]:
+        selected, popped, failures = [], [], 0
+        space = max_weight - COINBASE_WEIGHT
+        while self._heap and failures < MAX_CONSECUTIVE_FAILURES and space > 0:
+            item = heapq.heappop(self._heap)
+            e = self._entries.get(item[2])
+            if e is None or e[4] != item[1]:
+                continue    # Stale - the transaction was removed (and possibly re-added) after this was pushed
+            popped.append(item)
+            if e[1] * 4 > space:
+                failures += 1
+                continue
+            selected.append(item[2])
+            space, failures = space - e[1] * 4, 0
+        # Put the transactions back - the caller removes them once the block has been added
+        for item in popped:
+            heapq.heappush(self._heap, item)
+        return selected
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteMempool(BaseMempool):
+    """
+    SQLite backed mempool, stored in the database of a :class:`privex.rpcemulator.store.SqliteTransactionStore`,
+    so that it's shared by every process using the database.
+
+    Entries are stored in the ``mempool`` table, which is indexed by feerate for block assembly, while the
+    ``mempool_buckets`` table holds the running totals of each feerate bucket. The tables are created by the store
+    (see :py:attr:`.SCHEMA`).
+
+    The methods starting with an underscore take a cursor, so the store can update the mempool inside of its own
+    database transactions (e.g. when adding a block).
+    """
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS mempool (txid TEXT PRIMARY KEY, fee INTEGER NOT NULL, vsize INTEGER NOT NULL, '
+        'feerate REAL NOT NULL, bucket INTEGER NOT NULL, time INTEGER NOT NULL, height INTEGER)',
+        'CREATE INDEX IF NOT EXISTS mempool_feerate ON mempool (feerate DESC)',
+        'CREATE TABLE IF NOT EXISTS mempool_buckets (bucket INTEGER PRIMARY KEY, count INTEGER NOT NULL, '
+        'vsize INTEGER NOT NULL, fee INTEGER NOT NULL)',
+    ]
+    """Statements which create the mempool tables, ran by the store when it connects"""
+
+    def __init__(self, store):
+        """:param SqliteTransactionStore store: The store whose database (and coin decimals) are used"""
+        self.store = store
+        self.unit = store.unit
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.store.conn
+
+    def _write(self, fn, *args):
+        """Call ``fn(cursor, *args)`` inside of a database transaction"""
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            res = fn(cur, *args)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+        return res
+
+    def _buckets(self, cur: sqlite3.Cursor, rows: Iterable[tuple], sign: int):
+        """Add (``sign=1``) or remove (``sign=-1``) each ``(bucket, vsize, fee)`` in ``rows`` to the bucket totals"""
+        buckets = defaultdict(lambda: [0, 0, 0])
+        for bucket, vsize, fee in rows:
+            b = buckets[bucket]
+            b[0], b[1], b[2] = b[0] + sign, b[1] + vsize * sign, b[2] + fee * sign
+        cur.executemany(
+            'INSERT INTO mempool_buckets (bucket, count, vsize, fee) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (bucket) DO UPDATE SET count = count + excluded.count, vsize = vsize + excluded.vsize, '
+            'fee = fee + excluded.fee', [(k, *v) for k, v in buckets.items()]
+        )
+        cur.execute('DELETE FROM mempool_buckets WHERE count <= 0')
+
+    def _add(self, cur: sqlite3.Cursor, entries: Iterable[dict]) -> int:
+        rows, now = {}, int(_now())
+        for e in entries:
+            txid = e['txid']
+            if txid in rows:
+                continue
+            fee, vsize = self._units(e.get('fee', 0)), max(int(e.get('vsize', DEFAULT_VSIZE)), 1)
+            rows[txid] = (
+                txid, fee, vsize, fee / vsize, fee_bucket(fee / vsize), int(e.get('time') or now), e.get('height')
+            )
+        if not rows:
+            return 0
+        # Skip transactions which are already in the mempool
+        existing = set()
+        txids = list(rows)
+        for i in range(0, len(txids), 500):
+            chunk = txids[i:i + 500]
+            existing.update(r[0] for r in cur.execute(
+                f'SELECT txid FROM mempool WHERE txid IN ({",".join("?" * len(chunk))})', chunk
+            ))
+        new = [r for t, r in rows.items() if t not in existing]
+        cur.executemany('INSERT INTO mempool VALUES (?, ?, ?, ?, ?, ?, ?)', new)
+        self._buckets(cur, ((r[4], r[2], r[1]) for r in new), 1)
+        return len(new)
+
+    def _remove(self, cur: sqlite3.Cursor, txids: Iterable[str]) -> int:
+        txids, removed = list(dict.fromkeys(txids)), []
+        for i in range(0, len(txids), 500):
+            chunk = txids[i:i + 500]
+            removed += cur.execute(
+                f'SELECT bucket, vsize, fee FROM mempool WHERE txid IN ({",".join("?" * len(chunk))})', chunk
+            ).fetchall()
+            cur.execute(f'DELETE FROM mempool WHERE txid IN ({",".join("?" * len(chunk))})', chunk)
+        self._buckets(cur, removed, -1)
+        return len(removed)
+
+    def add(self, txid: str, fee: Decimal = Decimal(0), vsize: int = DEFAULT_VSIZE, time: int = None,
+            height: int = None) -> bool:
+        return self.extend([dict(txid=txid, fee=fee, vsize=vsize, time=time, height=height)]) > 0
+
+    def extend(self, entries: Iterable[dict]) -> int:
+        """Add each entry in ``entries`` inside of a single database transaction"""
+        return self._write(self._add, entries)
+
+    def remove(self, txids: Iterable[str]) -> int:
+        return self._write(self._remove, txids)
+
+    def get(self, txid: str) -> Optional[dict]:
+        row = self.conn.execute('SELECT txid, fee, vsize, time, height FROM mempool WHERE txid = ?', (txid,)).fetchone()
+        return None if row is None else self._entry(*row)
+
+    def txids(self) -> List[str]:
+        return [r[0] for r in self.conn.execute('SELECT txid FROM mempool')]
+
+    def entries(self) -> Iterable[dict]:
+        for row in self.conn.execute('SELECT txid, fee, vsize, time, height FROM mempool'):
+            yield self._entry(*row)
+
+    def histogram(self) -> List[Tuple[int, int, int, int]]:
+        return self.conn.execute(
+            'SELECT bucket, count, vsize, fee FROM mempool_buckets WHERE count > 0 ORDER BY bucket DESC'
+        ).fetchall()
+
+    def select(self, max_weight: int = MAX_BLOCK_WEIGHT) -> List[str]:
+        """Same as :py:meth:`.BaseMempool.select` - walks the feerate index, only reading the rows it needs"""
+        selected, failures = [], 0
+        space = max_weight - COINBASE_WEIGHT
+        for txid, vsize in self.conn.execute('SELECT txid, vsize FROM mempool ORDER BY feerate DESC'):
+            if failures >= MAX_CONSECUTIVE_FAILURES or space <= 0:
+                break
+            if vsize * 4 > space:
+                failures += 1
+                continue
+            selected.append(txid)
+            space, failures = space - vsize * 4, 0
+        return selected
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM mempool').fetchone()[0]
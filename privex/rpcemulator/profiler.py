@@ -0,0 +1,183 @@
+"""
+Opt-in profiling of the emulator server process - used by :class:`privex.rpcemulator.base.Emulator` when it's
+constructed with ``profile='cprofile'`` or ``profile='sample'``, so hot paths can be profiled under realistic load
+without patching the library::
+
+    >>> from privex.rpcemulator.bitcoin import BitcoinEmulator
+    >>> with BitcoinEmulator(port=0, profile='sample', profile_path='/tmp/btc-{pid}.folded') as emu:
+    ...     # make some queries to the RPC at http://127.0.0.1:{emu.port}
+    ...
+    >>> emu.profile_files
+    ['/tmp/btc-1234.folded']
+
+Two profilers are available:
+
+ * ``cprofile`` - deterministic profiling using :mod:`cProfile`, written as a :mod:`pstats` file which can be read
+   using ``python3 -m pstats``, ``snakeviz`` or ``gprof2dot``. On Python versions older than 3.12, only the thread
+   which started the server is profiled - which covers the default and AsyncIO backends, but not ``threaded=True``.
+ * ``sample`` - a :class:`.StackSampler`, which records the stack of every thread in the process each ``interval``
+   seconds, and writes them in the "folded stacks" format read by ``flamegraph.pl`` and https://www.speedscope.app
+
+The profile is written when the server stops - either when it's terminated with ``SIGTERM``
+(e.g. :py:meth:`.Emulator.terminate`), or when ``serve_forever`` returns / raises.
+
+"""
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+PROFILE_EXTENSIONS = {'cprofile': 'prof', 'sample': 'folded'}
+"""The available profilers, mapped to the file extension used for their default output path"""
+
+DEFAULT_INTERVAL = 0.005
+"""Default number of seconds between each sample taken by :class:`.StackSampler`"""
+
+
+class StackSampler:
+    """
+    A low overhead sampling profiler, which records the call stack of every thread (other than its own) every
+    ``interval`` seconds from a background thread.
+
+    Samples include idle threads (e.g. a server waiting in ``select``), so the output shows where wall clock time
+    is spent, rather than CPU time.
+
+        >>> sampler = StackSampler()
+        >>> sampler.start()
+        >>> # ... run some code ...
+        >>> sampler.stop()
+        >>> sampler.dump('/tmp/out.folded')
+
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        """Number of times each stack was sampled, keyed by the folded stack (root first, separated by ``;``)"""
+        self.samples = 0
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(';', ',')
+        return label
+
+    def _fold(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[self._fold(frame)] += 1
+            self.samples += 1
+
+    def start(self):
+        """Start sampling in a background daemon thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='StackSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, and wait for the background thread to exit"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def dump(self, path: str):
+        """Write the samples to ``path`` in the folded stacks format - one ``frame;frame;frame count`` per line"""
+        with open(path, 'w') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f"{stack} {count}\n")
+
+
+class CProfiler:
+    """Wraps :class:`cProfile.Profile` with the same methods as :class:`.StackSampler`"""
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path: str):
+        """Write the stats to ``path`` in the :mod:`pstats` format"""
+        self.profile.dump_stats(path)
+
+
+def profile_path(kind: str, path: str = None, pid: int = None) -> str:
+    """
+    Returns the output path for the profiler ``kind`` in the process ``pid`` (default: this process).
+
+    ``{pid}`` in ``path`` is replaced with the process ID. When ``path`` isn't set, defaults to
+    ``rpcemulator-{pid}.prof`` (``cprofile``) or ``rpcemulator-{pid}.folded`` (``sample``) in the current directory.
+    """
+    if kind not in PROFILE_EXTENSIONS:
+        raise ValueError(f"Unknown profiler '{kind}' - must be one of: {', '.join(PROFILE_EXTENSIONS)}")
+    path = f"rpcemulator-{{pid}}.{PROFILE_EXTENSIONS[kind]}" if path is None else path
+    return path.format(pid=os.getpid() if pid is None else pid)
+
+
+def cleanup_on_sigterm(callback: Callable[[], None]):
+    """
+    Call ``callback`` when this process receives ``SIGTERM``, before passing the signal on to the previously
+    installed handler (e.g. the ``pytest-cov`` cleanup hook) - or if there wasn't one, terminating the process
+    the same way as the default handler would.
+
+    Does nothing when called outside of the main thread, as signal handlers can only be installed from it.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def _handler(signum, frame):
+        signal.signal(signal.SIGTERM, previous if previous is not None else signal.SIG_DFL)
+        callback()
+        if callable(previous):
+            return previous(signum, frame)
+        if previous != signal.SIG_IGN:
+            os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, _handler)
+
+
+def start_profiler(kind: str, path: str = None, interval: float = DEFAULT_INTERVAL) -> Callable[[], None]:
+    """
+    Start profiling this process using the profiler ``kind`` (``cprofile`` or ``sample``), and hook ``SIGTERM``
+    (see :func:`.cleanup_on_sigterm`) so the profile is written when the process is terminated.
+
+    :param str kind: Either ``cprofile`` or ``sample``
+    :param str path: Where to write the profile - see :func:`.profile_path`
+    :param float interval: Seconds between each sample (``sample`` only)
+    :return callable finish: Stops the profiler and writes the profile. Safe to call more than once.
+    """
+    path = profile_path(kind, path)
+    prof = CProfiler() if kind == 'cprofile' else StackSampler(interval)
+    finished = threading.Lock()
+
+    def finish():
+        if not finished.acquire(blocking=False):
+            return
+        prof.stop()
+        prof.dump(path)
+        log.info(" * Wrote %s profile to %s", kind, path)
+
+    cleanup_on_sigterm(finish)
+    prof.start()
+    return finish
@@ -0,0 +1,315 @@
+"""
+Raw transaction serialization - encodes and decodes the Bitcoin transaction format used by ``createrawtransaction``,
+``decoderawtransaction``, ``signrawtransactionwithwallet`` and ``sendrawtransaction`` (see
+:mod:`privex.rpcemulator.bitcoin`), in both the legacy and the segwit (BIP 144) layouts.
+
+ * Transactions are parsed from a :class:`memoryview` of the raw bytes using :func:`struct.unpack_from` - scripts
+   and witness items are zero-copy slices of it, and the TXID / WTXID are hashed straight from the slices, rather than
+   by re-serializing the transaction.
+ * :func:`.decode_hex` caches decoded transactions by their hex, so a transaction which is decoded, signed and then
+   sent by a client is only parsed once for each distinct hex string.
+
+Basic Usage::
+
+    >>> from privex.rpcemulator.rawtx import TxIn, TxOut, decode_hex, serialize_transaction
+    >>> from privex.rpcemulator.rawtx import p2pkh_script, script_address
+    >>> raw = serialize_transaction(2, [TxIn('aa' * 32, 0)], [TxOut(10000, p2pkh_script(bytes(20)))])
+    >>> tx = decode_hex(raw.hex())
+    >>> tx.inputs[0].txid == 'aa' * 32, tx.outputs[0].value, tx.vsize
+    (True, 10000, 85)
+    >>> script_address(tx.outputs[0].script_pubkey)
+    '1111111111111111111114oLvT2'
+
+"""
+import hashlib
+import struct
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from privex.rpcemulator.addresses import P2PKH_VERSION, b58check_encode
+
+Bytes = Union[bytes, memoryview]
+
+DECODE_CACHE_SIZE = 4096
+"""Maximum number of decoded transactions kept by :func:`.decode_hex`"""
+
+SEQUENCE_FINAL = 0xffffffff
+"""The default ``nSequence`` of an input - final, i.e. the transaction's locktime is ignored"""
+
+SIGHASH_TYPES = {
+    'ALL': 0x01, 'NONE': 0x02, 'SINGLE': 0x03,
+    'ALL|ANYONECANPAY': 0x81, 'NONE|ANYONECANPAY': 0x82, 'SINGLE|ANYONECANPAY': 0x83,
+}
+"""Signature hash types accepted by ``signrawtransactionwithwallet``, mapped to the byte appended to signatures"""
+
+_SIGHASH_NAMES = {v: k for k, v in SIGHASH_TYPES.items()}
+
+_OPCODES = {
+    0x00: '0', 0x4f: '-1', **{0x50 + n: str(n) for n in range(1, 17)},
+    0x61: 'OP_NOP', 0x63: 'OP_IF', 0x64: 'OP_NOTIF', 0x67: 'OP_ELSE', 0x68: 'OP_ENDIF', 0x69: 'OP_VERIFY',
+    0x6a: 'OP_RETURN', 0x75: 'OP_DROP', 0x76: 'OP_DUP', 0x87: 'OP_EQUAL', 0x88: 'OP_EQUALVERIFY',
+    0xa8: 'OP_SHA256', 0xa9: 'OP_HASH160', 0xaa: 'OP_HASH256', 0xac: 'OP_CHECKSIG', 0xad: 'OP_CHECKSIGVERIFY',
+    0xae: 'OP_CHECKMULTISIG', 0xaf: 'OP_CHECKMULTISIGVERIFY', 0xb1: 'OP_CHECKLOCKTIMEVERIFY',
+    0xb2: 'OP_CHECKSEQUENCEVERIFY',
+}
+
+_U16, _U32, _I32, _U64 = struct.Struct('<H'), struct.Struct('<I'), struct.Struct('<i'), struct.Struct('<Q')
+
+
+class TxIn(NamedTuple):
+    """A transaction input, spending the output ``vout`` of the transaction ``txid``"""
+    txid: str
+    vout: int
+    script_sig: Bytes = b''
+    sequence: int = SEQUENCE_FINAL
+    witness: Tuple[Bytes, ...] = ()
+
+
+class TxOut(NamedTuple):
+    """A transaction output, paying ``value`` units (e.g. satoshis) to ``script_pubkey``"""
+    value: int
+    script_pubkey: Bytes
+
+
+class Transaction(NamedTuple):
+    """A decoded transaction (see :func:`.parse_transaction`) - ``hash`` is the WTXID, same as bitcoind"""
+    version: int
+    inputs: Tuple[TxIn, ...]
+    outputs: Tuple[TxOut, ...]
+    locktime: int
+    txid: str
+    hash: str
+    size: int
+    weight: int
+
+    @property
+    def vsize(self) -> int:
+        """The virtual size of the transaction, i.e. its weight / 4 (rounded up)"""
+        return (self.weight + 3) // 4
+
+
+def _sha256d(*parts: Bytes) -> bytes:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p)
+    return hashlib.sha256(h.digest()).digest()
+
+
+def compact_size(n: int) -> bytes:
+    """Encode ``n`` as a Bitcoin variable length integer (``CompactSize``)"""
+    if n < 0xfd:
+        return bytes((n,))
+    if n <= 0xffff:
+        return b'\xfd' + _U16.pack(n)
+    if n <= 0xffffffff:
+        return b'\xfe' + _U32.pack(n)
+    return b'\xff' + _U64.pack(n)
+
+
+def read_compact_size(buf: memoryview, pos: int) -> Tuple[int, int]:
+    """Read the ``CompactSize`` integer at ``pos`` of ``buf``, returning ``(value, position after it)``"""
+    n = buf[pos]
+    if n < 0xfd:
+        return n, pos + 1
+    if n == 0xfd:
+        return _U16.unpack_from(buf, pos + 1)[0], pos + 3
+    if n == 0xfe:
+        return _U32.unpack_from(buf, pos + 1)[0], pos + 5
+    return _U64.unpack_from(buf, pos + 1)[0], pos + 9
+
+
+def _read_bytes(buf: memoryview, pos: int) -> Tuple[memoryview, int]:
+    """Read a ``CompactSize`` length prefixed byte string (as a slice of ``buf``), returning it and the next position"""
+    n, pos = read_compact_size(buf, pos)
+    if pos + n > len(buf):
+        raise ValueError('Transaction data is truncated')
+    return buf[pos:pos + n], pos + n
+
+
+def serialize_transaction(version: int, inputs: Sequence[TxIn], outputs: Sequence[TxOut], locktime: int = 0,
+                          witness: bool = True) -> bytes:
+    """
+    Serialize a transaction - using the segwit layout if any of the ``inputs`` have a witness (unless ``witness`` is
+    ``False``, which produces the legacy serialization that the TXID is the hash of).
+    """
+    segwit = witness and any(i.witness for i in inputs)
+    parts = [_I32.pack(version), b'\x00\x01' if segwit else b'', compact_size(len(inputs))]
+    for i in inputs:
+        parts += (
+            bytes.fromhex(i.txid)[::-1], _U32.pack(i.vout), compact_size(len(i.script_sig)), i.script_sig,
+            _U32.pack(i.sequence)
+        )
+    parts.append(compact_size(len(outputs)))
+    for o in outputs:
+        parts += (_U64.pack(o.value), compact_size(len(o.script_pubkey)), o.script_pubkey)
+    if segwit:
+        for i in inputs:
+            parts.append(compact_size(len(i.witness)))
+            for item in i.witness:
+                parts += (compact_size(len(item)), item)
+    parts.append(_U32.pack(locktime))
+    return b''.join(parts)
+
+
+def _parse(buf: memoryview, segwit: bool) -> Transaction:
+    version, pos = _I32.unpack_from(buf, 0)[0], 6 if segwit else 4
+    # Start of the inputs - the TXID is hashed from the version, inputs + outputs, and locktime (without witnesses)
+    start = pos
+    n_in, pos = read_compact_size(buf, pos)
+    raw_inputs = []
+    for _ in range(n_in):
+        if pos + 36 > len(buf):
+            raise ValueError('Transaction data is truncated')
+        txid, vout = buf[pos:pos + 32].tobytes()[::-1].hex(), _U32.unpack_from(buf, pos + 32)[0]
+        script_sig, pos = _read_bytes(buf, pos + 36)
+        raw_inputs.append((txid, vout, script_sig, _U32.unpack_from(buf, pos)[0]))
+        pos += 4
+    n_out, pos = read_compact_size(buf, pos)
+    outputs = []
+    for _ in range(n_out):
+        value = _U64.unpack_from(buf, pos)[0]
+        script_pubkey, pos = _read_bytes(buf, pos + 8)
+        outputs.append(TxOut(value, script_pubkey))
+    end = pos
+    witnesses = [()] * len(raw_inputs)
+    if segwit:
+        for n in range(len(raw_inputs)):
+            count, pos = read_compact_size(buf, pos)
+            items = []
+            for _ in range(count):
+                item, pos = _read_bytes(buf, pos)
+                items.append(item)
+            witnesses[n] = tuple(items)
+        if not any(witnesses):
+            raise ValueError('Superfluous witness record')
+    locktime = _U32.unpack_from(buf, pos)[0]
+    pos += 4
+    if pos != len(buf):
+        raise ValueError('Unexpected data after the transaction')
+    if segwit:
+        txid = _sha256d(buf[:4], buf[start:end], buf[pos - 4:pos])[::-1].hex()
+        wtxid, stripped = _sha256d(buf)[::-1].hex(), 4 + (end - start) + 4
+    else:
+        txid = wtxid = _sha256d(buf)[::-1].hex()
+        stripped = len(buf)
+    return Transaction(
+        version=version, inputs=tuple(TxIn(*i, witness=w) for i, w in zip(raw_inputs, witnesses)),
+        outputs=tuple(outputs), locktime=locktime, txid=txid, hash=wtxid, size=len(buf),
+        weight=stripped * 3 + len(buf)
+    )
+
+
+def parse_transaction(data: Bytes) -> Transaction:
+    """
+    Parse a serialized transaction (legacy or segwit). Scripts and witness items in the result are slices of
+    ``data``, so it must not be modified afterwards.
+
+    :raises ValueError: When ``data`` isn't a valid transaction
+    """
+    buf = memoryview(data)
+    try:
+        # A segwit marker (0x00) and flag (0x01) - though a legacy transaction with no inputs and one output
+        # starts the same way, so fall back to the legacy layout if it doesn't parse
+        if len(buf) > 5 and buf[4] == 0 and buf[5] == 1:
+            try:
+                return _parse(buf, True)
+            except (ValueError, IndexError, struct.error):
+                pass
+        return _parse(buf, False)
+    except (IndexError, struct.error) as e:
+        raise ValueError('Transaction data is truncated') from e
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_hex(hexstring: str) -> Optional[Transaction]:
+    """
+    Decode a hex encoded transaction using :func:`.parse_transaction` - or return ``None`` if it isn't valid.
+    The last :py:attr:`.DECODE_CACHE_SIZE` results are cached, so the returned transaction must not be modified.
+    """
+    try:
+        return parse_transaction(bytes.fromhex(hexstring))
+    except (TypeError, ValueError):
+        return None
+
+
+def push_data(data: Bytes) -> bytes:
+    """Encode a script operation which pushes ``data`` onto the stack"""
+    n = len(data)
+    if n < 0x4c:
+        prefix = bytes((n,))
+    elif n <= 0xff:
+        prefix = b'\x4c' + bytes((n,))
+    elif n <= 0xffff:
+        prefix = b'\x4d' + _U16.pack(n)
+    else:
+        prefix = b'\x4e' + _U32.pack(n)
+    return prefix + bytes(data)
+
+
+def p2pkh_script(pubkey_hash: bytes) -> bytes:
+    """The pay-to-pubkey-hash output script which pays to the 20 byte hash160 ``pubkey_hash``"""
+    return b'\x76\xa9\x14' + pubkey_hash + b'\x88\xac'
+
+
+def p2pkh_script_sig(signature: bytes, pubkey: bytes) -> bytes:
+    """The input script which spends a pay-to-pubkey-hash output - pushes of ``signature`` and ``pubkey``"""
+    return push_data(signature) + push_data(pubkey)
+
+
+def nulldata_script(data: bytes) -> bytes:
+    """An unspendable ``OP_RETURN`` output script carrying ``data``"""
+    return b'\x6a' + push_data(data)
+
+
+def script_type(script: Bytes) -> str:
+    """The bitcoind name of the output script type of ``script``, e.g. ``pubkeyhash`` or ``nulldata``"""
+    n = len(script)
+    if n == 25 and script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+        return 'pubkeyhash'
+    if n == 23 and script[:2] == b'\xa9\x14' and script[22] == 0x87:
+        return 'scripthash'
+    if n == 22 and script[:2] == b'\x00\x14':
+        return 'witness_v0_keyhash'
+    if n == 34 and script[:2] == b'\x00\x20':
+        return 'witness_v0_scripthash'
+    if n and script[0] == 0x6a:
+        return 'nulldata'
+    return 'nonstandard'
+
+
+def script_address(script: Bytes, version: int = P2PKH_VERSION) -> Optional[str]:
+    """The P2PKH address (with the version byte ``version``) paid by the output script ``script``, if it has one"""
+    if script_type(script) != 'pubkeyhash':
+        return None
+    return b58check_encode(bytes((version,)) + bytes(script[3:23]))
+
+
+def script_asm(script: Bytes, sighash: bool = False) -> str:
+    """
+    Disassemble ``script`` the same way as bitcoind, e.g. ``OP_DUP OP_HASH160 <hash> OP_EQUALVERIFY OP_CHECKSIG``.
+
+    :param bool sighash: Decode the hash type of pushed signatures, e.g. ``3044...[ALL]`` (for input scripts)
+    """
+    parts: List[str] = []
+    pos, n = 0, len(script)
+    while pos < n:
+        op = script[pos]
+        pos += 1
+        if not 0 < op <= 0x4e:
+            parts.append(_OPCODES.get(op, 'OP_UNKNOWN'))
+            continue
+        size = op
+        if op >= 0x4c:
+            width = {0x4c: 1, 0x4d: 2, 0x4e: 4}[op]
+            size = int.from_bytes(script[pos:pos + width], 'little')
+            pos += width
+        if pos + size > n:
+            parts.append('[error]')
+            break
+        data = script[pos:pos + size]
+        pos += size
+        if sighash and size > 8 and data[0] == 0x30 and data[-1] in _SIGHASH_NAMES:
+            parts.append(f'{data[:-1].hex()}[{_SIGHASH_NAMES[data[-1]]}]')
+        else:
+            parts.append(data.hex())
+    return ' '.join(parts)
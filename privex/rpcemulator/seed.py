@@ -0,0 +1,50 @@
+"""
+Command line tool for seeding an SQLite wallet database with large amounts of fake transactions, which can then be
+shared between test runs using ``BitcoinEmulator(store='wallet.db')``
+
+Transactions are generated in bulk using :func:`privex.rpcemulator.bitcoin.j_add_txs`, and are reproducible when
+``--seed`` is specified.
+
+Usage::
+
+    user@host: ~/rpcemulator $ python3 -m privex.rpcemulator.seed -n 1000000 --seed 123 /tmp/wallet.db
+    Added 1000000 transactions to /tmp/wallet.db in 14.52 seconds (68870 TX/s) - total transactions: 1000003
+
+"""
+import argparse
+import sys
+import time
+from typing import List
+
+from privex.rpcemulator import bitcoin
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        description='Seed an SQLite wallet database for the Bitcoin RPC emulator with fake transactions'
+    )
+    parser.add_argument('db', help='Path to the SQLite database to seed (created if it does not exist)')
+    parser.add_argument('-n', '--count', type=int, default=100000, help='Number of transactions to generate')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='Random seed, for reproducible transactions')
+    parser.add_argument('-a', '--account', default='', help='Wallet account to label the transactions under')
+    parser.add_argument('-c', '--category', choices=['receive', 'send'], default=None,
+                        help='Transaction category (default: random)')
+    parser.add_argument('-m', '--max-amount', default='1', help='Maximum amount per transaction')
+    parser.add_argument('-b', '--batch-size', type=int, default=10000, help='Transactions to insert per batch')
+    args = parser.parse_args(argv)
+
+    store = bitcoin.j_use_store(args.db)
+    start = time.time()
+    added = bitcoin.j_add_txs(
+        args.count, seed=args.seed, account=args.account, category=args.category, max_amount=args.max_amount,
+        batch_size=args.batch_size
+    )
+    taken = time.time() - start
+    print(f'Added {added} transactions to {args.db} in {taken:.2f} seconds ({added / max(taken, 0.000001):.0f} TX/s)'
+          f' - total transactions: {len(store)}')
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Per-method instrumentation for the JsonRPC emulators - call counts, error counts, latency histograms and payload
+sizes for each RPC method, recorded by :mod:`privex.rpcemulator.dispatcher` around every method call.
+
+Counters are kept per thread (so recording a call never takes a lock), and are only combined when they're read,
+via the ``emulator_stats`` RPC method, :func:`.snapshot` or the Prometheus text format from :func:`.prometheus_text`
+(served at ``/metrics`` when the emulator is started with ``metrics=True``).
+
+    $ curl -s --data '{"jsonrpc": "2.0", "method": "emulator_stats", "id": 1}' http://127.0.0.1:8332
+    {"jsonrpc": "2.0", "result": {"pid": 1234, "uptime": 12.5, "methods": {"getbalance": {"calls": 120, ...}}}, ...}
+
+When the emulator is ran with multiple worker processes, each worker keeps its own stats, so ``emulator_stats``
+reports the stats of whichever worker served the request (identified by ``pid``).
+
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from jsonrpcserver import method
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+"""Upper bounds (in seconds) of the latency histogram buckets - calls slower than the last bound go into ``+Inf``"""
+
+enabled = True
+"""Set ``stats.enabled = False`` to stop recording calls"""
+
+CALLS, ERRORS, SECONDS, REQUEST_BYTES, RESPONSE_BYTES, BUCKETS = range(6)
+
+_local = threading.local()
+_registry: List[Tuple[threading.Thread, Dict[str, list]]] = []
+_retired: Dict[str, list] = {}
+_registry_lock = threading.Lock()
+_started = time.time()
+
+
+def _new_counters() -> list:
+    return [0, 0, 0.0, 0, 0] + [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+def _merge(into: Dict[str, list], counters: Dict[str, list]):
+    for name, c in counters.items():
+        total = into.get(name)
+        if total is None:
+            total = into[name] = _new_counters()
+        for i, v in enumerate(c):
+            total[i] += v
+
+
+def _sweep():
+    """Fold the counters of threads which have exited into ``_retired`` - must be called with the registry lock"""
+    alive = []
+    for thread, counters in _registry:
+        if thread.is_alive():
+            alive.append((thread, counters))
+        else:
+            _merge(_retired, counters)
+    _registry[:] = alive
+
+
+def _thread_counters() -> Dict[str, list]:
+    try:
+        return _local.counters
+    except AttributeError:
+        counters = _local.counters = {}
+        with _registry_lock:
+            # Threaded servers may use a new thread per connection, so don't let dead threads pile up
+            if len(_registry) >= 64 and len(_registry) % 64 == 0:
+                _sweep()
+            _registry.append((threading.current_thread(), counters))
+        return counters
+
+
+def record(name: str, seconds: float, error: bool = False, request_bytes: int = 0, response_bytes: int = 0):
+    """
+    Record a single call of the RPC method ``name``
+
+    :param str name: The name of the RPC method
+    :param float seconds: How long the call took
+    :param bool error: ``True`` if the call returned an error
+    :param int request_bytes: The size of the call's JSON request
+    :param int response_bytes: The size of the call's JSON result
+    """
+    if not enabled:
+        return
+    counters = _thread_counters()
+    c = counters.get(name)
+    if c is None:
+        c = counters[name] = _new_counters()
+    c[CALLS] += 1
+    c[ERRORS] += error
+    c[SECONDS] += seconds
+    c[REQUEST_BYTES] += request_bytes
+    c[RESPONSE_BYTES] += response_bytes
+    c[BUCKETS + bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+def _totals() -> Dict[str, list]:
+    with _registry_lock:
+        _sweep()
+        totals = {}
+        _merge(totals, _retired)
+        for _, counters in _registry:
+            _merge(totals, dict(counters))
+    return totals
+
+
+def clear():
+    """Clear all recorded stats"""
+    global _started
+    with _registry_lock:
+        _retired.clear()
+        for _, counters in _registry:
+            counters.clear()
+        _started = time.time()
+
+
+def _percentile_ms(buckets: List[int], calls: int, pct: float) -> Optional[float]:
+    """
+    Estimate the ``pct`` percentile in milliseconds from the histogram, as the upper bound of the bucket it falls
+    into - or ``None`` if it's slower than the last bucket.
+    """
+    target, seen = calls * pct / 100, 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if seen >= target and count:
+            return LATENCY_BUCKETS[i] * 1000 if i < len(LATENCY_BUCKETS) else None
+    return 0.0
+
+
+def snapshot() -> dict:
+    """
+    Returns the stats recorded by this process, combined across all threads::
+
+        >>> snapshot()
+        {'pid': 1234, 'uptime': 12.5, 'methods': {
+            'getbalance': {'calls': 120, 'errors': 0, 'total_seconds': 0.031, 'mean_ms': 0.258, 'p50_ms': 0.25,
+                           'p99_ms': 1.0, 'request_bytes': 6960, 'response_bytes': 480,
+                           'histogram': {'0.0001': 0, '0.00025': 64, ..., '+Inf': 0}},
+            ...
+        }}
+
+    Histogram buckets hold the number of calls which took at most that many seconds (not cumulative), and the
+    percentiles are estimated from the histogram.
+    """
+    methods = {}
+    for name, c in sorted(_totals().items()):
+        calls, buckets = c[CALLS], c[BUCKETS:]
+        methods[name] = dict(
+            calls=calls, errors=c[ERRORS], total_seconds=round(c[SECONDS], 6),
+            mean_ms=round(c[SECONDS] / calls * 1000, 3) if calls else 0.0,
+            p50_ms=_percentile_ms(buckets, calls, 50), p99_ms=_percentile_ms(buckets, calls, 99),
+            request_bytes=c[REQUEST_BYTES], response_bytes=c[RESPONSE_BYTES],
+            histogram={**{str(le): n for le, n in zip(LATENCY_BUCKETS, buckets)}, '+Inf': buckets[-1]},
+        )
+    return dict(pid=os.getpid(), uptime=round(time.time() - _started, 3), methods=methods)
+
+
+def prometheus_text(prefix: str = 'rpcemulator') -> str:
+    """
+    Returns the recorded stats in the Prometheus text exposition format, e.g. ::
+
+        # TYPE rpcemulator_calls_total counter
+        rpcemulator_calls_total{method="getbalance"} 120
+        ...
+        # TYPE rpcemulator_latency_seconds histogram
+        rpcemulator_latency_seconds_bucket{method="getbalance",le="0.0001"} 0
+        ...
+
+    """
+    # Method names come from clients, so escape them before using them as label values
+    totals = [
+        (n.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'), c) for n, c in sorted(_totals().items())
+    ]
+    lines = []
+    for metric, idx, help_text in (
+        ('calls_total', CALLS, 'Total JsonRPC calls by method'),
+        ('errors_total', ERRORS, 'Total JsonRPC calls which returned an error, by method'),
+        ('request_bytes_total', REQUEST_BYTES, 'Total size of JsonRPC requests in bytes, by method'),
+        ('response_bytes_total', RESPONSE_BYTES, 'Total size of JsonRPC results in bytes, by method'),
+    ):
+        lines += [f'# HELP {prefix}_{metric} {help_text}', f'# TYPE {prefix}_{metric} counter']
+        lines += [f'{prefix}_{metric}{{method="{name}"}} {c[idx]}' for name, c in totals]
+
+    metric = f'{prefix}_latency_seconds'
+    lines += [f'# HELP {metric} JsonRPC call latency in seconds, by method', f'# TYPE {metric} histogram']
+    for name, c in totals:
+        cumulative = 0
+        for le, count in zip(LATENCY_BUCKETS + ('+Inf',), c[BUCKETS:]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{method="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{method="{name}"}} {c[SECONDS]}')
+        lines.append(f'{metric}_count{{method="{name}"}} {c[CALLS]}')
+    return '\n'.join(lines) + '\n'
+
+
+@method
+def emulator_stats(reset: bool = False):
+    """
+    RPC method returning the per-method stats recorded by the emulator (see :func:`.snapshot`)
+
+    :param bool reset: If ``True``, clear the stats after returning them
+    """
+    res = snapshot()
+    if reset:
+        clear()
+    return res
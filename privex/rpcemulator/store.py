@@ -0,0 +1,1195 @@
+"""
+Indexed transaction storage used by the emulators, e.g. ``internal["transactions"]`` in :mod:`.bitcoin`
+
+:class:`.TransactionStore` behaves like a ``list`` of transaction ``dict`` s (append / iterate / index / len), but
+also maintains indexes by txid, address, account, category and block height, as well as running balances which are
+updated as each transaction is added - so lookups and balance queries don't need to scan the entire transaction history.
+
+Each store also holds the emulated chain tip (:py:attr:`.BaseTransactionStore.tip`). Transactions store the height of
+the block they were confirmed in (``blockheight``, or ``None`` while unconfirmed), and their ``confirmations`` are
+derived from the tip when they're serialized - so adding a block (:py:meth:`.BaseTransactionStore.add_block`) doesn't
+need to touch any transaction other than the ones confirmed in it. Transactions added with ``confirmations`` instead of
+a ``blockheight`` are placed that many blocks below the tip.
+
+Unconfirmed transactions are also added to the store's mempool (:py:attr:`.BaseTransactionStore.mempool`, see
+:mod:`privex.rpcemulator.mempool`), which decides which of them are confirmed by
+:py:meth:`.BaseTransactionStore.mine_block`. The ``fee`` of a send transaction (negative, same as bitcoind) is
+included in the balances, on top of its ``amount``.
+
+Each store also keeps the wallet's unspent outputs (:py:attr:`.BaseTransactionStore.utxos`, see
+:mod:`privex.rpcemulator.utxo`), which are created by ``receive`` transactions and spent by ``send`` transactions as
+they're added.
+
+Basic Usage::
+
+    >>> from privex.rpcemulator.store import TransactionStore
+    >>> store = TransactionStore()
+    >>> store.append(dict(account='', address='1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', amount=Decimal('0.1'),
+    ...                   category='receive', txid='db3f9b83...', confirmations=5))
+    >>> store.get('db3f9b83...')['address']
+    '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8'
+    >>> store.balance()
+    Decimal('0.1')
+
+"""
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from time import time as _now
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from privex.rpcemulator.mempool import MAX_BLOCK_WEIGHT, BaseMempool, Mempool, SqliteMempool
+from privex.rpcemulator.utxo import BaseUTXOSet, Outpoint, SqliteUTXOSet, UTXOSet
+
+ALL_ACCOUNTS = ('', '*', None)
+"""Account names which refer to "all accounts" when querying balances / transactions"""
+
+DEFAULT_TIP = 601440
+"""The chain height of new stores (the Bitcoin mainnet height when the emulator was written)"""
+
+BLOCK_SPACING = 600
+"""Seconds between blocks, used to estimate the time of blocks which were mined before the store was created"""
+
+
+def _account_key(account: Optional[str]) -> str:
+    return '' if account is None else account.lower()
+
+
+def _net_amount(tx: dict) -> Decimal:
+    """The change in balance caused by ``tx`` - its amount, plus its (negative) fee if it's a send"""
+    return Decimal(tx['amount']) + Decimal(tx.get('fee') or 0)
+
+
+def _mempool_entry(tx: dict, tip: int) -> dict:
+    """The mempool entry (see :py:meth:`.BaseMempool.add`) for the unconfirmed wallet transaction ``tx``"""
+    return dict(txid=tx['txid'], fee=tx.get('fee') or 0, time=tx.get('time'), height=tip)
+
+
+def block_hash(height: int) -> str:
+    """
+    Return the (fake) hash of the emulated block at ``height``.
+
+    Hashes are derived from the height, so every process agrees on them without storing them, and the height is
+    encoded in the last 8 hex digits, so blocks can be looked up by hash using :func:`.block_hash_height`.
+    """
+    digest = hashlib.sha256(f'rpcemulator-block:{height}'.encode()).hexdigest()
+    return '0' * 16 + digest[:40] + f'{height:08x}'
+
+
+def block_hash_height(blockhash: str) -> Optional[int]:
+    """Return the height of the block with the hash ``blockhash`` (see :func:`.block_hash`), or ``None`` if invalid"""
+    try:
+        height = int(blockhash[-8:], 16)
+    except (TypeError, ValueError):
+        return None
+    return height if len(blockhash) == 64 and block_hash(height) == blockhash.lower() else None
+
+
+def with_height(tx: dict, tip: int) -> dict:
+    """
+    Returns ``tx`` with a ``blockheight`` key (``None`` if unconfirmed). Transactions which have ``confirmations``
+    instead are copied, and placed ``confirmations`` blocks below ``tip`` (no lower than block ``0``).
+    """
+    if 'confirmations' not in tx and 'blockheight' in tx:
+        return tx
+    tx = dict(tx)
+    conf = tx.pop('confirmations', 0)
+    if 'blockheight' not in tx:
+        tx['blockheight'] = max(tip - int(conf) + 1, 0) if conf and int(conf) > 0 else None
+    return tx
+
+
+def serialize_tx(tx: dict, cast_decimal=float) -> dict:
+    """
+    Returns a copy of the transaction ``tx`` with unserializable types such as ``Decimal`` casted appropriately.
+
+    :param dict tx: A transaction dict
+    :param cast_decimal: A casting function to use to convert Decimal's, e.g. ``float`` or ``str``
+    :return dict tx: The transaction, with values converted to allow JSON serialisation.
+    """
+    return {k: cast_decimal(v) if type(v) is Decimal else v for k, v in tx.items()}
+
+
+class BaseTransactionStore(ABC):
+    """
+    Base class for transaction storage backends, such as the in-memory :class:`.TransactionStore` and the
+    SQLite backed :class:`.SqliteTransactionStore`.
+
+    Transactions are identified by their position - the order they were added in, starting from ``0``.
+
+    Sub-classes must implement the abstract methods, while helpers such as :py:meth:`.get`, :py:meth:`.find`,
+    :py:meth:`.views` and :py:meth:`.richest` are built on top of them.
+    """
+    mempool: BaseMempool
+    """
+    The unconfirmed transactions waiting to be mined, including foreign transactions which aren't in the store.
+    Unconfirmed transactions are added to it when they're added to the store, and removed once confirmed.
+    """
+    utxos: BaseUTXOSet
+    """
+    The wallet's unspent transaction outputs, updated as transactions are added (see :py:meth:`.extend`), with their
+    block heights kept in sync with the transactions which created them.
+    """
+
+    @property
+    @abstractmethod
+    def tip(self) -> int:
+        """The height of the most recent block in the emulated chain"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_block(self, positions: Iterable[int] = (), time: int = None) -> int:
+        """
+        Add a block on top of the chain tip, confirming the unconfirmed transactions at ``positions`` in it.
+
+        Only the transactions in the block are updated - every other transaction's confirmations are derived from the
+        new tip - so an empty block costs ``O(1)``.
+
+        :param positions: Positions of unconfirmed transactions to include in the block
+        :param int time: UNIX timestamp of the block (default: now)
+        :return int height: The height of the new block
+        """
+        raise NotImplementedError
+
+    def mine_block(self, max_weight: int = MAX_BLOCK_WEIGHT, time: int = None) -> int:
+        """
+        Add a block containing the highest feerate transactions in the :py:attr:`.mempool` which fit into
+        ``max_weight`` (see :py:meth:`.BaseMempool.select`), confirming the wallet transactions among them.
+
+        :param int max_weight: The maximum weight of the block
+        :param int time: UNIX timestamp of the block (default: now)
+        :return int height: The height of the new block
+        """
+        txids = self.mempool.select(max_weight)
+        height = self.add_block([p for t in txids for p in self.txid_positions(t)], time=time)
+        self.mempool.remove(txids)
+        return height
+
+    @abstractmethod
+    def block_time(self, height: int) -> int:
+        """Return the UNIX timestamp of the block at ``height``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def height_positions(self, start: int, end: int = None) -> Sequence[int]:
+        """
+        Return the positions of the transactions confirmed in blocks ``start`` to ``end`` (inclusive, default: the
+        chain tip), in the order they were added. Uses the block height index, so this costs ``O(log n + k)``.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def mempool_positions(self) -> Sequence[int]:
+        """Return the positions of the unconfirmed transactions, in the order they were added"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def append(self, tx: dict):
+        """Add a transaction to the end of the store, updating the indexes and running balances"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, pos: int, **changes) -> dict:
+        """Replace the transaction at position ``pos`` with a copy containing ``changes``, and return it"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def view(self, pos: int) -> dict:
+        """Return a JSON serializable copy of the transaction at position ``pos`` (must be treated as read-only)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def txid_positions(self, txid: str) -> Sequence[int]:
+        """Return the positions of the transactions with the txid ``txid``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def address_positions(self, address: str) -> Sequence[int]:
+        """Return the positions of the transactions sending from, or received into ``address``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def account_positions(self, account: str) -> Sequence[int]:
+        """
+        Return the positions of the transactions for the (case insensitive) account ``account``, or all
+        transactions if ``account`` is ``"*"``, ``""`` or ``None``
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def category_positions(self, category: str) -> Sequence[int]:
+        """Return the positions of the transactions in the category ``category``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def page(self, account: str = '*', count: int = 10, skip: int = 0) -> Sequence[int]:
+        """
+        Return the positions of the ``count`` most recently added transactions for ``account``, after skipping
+        the ``skip`` most recent ones - in the order they were added (oldest first), same as bitcoind's
+        ``listtransactions``.
+
+        :param str account: Only return transactions for this account (``"*"``, ``""`` or ``None`` for all)
+        :param int count: The maximum number of transactions to return
+        :param int skip: Skip this many of the most recent transactions
+        :return Sequence[int] positions: The positions of the transactions
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def balance(self, account: str = '*', confirmations: int = 0) -> Decimal:
+        """
+        Return the balance of ``account`` (or all accounts if ``account`` is ``"*"``, ``""`` or ``None``),
+        only counting transactions with at least ``confirmations`` confirmations.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def address_balance(self, address: str, confirmations: int = 0) -> Decimal:
+        """Return the balance of ``address`` - received amounts minus sent amounts"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def received_by_address(self, address: str, confirmations: int = 0) -> Decimal:
+        """Return the total amount received into ``address`` (excludes send transactions)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def select_addresses(self, amount: Decimal = None, limit: int = None,
+                         predicate: Callable[[str], bool] = None) -> List[Tuple[str, Decimal]]:
+        """
+        Return ``(address, balance)`` tuples for addresses with a positive balance, richest first, stopping once the
+        balances add up to at least ``amount``, or ``limit`` addresses have been returned.
+
+        :param Decimal amount: Stop once the returned balances add up to at least this amount
+        :param int limit: Return at most this many addresses
+        :param callable predicate: Skip addresses for which ``predicate(address)`` returns ``False``
+        :return list addresses: A list of ``(address, balance)`` tuples, ordered by balance descending
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def __getitem__(self, pos: int) -> dict:
+        raise NotImplementedError
+
+    def add(self, tx: dict):
+        """Alias for :py:meth:`.append`"""
+        return self.append(tx)
+
+    @abstractmethod
+    def extend(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()):
+        """
+        Add each transaction in ``txs``, updating the indexes, running balances and :py:attr:`.utxos`.
+
+        :param txs: The transactions to add
+        :param spends: The ``(txid, vout)`` outpoints spent by the transactions. If ``None``, each ``send`` spends the
+                       largest UTXOs of its address instead (see :py:meth:`.BaseUTXOSet.apply`)
+        :param change: Change outputs created by the transactions - dicts of ``{txid, vout, address, amount}``
+        """
+        raise NotImplementedError
+
+    def _select(self, positions: Iterable[int]) -> List[dict]:
+        return [self[p] for p in positions]
+
+    def confirmations(self, tx: dict, tip: int = None) -> int:
+        """Return the number of confirmations of ``tx`` - ``0`` while it's unconfirmed"""
+        height = tx.get('blockheight')
+        return 0 if height is None else (self.tip if tip is None else tip) - height + 1
+
+    def serialize(self, tx: dict, cast_decimal=float, tip: int = None) -> dict:
+        """
+        Returns a copy of the transaction ``tx`` with unserializable types casted (see :func:`.serialize_tx`), plus
+        its ``confirmations``, and the ``blockhash`` / ``blocktime`` of the block it was confirmed in.
+        """
+        v = serialize_tx(tx, cast_decimal)
+        v['confirmations'] = self.confirmations(tx, tip)
+        if tx.get('blockheight') is not None:
+            v['blockhash'], v['blocktime'] = block_hash(tx['blockheight']), self.block_time(tx['blockheight'])
+        return v
+
+    def views(self, positions: Iterable[int]) -> List[dict]:
+        """Return JSON serializable copies (see :py:meth:`.view`) of the transactions at each of ``positions``"""
+        return [self.view(p) for p in positions]
+
+    def position(self, txid: str) -> Optional[int]:
+        """Return the position of the first transaction with the txid ``txid``, or ``None`` if it doesn't exist"""
+        pos = self.txid_positions(txid)
+        return pos[0] if pos else None
+
+    def get(self, txid: str) -> Optional[dict]:
+        """Return the first transaction with the txid ``txid``, or ``None`` if it doesn't exist"""
+        pos = self.position(txid)
+        return None if pos is None else self[pos]
+
+    def find(self, txid: str) -> List[dict]:
+        """Return all transactions with the txid ``txid`` (e.g. both the send and receive side)"""
+        return self._select(self.txid_positions(txid))
+
+    def by_address(self, address: str) -> List[dict]:
+        """Return all transactions sending from, or received into ``address``"""
+        return self._select(self.address_positions(address))
+
+    def by_account(self, account: str) -> List[dict]:
+        """Return all transactions for the (case insensitive) account ``account``"""
+        return self._select(self.account_positions(account))
+
+    def by_category(self, category: str) -> List[dict]:
+        """Return all transactions in the category ``category``"""
+        return self._select(self.category_positions(category))
+
+    def richest(self, predicate: Callable[[str], bool] = None) -> Optional[Tuple[str, Decimal]]:
+        """Return the ``(address, balance)`` of the address with the highest positive balance, or ``None``"""
+        res = self.select_addresses(limit=1, predicate=predicate)
+        return res[0] if res else None
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self[pos]
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} transactions={len(self)}>'
+
+
+class _HeightLedger:
+    """
+    A running balance bucketed by block height (``None`` = unconfirmed), plus the total across every height.
+
+    Balances with a minimum number of confirmations are calculated by subtracting the buckets of the most recent
+    blocks from the total, so they cost ``O(confirmations)`` rather than one bucket per block in the chain.
+    """
+    __slots__ = ('total', 'heights')
+
+    def __init__(self):
+        self.total = Decimal(0)
+        self.heights: Dict[Optional[int], Decimal] = defaultdict(Decimal)
+
+    def add(self, height: Optional[int], amount: Decimal):
+        self.total += amount
+        self.heights[height] += amount
+
+    def sum(self, tip: int, confirmations: int = 0) -> Decimal:
+        if confirmations <= 0:
+            return self.total
+        # Only transactions confirmed at or below this height have enough confirmations
+        threshold = tip - confirmations + 1
+        if confirmations > len(self.heights):
+            return sum((v for h, v in self.heights.items() if h is not None and h <= threshold), Decimal(0))
+        res = self.total - self.heights.get(None, 0)
+        for h in range(threshold + 1, tip + 1):
+            res -= self.heights.get(h, 0)
+        return res
+
+
+class TransactionStore(BaseTransactionStore):
+    """
+    In-memory transaction store, with indexes by txid, address, account, category and block height, plus running
+    balances.
+
+    Transactions are stored in insertion order, and each index maps a key to a list of positions within
+    :py:attr:`.transactions`. Balances are maintained per account and per address, and are bucketed by the height of
+    the block each transaction was confirmed in, so that balance queries with a minimum amount of confirmations only
+    need to subtract the buckets of the most recent blocks, rather than summing every transaction.
+
+    The total balance of each address is also kept in a max-heap, so the richest addresses can be found in
+    ``O(log n)`` (see :py:meth:`.richest` and :py:meth:`.select_addresses`) without sorting every address.
+
+    JSON serializable copies of transactions are only created when they're requested through :py:meth:`.view` /
+    :py:meth:`.views`, and are cached until the transaction is changed with :py:meth:`.update`, so returning a page
+    of transactions costs ``O(page)``, not ``O(history)``.
+
+    Transactions must not be modified in-place once added - use :py:meth:`.update` so the indexes,
+    balances and serialization cache are kept in sync.
+    """
+    transactions: List[dict]
+    """The stored transactions, in the order they were added"""
+
+    txids: Dict[str, List[int]]
+    """Maps a txid to the positions of the transactions with that txid (a send to ourselves has two entries)"""
+
+    addresses: Dict[str, List[int]]
+    """Maps an address to the positions of the transactions sending from, or received into that address"""
+
+    accounts: Dict[str, List[int]]
+    """Maps a lowercase account name to the positions of the transactions under that account"""
+
+    categories: Dict[str, List[int]]
+    """Maps a category (``send`` / ``receive``) to the positions of the transactions in that category"""
+
+    heights: Dict[int, List[int]]
+    """Maps a block height to the positions of the transactions confirmed in that block"""
+
+    unconfirmed: Dict[int, None]
+    """The positions of the unconfirmed transactions (an insertion ordered set)"""
+
+    def __init__(self, transactions: Iterable[dict] = None, tip: int = DEFAULT_TIP, tip_time: int = None,
+                 decimals: int = 8):
+        """
+        :param transactions: Transactions to add to the store
+        :param int tip: The initial chain height
+        :param int tip_time: UNIX timestamp of the block at ``tip`` (default: now) - older blocks are assumed to be
+                             :py:attr:`.BLOCK_SPACING` seconds apart
+        :param int decimals: The number of decimal places of the coin, used by the mempool and UTXO set to convert
+                             amounts to integer units
+        """
+        self.transactions = []
+        self.txids = defaultdict(list)
+        self.addresses = defaultdict(list)
+        self.accounts = defaultdict(list)
+        self.categories = defaultdict(list)
+        self.heights, self.unconfirmed, self._height_keys = {}, {}, []
+        self._tip, self._anchor = tip, (tip, int(_now()) if tip_time is None else int(tip_time))
+        self._block_times: Dict[int, int] = {}
+        self.mempool = Mempool(decimals)
+        self.utxos = UTXOSet(decimals)
+        # account -> height ledger. The key '*' holds the balance for all accounts.
+        self._account_balances = defaultdict(_HeightLedger)
+        # address -> height ledger of the balance / amount received
+        self._address_balances = defaultdict(_HeightLedger)
+        self._address_received = defaultdict(_HeightLedger)
+        # address -> total balance, and a lazily invalidated max-heap of (-balance, address). Whenever an address
+        # balance changes, a new entry is pushed - entries which don't match _totals are stale and skipped.
+        self._totals: Dict[str, Decimal] = {}
+        self._heap: List[Tuple[Decimal, str]] = []
+        # position -> JSON serializable copy of the transaction, populated on demand by view()
+        self._views: Dict[int, dict] = {}
+        if transactions is not None:
+            self.extend(transactions)
+
+    def _apply(self, tx: dict, sign: int = 1, push: bool = True):
+        """
+        Add (``sign=1``) or remove (``sign=-1``) the balance contribution of ``tx``. If ``push`` is ``False``, the
+        caller must call :py:meth:`._push` for the address once it's done updating balances.
+        """
+        amount, height = _net_amount(tx) * sign, tx.get('blockheight')
+        self._account_balances['*'].add(height, amount)
+        self._account_balances[_account_key(tx.get('account'))].add(height, amount)
+        self._address_balances[tx['address']].add(height, amount)
+        if tx['category'] == 'receive':
+            self._address_received[tx['address']].add(height, Decimal(tx['amount']) * sign)
+        self._totals[tx['address']] = self._totals.get(tx['address'], Decimal(0)) + amount
+        if push:
+            self._push(tx['address'])
+
+    def _push(self, address: str):
+        """Push the current balance of ``address`` onto the richest address heap"""
+        heapq.heappush(self._heap, (-self._totals[address], address))
+        # Rebuild the heap from scratch once it's mostly made up of stale entries, to keep it from growing forever
+        if len(self._heap) > 2 * len(self._totals) + 64:
+            self._heap = [(-b, a) for a, b in self._totals.items()]
+            heapq.heapify(self._heap)
+
+    _INDEXED = ('txid', 'address', 'account', 'category')
+
+    def _index(self, tx: dict, pos: int):
+        self.txids[tx['txid']].append(pos)
+        self.addresses[tx['address']].append(pos)
+        self.accounts[_account_key(tx.get('account'))].append(pos)
+        self.categories[tx['category']].append(pos)
+
+    def _unindex(self, tx: dict, pos: int):
+        self.txids[tx['txid']].remove(pos)
+        self.addresses[tx['address']].remove(pos)
+        self.accounts[_account_key(tx.get('account'))].remove(pos)
+        self.categories[tx['category']].remove(pos)
+
+    def _index_height(self, tx: dict, pos: int):
+        height = tx.get('blockheight')
+        if height is None:
+            self.unconfirmed[pos] = None
+            self.mempool.add(**_mempool_entry(tx, self._tip))
+            return
+        positions = self.heights.get(height)
+        if positions is None:
+            positions = self.heights[height] = []
+            insort(self._height_keys, height)
+        insort(positions, pos)
+
+    def _unindex_height(self, tx: dict, pos: int):
+        height = tx.get('blockheight')
+        if height is None:
+            del self.unconfirmed[pos]
+            return
+        positions = self.heights[height]
+        positions.remove(pos)
+        if not positions:
+            del self.heights[height]
+            self._height_keys.remove(height)
+
+    def append(self, tx: dict):
+        """Add a transaction to the end of the store, updating the indexes and running balances"""
+        tx = with_height(tx, self._tip)
+        pos = len(self.transactions)
+        self.transactions.append(tx)
+        self._index(tx, pos)
+        self._index_height(tx, pos)
+        self._apply(tx)
+        self.utxos.apply([tx])
+
+    def extend(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()):
+        """
+        Same as :py:meth:`.BaseTransactionStore.extend` - only updates the richest address heap once per address,
+        and the UTXO set once for the whole batch
+        """
+        touched, added = set(), []
+        for tx in txs:
+            tx = with_height(tx, self._tip)
+            pos = len(self.transactions)
+            self.transactions.append(tx)
+            self._index(tx, pos)
+            self._index_height(tx, pos)
+            self._apply(tx, push=False)
+            touched.add(tx['address'])
+            added.append(tx)
+        for addr in touched:
+            self._push(addr)
+        self.utxos.apply(added, spends, change)
+
+    def update(self, pos: int, **changes) -> dict:
+        """
+        Replace the transaction at position ``pos`` with a copy containing ``changes``, re-indexing it
+        and adjusting the running balances. Indexes are only updated for the keys which changed, so confirming a
+        transaction (changing its ``blockheight``) doesn't need to touch the txid / address / account indexes.
+
+        :param int pos: The position of the transaction within :py:attr:`.transactions`
+        :param changes: Keys to update in the transaction
+        :return dict tx: The updated transaction
+        """
+        old = self.transactions[pos]
+        new = with_height({**old, **changes}, self._tip)
+        reindex = any(old.get(k) != new.get(k) for k in self._INDEXED)
+        if reindex:
+            self._unindex(old, pos)
+        if old.get('blockheight') != new.get('blockheight'):
+            self._unindex_height(old, pos)
+            self._index_height(new, pos)
+            self.utxos.confirm([new['txid']], new.get('blockheight'))
+        self._apply(old, -1)
+        self._views.pop(pos, None)
+        self.transactions[pos] = new
+        if reindex:
+            self._index(new, pos)
+        self._apply(new)
+        return new
+
+    def view(self, pos: int) -> dict:
+        """
+        Return a JSON serializable copy of the transaction at position ``pos`` (see :py:meth:`.serialize`).
+
+        The copy is cached, and shared between callers - it must be treated as read-only. When new blocks have been
+        added since it was cached, a new copy is made with the updated ``confirmations``.
+        """
+        v = self._views.get(pos)
+        if v is None:
+            v = self._views[pos] = self.serialize(self.transactions[pos])
+        elif v['blockheight'] is not None and v['confirmations'] != self._tip - v['blockheight'] + 1:
+            v = self._views[pos] = {**v, 'confirmations': self._tip - v['blockheight'] + 1}
+        return v
+
+    @property
+    def tip(self) -> int:
+        return self._tip
+
+    def add_block(self, positions: Iterable[int] = (), time: int = None) -> int:
+        height = self._tip + 1
+        self._block_times[height] = int(_now() if time is None else time)
+        self._tip = height
+        txids = set()
+        for pos in positions:
+            if self.transactions[pos].get('blockheight') is None:
+                txids.add(self.update(pos, blockheight=height)['txid'])
+        self.mempool.remove(txids)
+        return height
+
+    def block_time(self, height: int) -> int:
+        t = self._block_times.get(height)
+        if t is None:
+            anchor, anchor_time = self._anchor
+            t = anchor_time - (anchor - height) * BLOCK_SPACING
+        return t
+
+    def height_positions(self, start: int, end: int = None) -> Sequence[int]:
+        end = self._tip if end is None else end
+        keys = self._height_keys[bisect_left(self._height_keys, start):bisect_right(self._height_keys, end)]
+        if len(keys) == 1:
+            return list(self.heights[keys[0]])
+        return sorted(p for h in keys for p in self.heights[h])
+
+    def mempool_positions(self) -> Sequence[int]:
+        return list(self.unconfirmed)
+
+    def txid_positions(self, txid: str) -> Sequence[int]:
+        return self.txids.get(txid, [])
+
+    def address_positions(self, address: str) -> Sequence[int]:
+        return self.addresses.get(address, [])
+
+    def account_positions(self, account: str) -> Sequence[int]:
+        if account in ALL_ACCOUNTS:
+            return range(len(self.transactions))
+        return self.accounts.get(_account_key(account), [])
+
+    def category_positions(self, category: str) -> Sequence[int]:
+        return self.categories.get(category, [])
+
+    def page(self, account: str = '*', count: int = 10, skip: int = 0) -> Sequence[int]:
+        """
+        Same as :py:meth:`.BaseTransactionStore.page` - only the requested window is sliced from the index,
+        so this costs ``O(count)`` regardless of how many transactions are stored.
+        """
+        positions = self.account_positions(account)
+        end = max(len(positions) - skip, 0)
+        return positions[max(end - count, 0):end]
+
+    def balance(self, account: str = '*', confirmations: int = 0) -> Decimal:
+        """
+        Return the balance of ``account`` (or all accounts if ``account`` is ``"*"``, ``""`` or ``None``),
+        only counting transactions with at least ``confirmations`` confirmations.
+        """
+        key = '*' if account in ALL_ACCOUNTS else _account_key(account)
+        ledger = self._account_balances.get(key)
+        return Decimal(0) if ledger is None else ledger.sum(self._tip, confirmations)
+
+    def address_balance(self, address: str, confirmations: int = 0) -> Decimal:
+        """Return the balance of ``address`` - received amounts minus sent amounts"""
+        ledger = self._address_balances.get(address)
+        return Decimal(0) if ledger is None else ledger.sum(self._tip, confirmations)
+
+    def address_balances(self) -> Dict[str, Decimal]:
+        """Return a dict mapping each address with at least one transaction to its balance"""
+        return dict(self._totals)
+
+    def _pop_richest(self, seen: set) -> Optional[Tuple[Decimal, str]]:
+        """Pop the next valid (non-stale, not yet ``seen``) heap entry, or return ``None`` if the heap is empty"""
+        while self._heap:
+            neg, addr = heapq.heappop(self._heap)
+            if addr in seen or self._totals.get(addr) != -neg:
+                continue
+            seen.add(addr)
+            return neg, addr
+        return None
+
+    def select_addresses(self, amount: Decimal = None, limit: int = None,
+                         predicate: Callable[[str], bool] = None) -> List[Tuple[str, Decimal]]:
+        """
+        Return ``(address, balance)`` tuples for addresses with a positive balance, richest first, stopping once the
+        balances add up to at least ``amount``, or ``limit`` addresses have been returned.
+
+        Only the returned entries are taken from the heap (and then put back), so this costs ``O(k log n)`` for
+        ``k`` returned addresses, rather than sorting every address.
+
+        :param Decimal amount: Stop once the returned balances add up to at least this amount
+        :param int limit: Return at most this many addresses
+        :param callable predicate: Skip addresses for which ``predicate(address)`` returns ``False``
+        :return list addresses: A list of ``(address, balance)`` tuples, ordered by balance descending
+        """
+        seen, popped, selected, total = set(), [], [], Decimal(0)
+        try:
+            while (amount is None or total < amount) and (limit is None or len(selected) < limit):
+                entry = self._pop_richest(seen)
+                if entry is None:
+                    break
+                popped.append(entry)
+                neg, addr = entry
+                if -neg <= 0:
+                    break
+                if predicate is not None and not predicate(addr):
+                    continue
+                selected.append((addr, -neg))
+                total += -neg
+        finally:
+            for entry in popped:
+                heapq.heappush(self._heap, entry)
+        return selected
+
+    def received_by_address(self, address: str, confirmations: int = 0) -> Decimal:
+        """Return the total amount received into ``address`` (excludes send transactions)"""
+        ledger = self._address_received.get(address)
+        return Decimal(0) if ledger is None else ledger.sum(self._tip, confirmations)
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __iter__(self):
+        return iter(self.transactions)
+
+    def __getitem__(self, item: Union[int, slice]):
+        return self.transactions[item]
+
+
+def _json_default(obj):
+    if isinstance(obj, Decimal):
+        return {'__decimal__': str(obj)}
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1 and '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+class SqliteTransactionStore(BaseTransactionStore):
+    """
+    SQLite backed transaction store, allowing wallets with tens of millions of transactions to be held without loading
+    them into Python dicts, persisted between runs, and shared between processes.
+
+    Transactions are stored in an indexed ``transactions`` table (by txid, address, account, category and block
+    height), while balances are kept in ledger tables which are updated in the same database transaction as each
+    inserted TX - so balance queries never need to sum the transaction history. Amounts in the ledgers are stored as
+    integers in the coin's smallest unit (e.g. satoshis), with the original ``Decimal`` kept in the stored transaction.
+
+    The chain tip is stored in the database too, so every process sharing the database sees the same blocks.
+
+    If the database already contains transactions (e.g. a fixture prepared by a previous run), they're used as-is,
+    so re-opening a large wallet is instant. Databases created before transactions had a block height are migrated
+    when they're opened, placing each transaction ``confirmations`` blocks below ``tip``.
+
+    Basic Usage::
+
+        >>> from privex.rpcemulator.store import SqliteTransactionStore
+        >>> from privex.rpcemulator.bitcoin import BitcoinEmulator
+        >>> with BitcoinEmulator(store=SqliteTransactionStore('/tmp/wallet.db')):
+        ...     # make some queries to the RPC at https://127.0.0.1:8332
+        ...
+
+    The connection is re-opened automatically if the store is used from a forked process, since SQLite connections
+    can't be shared across a fork.
+    """
+    # Ledger rows for unconfirmed transactions use this height, as NULLs can't be used in a primary key
+    UNCONFIRMED = -1
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transactions (
+        pos INTEGER PRIMARY KEY, txid TEXT NOT NULL, address TEXT NOT NULL, account TEXT NOT NULL,
+        category TEXT NOT NULL, amount INTEGER NOT NULL, blockheight INTEGER, data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS tx_txid ON transactions (txid);
+    CREATE INDEX IF NOT EXISTS tx_address ON transactions (address);
+    CREATE INDEX IF NOT EXISTS tx_account ON transactions (account, pos);
+    CREATE INDEX IF NOT EXISTS tx_category ON transactions (category);
+    CREATE INDEX IF NOT EXISTS tx_blockheight ON transactions (blockheight, pos);
+    CREATE TABLE IF NOT EXISTS account_ledger (
+        account TEXT NOT NULL, height INTEGER NOT NULL, balance INTEGER NOT NULL,
+        PRIMARY KEY (account, height)
+    );
+    CREATE TABLE IF NOT EXISTS address_ledger (
+        address TEXT NOT NULL, height INTEGER NOT NULL, balance INTEGER NOT NULL, received INTEGER NOT NULL,
+        PRIMARY KEY (address, height)
+    );
+    CREATE TABLE IF NOT EXISTS address_totals (address TEXT PRIMARY KEY, balance INTEGER NOT NULL);
+    CREATE INDEX IF NOT EXISTS address_totals_balance ON address_totals (balance);
+    CREATE TABLE IF NOT EXISTS chain (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, time INTEGER NOT NULL);
+    """
+
+    def __init__(self, path: str = ':memory:', transactions: Iterable[dict] = None, decimals: int = 8,
+                 mmap_size: int = 256 * 1024 * 1024, tip: int = DEFAULT_TIP, tip_time: int = None):
+        """
+        :param str path: The path to the SQLite database file, created if it doesn't exist. The default
+                         ``:memory:`` database is private to the process, so it won't be seen by a forked emulator.
+        :param transactions: Transactions to add if the database is empty (e.g. the default wallet transactions)
+        :param int decimals: The number of decimal places of the coin, used to convert amounts to integers
+        :param int mmap_size: Memory map up to this many bytes of the database file (``PRAGMA mmap_size``)
+        :param int tip: The initial chain height, if the database doesn't have one yet
+        :param int tip_time: UNIX timestamp of the block at ``tip`` (default: now), if the database doesn't have one
+        """
+        self.path, self.mmap_size = path, mmap_size
+        self.unit = Decimal(10) ** decimals
+        self._conn, self._pid = None, None
+        self._init_chain = (int(tip), int(_now()) if tip_time is None else int(tip_time))
+        # Block times never change once a block is added, so they're safe to cache (even across processes)
+        self._block_times: Dict[int, int] = {}
+        self.mempool = SqliteMempool(self)
+        self.utxos = SqliteUTXOSet(self)
+        if transactions is not None and len(self) == 0:
+            self.extend(transactions)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection for the current process - (re-)connects if needed"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA cache_size=-65536')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                columns = {r[1] for r in conn.execute('PRAGMA table_info(transactions)')}
+                has_mempool = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'mempool'").fetchone()
+                has_utxos = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'utxos'").fetchone()
+                if 'confirmations' in columns:
+                    self._migrate(conn)
+                else:
+                    self._create_schema(conn)
+                if columns and not has_mempool:
+                    # Databases created before the mempool existed may already have unconfirmed transactions
+                    self.mempool._add(conn.cursor(), (
+                        _mempool_entry(self._load(None, r[0]), self._init_chain[0])
+                        for r in conn.execute('SELECT data FROM transactions WHERE blockheight IS NULL')
+                    ))
+                if columns and not has_utxos:
+                    self._replay_utxos(conn.cursor())
+                tip, tip_time = self._init_chain
+                conn.executemany(
+                    'INSERT OR IGNORE INTO chain (key, value) VALUES (?, ?)',
+                    [('tip', tip), ('anchor', tip), ('anchor_time', tip_time)]
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        # executescript() would commit the current transaction, so each statement is ran individually
+        for stmt in self.SCHEMA.split(';'):
+            if stmt.strip():
+                conn.execute(stmt)
+        for stmt in SqliteMempool.SCHEMA + SqliteUTXOSet.SCHEMA:
+            conn.execute(stmt)
+
+    def _replay_utxos(self, cur: sqlite3.Cursor, batch_size: int = 10000):
+        """
+        Build the UTXO set of a database created before UTXOs were tracked, by replaying its transactions - each
+        ``send`` spends the largest UTXOs of its address (see :py:meth:`.BaseUTXOSet.apply`)
+        """
+        rows = cur.connection.execute('SELECT blockheight, data FROM transactions ORDER BY pos')
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            self.utxos._apply(cur, [self._load(*r) for r in batch])
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Convert a database which stored ``confirmations`` per transaction to store block heights"""
+        tip = self._init_chain[0]
+        # The old column was NOT NULL, which SQLite can't alter in place, so the table is copied into a new one
+        conn.execute('ALTER TABLE transactions RENAME TO old_transactions')
+        conn.execute('DROP TABLE IF EXISTS account_ledger')
+        conn.execute('DROP TABLE IF EXISTS address_ledger')
+        self._create_schema(conn)
+        conn.execute(
+            'INSERT INTO transactions (pos, txid, address, account, category, amount, blockheight, data) '
+            'SELECT pos, txid, address, account, category, amount, '
+            'CASE WHEN confirmations > 0 THEN MAX(? - confirmations + 1, 0) END, data FROM old_transactions', (tip,)
+        )
+        # Dropping the old table also drops its indexes, so the second pass creates them for the new table
+        conn.execute('DROP TABLE old_transactions')
+        self._create_schema(conn)
+        conn.execute(
+            'INSERT INTO account_ledger (account, height, balance) SELECT \'*\', COALESCE(blockheight, ?), '
+            'SUM(amount) FROM transactions GROUP BY 2', (self.UNCONFIRMED,)
+        )
+        conn.execute(
+            'INSERT INTO account_ledger (account, height, balance) SELECT account, COALESCE(blockheight, ?), '
+            'SUM(amount) FROM transactions WHERE true GROUP BY 1, 2 '
+            'ON CONFLICT (account, height) DO UPDATE SET balance = balance + excluded.balance', (self.UNCONFIRMED,)
+        )
+        conn.execute(
+            'INSERT INTO address_ledger (address, height, balance, received) SELECT address, '
+            'COALESCE(blockheight, ?), SUM(amount), SUM(CASE WHEN category = \'receive\' THEN amount ELSE 0 END) '
+            'FROM transactions GROUP BY 1, 2', (self.UNCONFIRMED,)
+        )
+
+    def close(self):
+        """Close the SQLite connection (it will be re-opened if the store is used again)"""
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def _units(self, amount) -> int:
+        return int((Decimal(amount) * self.unit).to_integral_value())
+
+    def _decimal(self, units: Optional[int]) -> Decimal:
+        return Decimal(units or 0) / self.unit
+
+    def _apply(self, cur: sqlite3.Cursor, txs: Iterable[Tuple[dict, int]]):
+        """
+        Add (``sign=1``) or remove (``sign=-1``) the balance contribution of each ``(tx, sign)`` in ``txs`` to the
+        ledger tables. Contributions are summed in Python first, so each ledger row is only written once per batch.
+        """
+        accounts, addresses, totals = defaultdict(int), defaultdict(lambda: [0, 0]), defaultdict(int)
+        for tx, sign in txs:
+            amount, height = self._units(_net_amount(tx)) * sign, tx.get('blockheight')
+            height = self.UNCONFIRMED if height is None else height
+            accounts[('*', height)] += amount
+            accounts[(_account_key(tx.get('account')), height)] += amount
+            addr = addresses[(tx['address'], height)]
+            addr[0] += amount
+            if tx['category'] == 'receive':
+                addr[1] += self._units(tx['amount']) * sign
+            totals[tx['address']] += amount
+        cur.executemany(
+            'INSERT INTO account_ledger (account, height, balance) VALUES (?, ?, ?) '
+            'ON CONFLICT (account, height) DO UPDATE SET balance = balance + excluded.balance',
+            [k + (v,) for k, v in accounts.items()]
+        )
+        cur.executemany(
+            'INSERT INTO address_ledger (address, height, balance, received) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (address, height) DO UPDATE SET balance = balance + excluded.balance, '
+            'received = received + excluded.received', [k + tuple(v) for k, v in addresses.items()]
+        )
+        cur.executemany(
+            'INSERT INTO address_totals (address, balance) VALUES (?, ?) '
+            'ON CONFLICT (address) DO UPDATE SET balance = balance + excluded.balance', list(totals.items())
+        )
+
+    def _row(self, tx: dict) -> tuple:
+        return (
+            tx['txid'], tx['address'], _account_key(tx.get('account')), tx['category'], self._units(_net_amount(tx)),
+            tx.get('blockheight'), json.dumps(tx, default=_json_default)
+        )
+
+    def append(self, tx: dict):
+        self.extend([tx])
+
+    def extend(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()):
+        """Same as :py:meth:`.BaseTransactionStore.extend`, inside of a single database transaction"""
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            tip = self._tip(cur)
+            txs = [with_height(tx, tip) for tx in txs]
+            pos = self._next_pos(cur)
+            cur.executemany(
+                'INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((pos + i,) + self._row(tx) for i, tx in enumerate(txs))
+            )
+            self._apply(cur, ((tx, 1) for tx in txs))
+            self.mempool._add(cur, (_mempool_entry(tx, tip) for tx in txs if tx['blockheight'] is None))
+            self.utxos._apply(cur, txs, spends, change)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _next_pos(cur: sqlite3.Cursor) -> int:
+        return cur.execute('SELECT COALESCE(MAX(pos) + 1, 0) FROM transactions').fetchone()[0]
+
+    @staticmethod
+    def _tip(cur: sqlite3.Cursor) -> int:
+        return cur.execute("SELECT value FROM chain WHERE key = 'tip'").fetchone()[0]
+
+    def _update(self, cur: sqlite3.Cursor, pos: int, old: dict, **changes) -> dict:
+        new = with_height({**old, **changes}, self._tip(cur))
+        cur.execute(
+            'UPDATE transactions SET txid = ?, address = ?, account = ?, category = ?, amount = ?, '
+            'blockheight = ?, data = ? WHERE pos = ?', self._row(new) + (pos,)
+        )
+        self._apply(cur, [(old, -1), (new, 1)])
+        if old.get('blockheight') != new.get('blockheight'):
+            self.utxos._confirm(cur, [new['txid']], new['blockheight'])
+        return new
+
+    def update(self, pos: int, **changes) -> dict:
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            new = self._update(cur, pos, self[pos], **changes)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+        return new
+
+    @property
+    def tip(self) -> int:
+        return self._tip(self.conn.cursor())
+
+    def _add_block(self, cur: sqlite3.Cursor, positions: Iterable[int], time: Optional[int]) -> int:
+        height = self._tip(cur) + 1
+        block_time = int(_now() if time is None else time)
+        cur.execute('INSERT INTO blocks (height, time) VALUES (?, ?)', (height, block_time))
+        cur.execute("UPDATE chain SET value = ? WHERE key = 'tip'", (height,))
+        txids = set()
+        for pos, tx in zip(*self._load_positions(list(positions), cur)):
+            if tx.get('blockheight') is None:
+                txids.add(self._update(cur, pos, tx, blockheight=height)['txid'])
+        self.mempool._remove(cur, txids)
+        return height
+
+    def add_block(self, positions: Iterable[int] = (), time: int = None) -> int:
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            height = self._add_block(cur, positions, time)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+        return height
+
+    def mine_block(self, max_weight: int = MAX_BLOCK_WEIGHT, time: int = None) -> int:
+        """Same as :py:meth:`.BaseTransactionStore.mine_block`, but adds the block in a single database transaction"""
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            txids = self.mempool.select(max_weight)
+            positions = []
+            for i in range(0, len(txids), 500):
+                chunk = txids[i:i + 500]
+                positions += [r[0] for r in cur.execute(
+                    f'SELECT pos FROM transactions WHERE txid IN ({",".join("?" * len(chunk))}) ORDER BY pos', chunk
+                )]
+            height = self._add_block(cur, positions, time)
+            self.mempool._remove(cur, txids)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+        return height
+
+    def block_time(self, height: int) -> int:
+        t = self._block_times.get(height)
+        if t is None:
+            row = self.conn.execute('SELECT time FROM blocks WHERE height = ?', (height,)).fetchone()
+            if row is None:
+                chain = dict(self.conn.execute("SELECT key, value FROM chain WHERE key IN ('anchor', 'anchor_time')"))
+                row = (chain['anchor_time'] - (chain['anchor'] - height) * BLOCK_SPACING,)
+            t = self._block_times[height] = row[0]
+        return t
+
+    def height_positions(self, start: int, end: int = None) -> Sequence[int]:
+        rows = self.conn.execute(
+            'SELECT pos FROM transactions WHERE blockheight BETWEEN ? AND ? ORDER BY pos',
+            (start, self.tip if end is None else end)
+        )
+        return [r[0] for r in rows]
+
+    def mempool_positions(self) -> Sequence[int]:
+        return [r[0] for r in self.conn.execute('SELECT pos FROM transactions WHERE blockheight IS NULL ORDER BY pos')]
+
+    def __getitem__(self, pos: int) -> dict:
+        if pos < 0:
+            pos += len(self)
+        row = self.conn.execute('SELECT blockheight, data FROM transactions WHERE pos = ?', (pos,)).fetchone()
+        if row is None:
+            raise IndexError('transaction index out of range')
+        return self._load(*row)
+
+    def view(self, pos: int) -> dict:
+        return self.serialize(self[pos])
+
+    def _load(self, height: Optional[int], data: str) -> dict:
+        tx = json.loads(data, object_hook=_json_object_hook)
+        # The block height column is the source of truth (e.g. for transactions migrated from confirmations)
+        tx.pop('confirmations', None)
+        tx['blockheight'] = height
+        return tx
+
+    def _load_positions(self, positions: List[int], cur: sqlite3.Cursor = None) -> Tuple[List[int], List[dict]]:
+        """Load the transactions at ``positions`` in batches of 500 per query"""
+        cur, rows = self.conn.cursor() if cur is None else cur, {}
+        for i in range(0, len(positions), 500):
+            chunk = positions[i:i + 500]
+            rows.update((r[0], r[1:]) for r in cur.execute(
+                f'SELECT pos, blockheight, data FROM transactions WHERE pos IN ({",".join("?" * len(chunk))})', chunk
+            ))
+        return positions, [self._load(*rows[p]) for p in positions]
+
+    def views(self, positions: Iterable[int]) -> List[dict]:
+        """Same as :py:meth:`.BaseTransactionStore.views`, but loads the transactions in batches of 500 per query"""
+        tip = self.tip
+        if isinstance(positions, range) and positions.step == 1:
+            rows = self.conn.execute(
+                'SELECT blockheight, data FROM transactions WHERE pos >= ? AND pos < ? ORDER BY pos',
+                (positions.start, positions.stop)
+            )
+            return [self.serialize(self._load(*r), tip=tip) for r in rows]
+        return [self.serialize(tx, tip=tip) for tx in self._load_positions(list(positions))[1]]
+
+    def _positions(self, column: str, value) -> List[int]:
+        rows = self.conn.execute(f'SELECT pos FROM transactions WHERE {column} = ? ORDER BY pos', (value,))
+        return [r[0] for r in rows]
+
+    def txid_positions(self, txid: str) -> Sequence[int]:
+        return self._positions('txid', txid)
+
+    def address_positions(self, address: str) -> Sequence[int]:
+        return self._positions('address', address)
+
+    def account_positions(self, account: str) -> Sequence[int]:
+        if account in ALL_ACCOUNTS:
+            return range(len(self))
+        return self._positions('account', _account_key(account))
+
+    def category_positions(self, category: str) -> Sequence[int]:
+        return self._positions('category', category)
+
+    def page(self, account: str = '*', count: int = 10, skip: int = 0) -> Sequence[int]:
+        if account in ALL_ACCOUNTS:
+            end = max(len(self) - skip, 0)
+            return range(max(end - count, 0), end)
+        rows = self.conn.execute(
+            'SELECT pos FROM transactions WHERE account = ? ORDER BY pos DESC LIMIT ? OFFSET ?',
+            (_account_key(account), count, skip)
+        )
+        return [r[0] for r in rows][::-1]
+
+    def _ledger(self, table: str, column: str, key_column: str, key: str, confirmations: int) -> Decimal:
+        if confirmations <= 0:
+            row = self.conn.execute(f'SELECT SUM({column}) FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+        else:
+            # Only transactions confirmed at or below this height have enough confirmations
+            threshold = self.tip - confirmations + 1
+            row = self.conn.execute(
+                f'SELECT SUM({column}) FROM {table} WHERE {key_column} = ? AND height BETWEEN 0 AND ?',
+                (key, threshold)
+            ).fetchone()
+        return self._decimal(row[0])
+
+    def balance(self, account: str = '*', confirmations: int = 0) -> Decimal:
+        key = '*' if account in ALL_ACCOUNTS else _account_key(account)
+        return self._ledger('account_ledger', 'balance', 'account', key, confirmations)
+
+    def address_balance(self, address: str, confirmations: int = 0) -> Decimal:
+        return self._ledger('address_ledger', 'balance', 'address', address, confirmations)
+
+    def received_by_address(self, address: str, confirmations: int = 0) -> Decimal:
+        return self._ledger('address_ledger', 'received', 'address', address, confirmations)
+
+    def address_balances(self) -> Dict[str, Decimal]:
+        """Return a dict mapping each address with at least one transaction to its balance"""
+        return {a: self._decimal(b) for a, b in self.conn.execute('SELECT address, balance FROM address_totals')}
+
+    def select_addresses(self, amount: Decimal = None, limit: int = None,
+                         predicate: Callable[[str], bool] = None) -> List[Tuple[str, Decimal]]:
+        """
+        Same as :py:meth:`.BaseTransactionStore.select_addresses` - walks the ``address_totals`` balance index from
+        the richest address downwards, only reading as many rows as are needed.
+        """
+        selected, total = [], Decimal(0)
+        rows = self.conn.execute(
+            'SELECT address, balance FROM address_totals WHERE balance > 0 ORDER BY balance DESC'
+        )
+        for addr, bal in rows:
+            if (amount is not None and total >= amount) or (limit is not None and len(selected) >= limit):
+                break
+            if predicate is not None and not predicate(addr):
+                continue
+            bal = self._decimal(bal)
+            selected.append((addr, bal))
+            total += bal
+        return selected
+
+    def __len__(self) -> int:
+        return self._next_pos(self.conn.cursor())
+
+    def __iter__(self):
+        for row in self.conn.execute('SELECT blockheight, data FROM transactions ORDER BY pos'):
+            yield self._load(*row)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} path={self.path!r} transactions={len(self)}>'
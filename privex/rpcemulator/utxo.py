@@ -0,0 +1,682 @@
+"""
+Emulated UTXO set - the unspent transaction outputs held by the wallet of a transaction store (see
+:py:attr:`privex.rpcemulator.store.BaseTransactionStore.utxos`), which sends spend as their inputs, and which
+:func:`privex.rpcemulator.bitcoin.listunspent` answers from.
+
+Each UTXO is keyed by its outpoint ``(txid, vout)``, and holds the address it pays, its amount, and the height of the
+block it was confirmed in (``None`` while unconfirmed).
+
+ * UTXOs are indexed per address, and by amount (using a bucketed sorted list, or an SQLite index), so listing the
+   UTXOs of an address, or within an amount range, only reads the UTXOs which are returned - even for wallets holding
+   hundreds of thousands of UTXOs.
+ * Coin selection (:py:meth:`.BaseUTXOSet.select`) first searches for an input set which doesn't need change, using
+   branch and bound (see :func:`.branch_and_bound`) over the largest UTXOs which don't overshoot the target, and falls
+   back to spending the largest UTXOs first.
+
+UTXOs are created by the ``receive`` transactions added to the store. Spends are either given explicitly (by the
+wallet's own sends, see :py:meth:`.BaseUTXOSet.apply`), or derived from the ``send`` transactions being added - the
+largest UTXOs of the sending address are spent, with the change returned to it - so a wallet seeded with generated
+transactions has a UTXO set which adds up to its balance (as long as no address sends more than it holds - the UTXOs
+of an address can't go negative, while its balance can).
+
+Basic Usage::
+
+    >>> from privex.rpcemulator.utxo import UTXOSet
+    >>> utxos = UTXOSet()
+    >>> utxos.add([dict(txid='aa' * 32, vout=0, address='1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', amount='0.1')])
+    >>> utxos.select(Decimal('0.05'))
+    [{'txid': 'aaaa...', 'vout': 0, 'address': '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', 'amount': Decimal('0.1'), ...}]
+
+"""
+import heapq
+import sqlite3
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+Outpoint = Tuple[str, int]
+"""A ``(txid, vout)`` tuple identifying a transaction output"""
+
+DUST_LIMIT = 546
+"""Change outputs smaller than this many units (e.g. satoshis) are added to the fee instead of being created"""
+
+BNB_CANDIDATES = 1000
+"""Branch and bound coin selection only considers this many of the largest UTXOs which fit the target"""
+
+BNB_MAX_TRIES = 10000
+"""
+Give up searching for a changeless input set after visiting this many branches - a tenth of bitcoind's limit, so a
+failed search costs a few milliseconds rather than dominating the latency of a send
+"""
+
+
+def branch_and_bound(values: List[int], target: int, cost_of_change: int = 0,
+                     max_tries: int = BNB_MAX_TRIES) -> Optional[List[int]]:
+    """
+    Search for a subset of ``values`` which adds up to between ``target`` and ``target + cost_of_change``, so that
+    a transaction can spend them without a change output (same algorithm as bitcoind's ``SelectCoinsBnB``).
+
+    A depth first search which tries including, then excluding each value - branches are cut once they overshoot
+    the window, or once the values left can't reach ``target``. The subset with the least excess is returned.
+
+    :param list values: The amounts to choose from, sorted largest first
+    :param int target: The amount the selected values must add up to at least
+    :param int cost_of_change: The most the selected values may exceed ``target`` by
+    :param int max_tries: Give up after visiting this many branches
+    :return list indexes: The indexes of the selected values within ``values``, or ``None`` if there's no match
+    """
+    available = sum(values)
+    if available < target:
+        return None
+    best, best_waste = None, None
+    selection, value, i = [], 0, 0
+    for _ in range(max_tries):
+        backtrack = False
+        if value + available < target or value > target + cost_of_change:
+            backtrack = True
+        elif value >= target:
+            if best_waste is None or value - target < best_waste:
+                best, best_waste = list(selection), value - target
+                if not best_waste:
+                    break
+            backtrack = True
+        if backtrack:
+            if not selection:
+                break
+            # Put the values skipped since the last included one back, then try the branch excluding it
+            i -= 1
+            while i > selection[-1]:
+                available += values[i]
+                i -= 1
+            value -= values[i]
+            selection.pop()
+        else:
+            available -= values[i]
+            # Excluding a value and then including an equal one would only repeat the branch which was just searched
+            if not (selection and selection[-1] != i - 1 and values[i] == values[i - 1]):
+                selection.append(i)
+                value += values[i]
+        i += 1
+    return best
+
+
+def _units_key(utxo: tuple) -> int:
+    return utxo[0]
+
+
+class _SortedList:
+    """
+    A list of comparable values kept in order, split into sub-lists of up to ``2 * LOAD`` values, so that adding and
+    removing a value costs ``O(log n + LOAD)`` rather than ``O(n)``, while range queries only read what they return.
+    """
+    LOAD = 500
+
+    __slots__ = ('_lists', '_maxes', '_len')
+
+    def __init__(self, values: Iterable = ()):
+        self._lists: List[list] = []
+        self._maxes: list = []
+        self._len = 0
+        self.update(values)
+
+    def add(self, value):
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+        else:
+            i = bisect_left(self._maxes, value)
+            if i == len(self._maxes):
+                i -= 1
+                self._lists[i].append(value)
+                self._maxes[i] = value
+            else:
+                insort(self._lists[i], value)
+            self._split(i)
+        self._len += 1
+
+    def _split(self, i: int):
+        lst = self._lists[i]
+        if len(lst) > 2 * self.LOAD:
+            half = lst[self.LOAD:]
+            del lst[self.LOAD:]
+            self._maxes[i] = lst[-1]
+            self._lists.insert(i + 1, half)
+            self._maxes.insert(i + 1, half[-1])
+
+    def discard(self, value) -> bool:
+        """Remove ``value``, returning ``False`` if it wasn't in the list"""
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            return False
+        lst = self._lists[i]
+        j = bisect_left(lst, value)
+        if j == len(lst) or lst[j] != value:
+            return False
+        del lst[j]
+        self._len -= 1
+        if lst:
+            self._maxes[i] = lst[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+        return True
+
+    def update(self, values: Iterable):
+        """Add each of ``values`` - large batches are merged by re-sorting, rather than inserted one at a time"""
+        values = list(values)
+        if len(values) * 4 < self._len:
+            for v in values:
+                self.add(v)
+            return
+        merged = [v for lst in self._lists for v in lst]
+        merged.extend(values)
+        merged.sort()
+        self._lists = [merged[i:i + self.LOAD] for i in range(0, len(merged), self.LOAD)]
+        self._maxes = [lst[-1] for lst in self._lists]
+        self._len = len(merged)
+
+    def irange(self, lo=None, hi=None, reverse: bool = False) -> Iterator:
+        """Iterate over the values where ``lo <= value < hi`` (``None`` for no bound), in order or ``reverse``"""
+        if not self._maxes:
+            return
+        first = 0 if lo is None else bisect_left(self._maxes, lo)
+        last = len(self._maxes) - 1 if hi is None else min(bisect_left(self._maxes, hi), len(self._maxes) - 1)
+        blocks = range(last, first - 1, -1) if reverse else range(first, last + 1)
+        for i in blocks:
+            lst = self._lists[i]
+            start = 0 if lo is None or i != first else bisect_left(lst, lo)
+            end = len(lst) if hi is None or i != last else bisect_left(lst, hi)
+            if reverse:
+                for j in range(end - 1, start - 1, -1):
+                    yield lst[j]
+            else:
+                yield from lst[start:end]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        for lst in self._lists:
+            yield from lst
+
+
+class BaseUTXOSet(ABC):
+    """
+    Base class for UTXO set backends, such as the in-memory :class:`.UTXOSet` and the SQLite backed
+    :class:`.SqliteUTXOSet`.
+
+    Amounts are passed in and returned as ``Decimal`` amounts of the coin, and are stored as integer units, which
+    sub-classes convert using :py:meth:`._units` / :py:meth:`._decimal`. UTXOs are returned as dicts of
+    ``{txid, vout, address, amount, blockheight}``.
+
+    Locked UTXOs (see :py:meth:`.lock`) aren't returned by :py:meth:`.by_address` / :py:meth:`.by_amount`, so they're
+    never selected to be spent by the wallet's sends - but are still spent by transactions which name them explicitly.
+    """
+    unit: Decimal
+
+    def _units(self, amount) -> int:
+        return int((abs(Decimal(amount)) * self.unit).to_integral_value())
+
+    def _decimal(self, units: Optional[int]) -> Decimal:
+        return Decimal(units or 0) / self.unit
+
+    def _entry(self, txid: str, vout: int, address: str, units: int, height: Optional[int]) -> dict:
+        return dict(txid=txid, vout=vout, address=address, amount=self._decimal(units), blockheight=height)
+
+    def _plan(self, txs: Iterable[dict], spends: Optional[Iterable[Outpoint]], change: Iterable[dict],
+              address_utxos: Callable[[str], Iterator[Tuple[int, str, int]]]):
+        """
+        Work out which UTXOs are created and spent by adding ``txs`` (see :py:meth:`.apply`), without changing
+        anything - so the backend can then write the result in one go.
+
+        :param address_utxos: Returns an iterator of ``(units, txid, vout)`` for the stored UTXOs of an address,
+                              largest first (including locked UTXOs)
+        :return tuple plan: A dict mapping each new outpoint to ``(address, units, height)``, and the set of spent
+                            outpoints
+        """
+        added: Dict[Outpoint, Tuple[str, int, Optional[int]]] = {}
+        removed: Set[Outpoint] = set()
+        # address -> the UTXOs added by this batch, so later sends in the batch can spend them
+        pending: Dict[str, _SortedList] = defaultdict(_SortedList)
+
+        def _add(op: Outpoint, address: str, units: int, height: Optional[int]):
+            if units > 0:
+                added[op] = (address, units, height)
+                pending[address].add((units, *op))
+
+        def _spend(op: Outpoint):
+            removed.add(op)
+            if op in added:
+                address, units, _ = added.pop(op)
+                pending[address].discard((units, *op))
+
+        txs = list(txs)
+        # Change from derived spends is paid to the vouts after the transaction's own outputs
+        last_vout = {}
+        if spends is None:
+            for tx in txs:
+                last_vout[tx['txid']] = max(last_vout.get(tx['txid'], 0), int(tx.get('vout') or 0))
+        for tx in txs:
+            if tx['category'] == 'receive':
+                _add((tx['txid'], int(tx.get('vout') or 0)), tx['address'], self._units(tx['amount']),
+                     tx.get('blockheight'))
+                continue
+            if spends is not None or tx['category'] != 'send':
+                continue
+            address = tx['address']
+            needed = self._units(Decimal(tx['amount']) + Decimal(tx.get('fee') or 0))
+            if needed <= 0:
+                continue
+            # Both sources are largest first - they're materialised up front, as spending changes the pending list
+            candidates, spent = [], 0
+            for units, txid, vout in heapq.merge(
+                pending[address].irange(reverse=True), address_utxos(address), key=_units_key, reverse=True
+            ):
+                if spent >= needed:
+                    break
+                if (txid, vout) not in removed:
+                    candidates.append((txid, vout))
+                    spent += units
+            for op in candidates:
+                _spend(op)
+            if spent > needed:
+                last_vout[tx['txid']] += 1
+                _add((tx['txid'], last_vout[tx['txid']]), address, spent - needed, tx.get('blockheight'))
+        if spends is not None:
+            for txid, vout in spends:
+                _spend((txid, int(vout)))
+            for c in change:
+                _add((c['txid'], int(c['vout'])), c['address'], self._units(c['amount']), c.get('blockheight'))
+        return added, removed
+
+    @abstractmethod
+    def apply(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()) -> int:
+        """
+        Update the UTXO set for the wallet transactions ``txs`` - each ``receive`` creates a UTXO at its
+        ``(txid, vout)``.
+
+        If ``spends`` is ``None``, each ``send`` spends the largest UTXOs of its address until its amount plus fee is
+        covered (or the address runs out), paying any change back to the address. Otherwise, exactly the outpoints in
+        ``spends`` are spent, and the UTXOs in ``change`` are created.
+
+        :param txs: Wallet transactions (with a ``blockheight``), in the order they were added
+        :param spends: The outpoints spent by the transactions, or ``None`` to derive them from the ``send`` entries
+        :param change: UTXOs to create as well as the received outputs - dicts of ``{txid, vout, address, amount}``,
+                       optionally with a ``blockheight``
+        :return int spent: The number of UTXOs which were spent
+        """
+        raise NotImplementedError
+
+    def add(self, utxos: Iterable[dict]) -> int:
+        """Add each UTXO in ``utxos`` - dicts of ``{txid, vout, address, amount}``, optionally with a ``blockheight``"""
+        return self.apply((), spends=(), change=utxos)
+
+    def spend(self, outpoints: Iterable[Outpoint]) -> int:
+        """Remove each ``(txid, vout)`` in ``outpoints``, returning how many were unspent"""
+        return self.apply((), spends=outpoints)
+
+    @abstractmethod
+    def confirm(self, txids: Iterable[str], height: Optional[int]):
+        """Set the block height of the UTXOs created by each of ``txids`` (``None`` if they're unconfirmed again)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, txid: str, vout: int) -> Optional[dict]:
+        """Return the UTXO ``(txid, vout)`` (even if it's locked), or ``None`` if it's spent or doesn't exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def by_address(self, address: str) -> List[dict]:
+        """Return the unlocked UTXOs paying ``address``, largest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def by_amount(self, min_amount: Decimal = None, max_amount: Decimal = None) -> Iterator[dict]:
+        """Iterate over the unlocked UTXOs worth ``min_amount`` to ``max_amount`` (inclusive), largest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def entries(self) -> Iterator[dict]:
+        """Iterate over every UTXO, including locked ones"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def total(self) -> Decimal:
+        """Return the sum of every UTXO, including locked ones"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def lock(self, outpoints: Iterable[Outpoint]) -> int:
+        """Lock each ``(txid, vout)`` in ``outpoints``, so it isn't selected to be spent, returning how many"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def unlock(self, outpoints: Iterable[Outpoint] = None) -> int:
+        """Unlock each ``(txid, vout)`` in ``outpoints`` (or every locked UTXO if ``None``), returning how many"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def locked(self) -> List[Outpoint]:
+        """Return the ``(txid, vout)`` of each locked UTXO"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        """Remove every UTXO and lock"""
+        raise NotImplementedError
+
+    def is_locked(self, txid: str, vout: int) -> bool:
+        return (txid, int(vout)) in set(self.locked())
+
+    def select(self, target: Decimal, cost_of_change: Decimal = Decimal(0), predicate: Callable[[str], bool] = None,
+               bnb_candidates: int = BNB_CANDIDATES) -> Optional[List[dict]]:
+        """
+        Select unlocked UTXOs adding up to at least ``target``.
+
+        An input set which exceeds ``target`` by no more than ``cost_of_change`` is searched for first (see
+        :func:`.branch_and_bound`), among the ``bnb_candidates`` largest UTXOs which aren't worth more than
+        ``target + cost_of_change`` - so the transaction doesn't need a change output. If there isn't one, the
+        largest UTXOs are spent first, which keeps the number of inputs (and the fee) down.
+
+        :param Decimal target: The amount being spent, including the fee
+        :param Decimal cost_of_change: The extra fee a change output would cost - excess up to this is left as fee
+        :param callable predicate: Skip UTXOs paying addresses for which ``predicate(address)`` returns ``False``
+        :param int bnb_candidates: The maximum number of UTXOs to search for a changeless input set
+        :return list utxos: The selected UTXOs, or ``None`` if the unlocked UTXOs don't add up to ``target``
+        """
+        target_units, change_units = self._units(target), self._units(cost_of_change)
+        candidates, values = [], []
+        for u in self.by_amount(max_amount=self._decimal(target_units + change_units)):
+            if len(candidates) >= bnb_candidates:
+                break
+            if predicate is None or predicate(u['address']):
+                candidates.append(u)
+                values.append(self._units(u['amount']))
+        found = branch_and_bound(values, target_units, change_units)
+        if found is not None:
+            return [candidates[i] for i in found]
+        selected, total = [], 0
+        for u in self.by_amount():
+            if predicate is not None and not predicate(u['address']):
+                continue
+            selected.append(u)
+            total += self._units(u['amount'])
+            if total >= target_units:
+                return selected
+        return None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, outpoint: Outpoint) -> bool:
+        return self.get(*outpoint) is not None
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} utxos={len(self)}>'
+
+
+class UTXOSet(BaseUTXOSet):
+    """
+    In-memory UTXO set - UTXOs are kept in a dict by outpoint, indexed by txid, and by ``(units, txid, vout)`` in
+    sorted lists per address and across the whole wallet, so UTXOs can be listed largest first (or within an amount
+    range) without sorting.
+    """
+    def __init__(self, decimals: int = 8):
+        """:param int decimals: The number of decimal places of the coin, used to convert amounts to integer units"""
+        self.unit = Decimal(10) ** decimals
+        self.clear()
+
+    def _address_utxos(self, address: str) -> Iterator[Tuple[int, str, int]]:
+        lst = self._by_address.get(address)
+        return iter(()) if lst is None else lst.irange(reverse=True)
+
+    def _remove(self, op: Outpoint) -> bool:
+        u = self._utxos.pop(op, None)
+        if u is None:
+            return False
+        address, units = u[0], u[1]
+        key = (units, *op)
+        self._amounts.discard(key)
+        self._by_address[address].discard(key)
+        if not self._by_address[address]:
+            del self._by_address[address]
+        vouts = self._by_txid[op[0]]
+        vouts.discard(op[1])
+        if not vouts:
+            del self._by_txid[op[0]]
+        self._locked.pop(op, None)
+        self._total -= units
+        return True
+
+    def apply(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()) -> int:
+        added, removed = self._plan(txs, spends, change, self._address_utxos)
+        spent = sum(self._remove(op) for op in removed)
+        for op in added:
+            self._remove(op)
+        by_address = defaultdict(list)
+        for op, (address, units, height) in added.items():
+            self._utxos[op] = [address, units, height]
+            self._by_txid[op[0]].add(op[1])
+            by_address[address].append((units, *op))
+            self._total += units
+        for address, keys in by_address.items():
+            self._by_address[address].update(keys)
+        self._amounts.update(k for keys in by_address.values() for k in keys)
+        return spent
+
+    def confirm(self, txids: Iterable[str], height: Optional[int]):
+        for txid in txids:
+            for vout in self._by_txid.get(txid, ()):
+                self._utxos[(txid, vout)][2] = height
+
+    def get(self, txid: str, vout: int) -> Optional[dict]:
+        u = self._utxos.get((txid, int(vout)))
+        return None if u is None else self._entry(txid, int(vout), *u)
+
+    def by_address(self, address: str) -> List[dict]:
+        return [
+            self._entry(txid, vout, address, units, self._utxos[(txid, vout)][2])
+            for units, txid, vout in self._address_utxos(address) if (txid, vout) not in self._locked
+        ]
+
+    def by_amount(self, min_amount: Decimal = None, max_amount: Decimal = None) -> Iterator[dict]:
+        lo = None if min_amount is None else (self._units(min_amount),)
+        hi = None if max_amount is None else (self._units(max_amount) + 1,)
+        for units, txid, vout in self._amounts.irange(lo, hi, reverse=True):
+            if (txid, vout) in self._locked:
+                continue
+            u = self._utxos[(txid, vout)]
+            yield self._entry(txid, vout, u[0], units, u[2])
+
+    def entries(self) -> Iterator[dict]:
+        for (txid, vout), u in self._utxos.items():
+            yield self._entry(txid, vout, *u)
+
+    def total(self) -> Decimal:
+        return self._decimal(self._total)
+
+    def lock(self, outpoints: Iterable[Outpoint]) -> int:
+        locked = 0
+        for txid, vout in outpoints:
+            op = (txid, int(vout))
+            if op in self._utxos and op not in self._locked:
+                self._locked[op] = None
+                locked += 1
+        return locked
+
+    def unlock(self, outpoints: Iterable[Outpoint] = None) -> int:
+        if outpoints is None:
+            unlocked = len(self._locked)
+            self._locked.clear()
+            return unlocked
+        return sum(self._locked.pop((txid, int(vout)), 0) is None for txid, vout in outpoints)
+
+    def locked(self) -> List[Outpoint]:
+        return list(self._locked)
+
+    def is_locked(self, txid: str, vout: int) -> bool:
+        return (txid, int(vout)) in self._locked
+
+    def clear(self):
+        # (txid, vout) -> [address, units, height]
+        self._utxos: Dict[Outpoint, list] = {}
+        self._by_txid: Dict[str, Set[int]] = defaultdict(set)
+        self._by_address: Dict[str, _SortedList] = defaultdict(_SortedList)
+        self._amounts = _SortedList()
+        self._locked: Dict[Outpoint, None] = {}
+        self._total = 0
+
+    def __contains__(self, outpoint: Outpoint) -> bool:
+        return (outpoint[0], int(outpoint[1])) in self._utxos
+
+    def __len__(self) -> int:
+        return len(self._utxos)
+
+
+class SqliteUTXOSet(BaseUTXOSet):
+    """
+    SQLite backed UTXO set, stored in the database of a :class:`privex.rpcemulator.store.SqliteTransactionStore`,
+    so that it's shared by every process using the database.
+
+    UTXOs are stored in the ``utxos`` table, indexed by ``(address, amount)`` and by amount, while locked outpoints
+    are kept in ``utxo_locks`` - so locks are shared between workers too, and persist with the database (unlike
+    bitcoind, which forgets them on restart). The tables are created by the store (see :py:attr:`.SCHEMA`).
+
+    The methods starting with an underscore take a cursor, so the store can update the UTXO set inside of its own
+    database transactions (e.g. when adding transactions).
+    """
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS utxos (txid TEXT NOT NULL, vout INTEGER NOT NULL, address TEXT NOT NULL, '
+        'amount INTEGER NOT NULL, height INTEGER, PRIMARY KEY (txid, vout))',
+        'CREATE INDEX IF NOT EXISTS utxos_address ON utxos (address, amount)',
+        'CREATE INDEX IF NOT EXISTS utxos_amount ON utxos (amount)',
+        'CREATE TABLE IF NOT EXISTS utxo_locks (txid TEXT NOT NULL, vout INTEGER NOT NULL, PRIMARY KEY (txid, vout))',
+    ]
+    """Statements which create the UTXO tables, ran by the store when it connects"""
+
+    _UNLOCKED = 'NOT EXISTS (SELECT 1 FROM utxo_locks l WHERE l.txid = u.txid AND l.vout = u.vout)'
+
+    def __init__(self, store):
+        """:param SqliteTransactionStore store: The store whose database (and coin decimals) are used"""
+        self.store = store
+        self.unit = store.unit
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.store.conn
+
+    def _write(self, fn, *args):
+        """Call ``fn(cursor, *args)`` inside of a database transaction"""
+        cur = self.conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            res = fn(cur, *args)
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+        return res
+
+    def _apply(self, cur: sqlite3.Cursor, txs: Iterable[dict], spends: Iterable[Outpoint] = None,
+               change: Iterable[dict] = ()) -> int:
+        conn = cur.connection
+
+        def _address_utxos(address: str) -> Iterator[Tuple[int, str, int]]:
+            return conn.execute(
+                'SELECT amount, txid, vout FROM utxos WHERE address = ? ORDER BY amount DESC', (address,)
+            )
+
+        added, removed = self._plan(txs, spends, change, _address_utxos)
+        spent = 0
+        if removed:
+            cur.executemany('DELETE FROM utxos WHERE txid = ? AND vout = ?', list(removed))
+            spent = cur.rowcount
+            cur.executemany('DELETE FROM utxo_locks WHERE txid = ? AND vout = ?', list(removed))
+        cur.executemany('INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)', [op + u for op, u in added.items()])
+        return spent
+
+    def _confirm(self, cur: sqlite3.Cursor, txids: Iterable[str], height: Optional[int]):
+        cur.executemany('UPDATE utxos SET height = ? WHERE txid = ?', [(height, t) for t in txids])
+
+    def apply(self, txs: Iterable[dict], spends: Iterable[Outpoint] = None, change: Iterable[dict] = ()) -> int:
+        return self._write(self._apply, txs, spends, change)
+
+    def confirm(self, txids: Iterable[str], height: Optional[int]):
+        self._write(self._confirm, txids, height)
+
+    def get(self, txid: str, vout: int) -> Optional[dict]:
+        row = self.conn.execute(
+            'SELECT txid, vout, address, amount, height FROM utxos WHERE txid = ? AND vout = ?', (txid, int(vout))
+        ).fetchone()
+        return None if row is None else self._entry(*row)
+
+    def by_address(self, address: str) -> List[dict]:
+        rows = self.conn.execute(
+            f'SELECT txid, vout, address, amount, height FROM utxos u WHERE address = ? AND {self._UNLOCKED} '
+            f'ORDER BY amount DESC', (address,)
+        )
+        return [self._entry(*r) for r in rows]
+
+    def by_amount(self, min_amount: Decimal = None, max_amount: Decimal = None) -> Iterator[dict]:
+        """Same as :py:meth:`.BaseUTXOSet.by_amount` - walks the amount index, only reading the rows it needs"""
+        # Only bound the amount where asked to - an "(? IS NULL OR amount <= ?)" style predicate would stop SQLite
+        # from using the amount index for the upper bound
+        where, params = ['amount >= ?'], [0 if min_amount is None else self._units(min_amount)]
+        if max_amount is not None:
+            where.append('amount <= ?')
+            params.append(self._units(max_amount))
+        rows = self.conn.execute(
+            f'SELECT txid, vout, address, amount, height FROM utxos u WHERE {" AND ".join(where)} '
+            f'AND {self._UNLOCKED} ORDER BY amount DESC', params
+        )
+        for row in rows:
+            yield self._entry(*row)
+
+    def entries(self) -> Iterator[dict]:
+        for row in self.conn.execute('SELECT txid, vout, address, amount, height FROM utxos'):
+            yield self._entry(*row)
+
+    def total(self) -> Decimal:
+        return self._decimal(self.conn.execute('SELECT SUM(amount) FROM utxos').fetchone()[0])
+
+    def _lock(self, cur: sqlite3.Cursor, outpoints: Iterable[Outpoint]) -> int:
+        before = cur.execute('SELECT COUNT(*) FROM utxo_locks').fetchone()[0]
+        cur.executemany(
+            'INSERT OR IGNORE INTO utxo_locks (txid, vout) SELECT txid, vout FROM utxos WHERE txid = ? AND vout = ?',
+            [(txid, int(vout)) for txid, vout in outpoints]
+        )
+        return cur.execute('SELECT COUNT(*) FROM utxo_locks').fetchone()[0] - before
+
+    def _unlock(self, cur: sqlite3.Cursor, outpoints: Iterable[Outpoint] = None) -> int:
+        if outpoints is None:
+            return cur.execute('DELETE FROM utxo_locks').rowcount
+        outpoints = [(txid, int(vout)) for txid, vout in outpoints]
+        if not outpoints:
+            return 0
+        cur.executemany('DELETE FROM utxo_locks WHERE txid = ? AND vout = ?', outpoints)
+        return cur.rowcount
+
+    def lock(self, outpoints: Iterable[Outpoint]) -> int:
+        return self._write(self._lock, outpoints)
+
+    def unlock(self, outpoints: Iterable[Outpoint] = None) -> int:
+        return self._write(self._unlock, outpoints)
+
+    def locked(self) -> List[Outpoint]:
+        return [tuple(r) for r in self.conn.execute('SELECT txid, vout FROM utxo_locks')]
+
+    def is_locked(self, txid: str, vout: int) -> bool:
+        row = self.conn.execute('SELECT 1 FROM utxo_locks WHERE txid = ? AND vout = ?', (txid, int(vout))).fetchone()
+        return row is not None
+
+    def clear(self):
+        def _clear(cur):
+            cur.execute('DELETE FROM utxos')
+            cur.execute('DELETE FROM utxo_locks')
+        self._write(_clear)
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM utxos').fetchone()[0]
@@ -61,12 +61,12 @@ setup(
         'privex-helpers>=2.0.0',
         'privex-jsonrpc>=1.1.2',
         'Faker>=2.0.0',
-        'jsonrpcserver>=4.0.0',
+        'jsonrpcserver>=4.0.0,<5',
     ],
+    python_requires='>=3.7',
     packages=find_packages(exclude=['tests', 'test.*']),
     classifiers=[
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "License :: OSI Approved :: MIT License",
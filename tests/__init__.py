@@ -6,7 +6,7 @@ Testing pre-requisites
 
     - Ensure you have any mandatory requirements installed (see setup.py's install_requires)
     - You may wish to install any optional requirements listed in README.md for best results
-    - Python 3.7 is recommended at the time of writing this. See README.md in-case this has changed.
+    - Python 3.7 or newer is required. See README.md in-case this has changed.
 
 Running via PyTest
 ------------------
@@ -107,7 +107,20 @@ import unittest
 from privex.loghelper import LogHelper
 from privex.helpers import env_bool
 from privex.rpcemulator.base import Emulator
-from tests.test_bitcoin import TestBitcoinEmulator
+from tests.test_bitcoin import (
+    TestBitcoinEmulator, TestBitcoinMethods, TestBitcoinBatch, TestBitcoinSqlite, TestBitcoinStartup,
+    TestBitcoinThreaded, TestBitcoinWorkers, TestBitcoinKeepAlive, TestBitcoinAsync, TestBitcoinStats,
+    TestBitcoinProfile, TestBitcoinMempool, TestBitcoinAddresses, TestBitcoinUTXOs, TestBitcoinRawTransactions,
+    TestBitcoinBlocks, TestBitcoinMultiWallet
+)
+from tests.test_store import TestTransactionStore, TestSqliteTransactionStore
+from tests.test_mempool import TestMempool, TestSqliteMempool
+from tests.test_benchmark import TestBenchmark
+from tests.test_addresses import TestAddressEncoding, TestAddressRegistry
+from tests.test_utxo import TestUTXOSet, TestSqliteUTXOSet, TestStoreUTXOs, TestSqliteStoreUTXOs, TestBranchAndBound
+from tests.test_rawtx import TestRawTransaction
+from tests.test_coins import TestCoinProfiles, TestCoinStates, TestMultiCoinServer
+from tests.test_faults import TestFaultInjector, TestFaultServer, TestFaultServerAsync, TestFaultServerInProcess
 
 Emulator.use_coverage = True
 
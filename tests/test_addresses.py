@@ -0,0 +1,121 @@
+import unittest
+
+from privex.rpcemulator.addresses import (
+    AddressRegistry, address_hash, b58check_decode, b58check_encode, derive_address, derive_addresses,
+    is_valid_address
+)
+
+
+class TestAddressEncoding(unittest.TestCase):
+    """Test Base58Check encoding, validation and address derivation in :mod:`privex.rpcemulator.addresses`"""
+    
+    def test_b58check(self):
+        """Test encoding known payloads, and that decoding reverses it"""
+        # The hash160 of the genesis block's coinbase key
+        payload = bytes.fromhex('0062e907b15cbf27d5425399ebf6f0fb50ebb88f18')
+        self.assertEqual(b58check_encode(payload), '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa')
+        self.assertEqual(b58check_decode('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'), payload)
+        self.assertEqual(b58check_encode(b'\0' * 21), '1111111111111111111114oLvT2')
+        self.assertEqual(b58check_decode('1111111111111111111114oLvT2'), b'\0' * 21)
+    
+    def test_is_valid_address(self):
+        """Test addresses with a bad checksum, invalid characters or the wrong version byte are rejected"""
+        self.assertTrue(is_valid_address('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'))
+        self.assertFalse(is_valid_address('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb'))
+        self.assertFalse(is_valid_address('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfN0'))
+        self.assertFalse(is_valid_address('notanaddress'))
+        self.assertFalse(is_valid_address(None))
+        self.assertFalse(is_valid_address('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa', version=5))
+        self.assertEqual(
+            address_hash('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa').hex(), '62e907b15cbf27d5425399ebf6f0fb50ebb88f18'
+        )
+    
+    def test_derive(self):
+        """Test derived addresses are valid, unique and reproducible from the seed"""
+        addresses = derive_addresses('seed', 0, 1000)
+        self.assertEqual(len(set(addresses)), 1000)
+        self.assertEqual(addresses[10:20], derive_addresses(b'seed', 10, 10))
+        self.assertEqual(addresses[500], derive_address('seed', 500))
+        self.assertNotEqual(addresses[0], derive_address('other seed', 0))
+        for addr in addresses:
+            self.assertTrue(is_valid_address(addr))
+        self.assertTrue(is_valid_address(derive_address('seed', 0, version=48), version=48))
+
+
+class TestAddressRegistry(unittest.TestCase):
+    """Test ownership, validation, labels and address generation of :class:`.AddressRegistry`"""
+    OWN = ['1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8', '13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp']
+    EXTERNAL = '17EZkTedEnhEHe6yyy48YX1goAuP92DMUy'
+    
+    def setUp(self) -> None:
+        self.reg = AddressRegistry(self.OWN, external=[self.EXTERNAL], seed='test', keypool_size=10)
+    
+    def test_sequence(self):
+        """Test the registry acts like the list of our own addresses"""
+        self.assertEqual(len(self.reg), 2)
+        self.assertEqual(list(self.reg), self.OWN)
+        self.assertEqual(self.reg[1], self.OWN[1])
+        self.assertIn(self.OWN[0], self.reg)
+        self.assertNotIn(self.EXTERNAL, self.reg)
+        self.assertFalse(self.reg.add(self.OWN[0]))
+    
+    def test_is_valid(self):
+        """Test known addresses, and unknown addresses with a valid checksum are valid"""
+        self.assertTrue(self.reg.is_valid(self.OWN[0]))
+        self.assertTrue(self.reg.is_valid(self.EXTERNAL))
+        self.assertTrue(self.reg.is_valid('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'))
+        self.assertFalse(self.reg.is_valid('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb'))
+        self.assertFalse(self.reg.is_mine('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'))
+    
+    def test_new_address(self):
+        """Test new addresses are derived in order from the seed, never repeat, and refill the keypool in batches"""
+        self.assertEqual(self.reg.keypool_remaining(), 0)
+        addresses = [self.reg.new_address() for _ in range(25)]
+        self.assertEqual(addresses, derive_addresses('test', 0, 25))
+        self.assertEqual(self.reg.keypool_remaining(), 5)
+        self.assertEqual(self.reg.generate(5, 'bulk'), derive_addresses('test', 25, 5))
+        self.assertEqual(self.reg.keypool_remaining(), 0)
+        self.assertEqual(self.reg.keypool_refill(100), 100)
+        self.assertEqual(self.reg.new_address(), derive_address('test', 30))
+        self.assertEqual(len(self.reg), 33)
+        self.assertEqual(self.reg.info(addresses[3]), dict(label='', index=3))
+        self.assertEqual(self.reg.info(self.OWN[0]), dict(label='', index=None))
+        self.assertIsNone(self.reg.info(self.EXTERNAL))
+    
+    def test_labels(self):
+        """Test addresses can be found by label, and relabelled"""
+        a, b = self.reg.new_address('deposits'), self.reg.new_address('deposits')
+        self.assertEqual(self.reg.addresses_by_label('deposits'), [a, b])
+        self.assertEqual(self.reg.labels(), ['', 'deposits'])
+        self.reg.set_label(a, 'withdrawals')
+        self.reg.set_label(b, 'withdrawals')
+        self.assertEqual(self.reg.label(b), 'withdrawals')
+        self.assertEqual(self.reg.labels(), ['', 'withdrawals'])
+        self.assertEqual(self.reg.addresses_by_label('deposits'), [])
+        self.assertIsNone(self.reg.label(self.EXTERNAL))
+        with self.assertRaises(KeyError):
+            self.reg.set_label(self.EXTERNAL, 'theirs')
+    
+    def test_large_registry(self):
+        """Test generating 200k addresses, then checking and labelling them"""
+        addresses = self.reg.generate(200000, 'bulk')
+        self.assertEqual(len(set(addresses)), 200000)
+        self.assertTrue(all(self.reg.is_mine(a) for a in addresses))
+        self.assertTrue(all(self.reg.is_valid(a) for a in addresses))
+        self.assertEqual(len(self.reg.addresses_by_label('bulk')), 200000)
+        self.assertNotIn(self.reg.new_address(), addresses)
+    
+    def test_share(self):
+        """Test addresses derived using the shared index by another copy of the registry are recognised as ours"""
+        self.reg.share()
+        try:
+            other = AddressRegistry(self.OWN, seed='test')
+            other._counter = self.reg._counter
+            theirs, ours = other.new_address(), self.reg.new_address()
+            self.assertNotEqual(theirs, ours)
+            self.assertTrue(self.reg.is_mine(theirs))
+            self.assertEqual(self.reg.info(theirs), dict(label='', index=0))
+        finally:
+            self.reg.unshare()
+        self.assertFalse(self.reg.shared)
+        self.assertEqual(self.reg.new_address(), derive_address('test', 2))
@@ -0,0 +1,65 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from privex.rpcemulator import benchmark, bitcoin
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test the benchmark harness in :mod:`privex.rpcemulator.benchmark`"""
+    
+    def test_parse_mix(self):
+        """Test parsing request mix strings, with and without weights"""
+        self.assertEqual(benchmark.parse_mix('getbalance=4, gettransaction'), {'getbalance': 4, 'gettransaction': 1})
+        with self.assertRaises(ValueError):
+            benchmark.parse_mix('getbalance,notamethod')
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile(values, 100), 100)
+        self.assertEqual(benchmark.percentile([], 50), 0.0)
+    
+    def test_run_benchmark(self):
+        """Test a small benchmark reports every method in the mix without errors, and restores the wallet"""
+        orig_store = bitcoin.internal['transactions']
+        report = benchmark.run_benchmark(transactions=500, clients=2, requests=100, threaded=True)
+        self.assertIs(bitcoin.internal['transactions'], orig_store)
+        self.assertEqual(report['config']['wallet_size'], 503)
+        self.assertEqual(report['total']['requests'], 100)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertEqual(set(report['methods']), set(benchmark.DEFAULT_MIX))
+        for stats in report['methods'].values():
+            self.assertGreater(stats['rps'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+    
+    def test_sendmany_benchmark(self):
+        """Test benchmarking ``sendmany`` payouts"""
+        report = benchmark.run_benchmark(transactions=200, clients=1, requests=5, mix='sendmany', payouts=50)
+        self.assertEqual(report['config']['payouts'], 50)
+        self.assertEqual(report['methods']['sendmany']['requests'], 5)
+        self.assertEqual(report['total']['errors'], 0)
+    
+    def test_rawtx_benchmark(self):
+        """Test benchmarking the raw transaction methods"""
+        mix = 'createrawtransaction,signrawtransactionwithwallet,decoderawtransaction'
+        report = benchmark.run_benchmark(transactions=200, clients=2, requests=30, mix=mix)
+        self.assertEqual(set(report['methods']), set(mix.split(',')))
+        self.assertEqual(report['total']['errors'], 0)
+    
+    def test_cli(self):
+        """Test the ``privex.rpcemulator.benchmark`` command line tool writes a JSON report"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'report.json')
+            with redirect_stdout(io.StringIO()):
+                code = benchmark.main(['-n', '100', '-c', '2', '-r', '20', '--mix', 'getbalance', '-o', path])
+            with open(path) as fh:
+                report = json.load(fh)
+        self.assertEqual(code, 0)
+        self.assertEqual(list(report['methods']), ['getbalance'])
+        self.assertEqual(report['methods']['getbalance']['requests'], 20)
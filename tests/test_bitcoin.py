@@ -1,11 +1,48 @@
+import asyncio
+import http.client
+import io
+import json
+import os
+import pstats
+import socket
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
 from decimal import Decimal
 from multiprocessing import Process
-from time import sleep
 from typing import List
 
+import requests
+from jsonrpcserver.methods import Methods
 from privex.jsonrpc import BitcoinRPC
-from privex.rpcemulator import bitcoin
+from privex.rpcemulator import asyncserver, base, bitcoin, dispatcher, seed, stats
+from privex.rpcemulator.addresses import AddressRegistry, derive_addresses
+from privex.rpcemulator.coins import LITECOIN
+from privex.rpcemulator.mempool import MAX_BLOCK_WEIGHT, tx_vsize
+from privex.rpcemulator.store import TransactionStore, block_hash
+
+
+BAD_REQUESTS = [
+    (b'POST / HTTP/1.1\r\n\r\n', 411),
+    (b'POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: -5\r\n\r\n', 400),
+    (b'POST / HTTP/1.1\r\nContent-Length: 999999999\r\n\r\n', 413),
+    (b'POST / HTTP/1.1\r\nContent-Length: 2\r\n\r\n\xff\xfe', 400),
+]
+"""Raw HTTP requests which aren't valid JsonRPC requests, and the status which the servers should respond with"""
+
+
+def _check_bad_requests(test: unittest.TestCase, port: int):
+    """Send each of :py:attr:`.BAD_REQUESTS` on its own connection, then check the server still works"""
+    for raw, status in BAD_REQUESTS:
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+            sock.sendall(raw)
+            test.assertEqual(sock.recv(1024).split(b' ')[1], str(status).encode(), raw)
+    test.assertEqual(BitcoinRPC(port=port).getnetworkinfo()['version'], 170100)
 
 
 def _contains_tx(tx_list: List[dict], txid: str):
@@ -15,6 +52,27 @@ def _contains_tx(tx_list: List[dict], txid: str):
     return False
 
 
+class WalletCopyMixin:
+    """
+    Runs each test against a copy of the default wallet's transactions and addresses, restoring them (and the
+    ``settxfee`` feerate) afterwards, so that tests don't affect the state inherited by emulators forked in other
+    test cases.
+    """
+    
+    def setUp(self) -> None:
+        self._orig_txs = bitcoin.internal['transactions']
+        bitcoin.internal['transactions'] = TransactionStore(list(self._orig_txs))
+        self._orig_addresses = orig = bitcoin.internal['addresses']
+        # A distinct seed, so that addresses generated by the copy aren't also derived by the original registry
+        bitcoin.internal['addresses'] = AddressRegistry(orig, external=orig.external, seed=type(self).__name__)
+        self._orig_paytxfee = bitcoin.internal['paytxfee']
+    
+    def tearDown(self) -> None:
+        bitcoin.internal['transactions'] = self._orig_txs
+        bitcoin.internal['addresses'] = self._orig_addresses
+        bitcoin.internal['paytxfee'] = self._orig_paytxfee
+
+
 class TestBitcoinEmulator(unittest.TestCase):
     emulator: bitcoin.BitcoinEmulator
     """Stores the :class:`.Process` returned from :py:func:`.bitcoin.j_server`"""
@@ -33,7 +91,6 @@ class TestBitcoinEmulator(unittest.TestCase):
         """Launch the Bitcoin RPC emulator in the background on default port 8332"""
         bitcoin.BitcoinEmulator.use_coverage = True
         cls.emulator = bitcoin.BitcoinEmulator()
-        sleep(2)
     
     @classmethod
     def tearDownClass(cls) -> None:
@@ -96,7 +153,994 @@ class TestBitcoinEmulator(unittest.TestCase):
         self.assertEqual(tx['address'], '13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp')
         self.assertAlmostEqual(tx['amount'], 0.03, delta=0.000001)
 
+
+class TestBitcoinMethods(WalletCopyMixin, unittest.TestCase):
+    """Test the emulated RPC methods directly (in-process), against a copy of the default wallet"""
+    EXTERNAL_ADDRESS = "17EZkTedEnhEHe6yyy48YX1goAuP92DMUy"
+    
+    def test_send_multiple_inputs(self):
+        """Test sending more than the richest address holds spends from multiple addresses under one txid"""
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.12')
+        sends = bitcoin.internal['transactions'].find(txid)
+        self.assertEqual(len(sends), 2)
+        self.assertEqual(sends[0]['address'], '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8')
+        self.assertEqual(sends[0]['amount'], Decimal('-0.1'))
+        self.assertEqual(sends[1]['address'], '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW')
+        self.assertEqual(sends[1]['amount'], Decimal('-0.02'))
+        # The fee is paid by the last input, and is included in the balance
+        fee = bitcoin.getmempoolentry(txid)['fee']
+        self.assertEqual((sends[0]['fee'], float(sends[1]['fee'])), (0, -fee))
+        self.assertAlmostEqual(bitcoin.getbalance(), 0.06 - fee)
+    
+    def test_sendmany(self):
+        """Test ``sendmany`` pays every address in one transaction, and only creates receives for our addresses"""
+        own, other = '12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV', "13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR"
+        txid = bitcoin.sendmany("", {self.EXTERNAL_ADDRESS: '0.01', other: 0.02, own: '0.03'}, 1, 'payouts')
+        entry = bitcoin.getmempoolentry(txid)
+        self.assertEqual(entry['vsize'], tx_vsize(1, 4))
+        txs = bitcoin.internal['transactions'].find(txid)
+        self.assertEqual([t['category'] for t in txs], ['send', 'receive'])
+        self.assertEqual((txs[0]['amount'], txs[0]['comment']), (Decimal('-0.06'), 'payouts'))
+        self.assertTrue(txs[0]['label'].endswith('to 3 addresses'))
+        self.assertEqual((txs[1]['address'], txs[1]['amount'], txs[1]['vout']), (own, Decimal('0.03'), 2))
+        self.assertAlmostEqual(bitcoin.getbalance(), 0.18 - 0.06 + 0.03 - entry['fee'])
+        self.assertEqual(bitcoin.getrawmempool(), [txid])
+    
+    def test_sendmany_invalid(self):
+        """Test ``sendmany`` rejects the whole payout if any address or amount is invalid, or the total is too high"""
+        with self.assertRaisesRegex(AssertionError, 'Invalid address: notanaddress'):
+            bitcoin.sendmany("", {self.EXTERNAL_ADDRESS: '0.01', 'notanaddress': '0.01'})
+        with self.assertRaisesRegex(AssertionError, 'Invalid amount'):
+            bitcoin.sendmany("", {self.EXTERNAL_ADDRESS: '0'})
+        with self.assertRaisesRegex(AssertionError, 'Insufficient funds'):
+            bitcoin.sendmany("", {self.EXTERNAL_ADDRESS: '0.1', "13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR": '0.1'})
+        with self.assertRaisesRegex(AssertionError, 'subtractfeefrom'):
+            bitcoin.sendmany("", {self.EXTERNAL_ADDRESS: '0.1'}, 1, '', ["13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR"])
+        with self.assertRaises(AssertionError):
+            bitcoin.sendmany("", {})
+        self.assertEqual(bitcoin.getrawmempool(), [])
+        self.assertEqual(len(bitcoin.internal['transactions']), 3)
+    
+    def test_sendmany_subtractfee(self):
+        """Test ``subtractfeefrom`` splits the fee evenly between the chosen outputs, the first paying any remainder"""
+        bitcoin.settxfee('0.00010001')
+        own = ['12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV', '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW']
+        txid = bitcoin.sendmany("", {own[0]: '0.01', own[1]: '0.01', self.EXTERNAL_ADDRESS: '0.01'}, 1, '', own)
+        fee = Decimal(str(bitcoin.getmempoolentry(txid)['fee']))
+        self.assertEqual(fee, Decimal('0.00002031'))
+        received = {t['address']: t['amount'] for t in bitcoin.internal['transactions'].find(txid) if t['amount'] > 0}
+        self.assertEqual(received, {own[0]: Decimal('0.00998984'), own[1]: Decimal('0.00998985')})
+        self.assertAlmostEqual(bitcoin.getbalance(), 0.18 - 0.03 + 0.02 - float(fee))
+    
+    def test_sendmany_large(self):
+        """
+        Test a 1000 output payout is stored as one transaction, paying every payee plus change.
+        Its speed is measured by ``python -m privex.rpcemulator.benchmark --mix sendmany --payouts 1000``
+        """
+        payees = derive_addresses('payees', 0, 1000)
+        balance = Decimal(str(bitcoin.getbalance()))
+        txid = bitcoin.sendmany("", {addr: '0.0001' for addr in payees})
+        entry = bitcoin.getmempoolentry(txid)
+        # 2 inputs, and an output for each of the 1000 payees plus the change output
+        self.assertEqual(entry['vsize'], tx_vsize(2, 1001))
+        self.assertEqual(sum(t['amount'] for t in bitcoin.internal['transactions'].find(txid)), Decimal('-0.1'))
+        self.assertEqual(
+            balance - Decimal(str(bitcoin.getbalance())), Decimal('0.1') + Decimal(str(entry['fee']))
+        )
+    
+    def test_listtransactions_pagination(self):
+        """Test ``listtransactions`` returns the most recent ``count`` TXs after ``skip``, oldest first"""
+        txids = [bitcoin.j_add_tx(account='paged')['txid'] for _ in range(25)]
+        self.assertEqual([t['txid'] for t in bitcoin.listtransactions()], txids[-10:])
+        self.assertEqual([t['txid'] for t in bitcoin.listtransactions('*', 10, 10)], txids[-20:-10])
+        # The last page includes the default transactions which were added before ours
+        self.assertEqual(len(bitcoin.listtransactions('*', 10, 20)), 8)
+        self.assertEqual(bitcoin.listtransactions('*', 10, 100), [])
+        # Pagination should also work when filtering by account
+        self.assertEqual([t['txid'] for t in bitcoin.listtransactions('Paged', 5, 3)], txids[-8:-3])
+        self.assertEqual([t['txid'] for t in bitcoin.listtransactions('paged', 10, 20)], txids[:5])
+    
+    def test_bulk_generate(self):
+        """Test bulk generated transactions are valid, reproducible from a seed, and added to the store"""
+        batches = list(bitcoin.j_gen_txs(250, seed=42, batch_size=100))
+        self.assertEqual([len(b) for b in batches], [100, 100, 50])
+        txs = [tx for b in batches for tx in b]
+        self.assertEqual(len({tx['txid'] for tx in txs}), 250)
+        self.assertEqual(txs, [tx for b in bitcoin.j_gen_txs(250, seed=42, batch_size=100) for tx in b])
+        self.assertNotEqual(txs, [tx for b in bitcoin.j_gen_txs(250, seed=43) for tx in b])
+        for tx in txs:
+            self.assertEqual(len(tx['txid']), 64)
+            self.assertEqual(tx['amount'] > 0, tx['category'] == 'receive')
+        self.assertEqual(txs, sorted(txs, key=lambda t: t['time']))
+        
+        self.assertEqual(bitcoin.j_add_txs(250, seed=42, batch_size=100), 250)
+        self.assertEqual(len(bitcoin.internal['transactions']), 253)
+        self.assertEqual(bitcoin.gettransaction(txs[-1]['txid'])['amount'], float(txs[-1]['amount']))
+    
+    def test_send_insufficient(self):
+        """Test sending more than the wallet balance is rejected"""
+        with self.assertRaises(AssertionError):
+            bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.5')
+    
+    def test_generate(self):
+        """Test sends are unconfirmed until a block is mined, and confirmations follow the chain tip"""
+        tip = bitcoin.getblockcount()
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        fee = bitcoin.getmempoolentry(txid)['fee']
+        self.assertEqual(bitcoin.gettransaction(txid)['confirmations'], 0)
+        self.assertAlmostEqual(bitcoin.getbalance(), 0.17 - fee)
+        self.assertEqual(bitcoin.getbalance('*', 1), 0.18)
         
+        hashes = bitcoin.generate(2)
+        self.assertEqual(len(hashes), 2)
+        self.assertEqual(bitcoin.getblockcount(), tip + 2)
+        self.assertEqual(bitcoin.getbestblockhash(), hashes[-1])
+        info = bitcoin.getblockchaininfo()
+        self.assertEqual((info['blocks'], info['bestblockhash']), (tip + 2, hashes[-1]))
+        tx = bitcoin.gettransaction(txid)
+        self.assertEqual((tx['confirmations'], tx['blockheight'], tx['blockhash']), (2, tip + 1, hashes[0]))
+        self.assertAlmostEqual(bitcoin.getbalance('*', 1), 0.17 - fee)
+        self.assertEqual(bitcoin.getbalance('*', 3), 0.18)
+        # The default transaction with 5 confirmations should now have 7
+        self.assertEqual(bitcoin.gettransaction(bitcoin.DEFAULT_TRANSACTIONS[0]['txid'])['confirmations'], 7)
+        with self.assertRaises(AssertionError):
+            bitcoin.generatetoaddress(1, 'notanaddress')
+    
+    def test_listsinceblock(self):
+        """Test listsinceblock only returns transactions confirmed after the given block, plus unconfirmed ones"""
+        res = bitcoin.listsinceblock()
+        self.assertEqual(len(res['transactions']), 3)
+        self.assertEqual((res['removed'], res['lastblock']), ([], bitcoin.getbestblockhash()))
+        
+        cursor = res['lastblock']
+        self.assertEqual(bitcoin.listsinceblock(cursor)['transactions'], [])
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        res = bitcoin.listsinceblock(cursor)
+        self.assertEqual([(t['txid'], t['confirmations']) for t in res['transactions']], [(txid, 0)])
+        
+        bitcoin.generate(3)
+        res = bitcoin.listsinceblock(cursor, 2)
+        self.assertEqual([(t['txid'], t['confirmations']) for t in res['transactions']], [(txid, 3)])
+        self.assertEqual(res['lastblock'], bitcoin.getblockhash(bitcoin.getblockcount() - 1))
+        self.assertEqual(bitcoin.listsinceblock(bitcoin.getbestblockhash())['transactions'], [])
+        self.assertNotIn('removed', bitcoin.listsinceblock(cursor, 1, False, False))
+        with self.assertRaises(AssertionError):
+            bitcoin.listsinceblock('00' * 32)
+        with self.assertRaises(AssertionError):
+            bitcoin.listsinceblock(cursor, 0)
+    
+    def test_getblock(self):
+        """Test getblockhash / getblock return the emulated blocks, listing the wallet TXs confirmed in them"""
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        mined, empty = bitcoin.generate(2)
+        tip = bitcoin.getblockcount()
+        self.assertEqual(bitcoin.getblockhash(tip - 1), mined)
+        block = bitcoin.getblock(mined)
+        self.assertEqual((block['height'], block['confirmations'], block['tx'], block['nTx']), (tip - 1, 2, [txid], 1))
+        self.assertEqual((block['previousblockhash'], block['nextblockhash']), (bitcoin.getblockhash(tip - 2), empty))
+        block = bitcoin.getblock(empty)
+        self.assertEqual((block['tx'], block['confirmations']), ([], 1))
+        self.assertNotIn('nextblockhash', block)
+        with self.assertRaises(AssertionError):
+            bitcoin.getblockhash(tip + 1)
+        with self.assertRaises(AssertionError):
+            bitcoin.getblock(block_hash(tip + 1))
+
+
+class TestBitcoinBatch(WalletCopyMixin, unittest.TestCase):
+    """Test JsonRPC batch requests, dispatched by :mod:`privex.rpcemulator.dispatcher`"""
+    EXTERNAL_ADDRESS = "17EZkTedEnhEHe6yyy48YX1goAuP92DMUy"
+    
+    @staticmethod
+    def _batch(*calls, **kwargs) -> list:
+        body = json.dumps([dict(jsonrpc='2.0', id=i, method=m, params=list(p)) for i, (m, *p) in enumerate(calls)])
+        return json.loads(str(dispatcher.dispatch(body, batch_context=bitcoin.batch_snapshot, **kwargs)))
+    
+    def test_batch_order(self):
+        """Test batch responses are returned in the same order as the calls"""
+        txids = [tx['txid'] for tx in bitcoin.internal['transactions']] * 20
+        res = self._batch(*[('gettransaction', txid) for txid in txids])
+        self.assertEqual([r['id'] for r in res], list(range(len(txids))))
+        self.assertEqual([r['result']['txid'] for r in res], txids)
+    
+    def test_batch_send_invalidates(self):
+        """Test balances within a batch reflect a ``sendtoaddress`` made earlier in the same batch"""
+        res = self._batch(('getbalance',), ('sendtoaddress', self.EXTERNAL_ADDRESS, '0.01'), ('getbalance',))
+        self.assertAlmostEqual(res[0]['result'], 0.18)
+        self.assertAlmostEqual(res[2]['result'], 0.17 - bitcoin.getmempoolentry(res[1]['result'])['fee'])
+        self.assertEqual(len(res[1]['result']), 64)
+    
+    def test_batch_cache_per_state(self):
+        """Test a batch's cache belongs to the active state, so calls for another coin's wallet don't read it"""
+        ltc = bitcoin.CoinState(LITECOIN, seed='test')
+        with bitcoin.batch_snapshot():
+            btc_txs = bitcoin.listtransactions('*', 10)
+            with ltc.activate():
+                ltc_txs = bitcoin.listtransactions('*', 10)
+            self.assertEqual(bitcoin.listtransactions('*', 10), btc_txs)
+        self.assertTrue(all(tx['address'].startswith('L') for tx in ltc_txs))
+        self.assertFalse({tx['address'] for tx in btc_txs} & {tx['address'] for tx in ltc_txs})
+    
+    def test_batch_errors(self):
+        """Test invalid calls and failing calls return errors without affecting the rest of the batch"""
+        body = json.dumps([
+            dict(jsonrpc='2.0', id=1, method='getbalance'), dict(id=2, method='getbalance'),
+            dict(jsonrpc='2.0', id=3, method='gettransaction', params=['notatxid']),
+        ])
+        res = json.loads(str(dispatcher.dispatch(body)))
+        self.assertAlmostEqual(res[0]['result'], 0.18)
+        self.assertEqual(res[1]['error']['code'], -32600)
+        self.assertEqual(res[2]['error']['code'], -32602)
+    
+    def test_batch_too_large(self):
+        """Test batches larger than ``max_batch_size`` are rejected"""
+        res = self._batch(*[('getbalance',)] * 3, max_batch_size=2)
+        self.assertEqual(res['error']['code'], -32600)
+        self.assertEqual(len(self._batch(*[('getbalance',)] * 2, max_batch_size=2)), 2)
+    
+    def test_batch_http(self):
+        """Test batch requests via a forked emulator, with a custom ``max_batch_size``"""
+        calls = [dict(jsonrpc='2.0', id=i, method='getbalance') for i in range(6)]
+        with bitcoin.BitcoinEmulator(port=0, max_batch_size=5) as emu:
+            url = f'http://127.0.0.1:{emu.port}'
+            self.assertEqual(len(requests.post(url, json=calls[:5]).json()), 5)
+            self.assertEqual(requests.post(url, json=calls).json()['error']['code'], -32600)
+
+
+class TestBitcoinSqlite(unittest.TestCase):
+    """Test the Bitcoin RPC emulator using an SQLite database for transaction storage"""
+    
+    def setUp(self) -> None:
+        self._orig_txs = bitcoin.internal['transactions']
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'wallet.db')
+    
+    def tearDown(self) -> None:
+        bitcoin.internal['transactions'].close()
+        bitcoin.internal['transactions'] = self._orig_txs
+        self.tmpdir.cleanup()
+    
+    def test_sqlite_persists(self):
+        """Test transactions sent via a forked emulator are stored in the database, and visible to a new emulator"""
+        with bitcoin.BitcoinEmulator(port=0, store=self.path) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertAlmostEqual(float(rpc.getbalance()), 0.18, delta=0.000001)
+            txid = rpc.sendtoaddress('13J8HRihYqEDYHAxLciryQYTjpxXcjYMmR', '0.01')
+            fee = rpc.call('getmempoolentry', txid)['fee']
         
+        with bitcoin.BitcoinEmulator(port=0, store=self.path) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertAlmostEqual(float(rpc.getbalance()), 0.17 - fee, delta=0.000001)
+            self.assertEqual(rpc.call('getmempoolinfo')['size'], 1)
+            self.assertEqual(rpc.gettransaction(txid)['category'], 'send')
+            self.assertEqual(len(rpc.listtransactions()), 4)
 
 
+    def test_seed_cli(self):
+        """Test seeding an SQLite wallet database using the ``privex.rpcemulator.seed`` command line tool"""
+        with redirect_stdout(io.StringIO()):
+            seed.main(['-n', '500', '--seed', '1', '--category', 'receive', self.path])
+        self.assertEqual(len(bitcoin.internal['transactions']), 503)
+        self.assertGreater(bitcoin.getbalance(), 1)
+
+
+class TestBitcoinStartup(unittest.TestCase):
+    """Test starting the Bitcoin RPC emulator on a free port, and waiting for it to become ready"""
+    
+    def test_wait_ready(self):
+        """Test ``port=0`` picks a free port which is known before the server process is ready"""
+        with bitcoin.BitcoinEmulator(port=0, wait=False) as emu:
+            self.assertNotEqual(emu.port, 0)
+            self.assertEqual(emu.wait_ready(), emu.port)
+            self.assertEqual(BitcoinRPC(port=emu.port).getnetworkinfo()['version'], 170100)
+
+
+class TestBitcoinThreaded(unittest.TestCase):
+    """Test the Bitcoin RPC emulator in threaded mode, with multiple concurrent clients"""
+    emulator: bitcoin.BitcoinEmulator
+    
+    EXTERNAL_ADDRESS = "165GagcJtj4LtvM94BDrM2nfBfnfX1gQxc"
+    
+    rpc = BitcoinRPC(port=18332)
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Launch the Bitcoin RPC emulator in the background on port 18332, using a pool of 8 worker threads"""
+        bitcoin.BitcoinEmulator.use_coverage = True
+        cls.emulator = bitcoin.BitcoinEmulator(port=18332, threaded=True, max_workers=8)
+    
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Shutdown the Bitcoin RPC emulator process"""
+        cls.emulator.terminate()
+    
+    def test_concurrent_send(self):
+        """Test that concurrent ``sendtoaddress`` calls each create a TX, and reduce the balance consistently"""
+        starting_balance = self.rpc.getbalance()
+        
+        def _send(_):
+            return BitcoinRPC(port=18332).sendtoaddress(self.EXTERNAL_ADDRESS, '0.0001')
+        
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            txids = list(pool.map(_send, range(20)))
+        
+        self.assertEqual(len(set(txids)), 20)
+        fees = sum(Decimal(str(self.rpc.call('getmempoolentry', txid)['fee'])) for txid in txids)
+        expected_bal = float(Decimal(str(starting_balance)) - Decimal('0.002') - fees)
+        self.assertAlmostEqual(expected_bal, float(self.rpc.getbalance()), delta=0.000001)
+
+
+class TestBitcoinWorkers(unittest.TestCase):
+    """Test serving the Bitcoin RPC emulator from multiple worker processes, sharing one wallet"""
+    EXTERNAL_ADDRESS = "165GagcJtj4LtvM94BDrM2nfBfnfX1gQxc"
+    
+    def test_workers_share_wallet(self):
+        """Test concurrent sends via 3 workers all reduce the same balance, and the parent's wallet is restored"""
+        orig_store, orig_lock = bitcoin.internal['transactions'], bitcoin.internal_lock
+        with bitcoin.BitcoinEmulator(port=0, workers=3) as emu:
+            self.assertEqual(len(emu.procs), 3)
+            self.assertEqual(len({p.pid for p in emu.procs}), 3)
+            db_path = bitcoin.internal['transactions'].path
+            starting_balance = float(BitcoinRPC(port=emu.port).getbalance())
+            
+            def _send(_):
+                return BitcoinRPC(port=emu.port).sendtoaddress(self.EXTERNAL_ADDRESS, '0.0001')
+            
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                txids = list(pool.map(_send, range(30)))
+            
+            self.assertEqual(len(set(txids)), 30)
+            fees = sum(BitcoinRPC(port=emu.port).call('getmempoolentry', txid)['fee'] for txid in txids)
+            for _ in range(6):
+                self.assertAlmostEqual(
+                    starting_balance - 0.003 - fees, float(BitcoinRPC(port=emu.port).getbalance()), delta=0.000001
+                )
+            # No UTXO was spent twice - what's left adds up to the balance
+            unspent = BitcoinRPC(port=emu.port).call('listunspent', 0)
+            self.assertAlmostEqual(sum(u['amount'] for u in unspent), starting_balance - 0.003 - fees, delta=0.000001)
+        self.assertIs(bitcoin.internal['transactions'], orig_store)
+        self.assertIs(bitcoin.internal_lock, orig_lock)
+        self.assertFalse(os.path.exists(db_path))
+    
+    def test_workers_unique_addresses(self):
+        """Test workers never hand out the same new address, and recognise the addresses derived by each other"""
+        with bitcoin.BitcoinEmulator(port=0, workers=3) as emu:
+            def _new(_):
+                return BitcoinRPC(port=emu.port).getnewaddress()
+            
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                addresses = list(pool.map(_new, range(60)))
+            self.assertEqual(len(set(addresses)), 60)
+            for addr in addresses[:10]:
+                self.assertTrue(BitcoinRPC(port=emu.port).call('getaddressinfo', addr)['ismine'])
+        self.assertFalse(bitcoin.internal['addresses'].shared)
+
+
+class TestBitcoinKeepAlive(unittest.TestCase):
+    """Test HTTP/1.1 persistent connections with the threaded HTTP server"""
+    emulator: bitcoin.BitcoinEmulator
+    
+    @classmethod
+    def setUpClass(cls) -> None:
+        """Launch a threaded emulator which closes connections after 5 requests, or 0.5 seconds idle"""
+        emu_cls = type('KeepAliveEmulator', (bitcoin.BitcoinEmulator,), dict(max_requests=5, keepalive_timeout=0.5))
+        cls.emulator = emu_cls(port=0, threaded=True)
+    
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.emulator.terminate()
+    
+    def _post(self, conn: http.client.HTTPConnection, body: dict):
+        conn.request('POST', '/', json.dumps(body), {'Content-Type': 'application/json'})
+        res = conn.getresponse()
+        return res, res.read()
+    
+    def test_keepalive(self):
+        """Test multiple requests are served over one connection, until ``max_requests`` is reached"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.emulator.port)
+        socks = []
+        for i in range(5):
+            res, data = self._post(conn, dict(jsonrpc='2.0', id=i, method='getblockchaininfo'))
+            self.assertEqual(res.status, 200)
+            self.assertEqual(int(res.getheader('Content-Length')), len(data))
+            self.assertEqual(json.loads(data)['id'], i)
+            socks.append(conn.sock)
+        # The connection is kept open for the first 4 requests, then closed by the server after the 5th
+        self.assertEqual(len(set(map(id, socks[:4]))), 1)
+        self.assertEqual(res.getheader('Connection'), 'close')
+        conn.close()
+    
+    def test_notification(self):
+        """Test notifications get an empty 204 response, without closing the connection"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.emulator.port)
+        res, data = self._post(conn, dict(jsonrpc='2.0', method='getblockchaininfo'))
+        self.assertEqual((res.status, data), (204, b''))
+        self.assertEqual(res.getheader('Connection'), 'keep-alive')
+        res, data = self._post(conn, dict(jsonrpc='2.0', id=1, method='getnetworkinfo'))
+        self.assertEqual(json.loads(data)['result']['version'], 170100)
+        conn.close()
+    
+    def test_bad_requests(self):
+        """Test malformed requests get an error status, without reading a body of a negative or oversized length"""
+        _check_bad_requests(self, self.emulator.port)
+    
+    def test_idle_timeout(self):
+        """Test idle connections are closed by the server after ``keepalive_timeout``"""
+        with socket.create_connection(('127.0.0.1', self.emulator.port), timeout=5) as sock:
+            sock.settimeout(5)
+            self.assertEqual(sock.recv(1), b'')
+    
+    def test_quiet_serve(self):
+        """Test :func:`.quiet_serve` passes ``max_requests`` through to the threaded server"""
+        sock = base.bind_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        proc = Process(target=base.quiet_serve, kwargs=dict(sock=sock, threaded=True, max_requests=2), daemon=True)
+        proc.start()
+        sock.close()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            headers = [self._post(conn, dict(jsonrpc='2.0', id=i, method='getblockcount'))[0] for i in range(2)]
+            self.assertEqual([h.getheader('Connection') for h in headers], ['keep-alive', 'close'])
+            conn.close()
+        finally:
+            proc.terminate()
+            proc.join(5)
+
+
+class TestBitcoinAsync(unittest.TestCase):
+    """Test the Bitcoin RPC emulator using the AsyncIO server backend"""
+    
+    def test_forked_async(self):
+        """Test the AsyncIO backend running in a background process"""
+        with bitcoin.BitcoinEmulator(port=0, use_async=True) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertEqual(rpc.getnetworkinfo()['version'], 170100)
+            self.assertGreater(rpc.getbalance(), 0)
+    
+    def test_in_loop(self):
+        """Test the AsyncIO backend running inside of the caller's event loop, with concurrent clients"""
+        async def _run():
+            loop = asyncio.get_running_loop()
+            async with bitcoin.BitcoinEmulator(port=0, use_async=True, background=False) as emu:
+                self.assertIsNone(emu.proc)
+                self.assertIsNotNone(emu.server)
+                self.assertNotEqual(emu.port, 0)
+                rpc = BitcoinRPC(port=emu.port)
+                results = await asyncio.gather(*[loop.run_in_executor(None, rpc.getblockchaininfo) for _ in range(10)])
+                return results
+        
+        results = asyncio.run(_run())
+        self.assertEqual(len(results), 10)
+        for info in results:
+            self.assertGreater(info['blocks'], 0)
+
+    def test_offload(self):
+        """Test a synchronous method which blocks doesn't stall requests on other connections"""
+        unblocked = threading.Event()
+        methods = Methods(wait=lambda: unblocked.wait(5), unblock=unblocked.set)
+
+        async def _run():
+            loop = asyncio.get_running_loop()
+            server = await asyncserver.async_serve('127.0.0.1', 0, quiet=True, methods=methods)
+            rpc = BitcoinRPC(port=server.sockets[0].getsockname()[1])
+            try:
+                waiting = loop.run_in_executor(None, rpc.call, 'wait')
+                await asyncio.sleep(0.1)
+                await loop.run_in_executor(None, rpc.call, 'unblock')
+                return await waiting
+            finally:
+                asyncserver.close_server(server)
+                await asyncserver.wait_server_closed(server)
+
+        # If the event loop was blocked by 'wait', 'unblock' couldn't be served until 'wait' timed out
+        self.assertTrue(asyncio.run(_run()))
+
+    def test_close(self):
+        """Test terminating an in-loop emulator closes open keep-alive connections, and stops its thread pool"""
+        body = json.dumps(dict(jsonrpc='2.0', method='getblockcount', params=[], id=1)).encode()
+
+        async def _run():
+            async with bitcoin.BitcoinEmulator(port=0, use_async=True, background=False) as emu:
+                reader, writer = await asyncio.open_connection('127.0.0.1', emu.port)
+                writer.write(b'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+                head = await reader.readuntil(b'\r\n\r\n')
+                self.assertIn(b'Connection: keep-alive', head)
+            # The server closed the idle connection, so the rest of the response is followed by EOF
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+
+        self.assertIsInstance(json.loads(asyncio.run(_run()))['result'], int)
+        deadline = time.monotonic() + 5
+        while any(t.name.startswith('rpcemulator-async') for t in threading.enumerate()):
+            self.assertLess(time.monotonic(), deadline, 'thread pool was not shut down')
+            time.sleep(0.05)
+
+    def test_bad_requests(self):
+        """Test malformed requests get an error status, and don't break the server"""
+        with bitcoin.BitcoinEmulator(port=0, use_async=True) as emu:
+            _check_bad_requests(self, emu.port)
+
+
+class TestBitcoinStats(unittest.TestCase):
+    """Test the per-method call stats recorded by :mod:`privex.rpcemulator.stats`"""
+    def setUp(self) -> None:
+        self.orig_store = bitcoin.internal['transactions']
+        bitcoin.j_use_store(TransactionStore(bitcoin.DEFAULT_TRANSACTIONS))
+        stats.clear()
+    
+    def tearDown(self) -> None:
+        bitcoin.j_use_store(self.orig_store)
+        stats.clear()
+    
+    def test_record_calls(self):
+        """Test calls, errors and payload sizes are recorded for single and batch requests"""
+        dispatcher.dispatch(json.dumps(dict(jsonrpc='2.0', id=1, method='getbalance')))
+        dispatcher.dispatch(json.dumps([
+            dict(jsonrpc='2.0', id=2, method='getbalance'),
+            dict(jsonrpc='2.0', id=3, method='gettransaction', params=['nonexistent']),
+        ]))
+        methods = stats.snapshot()['methods']
+        self.assertEqual(methods['getbalance']['calls'], 2)
+        self.assertEqual(methods['getbalance']['errors'], 0)
+        self.assertGreater(methods['getbalance']['request_bytes'], 0)
+        self.assertGreater(methods['getbalance']['response_bytes'], 0)
+        self.assertEqual(sum(methods['getbalance']['histogram'].values()), 2)
+        self.assertEqual(methods['gettransaction']['calls'], 1)
+        self.assertEqual(methods['gettransaction']['errors'], 1)
+    
+    def test_emulator_stats(self):
+        """Test the ``emulator_stats`` RPC method, and the Prometheus text served at ``/metrics``"""
+        with bitcoin.BitcoinEmulator(port=0, metrics=True) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            for _ in range(3):
+                rpc.getbalance()
+            res = rpc.call('emulator_stats')
+            self.assertEqual(res['methods']['getbalance']['calls'], 3)
+            self.assertEqual(res['methods']['getbalance']['errors'], 0)
+            
+            r = requests.get(f'http://127.0.0.1:{emu.port}/metrics')
+            self.assertEqual(r.status_code, 200)
+            self.assertIn('rpcemulator_calls_total{method="getbalance"} 3', r.text)
+            self.assertIn('rpcemulator_latency_seconds_count{method="getbalance"} 3', r.text)
+            self.assertIn('rpcemulator_latency_seconds_bucket{method="getbalance",le="+Inf"} 3', r.text)
+            self.assertEqual(requests.get(f'http://127.0.0.1:{emu.port}/other').status_code, 404)
+    
+    def test_metrics_async(self):
+        """Test ``/metrics`` on the AsyncIO backend, and that it isn't served unless ``metrics=True``"""
+        with bitcoin.BitcoinEmulator(port=0, use_async=True, metrics=True) as emu:
+            BitcoinRPC(port=emu.port).getbalance()
+            r = requests.get(f'http://127.0.0.1:{emu.port}/metrics')
+            self.assertEqual(r.status_code, 200)
+            self.assertIn('rpcemulator_calls_total{method="getbalance"} 1', r.text)
+        with bitcoin.BitcoinEmulator(port=0) as emu:
+            self.assertEqual(requests.get(f'http://127.0.0.1:{emu.port}/metrics').status_code, 501)
+
+
+class TestBitcoinProfile(unittest.TestCase):
+    """Test profiling the emulator's server process using :mod:`privex.rpcemulator.profiler`"""
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+    
+    def test_profile_cprofile(self):
+        """Test a :mod:`pstats` profile is written by the server process when the emulator is terminated"""
+        path = os.path.join(self.tmpdir.name, 'btc-{pid}.prof')
+        with bitcoin.BitcoinEmulator(port=0, profile='cprofile', profile_path=path) as emu:
+            BitcoinRPC(port=emu.port).getbalance()
+            pid = emu.proc.pid
+        self.assertEqual(emu.profile_files, [path.format(pid=pid)])
+        funcs = {f[2] for f in pstats.Stats(emu.profile_files[0]).stats}
+        self.assertIn('getbalance', funcs)
+    
+    def test_profile_sample(self):
+        """Test folded stacks are written by each worker when profiling with the stack sampler"""
+        path = os.path.join(self.tmpdir.name, 'btc.folded')
+        with bitcoin.BitcoinEmulator(port=0, workers=2, profile='sample', profile_path=path) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            for _ in range(20):
+                rpc.getbalance()
+            pids = [p.pid for p in emu.procs]
+        self.assertEqual(emu.profile_files, [f'{path}.{pid}' for pid in pids])
+        for f in emu.profile_files:
+            with open(f) as fh:
+                lines = fh.read().splitlines()
+            self.assertGreater(len(lines), 0)
+            stack, _, count = lines[0].rpartition(' ')
+            self.assertIn(';', stack)
+            self.assertGreater(int(count), 0)
+    
+    def test_profile_invalid(self):
+        """Test an unknown profiler name is rejected when the emulator is constructed, before forking"""
+        with self.assertRaises(ValueError):
+            bitcoin.BitcoinEmulator(port=0, profile='nonexistent')
+
+
+class TestBitcoinMempool(WalletCopyMixin, unittest.TestCase):
+    """Test the emulated mempool, fee market and fee handling of sends"""
+    EXTERNAL_ADDRESS = TestBitcoinMethods.EXTERNAL_ADDRESS
+    
+    def tearDown(self) -> None:
+        super().tearDown()
+        bitcoin.internal['max_block_weight'] = MAX_BLOCK_WEIGHT
+    
+    def test_send_mempool(self):
+        """Test sends wait in the mempool until mined, paying the minimum feerate when the mempool is empty"""
+        self.assertEqual(bitcoin.estimatesmartfee(6), dict(feerate=0.00001, blocks=6))
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        self.assertEqual(bitcoin.getrawmempool(), [txid])
+        entry = bitcoin.getrawmempool(True)[txid]
+        self.assertEqual((entry['vsize'], entry['fee']), (141, 0.00000141))
+        self.assertEqual(bitcoin.getmempoolentry(txid), entry)
+        self.assertEqual(bitcoin.gettransaction(txid)['fee'], -0.00000141)
+        info = bitcoin.getmempoolinfo()
+        self.assertEqual((info['size'], info['bytes'], info['total_fee']), (1, 141, 0.00000141))
+        bitcoin.generate(1)
+        self.assertEqual(bitcoin.getrawmempool(), [])
+        self.assertEqual(bitcoin.getmempoolinfo()['size'], 0)
+        with self.assertRaises(AssertionError):
+            bitcoin.getmempoolentry(txid)
+    
+    def test_subtractfee(self):
+        """Test ``subtractfee`` deducts the fee from the amount received, instead of the wallet balance"""
+        bitcoin.settxfee('0.0001')
+        own = '12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV'
+        txid = bitcoin.sendtoaddress(own, '0.01', '', '', True)
+        fee = Decimal('0.0000141')
+        self.assertEqual(bitcoin.getmempoolentry(txid)['fee'], float(fee))
+        self.assertEqual(bitcoin.getreceivedbyaddress(own), float(Decimal('0.01') - fee))
+        self.assertAlmostEqual(bitcoin.getbalance(), 0.18 - float(fee))
+        with self.assertRaises(AssertionError):
+            bitcoin.sendtoaddress(own, '0.00001', '', '', True)
+    
+    def test_fee_market(self):
+        """Test a large backlog raises fee estimates, and blocks confirm the highest feerate transactions first"""
+        self.assertEqual(bitcoin.j_fill_mempool(20000, seed=1, batch_size=5000), 20000)
+        self.assertEqual(bitcoin.getmempoolinfo()['size'], 20000)
+        fast, slow = bitcoin.estimatesmartfee(1)['feerate'], bitcoin.estimatesmartfee(50)['feerate']
+        self.assertGreater(fast, bitcoin.estimatesmartfee(3)['feerate'])
+        self.assertEqual(slow, 0.00001)
+        
+        # A send paying more than the 1 block estimate should be mined in the next block, while a minimum fee
+        # send waits behind the backlog
+        bitcoin.settxfee(fast * 2)
+        fast_txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.001')
+        bitcoin.settxfee('0.00001')
+        slow_txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.001')
+        before = bitcoin.getmempoolinfo()
+        bitcoin.generate(1)
+        after = bitcoin.getmempoolinfo()
+        self.assertEqual(bitcoin.gettransaction(fast_txid)['confirmations'], 1)
+        self.assertEqual(bitcoin.gettransaction(slow_txid)['confirmations'], 0)
+        mined = before['bytes'] - after['bytes']
+        self.assertLessEqual(mined, MAX_BLOCK_WEIGHT // 4)
+        self.assertGreater(mined, MAX_BLOCK_WEIGHT // 4 - 2000)
+        
+        bitcoin.internal['max_block_weight'] = 400000
+        bitcoin.generate(1)
+        self.assertLessEqual(after['bytes'] - bitcoin.getmempoolinfo()['bytes'], 100000)
+
+
+class TestBitcoinAddresses(unittest.TestCase):
+    """Test address generation, validation and labels via the emulated RPC methods"""
+    
+    def setUp(self) -> None:
+        self._orig_addresses = orig = bitcoin.internal['addresses']
+        bitcoin.internal['addresses'] = AddressRegistry(orig, external=orig.external, seed='addresses')
+    
+    def tearDown(self) -> None:
+        bitcoin.internal['addresses'] = self._orig_addresses
+    
+    def test_getnewaddress(self):
+        """Test ``getnewaddress`` derives unique, valid addresses which belong to the wallet"""
+        addresses = [bitcoin.getnewaddress() for _ in range(100)]
+        self.assertEqual(addresses, derive_addresses('addresses', 0, 100))
+        info = bitcoin.getaddressinfo(addresses[5])
+        self.assertEqual((info['ismine'], info['label'], info['hdkeypath']), (True, '', "m/0'/0'/5'"))
+        self.assertTrue(bitcoin.validateaddress(addresses[5])['isvalid'])
+        # Coins received by a new address are included in the balance
+        bitcoin.j_add_tx(address=addresses[5], amount='0.5', category='receive', blockheight=None)
+        self.assertEqual(bitcoin.getreceivedbyaddress(addresses[5]), 0.5)
+    
+    def test_validateaddress(self):
+        """Test ``validateaddress`` accepts any checksum-valid address, and returns its output script"""
+        res = bitcoin.validateaddress('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa')
+        self.assertTrue(res['isvalid'])
+        self.assertEqual(res['scriptPubKey'], '76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac')
+        self.assertEqual(bitcoin.validateaddress('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNb'), dict(isvalid=False))
+        self.assertFalse(bitcoin.getaddressinfo('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa')['ismine'])
+        with self.assertRaises(AssertionError):
+            bitcoin.getaddressinfo('notanaddress')
+    
+    def test_labels(self):
+        """Test ``getaddressesbylabel``, ``setlabel`` and ``listlabels``"""
+        a, b = bitcoin.getnewaddress('deposits'), bitcoin.getnewaddress('deposits')
+        self.assertEqual(
+            bitcoin.getaddressesbylabel('deposits'), {a: dict(purpose='receive'), b: dict(purpose='receive')}
+        )
+        bitcoin.setlabel(b, 'hot wallet')
+        self.assertEqual(list(bitcoin.getaddressesbylabel('deposits')), [a])
+        self.assertEqual(bitcoin.listlabels(), ['', 'deposits', 'hot wallet'])
+        self.assertEqual(bitcoin.listlabels('send'), [])
+        self.assertEqual(bitcoin.getaddressinfo(b)['labels'], [dict(name='hot wallet', purpose='receive')])
+        with self.assertRaises(AssertionError):
+            bitcoin.getaddressesbylabel('nonexistent')
+        with self.assertRaises(AssertionError):
+            bitcoin.setlabel('1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa', 'theirs')
+
+    def test_account(self):
+        """Test ``getnewaddress`` still accepts the pre-0.17 ``account`` argument, filing the address under it"""
+        a = bitcoin.getnewaddress(account='savings')
+        response = dispatcher.dispatch(json.dumps(
+            dict(jsonrpc='2.0', method='getnewaddress', params=dict(account='savings'), id=1)
+        ))
+        b = response.result
+        self.assertEqual(set(bitcoin.getaddressesbylabel('savings')), {a, b})
+
+    def test_keypoolrefill(self):
+        """Test ``keypoolrefill`` derives addresses ahead of time, without changing which addresses are handed out"""
+        bitcoin.keypoolrefill(500)
+        self.assertEqual(bitcoin.internal['addresses'].keypool_remaining(), 500)
+        self.assertEqual(bitcoin.getnewaddress(), derive_addresses('addresses', 0, 1)[0])
+        self.assertEqual(bitcoin.internal['addresses'].keypool_remaining(), 499)
+
+
+class TestBitcoinUTXOs(WalletCopyMixin, unittest.TestCase):
+    """Test the wallet's UTXOs via ``listunspent`` / ``lockunspent``, and the inputs and change of sends"""
+    EXTERNAL_ADDRESS = TestBitcoinMethods.EXTERNAL_ADDRESS
+    
+    def test_listunspent(self):
+        """Test ``listunspent`` lists UTXOs largest first, filtered by confirmations, address and amount"""
+        unspent = bitcoin.listunspent()
+        self.assertEqual([u['amount'] for u in unspent], [0.1, 0.05, 0.03])
+        self.assertEqual(
+            {k: unspent[0][k] for k in ('txid', 'vout', 'address', 'confirmations', 'safe')},
+            dict(txid=bitcoin.DEFAULT_TRANSACTIONS[0]['txid'], vout=0, address='1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8',
+                 confirmations=5, safe=True)
+        )
+        self.assertEqual([u['confirmations'] for u in bitcoin.listunspent(6, 27)], [26])
+        self.assertEqual(
+            [u['amount'] for u in bitcoin.listunspent(addresses=['13LWnGV7fGCUA2a9QiByGFKXL27H1HDuYp'])], [0.03]
+        )
+        small = bitcoin.listunspent(query_options=dict(maximumAmount=0.05))
+        self.assertEqual([u['amount'] for u in small], [0.05, 0.03])
+        self.assertEqual(len(bitcoin.listunspent(query_options=dict(minimumSumAmount=0.12))), 2)
+        self.assertEqual(len(bitcoin.listunspent(query_options=dict(maximumCount=1))), 1)
+        with self.assertRaises(AssertionError):
+            bitcoin.listunspent(addresses=['notanaddress'])
+    
+    def test_send_change(self):
+        """Test a send spends the largest UTXO, and returns the change to its address as an unconfirmed UTXO"""
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        fee = Decimal(str(bitcoin.getmempoolentry(txid)['fee']))
+        self.assertEqual([u['amount'] for u in bitcoin.listunspent()], [0.05, 0.03])
+        change = bitcoin.listunspent(0)[0]
+        self.assertEqual((change['txid'], change['vout'], change['confirmations'], change['safe']), (txid, 1, 0, False))
+        self.assertEqual(Decimal(str(change['amount'])), Decimal('0.09') - fee)
+        self.assertEqual(bitcoin.internal['transactions'].utxos.total(), bitcoin.internal['transactions'].balance())
+        bitcoin.generate(1)
+        self.assertEqual(bitcoin.listunspent()[0]['confirmations'], 1)
+        self.assertEqual(bitcoin.listunspent(include_unsafe=False, minconf=0)[0]['txid'], txid)
+    
+    def test_lockunspent(self):
+        """Test locked UTXOs aren't listed or spent until they're unlocked"""
+        richest = bitcoin.listunspent()[0]
+        outpoint = dict(txid=richest['txid'], vout=richest['vout'])
+        self.assertTrue(bitcoin.lockunspent(False, [outpoint]))
+        self.assertEqual(bitcoin.listlockunspent(), [outpoint])
+        self.assertEqual([u['amount'] for u in bitcoin.listunspent()], [0.05, 0.03])
+        with self.assertRaisesRegex(AssertionError, 'already locked'):
+            bitcoin.lockunspent(False, [outpoint])
+        with self.assertRaisesRegex(AssertionError, 'unknown transaction output'):
+            bitcoin.lockunspent(False, [dict(txid=richest['txid'], vout=5)])
+        # Only 0.08 is spendable while the 0.1 UTXO is locked
+        with self.assertRaisesRegex(AssertionError, 'Insufficient funds'):
+            bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.09')
+        txid = bitcoin.sendtoaddress(self.EXTERNAL_ADDRESS, '0.01')
+        sends = bitcoin.internal['transactions'].find(txid)
+        self.assertEqual(sends[0]['address'], '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW')
+        self.assertTrue(bitcoin.lockunspent(True))
+        self.assertEqual(bitcoin.listlockunspent(), [])
+        with self.assertRaisesRegex(AssertionError, 'expected locked output'):
+            bitcoin.lockunspent(True, [outpoint])
+    
+    def test_listunspent_large(self):
+        """Test ``listunspent`` pages through a 100k UTXO wallet, largest first, filtered by amount and address"""
+        address = '12Q3qTYGfgYwFC8Df2bgR7SqrQ5LcvkmhV'
+        before = len(bitcoin.internal['transactions'].utxos)
+        bitcoin.j_add_txs(100000, seed=21, category='receive', max_amount='0.01')
+        self.assertEqual(len(bitcoin.internal['transactions'].utxos), before + 100000)
+        largest = bitcoin.listunspent(query_options=dict(maximumCount=100))
+        small = bitcoin.listunspent(query_options=dict(maximumAmount=0.0001, maximumCount=100))
+        by_address = bitcoin.listunspent(addresses=[address], query_options=dict(maximumCount=100))
+        self.assertEqual(len(largest), 100)
+        self.assertEqual(largest, sorted(largest, key=lambda u: u['amount'], reverse=True))
+        self.assertEqual([u['amount'] for u in largest[:3]], [0.1, 0.05, 0.03])
+        self.assertEqual(len(small), 100)
+        self.assertTrue(all(u['amount'] <= 0.0001 for u in small))
+        self.assertEqual({u['address'] for u in by_address}, {address})
+        self.assertEqual(by_address, sorted(by_address, key=lambda u: u['amount'], reverse=True))
+
+
+class TestBitcoinRawTransactions(WalletCopyMixin, unittest.TestCase):
+    """Test the raw transaction pipeline - ``createrawtransaction`` through to ``sendrawtransaction``"""
+    EXTERNAL_ADDRESS = TestBitcoinMethods.EXTERNAL_ADDRESS
+    
+    def setUp(self) -> None:
+        super().setUp()
+        self.utxo = bitcoin.listunspent()[0]
+    
+    def create(self, external='0.03', change='0.0699', **kwargs):
+        u = self.utxo
+        outputs = {self.EXTERNAL_ADDRESS: external, u['address']: change}
+        return bitcoin.createrawtransaction([dict(txid=u['txid'], vout=u['vout'])], outputs, **kwargs)
+    
+    def test_create_decode(self):
+        """Test a created transaction decodes to the same inputs and outputs"""
+        raw = self.create(locktime=100)
+        tx = bitcoin.decoderawtransaction(raw)
+        self.assertEqual(tx['vin'][0]['txid'], self.utxo['txid'])
+        self.assertEqual(tx['vin'][0]['sequence'], 0xfffffffe)
+        self.assertEqual([o['value'] for o in tx['vout']], [0.03, 0.0699])
+        self.assertEqual(tx['vout'][0]['scriptPubKey']['address'], self.EXTERNAL_ADDRESS)
+        self.assertEqual(tx['vout'][0]['scriptPubKey']['type'], 'pubkeyhash')
+        self.assertEqual((tx['locktime'], tx['version'], tx['size'], tx['vsize']), (100, 2, 119, 119))
+        data = bitcoin.createrawtransaction([], [{'data': 'cafe'}])
+        self.assertEqual(bitcoin.decoderawtransaction(data)['vout'][0]['scriptPubKey']['asm'], 'OP_RETURN cafe')
+        with self.assertRaisesRegex(AssertionError, 'TX decode failed'):
+            bitcoin.decoderawtransaction(raw[:-2])
+        with self.assertRaisesRegex(AssertionError, 'Invalid Bitcoin address'):
+            bitcoin.createrawtransaction([], {'notanaddress': 1})
+    
+    def test_sign_send(self):
+        """Test a signed transaction spends its input, pays its fee, and returns the change to the input address"""
+        unsigned = self.create()
+        with self.assertRaisesRegex(AssertionError, 'mandatory-script-verify-flag-failed'):
+            bitcoin.sendrawtransaction(unsigned)
+        signed = bitcoin.signrawtransactionwithwallet(unsigned)
+        self.assertTrue(signed['complete'])
+        # Signing is deterministic
+        self.assertEqual(bitcoin.signrawtransactionwithwallet(unsigned), signed)
+        tx = bitcoin.decoderawtransaction(signed['hex'])
+        self.assertTrue(tx['vin'][0]['scriptSig']['asm'].split()[0].endswith('[ALL]'))
+        balance = bitcoin.getbalance()
+        txid = bitcoin.sendrawtransaction(signed['hex'])
+        self.assertEqual(txid, tx['txid'])
+        self.assertAlmostEqual(bitcoin.getbalance(), balance - 0.0301)
+        entry = bitcoin.getmempoolentry(txid)
+        self.assertEqual((entry['fee'], entry['vsize']), (0.0001, tx['vsize']))
+        change = bitcoin.listunspent(0, addresses=[self.utxo['address']])[0]
+        self.assertEqual((change['txid'], change['vout'], change['amount']), (txid, 1, 0.0699))
+        self.assertEqual(bitcoin.internal['transactions'].utxos.total(), bitcoin.internal['transactions'].balance())
+        with self.assertRaisesRegex(AssertionError, 'txn-already-in-mempool'):
+            bitcoin.sendrawtransaction(signed['hex'])
+        # The input has been spent
+        again = bitcoin.signrawtransactionwithwallet(self.create(change='0.0698'))
+        self.assertFalse(again['complete'])
+        self.assertEqual(again['errors'][0]['error'], 'Input not found or already spent')
+    
+    def test_send_errors(self):
+        """Test transactions spending more than their inputs, or paying too much fee, are rejected"""
+        with self.assertRaisesRegex(AssertionError, 'bad-txns-in-belowout'):
+            bitcoin.sendrawtransaction(bitcoin.signrawtransactionwithwallet(self.create(change='0.08'))['hex'])
+        with self.assertRaisesRegex(AssertionError, 'Fee exceeds maximum'):
+            bitcoin.sendrawtransaction(bitcoin.signrawtransactionwithwallet(self.create(change='0.01'))['hex'])
+        with self.assertRaisesRegex(AssertionError, 'min relay fee not met'):
+            bitcoin.sendrawtransaction(bitcoin.signrawtransactionwithwallet(self.create(change='0.07'))['hex'])
+    
+    def test_throughput(self):
+        """Test thousands of create / sign / decode / send flows in a row each spend their UTXO, leaving the change"""
+        address = bitcoin.getnewaddress()
+        count = 2000
+        for _ in range(count):
+            bitcoin.j_add_tx(address=address, amount='0.01', category='receive')
+        utxos = bitcoin.listunspent(0, addresses=[address], query_options=dict(maximumCount=count))
+        self.assertEqual(len(utxos), count)
+        for u in utxos:
+            raw = bitcoin.createrawtransaction(
+                [dict(txid=u['txid'], vout=u['vout'])], {self.EXTERNAL_ADDRESS: 0.005, address: 0.0049}
+            )
+            signed = bitcoin.signrawtransactionwithwallet(raw)['hex']
+            bitcoin.decoderawtransaction(signed)
+            bitcoin.sendrawtransaction(signed)
+        change = bitcoin.listunspent(0, addresses=[address], query_options=dict(maximumCount=count))
+        self.assertEqual(len(change), count)
+        self.assertTrue(all(u['amount'] == 0.0049 for u in change))
+        self.assertFalse({u['txid'] for u in change} & {u['txid'] for u in utxos})
+
+
+class TestBitcoinBlocks(unittest.TestCase):
+    """Test automatic block production using :py:attr:`.BitcoinEmulator.block_interval`"""
+    def test_block_interval(self):
+        with bitcoin.BitcoinEmulator(port=0, block_interval=0.1) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            start = rpc.call('getblockcount')
+            txid = rpc.sendtoaddress(TestBitcoinMethods.EXTERNAL_ADDRESS, '0.001')
+            deadline = time.time() + 10
+            while rpc.call('getblockcount') < start + 2 and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(rpc.call('getblockcount'), start + 2)
+            self.assertGreaterEqual(rpc.gettransaction(txid)['confirmations'], 1)
+
+
+class TestBitcoinMultiWallet(unittest.TestCase):
+    """Test serving independent wallets from one in-process server, routed by port or ``/wallet/<name>``"""
+    EXTERNAL_ADDRESS = "165GagcJtj4LtvM94BDrM2nfBfnfX1gQxc"
+    
+    def test_in_process(self):
+        """Test an in-process emulator is served from a thread, and its wallet can be inspected directly"""
+        with bitcoin.BitcoinEmulator(port=0, in_process=True, isolated=True) as emu:
+            self.assertEqual(emu.procs, [])
+            self.assertIsNotNone(emu.httpd)
+            self.assertIsNot(emu.state, bitcoin.default_state())
+            rpc = BitcoinRPC(port=emu.port)
+            address = rpc.getnewaddress()
+            self.assertIn(address, emu.state.internal['addresses'])
+            self.assertNotIn(address, bitcoin.internal['addresses'])
+            port = emu.port
+        self.assertIsNone(emu.httpd)
+        with self.assertRaises(ConnectionError):
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+    
+    def test_route_by_port(self):
+        """Test several isolated in-process emulators on their own ports don't share balances"""
+        emus = [bitcoin.BitcoinEmulator(port=0, in_process=True, threaded=True, isolated=True) for _ in range(5)]
+        try:
+            BitcoinRPC(port=emus[0].port).sendtoaddress(self.EXTERNAL_ADDRESS, '0.1', "", "", True)
+            balances = [float(BitcoinRPC(port=e.port).getbalance()) for e in emus]
+            self.assertEqual(balances, [0.08] + [0.18] * 4)
+        finally:
+            for e in emus:
+                e.terminate()
+    
+    def test_route_by_path(self):
+        """Test each ``/wallet/<name>`` is served its own wallet, and unknown wallets / paths get a 404"""
+        with bitcoin.BitcoinEmulator(port=0, in_process=True, threaded=True, isolated=True,
+                                     wallets=['alice', 'bob smith']) as emu:
+            alice = BitcoinRPC(port=emu.port, url='/wallet/alice')
+            bob = BitcoinRPC(port=emu.port, url='/wallet/bob%20smith')
+            alice.sendtoaddress(self.EXTERNAL_ADDRESS, '0.1', "", "", True)
+            self.assertEqual(float(alice.getbalance()), 0.08)
+            self.assertEqual(float(bob.getbalance()), 0.18)
+            self.assertEqual(float(BitcoinRPC(port=emu.port).getbalance()), 0.18)
+            self.assertEqual(bob.call('getwalletinfo')['walletname'], 'bob smith')
+            payload = dict(jsonrpc='2.0', id=1, method='getbalance')
+            for path in ('/wallet/carol', '/wallets/alice', '/metrics'):
+                r = requests.post(f'http://127.0.0.1:{emu.port}{path}', json=payload)
+                self.assertEqual(r.status_code, 404, path)
+    
+    def test_wallet_rpcs(self):
+        """Test wallets can be created, listed and unloaded over RPC"""
+        with bitcoin.BitcoinEmulator(port=0, in_process=True, isolated=True) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertEqual(rpc.call('createwallet', 'carol'), dict(name='carol', warning=''))
+            self.assertEqual(rpc.call('listwallets'), ['', 'carol'])
+            carol = BitcoinRPC(port=emu.port, url='/wallet/carol')
+            self.assertNotIn(carol.getnewaddress(), emu.state.internal['addresses'])
+            self.assertEqual(carol.call('unloadwallet'), dict(warning=''))
+            self.assertEqual(rpc.call('listwallets'), [''])
+            self.assertEqual(requests.post(f'http://127.0.0.1:{emu.port}/wallet/carol', json=dict(
+                jsonrpc='2.0', id=1, method='getbalance'
+            )).status_code, 404)
+        with self.assertRaisesRegex(AssertionError, 'Method not found'):
+            bitcoin.listwallets()
+    
+    def test_async_routing(self):
+        """Test ``/wallet/<name>`` routing with the AsyncIO backend in the caller's event loop"""
+        async def _run():
+            loop = asyncio.get_running_loop()
+            async with bitcoin.BitcoinEmulator(port=0, use_async=True, background=False, isolated=True,
+                                               wallets=['alice']) as emu:
+                alice = BitcoinRPC(port=emu.port, url='/wallet/alice')
+                info = await loop.run_in_executor(None, alice.call, 'getwalletinfo')
+                missing = await loop.run_in_executor(None, partial(
+                    requests.post, f'http://127.0.0.1:{emu.port}/wallet/bob',
+                    json=dict(jsonrpc='2.0', id=1, method='getbalance')
+                ))
+                return info, missing.status_code
+        
+        info, status = asyncio.run(_run())
+        self.assertEqual(info['walletname'], 'alice')
+        self.assertEqual(status, 404)
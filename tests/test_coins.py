@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from decimal import Decimal
+
+from privex.jsonrpc import BitcoinRPC
+from requests.exceptions import HTTPError
+
+from privex.rpcemulator import bitcoin
+from privex.rpcemulator.altcoins import BitcoinCashEmulator, DogecoinEmulator, LitecoinEmulator
+from privex.rpcemulator.coins import BITCOIN, BITCOIN_CASH, DOGECOIN, LITECOIN, PROFILES
+
+
+class TestCoinProfiles(unittest.TestCase):
+    """Test the coin profiles, and the methods served for each coin"""
+    
+    def test_profiles(self):
+        """Test the derived units and fees of the built-in profiles"""
+        self.assertEqual(sorted(PROFILES), ['BCH', 'BTC', 'DOGE', 'LTC'])
+        self.assertEqual(BITCOIN.unit, Decimal('0.00000001'))
+        self.assertEqual(BITCOIN.relay_fee, Decimal('0.00001'))
+        self.assertEqual(DOGECOIN.relay_fee, Decimal('0.01'))
+        self.assertEqual(LitecoinEmulator.coin, LITECOIN)
+    
+    def test_coin_methods(self):
+        """Test each coin's registry drops the methods its daemon lacks, and adds its compat methods"""
+        btc, doge, bch = (bitcoin.coin_methods(c).items for c in (BITCOIN, DOGECOIN, BITCOIN_CASH))
+        self.assertIn('signrawtransactionwithwallet', btc)
+        self.assertNotIn('signrawtransaction', btc)
+        self.assertNotIn('estimatefee', btc)
+        self.assertNotIn('signrawtransactionwithwallet', doge)
+        self.assertIn('signrawtransaction', doge)
+        self.assertNotIn('estimatesmartfee', bch)
+        self.assertIn('estimatefee', bch)
+        self.assertIn('emulator_stats', bch)
+        # The compat methods aren't served by the global methods
+        self.assertNotIn('estimatefee', bitcoin.global_methods.items)
+
+
+class TestCoinStates(unittest.TestCase):
+    """Test the wallets of other coins, and that they're isolated from each other and the default wallet"""
+    
+    def test_litecoin(self):
+        """Test a Litecoin wallet has its own L addresses and balance, and sends don't touch the Bitcoin wallet"""
+        btc_balance, ltc = bitcoin.getbalance(), bitcoin.CoinState(LITECOIN, seed='test')
+        with ltc.activate():
+            self.assertIs(bitcoin.current_state(), ltc)
+            address = bitcoin.getnewaddress()
+            self.assertTrue(address.startswith('L'))
+            self.assertTrue(bitcoin.validateaddress(address)['isvalid'])
+            self.assertFalse(bitcoin.validateaddress('1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8')['isvalid'])
+            self.assertEqual(bitcoin.getbalance(), 0.18)
+            bitcoin.sendtoaddress(sorted(bitcoin.internal['addresses'].external)[0], '0.1')
+            self.assertLess(bitcoin.getbalance(), 0.08)
+            self.assertEqual(bitcoin.getnetworkinfo()['subversion'], '/LitecoinCore:0.18.1/')
+        self.assertIs(bitcoin.current_state(), bitcoin.default_state())
+        self.assertEqual(bitcoin.getbalance(), btc_balance)
+        self.assertFalse(bitcoin.validateaddress(address)['isvalid'])
+    
+    def test_dogecoin_fees(self):
+        """Test Dogecoin sends pay at least the minimum feerate, for the size of a legacy transaction"""
+        with bitcoin.CoinState(DOGECOIN, seed='test').activate():
+            self.assertEqual(bitcoin.estimatesmartfee(2)['feerate'], 0.01)
+            txid = bitcoin.sendtoaddress(sorted(bitcoin.internal['addresses'].external)[0], '0.05')
+            entry = bitcoin.getmempoolentry(txid)
+            self.assertEqual(entry['vsize'], 226)
+            self.assertEqual(entry['fee'], 0.00226)
+            # The change of the 0.1 DOGE input is above the 0.01 DOGE dust limit, so it's kept
+            utxos = bitcoin.internal['transactions'].utxos
+            self.assertEqual(len(utxos.by_address(bitcoin.internal['addresses'][0])), 1)
+    
+    def test_decimals(self):
+        """Test the stores of a coin with other than 8 decimals use its unit, in memory and in SQLite"""
+        coin = BITCOIN._replace(name='fourcoin', symbol='FOUR', decimals=4)
+        with bitcoin.CoinState(coin, seed='test').activate():
+            store = bitcoin.internal['transactions']
+            self.assertEqual((store.mempool.unit, store.utxos.unit), (Decimal(10000), Decimal(10000)))
+            self.assertEqual(round(sum(u['amount'] for u in bitcoin.listunspent()), 4), bitcoin.getbalance())
+            sqlite = bitcoin.j_use_store(':memory:')
+            self.assertEqual(sqlite.unit, Decimal(10000))
+            self.assertEqual(sqlite.balance(), Decimal('0.18'))
+
+    def test_default_state(self):
+        """Test each coin has one default state, with addresses derived from the coin's name"""
+        state = bitcoin.default_state(BITCOIN_CASH)
+        self.assertIs(bitcoin.default_state(BITCOIN_CASH), state)
+        self.assertEqual(state.internal['addresses'].seed, b'bitcoincash')
+        self.assertIs(bitcoin.default_state(), bitcoin.default_state(BITCOIN))
+
+
+class TestMultiCoinServer(unittest.TestCase):
+    """Test serving several coin emulators from one process"""
+    
+    def test_one_event_loop(self):
+        """Test Bitcoin, Litecoin and Dogecoin emulators served by one event loop each serve their own wallet"""
+        async def _run():
+            loop = asyncio.get_running_loop()
+            opts = dict(port=0, use_async=True, background=False)
+            async with bitcoin.BitcoinEmulator(**opts) as btc, LitecoinEmulator(**opts) as ltc, \
+                    DogecoinEmulator(state=bitcoin.CoinState(DOGECOIN), **opts) as doge:
+                self.assertEqual(len({btc.port, ltc.port, doge.port}), 3)
+                calls = [
+                    (emu.port, name) for emu in (btc, ltc, doge) for name in ('getnewaddress', 'getnetworkinfo')
+                ]
+                return await asyncio.gather(*[
+                    loop.run_in_executor(None, BitcoinRPC(port=port).call, name) for port, name in calls
+                ])
+        
+        btc_addr, btc_info, ltc_addr, ltc_info, doge_addr, doge_info = asyncio.run(_run())
+        self.assertTrue(btc_addr.startswith('1'))
+        self.assertTrue(ltc_addr.startswith('L'))
+        self.assertTrue(doge_addr.startswith('D'))
+        self.assertEqual(
+            [i['subversion'] for i in (btc_info, ltc_info, doge_info)],
+            ['/Satoshi:0.17.1/', '/LitecoinCore:0.18.1/', '/Shibetoshi:1.14.6/']
+        )
+    
+    def test_compat_methods(self):
+        """Test a forked Bitcoin Cash emulator serves ``estimatefee`` instead of ``estimatesmartfee``"""
+        with BitcoinCashEmulator(port=0) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertEqual(rpc.call('estimatefee'), 0.00001)
+            # "Method not found" is returned with a 404 status, which the client raises as an HTTPError
+            with self.assertRaisesRegex(HTTPError, '404'):
+                rpc.call('estimatesmartfee', 6)
@@ -0,0 +1,201 @@
+import json
+import time
+import unittest
+from http import HTTPStatus
+
+import requests
+from privex.jsonrpc import BitcoinRPC
+
+from privex.rpcemulator import bitcoin, faults
+from privex.rpcemulator.faults import ErrorRate, FaultInjector, Latency, TokenBucket
+
+
+def _post(port: int, method: str, params=None, **kwargs) -> requests.Response:
+    data = dict(jsonrpc='2.0', method=method, params=[] if params is None else params, id=1)
+    return requests.post(f'http://127.0.0.1:{port}/', data=json.dumps(data), **kwargs)
+
+
+class TestFaultInjector(unittest.TestCase):
+    """Test the fault settings and sampling of :class:`.FaultInjector`, without a server"""
+
+    def setUp(self):
+        self.faults = FaultInjector(seed=1)
+
+    def test_inactive(self):
+        """Test a new injector is inactive, and never faults a call"""
+        self.assertFalse(self.faults.active)
+        self.assertEqual(self.faults.call_fault('getblockchaininfo'), (0.0, None))
+        self.assertIsNone(self.faults.reject())
+        self.assertFalse(self.faults.drop())
+
+    def test_configure(self):
+        """Test shorthand settings are expanded, ``*`` is the default for other methods, and ``None`` removes one"""
+        config = self.faults.configure(
+            latency={'*': 0.5, 'getblock': ['uniform', 1, 2]}, errors={'getblock': 1}, drip={'chunk': 10}
+        )
+        self.assertTrue(self.faults.active)
+        self.assertEqual(config['latency']['*'], dict(distribution='fixed', a=0.5, b=0.0))
+        self.assertEqual(config['errors']['getblock'], dict(rate=1.0, code=-28, message="Loading block index..."))
+        self.assertEqual(config['drip'], dict(chunk=10, interval=0.0))
+        self.assertEqual(self.faults.call_fault('getnewaddress'), (0.5, None))
+        delay, error = self.faults.call_fault('getblock')
+        self.assertTrue(1 <= delay <= 2)
+        self.assertEqual(error, ErrorRate(1.0))
+        # The admin method is never faulted
+        self.assertEqual(self.faults.call_fault(faults.ADMIN_METHOD), (0.0, None))
+
+        self.faults.configure(latency={'*': None}, errors={'getblock': None}, drip={})
+        self.assertEqual(self.faults.call_fault('getnewaddress'), (0.0, None))
+        self.assertTrue(self.faults.active)
+        self.faults.reset()
+        self.assertFalse(self.faults.active)
+
+    def test_invalid(self):
+        """Test invalid settings are rejected without changing any of the current settings"""
+        self.faults.configure(errors={'*': 0.5})
+        with self.assertRaises(AssertionError):
+            self.faults.configure(latency={'*': ('gamma', 1)}, errors={'*': 0.1})
+        with self.assertRaises(AssertionError):
+            self.faults.configure(errors={'*': 2})
+        with self.assertRaises(AssertionError):
+            self.faults.configure(rate_limit={'rate': 10, 'status': 500})
+        self.assertEqual(self.faults.errors['*'].rate, 0.5)
+        self.assertNotIn('*', self.faults.latency)
+
+    def test_seed(self):
+        """Test faults sampled with the same seed are reproducible"""
+        settings = dict(latency={'*': ('lognormal', 0.05, 1)}, errors={'*': 0.3}, seed=123)
+        samples = []
+        for _ in range(2):
+            self.faults.configure(**settings)
+            samples.append([self.faults.call_fault('getblockcount') for _ in range(20)])
+        self.assertEqual(samples[0], samples[1])
+        self.assertTrue(any(error is None for _, error in samples[0]))
+        self.assertTrue(any(error is not None for _, error in samples[0]))
+
+    def test_distributions(self):
+        """Test each latency distribution samples non-negative delays in the expected range"""
+        rng = self.faults.rng
+        self.assertEqual(Latency('fixed', 0.25).sample(rng), 0.25)
+        for d in faults.DISTRIBUTIONS:
+            delays = [Latency(d, 0.01, 0.02).sample(rng) for _ in range(200)]
+            self.assertTrue(all(delay >= 0 for delay in delays), d)
+        self.assertTrue(all(0.01 <= Latency('uniform', 0.01, 0.02).sample(rng) <= 0.02 for _ in range(50)))
+
+    def test_token_bucket(self):
+        """Test the bucket allows a burst, then refills at its rate"""
+        bucket = TokenBucket(rate=20, burst=3)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        time.sleep(0.1)
+        self.assertTrue(bucket.take())
+
+    def test_exempt(self):
+        """Test requests calling the admin method are detected, as bytes or str"""
+        self.assertTrue(FaultInjector.exempt(b'{"method": "emulator_faults", "params": []}'))
+        self.assertTrue(FaultInjector.exempt('{"method":"emulator_faults"}'))
+        self.assertFalse(FaultInjector.exempt('{"method": "getblockchaininfo"}'))
+        self.assertTrue(FaultInjector.exempt('[{"method": "emulator_faults"}, {"method": "emulator_faults"}]'))
+
+    def test_not_exempt(self):
+        """Test batches mixing other calls with admin calls, and admin names in parameters, aren't exempt"""
+        self.assertFalse(FaultInjector.exempt('[{"method": "emulator_faults"}, {"method": "getblockcount"}]'))
+        self.assertFalse(FaultInjector.exempt('{"method": "getaddressesbylabel", "params": ["emulator_faults"]}'))
+        self.assertFalse(FaultInjector.exempt('{"method": "emulator_faults"'))
+        self.assertFalse(FaultInjector.exempt('[]'))
+
+
+class TestFaultServer(unittest.TestCase):
+    """Test faults injected by the :mod:`http.server` backend, configured at startup and via ``emulator_faults``"""
+    use_async = False
+
+    def emulator(self, **kwargs) -> bitcoin.BitcoinEmulator:
+        return bitcoin.BitcoinEmulator(port=0, use_async=self.use_async, threaded=True, **kwargs)
+
+    def test_errors(self):
+        """Test a method with an error rate of 1 always returns bitcoind's ``-28`` warmup error"""
+        with self.emulator(faults=dict(errors={'getblockchaininfo': 1})) as emu:
+            r = _post(emu.port, 'getblockchaininfo').json()
+            self.assertEqual(r['error']['code'], -28)
+            self.assertEqual(r['error']['message'], "Loading block index...")
+            self.assertIn('result', _post(emu.port, 'getblockcount').json())
+
+    def test_batch_errors(self):
+        """Test only the faulty calls of a batch fail"""
+        with self.emulator(faults=dict(errors={'getblockcount': dict(rate=1, code=-1, message='boom')})) as emu:
+            batch = [
+                dict(jsonrpc='2.0', method=m, params=[], id=i) for i, m in enumerate(['getblockcount', 'getbalance'])
+            ]
+            r = requests.post(f'http://127.0.0.1:{emu.port}/', data=json.dumps(batch)).json()
+            self.assertEqual(r[0]['error'], dict(code=-1, message='boom'))
+            self.assertIn('result', r[1])
+
+    def test_latency(self):
+        """Test calls are delayed by at least their method's latency"""
+        with self.emulator(faults=dict(latency={'*': 0, 'getblockcount': 0.3})) as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            start = time.perf_counter()
+            rpc.getblockcount()
+            self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+            self.assertEqual(rpc.call('getnetworkinfo')['version'], 170100)
+
+    def test_rate_limit(self):
+        """Test requests beyond the burst are rejected with a 429 and ``Retry-After``, or a 503 if configured"""
+        with self.emulator(faults=dict(rate_limit=dict(rate=0.1, burst=2))) as emu:
+            statuses = [_post(emu.port, 'getblockcount') for _ in range(3)]
+            self.assertEqual([r.status_code for r in statuses], [200, 200, HTTPStatus.TOO_MANY_REQUESTS])
+            self.assertEqual(statuses[2].headers['Retry-After'], '1')
+            # The admin method is exempt from the rate limit
+            config = _post(emu.port, 'emulator_faults', dict(rate_limit=dict(rate=0.1, status=503))).json()
+            self.assertEqual(config['result']['rate_limit'], dict(rate=0.1, burst=1, status=503))
+            self.assertEqual(_post(emu.port, 'getblockcount').status_code, 200)
+            r = _post(emu.port, 'getblockcount')
+            self.assertEqual(r.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+            self.assertEqual(r.text, 'Work queue depth exceeded')
+            # A batch which includes an admin call is still rate limited
+            batch = [dict(jsonrpc='2.0', method=m, params=[], id=i) for i, m in enumerate(['emulator_faults', 'help'])]
+            r = requests.post(f'http://127.0.0.1:{emu.port}/', data=json.dumps(batch))
+            self.assertEqual(r.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def test_drop(self):
+        """Test a drop rate of 1 closes the connection without a response"""
+        with self.emulator(faults=dict(drop_rate=1)) as emu:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                _post(emu.port, 'getblockcount')
+            self.assertEqual(_post(emu.port, 'emulator_faults', dict(drop_rate=0)).status_code, 200)
+            self.assertEqual(_post(emu.port, 'getblockcount').status_code, 200)
+
+    def test_drip(self):
+        """Test slow-drip responses arrive intact, but take at least ``interval`` per chunk"""
+        with self.emulator(faults=dict(drip=dict(chunk=64, interval=0.02))) as emu:
+            start = time.perf_counter()
+            r = _post(emu.port, 'getblockchaininfo')
+            elapsed = time.perf_counter() - start
+            self.assertEqual(r.json()['result']['chain'], 'main')
+            self.assertGreaterEqual(elapsed, (len(r.content) - 1) // 64 * 0.02)
+
+    def test_admin(self):
+        """Test faults can be viewed, changed and reset at runtime"""
+        with self.emulator() as emu:
+            rpc = BitcoinRPC(port=emu.port)
+            self.assertEqual(rpc.call('emulator_faults')['errors'], {})
+            config = rpc.call('emulator_faults', errors={'*': 1})
+            self.assertEqual(config['errors']['*']['rate'], 1)
+            self.assertEqual(_post(emu.port, 'getblockcount').json()['error']['code'], -28)
+            self.assertEqual(rpc.call('emulator_faults', reset=True)['errors'], {})
+            self.assertIsInstance(rpc.getblockcount(), int)
+            self.assertEqual(_post(emu.port, 'emulator_faults', dict(drop_rate=5)).json()['error']['code'], -32602)
+
+
+class TestFaultServerAsync(TestFaultServer):
+    """Test faults injected by the AsyncIO server backend"""
+    use_async = True
+
+
+class TestFaultServerInProcess(TestFaultServer):
+    """Test faults injected by an in-process server, which configures this process's fault injector"""
+
+    def emulator(self, **kwargs) -> bitcoin.BitcoinEmulator:
+        return bitcoin.BitcoinEmulator(port=0, in_process=True, threaded=True, isolated=True, **kwargs)
+
+    def tearDown(self):
+        faults.injector.reset()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from privex.rpcemulator.mempool import (
+    COINBASE_WEIGHT, MIN_RELAY_FEERATE, Mempool, bucket_feerate, fee_bucket, tx_vsize
+)
+from privex.rpcemulator.store import SqliteTransactionStore
+
+
+def _sats(n) -> Decimal:
+    return Decimal(n).scaleb(-8)
+
+
+class TestMempool(unittest.TestCase):
+    """Test block assembly, fee estimates and totals of :class:`.Mempool`"""
+    
+    def make_pool(self):
+        return Mempool()
+    
+    def setUp(self) -> None:
+        self.pool = self.make_pool()
+        # feerates of 20, 1 and 5 sat/vB
+        self.pool.extend([
+            dict(txid='aa', fee=_sats(2000), vsize=100), dict(txid='bb', fee=_sats(100), vsize=100),
+            dict(txid='cc', fee=_sats(1000), vsize=200),
+        ])
+    
+    def test_add_remove(self):
+        """Test entries can be added, looked up and removed, and duplicate txids are ignored"""
+        self.assertEqual(len(self.pool), 3)
+        self.assertFalse(self.pool.add('aa', _sats(1)))
+        e = self.pool.get('cc')
+        self.assertEqual((e['fee'], e['vsize'], e['weight']), (Decimal('0.00001'), 200, 800))
+        self.assertIn('bb', self.pool)
+        self.assertEqual(self.pool.remove(['bb', 'nonexistent']), 1)
+        self.assertNotIn('bb', self.pool)
+        self.assertIsNone(self.pool.get('bb'))
+        self.assertEqual(sorted(self.pool.txids()), ['aa', 'cc'])
+        self.assertEqual(sorted(e['txid'] for e in self.pool.entries()), ['aa', 'cc'])
+    
+    def test_info(self):
+        """Test the totals of the mempool are kept up to date"""
+        self.assertEqual(self.pool.info(), dict(size=3, bytes=400, fees=Decimal('0.000031')))
+        self.pool.remove(['aa'])
+        self.assertEqual(self.pool.info(), dict(size=2, bytes=300, fees=Decimal('0.000011')))
+        self.assertEqual([b[1] for b in self.pool.histogram()], [1, 1])
+    
+    def test_select(self):
+        """Test block templates take the highest feerate first, and skip transactions which don't fit"""
+        self.assertEqual(self.pool.select(), ['aa', 'cc', 'bb'])
+        # Room for 'aa' and 'bb', but not 'cc'
+        self.assertEqual(self.pool.select(COINBASE_WEIGHT + 800), ['aa', 'bb'])
+        # Selecting doesn't remove anything
+        self.assertEqual(len(self.pool), 3)
+        self.pool.remove(['aa'])
+        self.pool.add('aa', _sats(10), 100)
+        self.assertEqual(self.pool.select(), ['cc', 'bb', 'aa'])
+    
+    def test_estimate(self):
+        """Test fee estimates are the minimum until the mempool fills the target blocks"""
+        self.assertEqual(self.pool.estimate_feerate(1), Decimal('0.00001'))
+        # Blocks which only fit 200 vbytes - 'aa' and 'cc' fill the first block, so 5 sat/vB isn't enough
+        weight = COINBASE_WEIGHT + 800
+        expected = (Decimal(bucket_feerate(fee_bucket(5) + 1)) * 1000 / 10 ** 8).quantize(Decimal('0.00000001'))
+        self.assertEqual(self.pool.estimate_feerate(1, weight), expected)
+        self.assertGreater(expected, Decimal('0.00005'))
+        # Two blocks are exactly filled, so it has to outbid the 1 sat/vB transaction
+        self.assertEqual(self.pool.estimate_feerate(2, weight), Decimal('0.0000105'))
+        self.assertEqual(self.pool.estimate_feerate(3, weight), Decimal('0.00001'))
+    
+    def test_large_backlog(self):
+        """Test a 100k transaction backlog can be added, estimated and mined from, filling one block"""
+        self.pool.extend(
+            dict(txid=f'{i:064x}', fee=_sats(141 * (1 + i % 50)), vsize=141) for i in range(100000)
+        )
+        self.assertEqual(len(self.pool), 100003)
+        for _ in range(10):
+            self.pool.estimate_feerate(2)
+            self.pool.info()
+        txids = self.pool.select()
+        self.pool.remove(txids)
+        self.assertEqual(len(txids), (4000000 - COINBASE_WEIGHT) // (141 * 4))
+        self.assertEqual(self.pool.get(txids[-1]), None)
+    
+    def test_helpers(self):
+        """Test the vsize estimate and feerate buckets"""
+        self.assertEqual(tx_vsize(1, 2), 141)
+        self.assertEqual(tx_vsize(1, 2, segwit=False), 226)
+        self.assertEqual(fee_bucket(0), 0)
+        self.assertEqual(fee_bucket(MIN_RELAY_FEERATE), 0)
+        for feerate in (1.5, 7.3, 250):
+            self.assertLessEqual(bucket_feerate(fee_bucket(feerate)), feerate)
+            self.assertGreater(bucket_feerate(fee_bucket(feerate) + 1), feerate)
+
+
+class TestSqliteMempool(TestMempool):
+    """Run the :class:`.TestMempool` tests against the :class:`.SqliteMempool` of a :class:`.SqliteTransactionStore`"""
+    
+    def make_pool(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SqliteTransactionStore(os.path.join(self.tmpdir.name, 'wallet.db'))
+        return self.store.mempool
+    
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmpdir.cleanup()
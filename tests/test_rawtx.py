@@ -0,0 +1,73 @@
+import unittest
+
+from privex.rpcemulator.rawtx import (
+    TxIn, TxOut, compact_size, decode_hex, nulldata_script, p2pkh_script, parse_transaction, read_compact_size,
+    script_address, script_asm, script_type, serialize_transaction
+)
+
+# The signed segwit transaction from the BIP 143 "native P2WPKH" example - one legacy input, and one P2WPKH input
+SEGWIT_TX = (
+    '01000000000102fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f00000000494830450221008b9d1dc26ba6'
+    'a9cb62127b02742fa9d754cd3bebf337f7a55d114c8e5cdd30be022040529b194ba3f9281a99f2b1c0a19c0489bc22ede944ccf4ecbab4cc'
+    '618ef3ed01eeffffffef51e1b804cc89d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb20600'
+    '0000001976a9148280b37df378db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0'
+    '167faa815988ac000247304402203609e17b84f6a7d30c80bfa610b5b4542f32a8a0d5447a12fb1366d7f01cc44a0220573a954c451833'
+    '1561406f90300e8f3358f51928d43c212a8caed02de67eebee0121025476c2e83188368da1ff3e292e7acafcdb3566bb0ad253f62fc70f07'
+    'aeee635711000000'
+)
+
+
+class TestRawTransaction(unittest.TestCase):
+    """Test serializing and parsing raw transactions, and the script helpers"""
+    
+    def test_compact_size(self):
+        """Test variable length integers round trip at each width"""
+        for n, size in ((0, 1), (0xfc, 1), (0xfd, 3), (0xffff, 3), (0x10000, 5), (0x100000000, 9)):
+            encoded = compact_size(n)
+            self.assertEqual(len(encoded), size)
+            self.assertEqual(read_compact_size(memoryview(b'\0' + encoded), 1), (n, size + 1))
+    
+    def test_round_trip(self):
+        """Test a legacy transaction serializes and parses back to the same inputs and outputs"""
+        inputs = [TxIn('ab' * 32, 1, b'\x51', 0xfffffffd), TxIn('cd' * 32, 0)]
+        outputs = [TxOut(5000, p2pkh_script(bytes(range(20)))), TxOut(0, nulldata_script(b'hello'))]
+        raw = serialize_transaction(2, inputs, outputs, 500000)
+        tx = parse_transaction(raw)
+        self.assertEqual((tx.version, tx.locktime, tx.size, tx.vsize, tx.weight), (2, 500000, len(raw), len(raw),
+                                                                                   len(raw) * 4))
+        self.assertEqual(tx.inputs, tuple(inputs))
+        self.assertEqual(tx.outputs, tuple(outputs))
+        self.assertEqual(tx.txid, tx.hash)
+        self.assertEqual(serialize_transaction(tx.version, tx.inputs, tx.outputs, tx.locktime), raw)
+    
+    def test_segwit(self):
+        """Test the TXID of a segwit transaction excludes the witness, while the WTXID and weight include it"""
+        tx = decode_hex(SEGWIT_TX)
+        self.assertEqual(tx.txid, 'e8151a2af31c368a35053ddd4bdb285a8595c769a3ad83e0fa02314a602d4609')
+        self.assertNotEqual(tx.hash, tx.txid)
+        self.assertEqual((tx.size, tx.weight, tx.vsize), (343, 1042, 261))
+        self.assertEqual(tx.inputs[0].witness, ())
+        self.assertEqual(len(tx.inputs[1].witness), 2)
+        self.assertEqual(serialize_transaction(tx.version, tx.inputs, tx.outputs, tx.locktime).hex(), SEGWIT_TX)
+        legacy = serialize_transaction(tx.version, tx.inputs, tx.outputs, tx.locktime, witness=False)
+        self.assertEqual(parse_transaction(legacy).txid, tx.txid)
+    
+    def test_invalid(self):
+        """Test truncated or padded transactions aren't decoded, and results are cached"""
+        self.assertIsNone(decode_hex(SEGWIT_TX[:-2]))
+        self.assertIsNone(decode_hex(SEGWIT_TX + '00'))
+        self.assertIsNone(decode_hex('zz'))
+        with self.assertRaises(ValueError):
+            parse_transaction(b'\x01\x00\x00\x00\x05')
+        self.assertIs(decode_hex(SEGWIT_TX), decode_hex(SEGWIT_TX))
+    
+    def test_scripts(self):
+        """Test output script types, addresses and disassembly"""
+        script = p2pkh_script(bytes(20))
+        self.assertEqual(script_type(script), 'pubkeyhash')
+        self.assertEqual(script_address(script), '1111111111111111111114oLvT2')
+        self.assertEqual(script_asm(script), f'OP_DUP OP_HASH160 {"00" * 20} OP_EQUALVERIFY OP_CHECKSIG')
+        self.assertEqual(script_type(nulldata_script(b'x')), 'nulldata')
+        self.assertIsNone(script_address(nulldata_script(b'x')))
+        self.assertEqual(script_type(b'\x00\x14' + bytes(20)), 'witness_v0_keyhash')
+        self.assertEqual(script_asm(b'\x4c\x03abc\x05ab'), '616263 [error]')
@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from decimal import Decimal
+
+from privex.rpcemulator.store import TransactionStore, SqliteTransactionStore, block_hash, block_hash_height
+
+ADDR_A = '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8'
+ADDR_B = '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW'
+
+
+def _tx(txid, address, amount, category='receive', account='', confirmations=10):
+    return dict(
+        txid=txid, address=address, amount=Decimal(amount), category=category, account=account,
+        confirmations=confirmations
+    )
+
+
+class TestTransactionStore(unittest.TestCase):
+    """Test the indexes and running balances of :class:`.TransactionStore`"""
+    
+    def make_store(self, transactions):
+        return TransactionStore(transactions)
+    
+    def setUp(self) -> None:
+        self.store = self.make_store([
+            _tx('aa', ADDR_A, '1.0'),
+            _tx('bb', ADDR_B, '0.5', account='Savings', confirmations=1),
+            _tx('cc', ADDR_A, '-0.25', category='send'),
+        ])
+    
+    def test_list_behaviour(self):
+        """Test the store can be used like a list of transactions"""
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual([t['txid'] for t in self.store], ['aa', 'bb', 'cc'])
+        self.assertEqual(self.store[-1]['txid'], 'cc')
+    
+    def test_lookup(self):
+        """Test looking up transactions by txid, address, account and category"""
+        self.assertEqual(self.store.get('bb')['address'], ADDR_B)
+        self.assertIsNone(self.store.get('zz'))
+        self.assertEqual([t['txid'] for t in self.store.by_address(ADDR_A)], ['aa', 'cc'])
+        self.assertEqual([t['txid'] for t in self.store.by_account('savings')], ['bb'])
+        self.assertEqual([t['txid'] for t in self.store.by_category('send')], ['cc'])
+    
+    def test_balances(self):
+        """Test the running balances for all accounts, a single account, and addresses"""
+        self.assertEqual(self.store.balance(), Decimal('1.25'))
+        self.assertEqual(self.store.balance('*', confirmations=5), Decimal('0.75'))
+        self.assertEqual(self.store.balance('SAVINGS'), Decimal('0.5'))
+        self.assertEqual(self.store.balance('nonexistent'), Decimal('0'))
+        self.assertEqual(self.store.address_balance(ADDR_A), Decimal('0.75'))
+        self.assertEqual(self.store.received_by_address(ADDR_A), Decimal('1.0'))
+        self.assertEqual(self.store.received_by_address(ADDR_B, confirmations=2), Decimal('0'))
+    
+    def test_update(self):
+        """Test updating a transaction re-indexes it and adjusts the balances"""
+        self.store.update(1, account='', amount=Decimal('0.7'))
+        self.assertEqual(self.store.balance(), Decimal('1.45'))
+        self.assertEqual(self.store.balance('savings'), Decimal('0'))
+        self.assertEqual(self.store.by_account('savings'), [])
+    
+    def test_richest(self):
+        """Test finding the richest address, and selecting addresses to cover an amount"""
+        self.store.append(_tx('dd', ADDR_B, '0.6'))
+        self.assertEqual(self.store.richest(), (ADDR_B, Decimal('1.1')))
+        self.assertEqual(self.store.richest(predicate=lambda a: a != ADDR_B), (ADDR_A, Decimal('0.75')))
+        # After ADDR_B's balance drops, ADDR_A should become the richest address
+        self.store.append(_tx('ee', ADDR_B, '-1.0', category='send'))
+        self.assertEqual(self.store.richest(), (ADDR_A, Decimal('0.75')))
+        self.assertEqual(self.store.select_addresses(Decimal('0.8')), [
+            (ADDR_A, Decimal('0.75')), (ADDR_B, Decimal('0.1'))
+        ])
+        # Selecting addresses shouldn't consume them from the heap
+        self.assertEqual(len(self.store.select_addresses()), 2)
+    
+    def test_views(self):
+        """Test serialized views are JSON friendly, cached, and invalidated when a transaction is updated"""
+        v = self.store.view(0)
+        self.assertIs(type(v['amount']), float)
+        self.assertIs(type(self.store[0]['amount']), Decimal)
+        self.store.update(0, amount=Decimal('2.0'))
+        self.assertEqual(self.store.view(0)['amount'], 2.0)
+        self.assertEqual([t['txid'] for t in self.store.views([2, 0])], ['cc', 'aa'])
+    
+    def test_blocks(self):
+        """Test adding blocks confirms mempool transactions, and confirmations are derived from the chain tip"""
+        tip = self.store.tip
+        self.assertEqual(self.store[1]['blockheight'], tip)
+        self.assertEqual(self.store.view(1)['confirmations'], 1)
+        self.store.append(_tx('dd', ADDR_B, '2.0', confirmations=0))
+        self.assertEqual(self.store.mempool_positions(), [3])
+        self.assertEqual(self.store.view(3)['confirmations'], 0)
+        self.assertEqual(self.store.balance(), Decimal('3.25'))
+        self.assertEqual(self.store.balance('*', confirmations=1), Decimal('1.25'))
+        
+        height = self.store.add_block(self.store.mempool_positions())
+        self.assertEqual((height, self.store.tip), (tip + 1, tip + 1))
+        self.assertEqual(self.store.mempool_positions(), [])
+        self.assertEqual(self.store.view(3)['confirmations'], 1)
+        self.assertEqual(self.store.view(3)['blockhash'], block_hash(height))
+        self.assertEqual(self.store.view(1)['confirmations'], 2)
+        self.assertEqual(self.store.balance('*', confirmations=1), Decimal('3.25'))
+        self.assertEqual(self.store.balance('*', confirmations=2), Decimal('1.25'))
+        self.assertEqual(self.store.received_by_address(ADDR_B, confirmations=2), Decimal('0.5'))
+        
+        self.store.add_block(time=1600000000)
+        self.assertEqual(self.store.block_time(tip + 2), 1600000000)
+        self.assertEqual(self.store.view(3)['confirmations'], 2)
+        self.assertEqual(self.store.height_positions(tip), [1, 3])
+        self.assertEqual(self.store.height_positions(tip - 9, tip - 1), [0, 2])
+        self.assertEqual(self.store.height_positions(tip + 2), [])
+    
+    def test_mine_block(self):
+        """Test fees are included in balances, and mined blocks confirm the highest feerate mempool transactions"""
+        self.store.append(dict(_tx('dd', ADDR_A, '-0.1', 'send', confirmations=0), fee=Decimal('-0.0001')))
+        self.store.append(_tx('ee', ADDR_B, '0.2', confirmations=0))
+        self.assertEqual(self.store.balance(), Decimal('1.3499'))
+        self.assertEqual(self.store.address_balance(ADDR_A), Decimal('0.6499'))
+        self.assertEqual(sorted(self.store.mempool.txids()), ['dd', 'ee'])
+        self.assertEqual(self.store.mempool.get('dd')['fee'], Decimal('0.0001'))
+        
+        # Only room for one transaction - the one paying a fee is mined first
+        tip = self.store.tip
+        self.assertEqual(self.store.mine_block(4000 + 141 * 4), tip + 1)
+        self.assertEqual(self.store.view(3)['confirmations'], 1)
+        self.assertEqual(self.store.mempool_positions(), [4])
+        self.assertEqual(self.store.mempool.txids(), ['ee'])
+        self.store.mine_block()
+        self.assertEqual((self.store.mempool_positions(), len(self.store.mempool)), ([], 0))
+        self.assertEqual(self.store.balance('*', 2), Decimal('1.1499'))
+    
+    def test_block_hash(self):
+        """Test the block height can be recovered from a block hash"""
+        self.assertEqual(len(block_hash(601440)), 64)
+        self.assertEqual(block_hash_height(block_hash(601440)), 601440)
+        self.assertIsNone(block_hash_height(block_hash(601440)[:-1] + '1'))
+        self.assertIsNone(block_hash_height('nonexistent'))
+
+
+class TestSqliteTransactionStore(TestTransactionStore):
+    """Run the :class:`.TestTransactionStore` tests against :class:`.SqliteTransactionStore`, plus persistence tests"""
+    
+    def make_store(self, transactions):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'wallet.db')
+        return SqliteTransactionStore(self.path, transactions)
+    
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmpdir.cleanup()
+    
+    def test_reopen(self):
+        """Test re-opening the database keeps the transactions and balances, without re-adding the defaults"""
+        self.store.close()
+        store = SqliteTransactionStore(self.path, [_tx('zz', ADDR_A, '5.0')])
+        self.assertEqual(len(store), 3)
+        self.assertIsNone(store.get('zz'))
+        self.assertEqual(store.balance(), Decimal('1.25'))
+        self.assertEqual(store.page('*', 2, 0), range(1, 3))
+        self.assertEqual((len(store.utxos), store.utxos.total()), (2, Decimal('1.25')))
+        store.close()
+    
+    def test_migrate(self):
+        """Test a database which stored ``confirmations`` per transaction is migrated to block heights"""
+        path = os.path.join(self.tmpdir.name, 'old.db')
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+        CREATE TABLE transactions (
+            pos INTEGER PRIMARY KEY, txid TEXT NOT NULL, address TEXT NOT NULL, account TEXT NOT NULL,
+            category TEXT NOT NULL, amount INTEGER NOT NULL, confirmations INTEGER NOT NULL, data TEXT NOT NULL
+        );
+        CREATE TABLE account_ledger (
+            account TEXT NOT NULL, confirmations INTEGER NOT NULL, balance INTEGER NOT NULL,
+            PRIMARY KEY (account, confirmations)
+        );
+        """)
+        for pos, (txid, address, sats, account, conf) in enumerate([
+            ('aa', ADDR_A, 100000000, '', 5), ('bb', ADDR_B, 50000000, 'savings', 0)
+        ]):
+            data = dict(txid=txid, address=address, amount={'__decimal__': str(sats / 10 ** 8)}, category='receive',
+                        account=account, confirmations=conf)
+            conn.execute('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (pos, txid, address, account, 'receive', sats, conf, json.dumps(data)))
+        conn.commit()
+        conn.close()
+        
+        store = SqliteTransactionStore(path, tip=100)
+        self.assertEqual(store[0]['blockheight'], 96)
+        self.assertNotIn('confirmations', store[0])
+        self.assertIsNone(store[1]['blockheight'])
+        self.assertEqual(store.view(0)['confirmations'], 5)
+        self.assertEqual(store.balance(), Decimal('1.5'))
+        self.assertEqual(store.balance('*', confirmations=5), Decimal('1.0'))
+        self.assertEqual(store.balance('*', confirmations=6), Decimal('0'))
+        self.assertEqual(store.balance('savings'), Decimal('0.5'))
+        self.assertEqual(store.received_by_address(ADDR_A, 1), Decimal('1.0'))
+        # The unconfirmed transaction is added to the mempool, so it can be mined
+        self.assertEqual(store.mempool.txids(), ['bb'])
+        # The UTXO set is rebuilt from the transactions
+        utxos = sorted((u['txid'], u['blockheight']) for u in store.utxos.entries())
+        self.assertEqual(utxos, [('aa', 96), ('bb', None)])
+        store.close()
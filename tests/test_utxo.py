@@ -0,0 +1,180 @@
+import os
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+
+from privex.rpcemulator.store import SqliteTransactionStore, TransactionStore
+from privex.rpcemulator.utxo import UTXOSet, branch_and_bound
+
+ADDR_A = '1PNgW6AgPZMys844kFS2dK4tt7F36MzLC8'
+ADDR_B = '1CGzMWXH6JhSKrkrbcGhRtEJxrU1za23LW'
+
+
+def _utxo(txid, vout, address, amount, blockheight=100):
+    return dict(txid=txid, vout=vout, address=address, amount=Decimal(amount), blockheight=blockheight)
+
+
+class TestUTXOSet(unittest.TestCase):
+    """Test the indexes, locks and coin selection of :class:`.UTXOSet`"""
+    
+    def make_utxos(self):
+        return UTXOSet()
+    
+    def setUp(self) -> None:
+        self.utxos = self.make_utxos()
+        self.utxos.add([
+            _utxo('aa', 0, ADDR_A, '0.5'), _utxo('aa', 1, ADDR_B, '0.2'), _utxo('bb', 0, ADDR_A, '0.1'),
+            _utxo('cc', 3, ADDR_B, '0.05', None),
+        ])
+    
+    def test_add_spend(self):
+        """Test UTXOs can be looked up by outpoint, address and amount, and are removed once spent"""
+        self.assertEqual(len(self.utxos), 4)
+        self.assertEqual(self.utxos.get('aa', 1), _utxo('aa', 1, ADDR_B, '0.2'))
+        self.assertIn(('cc', 3), self.utxos)
+        self.assertEqual([u['amount'] for u in self.utxos.by_address(ADDR_A)], [Decimal('0.5'), Decimal('0.1')])
+        self.assertEqual([u['txid'] for u in self.utxos.by_amount()], ['aa', 'aa', 'bb', 'cc'])
+        amounts = [u['amount'] for u in self.utxos.by_amount('0.05', '0.2')]
+        self.assertEqual(amounts, [Decimal('0.2'), Decimal('0.1'), Decimal('0.05')])
+        self.assertEqual(self.utxos.total(), Decimal('0.85'))
+        self.assertEqual(self.utxos.spend([('aa', 0), ('zz', 0)]), 1)
+        self.assertIsNone(self.utxos.get('aa', 0))
+        self.assertEqual(len(self.utxos.by_address(ADDR_A)), 1)
+        self.assertEqual(self.utxos.total(), Decimal('0.35'))
+    
+    def test_confirm(self):
+        """Test confirming a transaction sets the height of every UTXO it created"""
+        self.utxos.confirm(['cc'], 101)
+        self.assertEqual(self.utxos.get('cc', 3)['blockheight'], 101)
+        self.utxos.confirm(['aa'], None)
+        self.assertEqual([u['blockheight'] for u in self.utxos.by_address(ADDR_B)], [None, 101])
+    
+    def test_lock(self):
+        """Test locked UTXOs aren't listed or selected, and are unlocked once spent"""
+        self.assertEqual(self.utxos.lock([('aa', 0), ('zz', 1)]), 1)
+        self.assertEqual(self.utxos.locked(), [('aa', 0)])
+        self.assertTrue(self.utxos.is_locked('aa', 0))
+        self.assertEqual([u['amount'] for u in self.utxos.by_address(ADDR_A)], [Decimal('0.1')])
+        self.assertEqual(self.utxos.select(Decimal('0.3')), [self.utxos.get('aa', 1), self.utxos.get('bb', 0)])
+        self.assertIsNone(self.utxos.select(Decimal('0.4')))
+        self.assertIsNotNone(self.utxos.get('aa', 0))
+        self.assertEqual(self.utxos.unlock(), 1)
+        self.utxos.lock([('aa', 0)])
+        self.utxos.spend([('aa', 0)])
+        self.assertEqual(self.utxos.locked(), [])
+    
+    def test_select(self):
+        """Test coin selection prefers an exact match, and otherwise spends the largest UTXOs first"""
+        # 0.2 + 0.1 is within the cost of change of 0.299, so no change is needed
+        self.assertEqual([u['amount'] for u in self.utxos.select(Decimal('0.299'), Decimal('0.002'))],
+                         [Decimal('0.2'), Decimal('0.1')])
+        self.assertEqual([u['amount'] for u in self.utxos.select(Decimal('0.62'))], [Decimal('0.5'), Decimal('0.2')])
+        self.assertEqual([u['amount'] for u in self.utxos.select(Decimal('0.3'), predicate=lambda a: a == ADDR_A)],
+                         [Decimal('0.5')])
+        self.assertIsNone(self.utxos.select(Decimal('1')))
+    
+    def test_apply(self):
+        """Test sends spend the largest UTXOs of their address and return the change, unless the spends are given"""
+        self.utxos.apply([
+            dict(txid='dd', vout=0, address=ADDR_A, amount=Decimal('0.3'), category='receive', blockheight=None),
+            dict(txid='ee', vout=0, address=ADDR_A, amount=Decimal('-0.35'), fee=Decimal('-0.01'), category='send',
+                 blockheight=None),
+        ])
+        # 0.5 is spent, leaving 0.14 change at the vout after the send's own
+        self.assertEqual([(u['txid'], u['vout'], u['amount']) for u in self.utxos.by_address(ADDR_A)], [
+            ('dd', 0, Decimal('0.3')), ('ee', 1, Decimal('0.14')), ('bb', 0, Decimal('0.1'))
+        ])
+        spent = self.utxos.apply(
+            [dict(txid='ff', vout=0, address=ADDR_A, amount=Decimal('-0.05'), category='send', blockheight=None)],
+            spends=[('cc', 3)], change=[dict(txid='ff', vout=1, address=ADDR_B, amount='0.001')]
+        )
+        self.assertEqual(spent, 1)
+        self.assertEqual(len(self.utxos.by_address(ADDR_A)), 3)
+        self.assertEqual(self.utxos.get('ff', 1)['amount'], Decimal('0.001'))
+    
+    def test_large(self):
+        """Test listing and selecting from 200k UTXOs only reads the UTXOs it needs"""
+        self.utxos.add(_utxo(f'{i:064x}', i % 3, ADDR_A if i % 2 else ADDR_B, Decimal(i + 1).scaleb(-8))
+                       for i in range(200000))
+        start = time.perf_counter()
+        for _ in range(10):
+            top = [u['amount'] for _, u in zip(range(100), self.utxos.by_amount(max_amount='0.001'))]
+            selected = self.utxos.select(Decimal('0.0015'), Decimal('0.000001'))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(top[:2], [Decimal('0.001'), Decimal('0.00099999')])
+        self.assertGreaterEqual(sum(u['amount'] for u in selected), Decimal('0.0015'))
+        self.assertLessEqual(sum(u['amount'] for u in selected), Decimal('0.001501'))
+
+
+class TestSqliteUTXOSet(TestUTXOSet):
+    """Run the :class:`.TestUTXOSet` tests against the :class:`.SqliteUTXOSet` of a :class:`.SqliteTransactionStore`"""
+    
+    def make_utxos(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SqliteTransactionStore(os.path.join(self.tmpdir.name, 'wallet.db'))
+        return self.store.utxos
+    
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmpdir.cleanup()
+    
+    def test_amount_index(self):
+        """Test amount range queries search the amount index for both bounds, rather than scanning to the minimum"""
+        queries = []
+        self.utxos.conn.set_trace_callback(queries.append)
+        list(self.utxos.by_amount('0.05', '0.2'))
+        self.utxos.conn.set_trace_callback(None)
+        plan = [row[-1] for row in self.utxos.conn.execute(f'EXPLAIN QUERY PLAN {queries[-1]}')]
+        # The wording of the plan differs between SQLite versions, but always names the index and its bounds
+        self.assertTrue(any('utxos_amount (amount>? AND amount<?)' in step for step in plan), plan)
+
+
+class TestStoreUTXOs(unittest.TestCase):
+    """Test the UTXO set of a transaction store is kept in sync with its transactions"""
+    
+    def make_store(self, transactions):
+        return TransactionStore(transactions)
+    
+    def setUp(self) -> None:
+        self.store = self.make_store([
+            dict(txid='aa', address=ADDR_A, amount=Decimal('1'), category='receive', confirmations=3),
+            dict(txid='bb', address=ADDR_A, amount=Decimal('0.4'), category='receive', blockheight=None),
+            dict(txid='cc', address=ADDR_A, amount=Decimal('-0.7'), category='send', blockheight=None),
+        ])
+    
+    def test_balance(self):
+        """Test the UTXOs add up to the balance, and sends spend the address' largest UTXOs"""
+        self.assertEqual(self.store.utxos.total(), self.store.balance())
+        self.assertEqual([(u['txid'], u['amount']) for u in self.store.utxos.by_address(ADDR_A)],
+                         [('bb', Decimal('0.4')), ('cc', Decimal('0.3'))])
+    
+    def test_mine(self):
+        """Test mining a block confirms the UTXOs created by the transactions in it"""
+        height = self.store.mine_block()
+        self.assertEqual({u['blockheight'] for u in self.store.utxos.entries()}, {height})
+
+
+class TestSqliteStoreUTXOs(TestStoreUTXOs):
+    """Run the :class:`.TestStoreUTXOs` tests against :class:`.SqliteTransactionStore`"""
+    
+    def make_store(self, transactions):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        return SqliteTransactionStore(os.path.join(self.tmpdir.name, 'wallet.db'), transactions)
+    
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmpdir.cleanup()
+
+
+class TestBranchAndBound(unittest.TestCase):
+    """Test the changeless input search used by coin selection"""
+    
+    def test_match(self):
+        """Test the subset with the least excess within the window is found, or ``None`` if there isn't one"""
+        values = [50, 40, 30, 20, 10]
+        self.assertEqual(branch_and_bound(values, 60), [0, 4])
+        self.assertEqual(branch_and_bound(values, 65, 6), [0, 3])
+        self.assertIsNone(branch_and_bound(values, 65, 4))
+        self.assertIsNone(branch_and_bound(values, 200, 50))
+        self.assertEqual(branch_and_bound([5] * 30, 50), [0, 1, 2, 3, 4, 5, 6, 7, 8, 9])